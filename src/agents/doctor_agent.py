@@ -5,13 +5,28 @@ import json
 from typing import Any
 
 from rag import AdaptiveRAGRetriever
-from services.llm_client import LLMClient
+from services.llm_client import LLMClient, stop_after_json_fields
+from services.prompt_budget import (
+    PromptBudget,
+    count_message_tokens,
+    count_tokens,
+    dedupe_chunks,
+    dumps_within,
+    get_prompt_token_budget,
+    truncate_to_tokens,
+)
+from services.question_store import QuestionStore, loaded_embedder
 from utils import get_logger
 
 
 class DoctorAgent:
     """医生智能体：初始不知道任何病例信息，通过问诊获取"""
     
+    # 提示词各部分的 token 上限（整体另受 llm.prompt_token_budget 约束）
+    _KB_CONTEXT_TOKENS = 1200  # 知识库参考（最多 4 条，单条 ≤ 320）
+    _COLLECTED_INFO_TOKENS = 1200  # 已收集信息 JSON
+    _HISTORY_ANSWER_TOKENS = 80  # 问诊历史中单条患者回答
+    
     def __init__(
         self,
         dept: str,
@@ -40,6 +55,7 @@ class DoctorAgent:
             "conversation_history": []  # 新增：完整的对话历史（问题+回答）
         }
         self.questions_asked: list[str] = []
+        self._question_store = QuestionStore()  # 已问问题的去重特征（本次就诊）
     
     def reset(self) -> None:
         """重置医生状态（用于处理新患者）
@@ -62,6 +78,7 @@ class DoctorAgent:
         }
         # ⚠️ 关键：清空已问问题列表
         self.questions_asked = []
+        self._question_store.clear()
         self._logger.debug(f"医生 Agent 已重置：collected_info + questions_asked 已清空")
     
     def generate_one_question(
@@ -97,7 +114,6 @@ class DoctorAgent:
             )
             kb_context = self._format_chunks(chunks)
         
-        # 构建历史对话展示 - 包括问题和患者的回答
         is_first_question = len(self.questions_asked) == 0
 
         # Python层面早停检查：核心信息充分收集后，跳过LLM调用直接终止
@@ -105,48 +121,7 @@ class DoctorAgent:
             self._logger.info("  ✅ [早停] 核心信息已充分收集，提前结束问诊")
             return ""
 
-        if self.questions_asked:
-            # 显示完整的对话历史（问题 + 回答）
-            conversation_history = self.collected_info.get("conversation_history", [])
-            
-            if conversation_history:
-                # 如果有完整的对话记录，显示问题和回答
-                history_lines = []
-                for i, conv in enumerate(conversation_history, 1):
-                    history_lines.append(f"👨‍⚕️ 医生第{i}问: {conv.get('question', '')}")
-                    history_lines.append(f"👤 患者回答: {conv.get('answer', '')[:100]}{'...' if len(conv.get('answer', '')) > 100 else ''}")
-                    history_lines.append("")  # 空行分隔
-                history_display = "\n".join(history_lines)
-            else:
-                # 如果没有对话记录，只显示问题列表
-                history_display = "\n".join([f"  {i+1}. {q}" for i, q in enumerate(self.questions_asked)])
-            
-            asked_summary = f"""⛔ **已问过的所有问题及患者回答（共{len(self.questions_asked)}个）**
-
-{history_display}
-
-⚠️ **绝对禁止重复！**
-- 以上每一个问题都已经问过，绝对不能再问！
-- 不能问语义相同或相似的问题（即使换个说法也不行）
-- **仅当患者的回答不完整时，才可以针对回答中的具体内容深入追问**
-- 如果患者已经回答了该问题，就不要再问相关内容！
-- 如果想不出新问题，就返回空字符串停止问诊！
-
-💡 **如何判断是否重复**：
-1. 检查你想问的内容是否已经在患者的回答中出现
-2. 检查是否已经有相似的问题（即使表述不同）
-3. 如果患者已经提到过某个症状，就不要再问“有没有这个症状”
-
-📝 **深入追问示例**：
-- 已问：“有哪里不舒服？” 患者答：“头疼”
-  ✅ 允许：“头哪个位置疼？前额、后脑勺还是两侧？”
-  ❌ 禁止：“还有别的不舒服吗？”（这是新问题，不是深入追问）
-
-- 已问：“疼痛会扩散到其他地方吗？” 患者答：“会，有时候会到后背”
-  ✅ 允许：“后背的哪个位置？是一直疼还是偶尔疼？”
-  ❌ 禁止：“疼痛的范围大吗？”（与已问问题重复）
-"""
-        else:
+        if is_first_question:
             # 首次问诊：使用独立最简提示词，直接返回开场问候，避免被后续阶段策略干扰
             _fq_prompt = (
                 f"你是{self._dept_name()}医生，患者刚进入诊室，这是本次就诊的第一句话。\n"
@@ -174,40 +149,128 @@ class DoctorAgent:
                 self._logger.error(f"  ❌ 首次问诊生成失败: {_fq_err}")
                 return "您好，哪里不舒服？"
 
-        # ── 后续轮次：构建含话题覆盖图的结构化提示词 ──
-        topic_map = self._build_topic_coverage_map()
-        system_prompt = f"""你是一名经验丰富的{self._dept_name()}医生，正在进行{context}（第{len(self.questions_asked)+1}问/上限{self._max_questions}问）。你需要通过系统的问诊收集关键信息，做出准确诊断。
+        # ── 后续轮次 ──
+        # 提示词按服务端上下文缓存的前缀匹配规则组织：
+        # system（问诊规则在前，场景/主诉/知识库在后，本次问诊不变）
+        # → 之前各轮提问与回答（只追加）→ 本轮进度、已收集信息与话题覆盖图（每轮变化，放在最后）
+        system_prompt = self._interview_system_prompt(chief_complaint, context, kb_context)
+        history_messages, last_answer = self._interview_messages()
+        base_user_prompt = f"""{last_answer}【问诊进度】已问 {len(self.questions_asked)} 问 / 上限 {self._max_questions} 问
+
+【已收集的信息】
+{dumps_within({k: v for k, v in self.collected_info.items() if k != "conversation_history"}, self._COLLECTED_INFO_TOKENS)}
+
+【已覆盖话题】
+{self._build_topic_coverage_map()}
+
+请根据以上信息，决定是否继续问诊。如果需要继续，生成下一个问题；如果信息已足够，返回空字符串。"""
+
+        # 最多重试2次：当检测到重复时，携带明确禁止的问题重新请求LLM
+        max_retries = 2
+        banned_questions: list[str] = []  # 本轮被判为重复的问题，用于重试时明确告知LLM
+
+        # 规则、知识库与本轮信息之外的预算留给问诊历史（另预留重试时的禁止问题说明）
+        history_messages = self._fit_history(
+            history_messages,
+            get_prompt_token_budget() - count_tokens(system_prompt) - count_tokens(base_user_prompt) - 300,
+        )
+
+        for attempt in range(max_retries + 1):
+            # 如果有被拒绝的问题，追加到user_prompt中
+            if banned_questions:
+                banned_block = "\n\n".join(
+                    f"  ❌ 禁止生成（已判定为与已问问题重复）：{q}" for q in banned_questions
+                )
+                user_prompt = (
+                    f"{base_user_prompt}\n\n"
+                    f"【注意】以下问题已被系统判定为重复，本次必须生成完全不同方向的新问题：\n"
+                    f"{banned_block}\n"
+                    f"请换一个完全不同的问诊方向，绝对不能再问与以上禁止问题语义相同或相似的内容。"
+                )
+            else:
+                user_prompt = base_user_prompt
+
+            try:
+                obj, _, _ = self._llm.generate_json(
+                    system_prompt=system_prompt,
+                    messages=history_messages,
+                    user_prompt=user_prompt,
+                    fallback=lambda: {"question": "", "reason": "", "duplicate_check": ""},
+                    temperature=0.3,
+                    # 只用到 question；reason / duplicate_check 仅用于日志，问题输出完整即断开
+                    stop=stop_after_json_fields("question"),
+                )
+                question = str(obj.get("question", "")).strip()
+                reason = str(obj.get("reason", "")).strip()
+                duplicate_check = str(obj.get("duplicate_check", "")).strip()
+
+                # 如果为空，直接返回
+                if not question:
+                    if reason:
+                        self._logger.debug(f"  💡 停止问诊: {reason}")
+                    return ""
+
+                # 【安全网】检查是否仍然重复
+                if self._is_duplicate_question(question):
+                    self._logger.warning(
+                        f"  ⚠️  LLM生成了重复问题（第{attempt + 1}次尝试）\n"
+                        f"     生成的问题: {question}\n"
+                        f"     LLM自己的检查: {duplicate_check if duplicate_check else '未填写'}\n"
+                        f"     当前已问问题数: {len(self.questions_asked)}"
+                    )
+                    self._logger.warning(
+                        f"     已问问题参考: {self.questions_asked[-3:] if len(self.questions_asked) >= 3 else self.questions_asked}"
+                    )
+                    banned_questions.append(question)  # 记录本次被拒绝的问题
+                    if attempt < max_retries:
+                        self._logger.warning(
+                            f"     携带禁止问题重试（第{attempt + 2}次）..."
+                        )
+                        continue  # 重试
+                    else:
+                        self._logger.warning(f"     已达最大重试次数，跳过本轮提问")
+                        return ""
+
+                # 成功得到非重复问题
+                if reason:
+                    self._logger.debug(f"  💡 问题目的: {reason}")
+                if duplicate_check:
+                    self._logger.debug(f"  ✓ 重复检查: {duplicate_check}")
+                return question
+
+            except Exception as e:
+                self._logger.error(f"  ❌ 生成问题时出错: {e}")
+                return ""
+
+        return ""
+    
+    def _interview_system_prompt(self, chief_complaint: str, context: str, kb_context: str) -> str:
+        """逐步问诊的 system 提示词：通用问诊规则（同科室所有患者相同）在前，本次问诊的场景、主诉与知识库参考在后"""
+        return f"""你是一名经验丰富的{self._dept_name()}医生，正在进行门诊问诊（上限{self._max_questions}问）。你需要通过系统的问诊收集关键信息，做出准确诊断。
 
 ⚠️ 患者状态感知
 - 观察患者的回答：如果简短、含糊或表现痛苦，说明状态不佳，应优先问最关键的问题
 - 疼痛剧烈或极度疲劳时：立即转向核心问题（症状性质、持续时间、危险征象），避免细枝末节
 - 意识异常或病情危重：停止常规问诊，建议紧急处理
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-【主诉】
-{chief_complaint}
-
-【已收集的信息】
-{json.dumps(self.collected_info, ensure_ascii=False, indent=2)}
-
-【问诊历史】({len(self.questions_asked)}/{self._max_questions}）
-{asked_summary}
+【对话格式】
+- 此前的问诊以多轮对话给出：你的每一问是一条助手消息，患者的回答在随后的消息中
+- 最后一条消息给出【问诊进度】【已收集的信息】【已覆盖话题】（✅=已收集到信息  ❌=仍空缺）
+- ⭐ 决定停止前必看【已覆盖话题】：当 ❌缺失维度 ≤2 时，信息已充分，应主动停止提问
 
-【临床知识参考】
-{kb_context}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-## 📊 已覆盖话题（优先阅读，决定停止前必看）
-{topic_map}
-（✅=已收集到信息  ❌=仍空缺）
-⭐ 当 ❌缺失维度 ≤2 时，信息已充分，应主动停止提问。
+⚠️ **绝对禁止重复！**
+- 对话中你问过的每一个问题都已经问过，绝对不能再问！
+- 不能问语义相同或相似的问题（即使换个说法也不行）
+- **仅当患者的回答不完整时，才可以针对回答中的具体内容深入追问**
+- 如果患者已经回答了该问题，就不要再问相关内容！
+- 如果想不出新问题，就返回空字符串停止问诊！
 
 🚫 **重复问题检测 - 核心原则（最高优先级）**
 
 ⚠️ 在生成新问题前，你必须执行以下严格检查流程：
 
 **步骤1：逐一核对已问问题**
-仔细阅读【问诊历史】中列出的每一个问题，逐条检查你想生成的问题是否与任何一个已问问题在以下维度重复：
+仔细阅读对话中你已问过的每一个问题，逐条检查你想生成的问题是否与任何一个已问问题在以下维度重复：
 - 语义重复：询问的内容实质相同（如"是否扩散"和"有无扩散现象"）
 - 意图重复：目的相同但表述不同（如"疼痛程度"和"疼痛打几分"）
 - 部分重复：询问的某个方面已包含在之前的问题中
@@ -323,9 +386,9 @@ class DoctorAgent:
 
 【你的任务】
 **① 优先判断：是否停止提问？**（满足任一条件即立即停止，返回 question=""）
-- 上方已覆盖话题中 ❌缺失维度 ≤2 个（信息已充分）
+- 【已覆盖话题】中 ❌缺失维度 ≤2 个（信息已充分）
 - 已收集信息足以制定初步检查计划或诊断方向
-- 已达问诊上限 {len(self.questions_asked)}/{self._max_questions} 问
+- 已达问诊上限（见【问诊进度】）
 
 ⭐ 质量原则：5个精准问题 > 机械问满{self._max_questions}问。信息够用时主动停止。
 
@@ -419,80 +482,54 @@ class DoctorAgent:
 - 第8-10问：既往史、暴露史
 ❌ 避免：与已问问题意思相同或高度相似的问题
 ❌ 避免："最近怎么样？"（过于开放，缺乏目的性）
-"""
-        
-        base_user_prompt = "请根据以上信息，决定是否继续问诊。如果需要继续，生成下一个问题；如果信息已足够，返回空字符串。"
-
-        # 最多重试2次：当检测到重复时，携带明确禁止的问题重新请求LLM
-        max_retries = 2
-        banned_questions: list[str] = []  # 本轮被判为重复的问题，用于重试时明确告知LLM
-
-        for attempt in range(max_retries + 1):
-            # 如果有被拒绝的问题，追加到user_prompt中
-            if banned_questions:
-                banned_block = "\n\n".join(
-                    f"  ❌ 禁止生成（已判定为与已问问题重复）：{q}" for q in banned_questions
-                )
-                user_prompt = (
-                    f"{base_user_prompt}\n\n"
-                    f"【注意】以下问题已被系统判定为重复，本次必须生成完全不同方向的新问题：\n"
-                    f"{banned_block}\n"
-                    f"请换一个完全不同的问诊方向，绝对不能再问与以上禁止问题语义相同或相似的内容。"
-                )
-            else:
-                user_prompt = base_user_prompt
-
-            try:
-                obj, _, _ = self._llm.generate_json(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    fallback=lambda: {"question": "", "reason": "", "duplicate_check": ""},
-                    temperature=0.3
-                )
-                question = str(obj.get("question", "")).strip()
-                reason = str(obj.get("reason", "")).strip()
-                duplicate_check = str(obj.get("duplicate_check", "")).strip()
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+【问诊场景】
+{context or f"{self._dept_name()}门诊问诊"}
 
-                # 如果为空，直接返回
-                if not question:
-                    if reason:
-                        self._logger.debug(f"  💡 停止问诊: {reason}")
-                    return ""
+【主诉】
+{chief_complaint}
 
-                # 【安全网】检查是否仍然重复
-                if self._is_duplicate_question(question):
-                    self._logger.warning(
-                        f"  ⚠️  LLM生成了重复问题（第{attempt + 1}次尝试）\n"
-                        f"     生成的问题: {question}\n"
-                        f"     LLM自己的检查: {duplicate_check if duplicate_check else '未填写'}\n"
-                        f"     当前已问问题数: {len(self.questions_asked)}"
-                    )
-                    self._logger.warning(
-                        f"     已问问题参考: {self.questions_asked[-3:] if len(self.questions_asked) >= 3 else self.questions_asked}"
-                    )
-                    banned_questions.append(question)  # 记录本次被拒绝的问题
-                    if attempt < max_retries:
-                        self._logger.warning(
-                            f"     携带禁止问题重试（第{attempt + 2}次）..."
-                        )
-                        continue  # 重试
-                    else:
-                        self._logger.warning(f"     已达最大重试次数，跳过本轮提问")
-                        return ""
+【临床知识参考】
+{kb_context}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"""
 
-                # 成功得到非重复问题
-                if reason:
-                    self._logger.debug(f"  💡 问题目的: {reason}")
-                if duplicate_check:
-                    self._logger.debug(f"  ✓ 重复检查: {duplicate_check}")
-                return question
+    def _interview_messages(self) -> tuple[list[dict[str, str]], str]:
+        """把已有问答转为多轮消息（医生提问为 assistant，患者回答为 user）
 
-            except Exception as e:
-                self._logger.error(f"  ❌ 生成问题时出错: {e}")
-                return ""
+        Returns:
+            (历史消息, 最后一个回答的文本块)；最后一个回答不单独成消息，
+            而是放在本轮 user 消息开头、与进度信息合并，保证 user / assistant 交替
+        """
+        conversation_history = self.collected_info.get("conversation_history", [])
+        if conversation_history:
+            turns = [(conv.get("question", ""), conv.get("answer", "")) for conv in conversation_history]
+        else:
+            turns = [(q, "") for q in self.questions_asked]
+
+        def answer_block(answer: str) -> str:
+            if not answer:
+                return "患者回答：（未记录）\n\n"
+            return f"患者回答：{truncate_to_tokens(answer, self._HISTORY_ANSWER_TOKENS)}\n\n"
+
+        messages: list[dict[str, str]] = [{"role": "user", "content": "患者已进入诊室，请开始问诊。"}]
+        for i, (question, answer) in enumerate(turns):
+            messages.append({
+                "role": "assistant",
+                "content": json.dumps({"question": question}, ensure_ascii=False),
+            })
+            if i < len(turns) - 1:
+                messages.append({"role": "user", "content": answer_block(answer).rstrip()})
+        last_answer = answer_block(turns[-1][1]) if turns else ""
+        return messages, last_answer
+
+    @staticmethod
+    def _fit_history(messages: list[dict[str, str]], max_tokens: int) -> list[dict[str, str]]:
+        """历史消息超出 max_tokens 时从最早的问答轮次开始丢弃（保留开场消息）"""
+        messages = list(messages)
+        while len(messages) > 3 and count_message_tokens(messages) > max_tokens:
+            del messages[1:3]
+        return messages
 
-        return ""
-    
     def _should_stop_early(self) -> bool:
         """Python层面判断核心维度覆盖是否充分，提前终止问诊以避免凑问题。
 
@@ -585,7 +622,7 @@ class DoctorAgent:
 {chief_complaint}
 
 【问诊已收集的信息】
-{json.dumps(collected_info, ensure_ascii=False, indent=2)}
+{dumps_within(collected_info, self._COLLECTED_INFO_TOKENS)}
 
 【检查结果分析】
 🔴 异常项目 ({len(abnormal_results)}项)：
@@ -717,7 +754,7 @@ class DoctorAgent:
 {json.dumps(rule_out_list, ensure_ascii=False, indent=2)}
 
 【已收集的信息】
-{json.dumps(collected_info, ensure_ascii=False, indent=2)}
+{dumps_within(collected_info, self._COLLECTED_INFO_TOKENS)}
 
 【之前的提问】
 {asked_summary if asked_summary else "（尚未提问）"}
@@ -811,6 +848,8 @@ class DoctorAgent:
     def _is_duplicate_question(self, new_question: str) -> bool:
         """检测新问题是否与已问问题重复
         
+        已问问题的特征缓存在本次就诊的问题库中；RAG 嵌入模型已加载时同时比较语义相似度。
+        
         Args:
             new_question: 新生成的问题
             
@@ -819,60 +858,33 @@ class DoctorAgent:
         """
         if not new_question or not self.questions_asked:
             return False
-        
-        new_q = new_question.lower().strip("？?。. ")
-        
-        for asked_q in self.questions_asked:
-            asked_q_normalized = asked_q.lower().strip("？?。. ")
-            
-            # 1. 完全相同
-            if new_q == asked_q_normalized:
-                return True
-            
-            # 2. 高度相似（关键词重叠度检测）
-            # 提取核心关键词（去除常见助词和标点）
-            stop_words = {"的", "了", "吗", "呢", "啊", "您", "你", "有没有", "是不是", "还", "也", "都", "和", "或者", "以及"}
-            
-            def extract_keywords(text: str) -> set:
-                """提取关键词"""
-                import re
-                # 移除标点和空格
-                text = re.sub(r'[^\w]', ' ', text)
-                words = text.split()
-                # 过滤停用词和单字词（除了一些重要的单字）
-                important_single = {"痛", "疼", "麻", "红", "肿", "热", "冷", "晕", "吐", "泻"}
-                keywords = {w for w in words if w not in stop_words and (len(w) > 1 or w in important_single)}
-                return keywords
-            
-            new_keywords = extract_keywords(new_q)
-            asked_keywords = extract_keywords(asked_q_normalized)
-            
-            if not new_keywords or not asked_keywords:
-                continue
-            
-            # 计算关键词重叠度
-            overlap = new_keywords & asked_keywords
-            overlap_ratio = len(overlap) / min(len(new_keywords), len(asked_keywords))
-            
-            # 如果重叠度超过55%，认为是重复问题（阈值从0.7降至0.55，减少漏网）
-            if overlap_ratio > 0.55:
-                return True
-        
-        return False
+        return self._question_store.is_duplicate(new_question, embed=loaded_embedder(self._retriever))
     
     def process_patient_answer(self, question: str, answer: str) -> None:
         """处理患者的回答，更新收集的信息"""
+        self.record_answer(question, answer)
+        self.merge_extracted_info(self.extract_answer_info(question, answer))
+    
+    def record_answer(self, question: str, answer: str) -> None:
+        """记录已问问题；首问询问主诉时以回答作为初步主诉"""
         self.questions_asked.append(question)
+        self._question_store.add(question)
         
         # 如果是第一个问题且询问主诉，提取主诉
         if len(self.questions_asked) == 1 and any(keyword in question for keyword in ["哪里不舒服", "什么症状", "怎么了", "主诉"]):
             # 简单提取：将第一个回答作为初步主诉
             self.collected_info["chief_complaint"] = answer[:100]  # 限制长度
+    
+    def extract_answer_info(self, question: str, answer: str) -> dict[str, Any]:
+        """用LLM从回答中提取结构化信息（不修改医生状态，可在后台线程执行）
         
-        # 如果有LLM，使用LLM提取结构化信息
-        if self._llm is not None:
-            try:
-                system_prompt = f"""你是{self._dept_name()}医生，正在分析患者回答并提取关键信息。
+        Returns:
+            提取结果 {字段: 值}；无LLM或调用失败时为空字典
+        """
+        if self._llm is None:
+            return {}
+        try:
+            system_prompt = f"""你是{self._dept_name()}医生，正在分析患者回答并提取关键信息。
 
 【问题】
 {question}
@@ -893,33 +905,38 @@ class DoctorAgent:
 
 只提取回答中明确包含的信息，不要推测。
 """
-                
-                user_prompt = '输出JSON格式：{"extracted_info": {"duration": "...", "severity": "...", ...}}'
-                
-                obj, _, _ = self._llm.generate_json(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    fallback=lambda: {"extracted_info": {}},
-                    temperature=0.1
-                )
-                
-                extracted = obj.get("extracted_info", {})
-                # 合并到history
-                for key, value in extracted.items():
-                    if value and value != "N/A" and value != "不详":
-                        if key in ["associated_symptoms", "aggravating_factors", "relieving_factors"]:
-                            # 列表类型，追加
-                            if key not in self.collected_info["history"]:
-                                self.collected_info["history"][key] = []
-                            if isinstance(value, list):
-                                self.collected_info["history"][key].extend(value)
-                            else:
-                                self.collected_info["history"][key].append(value)
+            
+            user_prompt = '输出JSON格式：{"extracted_info": {"duration": "...", "severity": "...", ...}}'
+            
+            obj, _, _ = self._llm.generate_json(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                fallback=lambda: {"extracted_info": {}},
+                temperature=0.1
+            )
+            extracted = obj.get("extracted_info", {})
+            return extracted if isinstance(extracted, dict) else {}
+        except Exception:
+            return {}
+    
+    def merge_extracted_info(self, extracted: dict[str, Any]) -> None:
+        """将 extract_answer_info 的结果合并到 history"""
+        try:
+            for key, value in extracted.items():
+                if value and value != "N/A" and value != "不详":
+                    if key in ["associated_symptoms", "aggravating_factors", "relieving_factors"]:
+                        # 列表类型，追加
+                        if key not in self.collected_info["history"]:
+                            self.collected_info["history"][key] = []
+                        if isinstance(value, list):
+                            self.collected_info["history"][key].extend(value)
                         else:
-                            # 单值类型，覆盖
-                            self.collected_info["history"][key] = value
-            except Exception:
-                pass
+                            self.collected_info["history"][key].append(value)
+                    else:
+                        # 单值类型，覆盖
+                        self.collected_info["history"][key] = value
+        except Exception:
+            pass
     
     def assess_interview_quality(self) -> dict[str, Any]:
         """评估当前问诊质量，提供改进建议
@@ -1059,7 +1076,7 @@ class DoctorAgent:
         system_prompt = f"""你是{self._dept_name()}医生，需要根据问诊结果决定检查项目。
 
 【收集的信息】
-{json.dumps(self.collected_info, ensure_ascii=False, indent=2)}
+{dumps_within(self.collected_info, self._COLLECTED_INFO_TOKENS)}
 
 【检查指南】
 {kb_context}
@@ -1095,21 +1112,10 @@ class DoctorAgent:
             k=4
         )
         
-        kb_context = self._format_chunks(chunks)
-        
-        test_summary = json.dumps(test_results, ensure_ascii=False) if test_results else "尚无检查结果"
-        
+        # 诊断规则与输出格式对所有患者相同，放在 system 开头以命中服务端上下文缓存；
+        # 本患者的问诊信息、检查结果与诊疗指南放在 user 消息中
         system_prompt = f"""你是{self._dept_name()}医生，需要做出诊断并制定治疗方案。
 
-【问诊信息】
-{json.dumps(self.collected_info, ensure_ascii=False, indent=2)}
-
-【检查结果】
-{test_summary}
-
-【诊疗指南】
-{kb_context}
-
 【诊断要求 - 临床推理框架】
 
 ⚠️ **强制要求**：必须完成以下临床推理步骤，否则诊断质量不合格
@@ -1153,36 +1159,61 @@ class DoctorAgent:
 - 不要忽略矛盾的证据
 - 不要给出过度具体的诊断（如果证据不足）
 
-【任务】
-综合分析并给出诊断和治疗建议。
-"""
-        
-        user_prompt = '''输出JSON格式（必须包含完整的鉴别诊断推理）：
-{
-  "diagnosis": {
+输出JSON格式（必须包含完整的鉴别诊断推理）：
+{{
+  "diagnosis": {{
     "name": "一个明确的主要诊断名称",
     "confidence": "high/medium/low",
     "evidence": ["支持证据1", "支持证据2", "支持证据3"],
     "differential": [
-      {"disease": "鉴别诊断1", "support": "支持依据", "against": "排除理由"},
-      {"disease": "鉴别诊断2", "support": "支持依据", "against": "排除理由"},
-      {"disease": "鉴别诊断3", "support": "支持依据", "against": "排除理由"}
+      {{"disease": "鉴别诊断1", "support": "支持依据", "against": "排除理由"}},
+      {{"disease": "鉴别诊断2", "support": "支持依据", "against": "排除理由"}},
+      {{"disease": "鉴别诊断3", "support": "支持依据", "against": "排除理由"}}
     ],
     "reasoning": "为什么选择主诊断的推理过程（200-300字）",
     "uncertainty": "诊断中的不确定因素",
     "further_tests": ["建议的进一步检查"]
-  },
-  "treatment_plan": {
+  }},
+  "treatment_plan": {{
     "medications": ["用药1", "用药2"],
     "lifestyle": ["生活建议1"],
     "followup": "随访计划"
-  }
-}'''
+  }}
+}}
+"""
+        
+        # 问诊信息 > 检查结果 > 诊疗指南，按优先级分配扣除 system 提示词后的预算
+        parts = (
+            PromptBudget(reserved_tokens=count_tokens(system_prompt) + 100)
+            .add("info", json.dumps(self.collected_info, ensure_ascii=False, indent=2), priority=3, min_tokens=800)
+            .add_items(
+                "tests", [json.dumps(r, ensure_ascii=False) for r in test_results or []],
+                priority=2, min_tokens=400, max_item_tokens=400,
+            )
+            .add("kb", self._format_chunks(chunks, nested=True), priority=1)
+            .build()
+        )
+        
+        user_prompt = f"""【问诊信息】
+{parts["info"]}
+
+【检查结果】
+{parts["tests"] or "尚无检查结果"}
+
+【诊疗指南】
+{parts["kb"]}
+
+【任务】
+综合分析并给出诊断和治疗建议，按上述JSON格式输出（必须包含完整的鉴别诊断推理）。"""
         
         try:
             obj, _, _ = self._llm.generate_json(
                 system_prompt=system_prompt,
                 user_prompt=user_prompt,
+                fallback=lambda: {
+                    "diagnosis": {"name": "诊断失败", "confidence": "low", "differential": []},
+                    "treatment_plan": {"medications": [], "lifestyle": [], "followup": ""}
+                },
                 temperature=0.2
             )
             return obj
@@ -1201,16 +1232,16 @@ class DoctorAgent:
         }
         return dept_names.get(self.dept, "通用科室")
     
-    def _format_chunks(self, chunks: list[dict[str, Any]]) -> str:
-        """格式化RAG检索结果"""
+    def _format_chunks(self, chunks: list[dict[str, Any]], max_tokens: int | None = None,
+                       *, nested: bool = False) -> str:
+        """格式化RAG检索结果（去重后取前4条，单条 ≤ 320 tokens，整体 ≤ max_tokens；nested 见 PromptBudget）"""
         lines = []
-        for i, c in enumerate(chunks[:4], 1):
-            text = str(c.get("text", "")).strip()
-            # 保留完整信息，只在过长时截断（500字符）
-            if len(text) > 500:
-                text = text[:500] + "..."
+        for i, c in enumerate(dedupe_chunks(chunks)[:4], 1):
+            text = truncate_to_tokens(str(c.get("text", "")).strip(), 320)
             lines.append(f"{i}. [{c.get('doc_id')}] {text}")
-        return "\n".join(lines)
+        return PromptBudget(max_tokens or self._KB_CONTEXT_TOKENS, nested=nested).add_items(
+            "kb", lines, dedupe=False
+        ).build()["kb"]
     
     def get_interaction_summary(self) -> dict[str, Any]:
         """获取医生问诊摘要"""
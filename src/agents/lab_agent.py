@@ -5,6 +5,8 @@ import json
 from typing import Any
 
 from services.llm_client import LLMClient
+from services.lab_catalog import CaseExamIndex
+from utils import get_logger
 
 
 class LabAgent:
@@ -17,6 +19,7 @@ class LabAgent:
         """
         self._llm = llm
         self._processed_tests: list[dict[str, Any]] = []
+        self.logger = get_logger("hospital_agent.lab")
     
     def reset(self) -> None:
         """重置检验科状态（用于处理新患者）
@@ -103,51 +106,62 @@ class LabAgent:
         if not ordered_tests:
             return []
         
-        results = []
+        results: list[dict[str, Any] | None] = [None] * len(ordered_tests)
+        missing: list[int] = []  # 病例中没有现成结果的检查（下标）
         
-        for test_order in ordered_tests:
+        # 1. 优先从病例数据中查找现有结果（辅助检查文本只扫描一次）
+        exam_index = self._build_exam_index(case_data, [t.get("name", "") for t in ordered_tests])
+        for i, test_order in enumerate(ordered_tests):
             test_name = test_order.get("name", "")
             test_type = test_order.get("type", "lab")
-            
-            # 1. 优先从病例数据中查找现有结果
-            existing_result = self._find_existing_result(test_name, case_data)
-            
+            existing_result = exam_index.find(test_name) if test_name else None
             if existing_result:
                 # 使用病例中的真实结果
-                result = self._format_existing_result(test_name, test_type, existing_result)
-                results.append(result)
+                results[i] = self._format_existing_result(test_name, test_type, existing_result)
+            else:
+                missing.append(i)
+        
+        # 2. 病例中没有的检查，使用LLM一次性批量生成
+        if missing:
+            if self._llm:
+                generated = self._generate_results_with_llm_batch(
+                    tests=[ordered_tests[i] for i in missing],
+                    chief_complaint=chief_complaint,
+                    case_data=case_data,
+                    physical_state=physical_state,
+                    existing_results=existing_results or []
+                )
+                for i, generated_result in zip(missing, generated):
+                    results[i] = generated_result
             else:
-                # 2. 如果病例中没有，使用LLM生成结果
-                if self._llm:
-                    generated_result = self._generate_result_with_llm(
-                        test_name=test_name,
-                        test_type=test_type,
-                        chief_complaint=chief_complaint,
-                        case_data=case_data,
-                        physical_state=physical_state,
-                        existing_results=existing_results or []
-                    )
-                    results.append(generated_result)
-                else:
+                for i in missing:
+                    test_name = ordered_tests[i].get("name", "")
                     # 没有现成结果，生成一个空结果
                     self.logger.warning(f"⚠️  {test_name} 无法生成结果")
-                    results.append({
+                    results[i] = {
                         "test_name": test_name,
-                        "type": test_type,
+                        "type": ordered_tests[i].get("type", "lab"),
                         "result": "检查未完成",
                         "abnormal": False,
                         "summary": "检查未完成"
-                    })
+                    }
         
         # 记录处理的检查
         self._processed_tests.extend(results)
         
         return results
     
+    @staticmethod
+    def _build_exam_index(case_data: dict[str, Any], test_names: list[str]) -> CaseExamIndex:
+        """辅助检查文本的检查名称索引（每次处理检查单构建一次）"""
+        return CaseExamIndex((case_data or {}).get("辅助检查", ""), test_names)
+    
     def _find_existing_result(self, test_name: str, case_data: dict[str, Any]) -> str | None:
         """
         从病例数据中查找现有的检查结果
         
+        检查名称的多种写法、段落截取规则见 services.lab_catalog。
+        
         Args:
             test_name: 检查名称
             case_data: 病例数据
@@ -155,63 +169,9 @@ class LabAgent:
         Returns:
             检查结果文本，如果没有则返回None
         """
-        if not case_data:
-            return None
-        
-        # 从辅助检查字段中查找
-        case_info = case_data.get("辅助检查", "")
-        if not case_info:
+        if not case_data or not case_data.get("辅助检查"):
             return None
-        
-        # 定义检查名称的多种可能写法（映射表）
-        test_name_variants = {
-            "血常规": ["血常规", "血细胞分析", "全血细胞计数", "CBC"],
-            "尿常规": ["尿常规", "尿液分析", "尿检"],
-            "肝功能": ["肝功能", "肝功", "肝酶", "转氨酶"],
-            "肾功能": ["肾功能", "肾功", "肌酐", "尿素氮"],
-            "血糖": ["血糖", "空腹血糖", "餐后血糖", "GLU"],
-            "CT": ["CT", "计算机断层扫描", "电子计算机断层扫描"],
-            "MRI": ["MRI", "核磁共振", "磁共振成像"],
-            "X光": ["X光", "X线", "胸片", "X-ray"],
-            "心电图": ["心电图", "ECG", "EKG"],
-            "B超": ["B超", "超声", "超声检查", "彩超"],
-            "胃镜": ["胃镜", "上消化道内镜", "食管胃十二指肠镜"],
-            "肠镜": ["肠镜", "结肠镜", "纤维结肠镜"],
-        }
-        
-        # 获取该检查的所有变体名称
-        variants = test_name_variants.get(test_name, [test_name])
-        
-        # 搜索匹配的检查结果
-        for variant in variants:
-            # 在病例信息中查找该检查名称
-            if variant in case_info:
-                # 提取该检查的结果段落
-                start_idx = case_info.find(variant)
-                
-                # 寻找结果的结束位置（下一个检查项目或段落）
-                end_markers = [
-                    "\n\n", "。\n", "。 ", 
-                    "诊断：", "治疗：", "讨论：",
-                    "血常规", "尿常规", "肝功能", "肾功能", 
-                    "CT", "MRI", "X光", "心电图", "B超"
-                ]
-                
-                end_idx = start_idx + 500  # 默认最多提取500字符
-                remaining = case_info[start_idx:]
-                
-                for marker in end_markers:
-                    pos = remaining.find(marker, len(variant) + 1)  # 从检查名称后开始找
-                    if pos != -1 and start_idx + pos < end_idx:
-                        end_idx = start_idx + pos
-                
-                result_text = case_info[start_idx:end_idx].strip()
-                
-                # 确保提取的文本包含实际结果（不只是检查名称）
-                if len(result_text) > len(variant) + 5:  # 至少比名称多5个字符
-                    return result_text
-        
-        return None
+        return self._build_exam_index(case_data, [test_name]).find(test_name)
     
     def _format_existing_result(
         self, 
@@ -255,29 +215,13 @@ class LabAgent:
             "timestamp": None,  # 可以从病例中提取时间
         }
     
-    def _generate_result_with_llm(
+    def _build_generation_context(
         self,
-        test_name: str,
-        test_type: str,
-        chief_complaint: str,
         case_data: dict[str, Any],
         physical_state: dict[str, Any] | None,
         existing_results: list[dict[str, Any]]
-    ) -> dict[str, Any]:
-        """
-        使用LLM生成检查结果
-        
-        Args:
-            test_name: 检查名称
-            test_type: 检查类型
-            chief_complaint: 患者主诉
-            case_data: 病例数据
-            physical_state: 患者物理状态
-            existing_results: 已有的检查结果
-            
-        Returns:
-            生成的检查结果字典
-        """
+    ) -> str:
+        """生成检查结果所需的病例背景、物理状态与已有结果摘要"""
         # 构建上下文信息
         case_summary = self._extract_case_summary(case_data)
         
@@ -308,10 +252,15 @@ class LabAgent:
                 for sign, value in vital_signs.items():
                     physical_summary += f"- {sign}: {value:.1f}\n"
         
-        # 根据检查类型和名称构建专业的检验报告格式指导
-        report_templates = self._get_report_template(test_name, test_type)
-        
-        system_prompt = f"""你是一名资深的医学检验科主任，拥有20年临床检验经验。你的任务是根据患者的临床信息，生成专业、逼真、符合医学规范的检查结果。
+        return f"""【病例背景】
+{case_summary}
+{physical_summary}
+{existing_summary}"""
+    
+    @staticmethod
+    def _generation_system_prompt(report_templates: str) -> str:
+        """生成检查结果的 system 提示词（report_templates 为各检查的报告格式模板）"""
+        return f"""你是一名资深的医学检验科主任，拥有20年临床检验经验。你的任务是根据患者的临床信息，生成专业、逼真、符合医学规范的检查结果。
 
 【检查类型与报告规范】
 {report_templates}
@@ -330,16 +279,57 @@ class LabAgent:
 - 内镜检查：需包含【观察部位 + 黏膜描述 + 病变特征 + 病理提示】
 - 异常结果：必须在summary中用1-2句话突出关键异常点及临床意义
 """
+    
+    @staticmethod
+    def _llm_result(obj: dict[str, Any], test_name: str, test_type: str) -> dict[str, Any]:
+        """LLM 输出 → 检查结果字典（补齐必需字段）"""
+        return {
+            "test_name": obj.get("test_name", test_name),
+            "test": test_name,
+            "type": test_type,
+            "result": obj.get("result", ""),
+            "abnormal": obj.get("abnormal", False),
+            "summary": obj.get("summary", ""),
+            "key_findings": obj.get("key_findings", []),
+            "clinical_significance": obj.get("clinical_significance", ""),
+            "source": "llm_generated",  # 标记来源
+            "timestamp": None,
+        }
+    
+    def _generate_result_with_llm(
+        self,
+        test_name: str,
+        test_type: str,
+        chief_complaint: str,
+        case_data: dict[str, Any],
+        physical_state: dict[str, Any] | None,
+        existing_results: list[dict[str, Any]]
+    ) -> dict[str, Any]:
+        """
+        使用LLM生成检查结果
+        
+        Args:
+            test_name: 检查名称
+            test_type: 检查类型
+            chief_complaint: 患者主诉
+            case_data: 病例数据
+            physical_state: 患者物理状态
+            existing_results: 已有的检查结果
+            
+        Returns:
+            生成的检查结果字典
+        """
+        background = self._build_generation_context(case_data, physical_state, existing_results)
+        
+        # 根据检查类型和名称构建专业的检验报告格式指导
+        system_prompt = self._generation_system_prompt(self._get_report_template(test_name, test_type))
         
         user_prompt = f"""【患者临床信息】
 检查项目：{test_name}
 检查类型：{test_type}
 患者主诉：{chief_complaint}
 
-【病例背景】
-{case_summary}
-{physical_summary}
-{existing_summary}
+{background}
 
 【任务要求】
 请严格按照上述【检查类型与报告规范】中的格式模板，生成该检查的详细结果报告。输出必须为严格的JSON格式：
@@ -372,7 +362,7 @@ class LabAgent:
 请严格按照报告格式模板生成专业、真实的检查报告。"""
         
         try:
-            obj, raw_text, finish_reason = self._llm.generate_json(
+            obj, _, _ = self._llm.generate_json(
                 system_prompt=system_prompt,
                 user_prompt=user_prompt,
                 fallback=lambda: {
@@ -385,22 +375,7 @@ class LabAgent:
                 },
                 temperature=0.3  # 适中温度，保证结果合理性
             )
-            
-            # 确保包含必需字段
-            result = {
-                "test_name": obj.get("test_name", test_name),
-                "test": test_name,
-                "type": test_type,
-                "result": obj.get("result", ""),
-                "abnormal": obj.get("abnormal", False),
-                "summary": obj.get("summary", ""),
-                "key_findings": obj.get("key_findings", []),
-                "clinical_significance": obj.get("clinical_significance", ""),
-                "source": "llm_generated",  # 标记来源
-                "timestamp": None,
-            }
-            
-            return result
+            return self._llm_result(obj, test_name, test_type)
             
         except Exception as e:
             self.logger.error(f"❌ LLM生成检查结果失败: {e}")
@@ -413,6 +388,137 @@ class LabAgent:
                 "source": "error"
             }
     
+    def _generate_results_with_llm_batch(
+        self,
+        tests: list[dict[str, Any]],
+        chief_complaint: str,
+        case_data: dict[str, Any],
+        physical_state: dict[str, Any] | None,
+        existing_results: list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        """
+        一次LLM调用生成多项检查结果（JSON 数组，与 tests 顺序一致）
+        
+        批量结果中缺失或格式不对的项目逐项调用 _generate_result_with_llm 补齐。
+        
+        Args:
+            tests: 需要生成结果的检查列表
+            chief_complaint: 患者主诉
+            case_data: 病例数据
+            physical_state: 患者物理状态
+            existing_results: 已有的检查结果
+            
+        Returns:
+            与 tests 一一对应的检查结果列表
+        """
+        names = [str(t.get("name", "")) for t in tests]
+        types = [str(t.get("type", "lab")) for t in tests]
+        if len(tests) == 1:
+            return [self._generate_result_with_llm(
+                test_name=names[0],
+                test_type=types[0],
+                chief_complaint=chief_complaint,
+                case_data=case_data,
+                physical_state=physical_state,
+                existing_results=existing_results
+            )]
+        
+        # 相同的报告模板只给一次（如多项检验共用通用实验室格式）
+        templates: dict[str, list[str]] = {}
+        for name, test_type in zip(names, types):
+            templates.setdefault(self._get_report_template(name, test_type), []).append(name)
+        report_templates = "\n\n".join(
+            f"▶ 适用于：{'、'.join(group)}\n{template}" for template, group in templates.items()
+        )
+        system_prompt = self._generation_system_prompt(report_templates)
+        
+        test_list = "\n".join(
+            f"{i}. {name}（检查类型：{test_type}）" for i, (name, test_type) in enumerate(zip(names, types), 1)
+        )
+        background = self._build_generation_context(case_data, physical_state, existing_results)
+        user_prompt = f"""【患者临床信息】
+检查项目（共{len(tests)}项）：
+{test_list}
+患者主诉：{chief_complaint}
+
+{background}
+
+【任务要求】
+请严格按照上述【检查类型与报告规范】中各检查对应的格式模板，逐项生成详细结果报告，各项结果之间应相互一致。
+输出必须为严格的JSON格式，results 按上面的编号顺序每项一条，test_name 与检查项目名称完全一致：
+
+{{
+  "results": [
+    {{
+      "test_name": "检查项目名称",
+      "result": "完整的检查结果描述（必须严格遵循对应的报告格式模板，包含所有必需项目、具体数值、单位、参考范围）",
+      "abnormal": true/false,
+      "summary": "关键发现摘要（1-2句话，用通俗语言说明主要异常及临床意义）",
+      "key_findings": ["关键异常1", "关键异常2", "..."],
+      "clinical_significance": "该结果对诊断的提示意义"
+    }}
+  ]
+}}
+
+【关键要求】
+1. result字段必须完全按照上述报告格式模板生成，不得简化或省略
+2. 实验室检查(lab)：每个指标必须包含【检测值 单位 箭头标记 (参考范围)】
+3. 影像学检查(imaging)：必须包含【检查所见 + 病灶描述 + 印象/诊断】
+4. 功能检查(functional)：必须包含【波形/节律描述 + 数值指标 + 诊断结论】
+5. 内镜检查(endoscopy)：必须包含【各部位观察 + 病灶详细描述 + 内镜诊断】
+
+【异常判断标准】
+- 若患者有明显症状（如发热、疼痛、出血），相关检查应显示异常
+- 异常程度应与症状严重度匹配（轻症→轻度异常，重症→显著异常）
+- 多个相关指标应协同变化（不要只有一个指标异常）
+
+【正常结果要求】
+- 即使正常也要给出具体数值，不能只写"正常"或"未见异常"
+- 数值应在参考范围中段（如WBC写6.5而非4.1或9.9）
+
+请严格按照报告格式模板生成专业、真实的检查报告。"""
+        
+        entries: list[Any] = []
+        try:
+            obj, _, _ = self._llm.generate_json(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                fallback=lambda: {"results": []},
+                temperature=0.3,  # 适中温度，保证结果合理性
+                max_tokens=min(8000, 800 * len(tests) + 200)
+            )
+            entries = obj.get("results") or []
+            if not isinstance(entries, list):
+                entries = []
+        except Exception as e:
+            self.logger.error(f"❌ LLM批量生成检查结果失败: {e}")
+        
+        # 按名称对应；名称对不上但条数一致时按顺序对应
+        by_name = {
+            str(entry.get("test_name", "")).strip(): entry
+            for entry in entries if isinstance(entry, dict)
+        }
+        positional = len(entries) == len(tests)
+        results: list[dict[str, Any]] = []
+        for i, (name, test_type) in enumerate(zip(names, types)):
+            entry = by_name.get(name)
+            if entry is None and positional and isinstance(entries[i], dict):
+                entry = entries[i]
+            if entry is not None and entry.get("result"):
+                entry = dict(entry, test_name=name)
+                results.append(self._llm_result(entry, name, test_type))
+            else:
+                self.logger.debug(f"  批量结果缺少 {name}，单独生成")
+                results.append(self._generate_result_with_llm(
+                    test_name=name,
+                    test_type=test_type,
+                    chief_complaint=chief_complaint,
+                    case_data=case_data,
+                    physical_state=physical_state,
+                    existing_results=existing_results
+                ))
+        return results
+    
     def _extract_case_summary(self, case_data: dict[str, Any]) -> str:
         """
         从病例数据中提取摘要信息
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 from services.llm_client import LLMClient
+from services.question_store import QuestionStore
 
 
 class NurseAgent:
@@ -18,16 +19,18 @@ class NurseAgent:
             llm: 语言模型客户端（必需，用于智能分诊）
         """
         self._llm = llm
+        # 分诊追问的去重特征（70%以上关键词重叠视为相似问题）
+        self._question_store = QuestionStore(keyword_threshold=0.7)
     
     def reset(self) -> None:
         """重置分诊历史（用于处理新患者）
         
-        NurseAgent目前为无状态设计，每次分诊独立处理，不保存历史记录。
-        提供此方法是为了保持接口一致性，未来如果需要添加状态管理时方便扩展。
+        NurseAgent的分诊本身无状态，每次分诊独立处理，不保存历史记录；
+        只有追问去重用的问题库按就诊缓存，在此清空。
         
         多患者处理时会自动调用此方法确保状态隔离。
         """
-        pass
+        self._question_store.clear()
     
     def triage(self, patient_description: str) -> str:
         """
@@ -139,7 +142,9 @@ class NurseAgent:
         return "neurology"
 
     def _is_duplicate_question(self, new_question: str, conversation_history: list[dict[str, str]]) -> bool:
-        """检查新问题是否与之前的问题重复（简单的字符串相似度检查）
+        """检查新问题是否与之前的问题重复
+        
+        对话历史中的问题只在首次出现时计算一次特征，缓存在本次就诊的问题库中。
         
         Args:
             new_question: 新问题
@@ -151,22 +156,5 @@ class NurseAgent:
         if not conversation_history:
             return False
         
-        # 简单的关键词检查
-        new_q_clean = new_question.lower().strip("？?。.！!")
-        for qa in conversation_history:
-            old_q_clean = qa["question"].lower().strip("？?。.！!")
-            
-            # 如果新问题和旧问题有80%以上的相似度，认为是重复
-            if new_q_clean == old_q_clean:
-                return True
-            
-            # 检查是否包含相同的关键词组
-            new_words = set(new_q_clean.split())
-            old_words = set(old_q_clean.split())
-            if len(new_words) > 2 and len(old_words) > 2:
-                overlap = len(new_words & old_words)
-                similarity = overlap / min(len(new_words), len(old_words))
-                if similarity > 0.7:  # 70%以上重叠认为是相似问题
-                    return True
-        
-        return False
+        self._question_store.sync([qa.get("question", "") for qa in conversation_history])
+        return self._question_store.is_duplicate(new_question)
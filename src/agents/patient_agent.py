@@ -4,12 +4,17 @@ from __future__ import annotations
 import json
 from typing import Any
 
-from services.llm_client import LLMClient
+from services.llm_client import LLMClient, stop_after_sentences
 
 
 class PatientAgent:
     """患者智能体：只知道自己的症状和基本信息，不知道检查结果"""
     
+    # 对话历史轮数上限（超出时丢弃较早的一半）
+    _MAX_HISTORY_TURNS = 20
+    # 单次回答的句数上限（流式接收时满足后即断开，不再等待多余输出）
+    _MAX_REPLY_SENTENCES = 4
+    
     def __init__(self, known_case: dict[str, Any], llm: LLMClient, chief_complaint: str = ""):
         """
         Args:
@@ -65,7 +70,8 @@ class PatientAgent:
             raise ValueError("结构化病例字段为空，无法创建患者智能体")
         
         self.llm = llm
-        self._recent_context: list[dict[str, str]] = []  # 仅保留最近5轮用于生成自然回答
+        self._recent_context: list[dict[str, str]] = []  # 问答历史（作为多轮消息发送）
+        self._respond_system_prompt = self._build_respond_system_prompt()
     
     def reset(self) -> None:
         """重置患者对话状态（用于处理新对话或重新开始问诊）
@@ -154,21 +160,14 @@ class PatientAgent:
     def respond_to_doctor(self, doctor_question: str, physical_state: dict[str, Any] | None = None) -> str:
         """根据病例信息回答医生的问题（完全使用LLM，受物理状态影响）
         
+        提示词按服务端上下文缓存的前缀匹配规则组织：
+        system（回答规则 + 病情，整个问诊不变）→ 之前各轮医生提问/患者回答（只追加）
+        → 本轮提问（物理状态与回答风格附在提问之后）。
+        
         Args:
             doctor_question: 医生的问题
             physical_state: 患者当前物理状态快照（energy_level, pain_level等）
         """
-        # 构建对话历史上下文（仅最近5轮）
-        history_context = ""
-        if self._recent_context:
-            history_lines = []
-            for turn in self._recent_context:
-                history_lines.append(f"医生：{turn['doctor']}")
-                history_lines.append(f"患者：{turn['patient']}")
-            history_context = "\n".join(history_lines)
-        else:
-            history_context = "（首次问诊）"
-        
         # 根据物理状态调整回答策略
         state_instruction = ""
         response_style = "正常、完整地"
@@ -177,10 +176,10 @@ class PatientAgent:
             energy_level = physical_state.get("energy_level", 10)
             
             if pain_level > 7:
-                state_instruction = f"\n\n【身体状态】你正感到剧烈疼痛（{pain_level}/10），很难集中注意力，说话时会不自觉地皱眉或捂住疼痛部位。回答要简短，可能会说一半停下来喘口气。表达时可以说'哎呦...好疼'、'我...我说不太清楚'等。"
+                state_instruction = f"【身体状态】你正感到剧烈疼痛（{pain_level}/10），很难集中注意力，说话时会不自觉地皱眉或捂住疼痛部位。回答要简短，可能会说一半停下来喘口气。表达时可以说'哎呦...好疼'、'我...我说不太清楚'等。"
                 response_style = "简短、断断续续地"
             elif pain_level > 4:
-                state_instruction = f"\n\n【身体状态】你感到明显的疼痛或不适（{pain_level}/10），有些难受，说话时可能会皱眉，回答相对简短。"
+                state_instruction = f"【身体状态】你感到明显的疼痛或不适（{pain_level}/10），有些难受，说话时可能会皱眉，回答相对简短。"
                 response_style = "稍微简短地"
             
             if energy_level < 3:
@@ -189,14 +188,46 @@ class PatientAgent:
             elif energy_level < 6:
                 state_instruction += f"\n你感到疲劳（体力{energy_level}/10），不太想多说话，回答倾向简洁。"
         
-        system_prompt = f"""你是一位真实的患者，正在医院接受医生问诊。你对自己的病情感到担心。你没有医学专业知识，是一个普通人。
-
-【你的真实病情】
-{self.case_info}
-
-【之前的对话】
-{history_context}
-{state_instruction}
+        # 历史轮次只保存医生原问题，本轮的状态说明附在问题之后，
+        # 下一轮请求与本轮请求的公共前缀一直延伸到本轮问题文本
+        turn_instruction = f"\n\n{state_instruction.strip()}" if state_instruction else ""
+        user_prompt = (
+            f"医生问：{doctor_question}{turn_instruction}\n\n"
+            f"请{response_style}回答医生的问题，记住：你是患者，不是医生。"
+        )
+        
+        # 使用LLM生成回答
+        response = self.llm.generate_text(
+            system_prompt=self._respond_system_prompt,
+            messages=self._history_messages(),
+            user_prompt=user_prompt,
+            temperature=0.7,
+            max_tokens=150,
+            stop=stop_after_sentences(self._MAX_REPLY_SENTENCES),
+        )
+        answer = response.strip()
+        
+        # 追加到对话历史；超出上限时一次丢弃较早的一半，其余轮次前缀保持不变
+        self._recent_context.append({
+            "doctor": doctor_question,
+            "patient": answer
+        })
+        if len(self._recent_context) > self._MAX_HISTORY_TURNS:
+            del self._recent_context[:len(self._recent_context) // 2]
+        
+        return answer
+    
+    def _history_messages(self) -> list[dict[str, str]]:
+        """之前的问答轮次（医生提问为 user，患者回答为 assistant）"""
+        messages: list[dict[str, str]] = []
+        for turn in self._recent_context:
+            messages.append({"role": "user", "content": f"医生问：{turn['doctor']}"})
+            messages.append({"role": "assistant", "content": turn["patient"]})
+        return messages
+    
+    def _build_respond_system_prompt(self) -> str:
+        """回答医生提问的 system 提示词（回答规则在前、病情在后，问诊全程不变）"""
+        return f"""你是一位真实的患者，正在医院接受医生问诊。你对自己的病情感到担心。你没有医学专业知识，是一个普通人。
 
 【回答原则】
 1. **非专业特征**：
@@ -222,7 +253,8 @@ class PatientAgent:
    - 如果医生问的是具体身体部位的专业名词，你应该不回答
 
 5. **回答风格**：
-   - {response_style}回答医生的问题
+   - 按每次提问后给出的要求（正常、简短或有气无力）回答医生的问题
+   - 如果提问后附有【身体状态】，回答要体现这种状态
    - 符合第一人称患者口吻，给人交流感
    - 不要一次说太多，像真实聊天一样一句一句说
    - 如果不确定，可以表现出犹豫：“唔...这个...”、“我想想...”
@@ -244,30 +276,8 @@ class PatientAgent:
 医生：请介绍你的病情情况。
 患者：唔...医生，我也不知道从哪儿说起，你问吧，我跟你说。
 
-现在医生问：{doctor_question}
-
-请{response_style}回答医生的问题，记住：你是患者，不是医生。"""
-        
-        user_prompt = f"医生问：{doctor_question}\n\n患者回答："
-        
-        # 使用LLM生成回答
-        response = self.llm.generate_text(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=0.7,
-            max_tokens=150
-        )
-        answer = response.strip()
-        
-        # 更新最近上下文（仅保留最近5轮）
-        self._recent_context.append({
-            "doctor": doctor_question,
-            "patient": answer
-        })
-        if len(self._recent_context) > 5:
-            self._recent_context.pop(0)
-        
-        return answer
+【你的真实病情】
+{self.case_info}"""
     
     def get_conversation_summary(self) -> dict[str, Any]:
         """获取对话摘要（简化版）"""
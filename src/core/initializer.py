@@ -1,15 +1,17 @@
-"""系统核心组件初始化器"""
+"""系统核心组件初始化器
+
+LLM 客户端、检索器、业务服务、病例库等依赖较重（httpx / Chroma / SQLAlchemy 等），
+在对应的 initialize_* 方法内按需导入，导入本模块本身保持轻量。
+"""
 
 import logging
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from services.llm_client import build_llm_client
-from graphs.router import default_retriever, build_services
-from rag import DummyRetriever
 from utils import get_logger
 from config import Config
-from integration import get_coordinator, get_medical_record_service
 
 
 logger = get_logger("hospital_agent.initializer")
@@ -21,11 +23,13 @@ class SystemInitializer:
     def __init__(self, config: Config):
         self.config = config
         self.components: Dict[str, Any] = {}
+        self._rag_warmup_thread: Optional[threading.Thread] = None
+        self._rag_warmup_result: Dict[str, Any] = {}
     
     def initialize_logging(self) -> None:
         """初始化日志系统"""
         from utils import setup_console_logging
-        from logging_utils import create_run_metrics_logs
+        from logging_utils import create_run_metrics_logs, configure_node_tracing, configure_patient_detail_logging
         
         console_level = logging.DEBUG if self.config.system.verbose else logging.INFO
         setup_console_logging(console_level=console_level)
@@ -35,10 +39,20 @@ class SystemInitializer:
         logging.getLogger("httpx").setLevel(logging.WARNING)
         logging.getLogger("httpcore").setLevel(logging.WARNING)
 
+        configure_patient_detail_logging(
+            jsonl=self.config.system.patient_log_jsonl,
+            max_open_files=self.config.system.patient_log_max_open_files,
+        )
+
         # 每次运行初始化独立的三类指标日志文件
         metrics_log_paths = create_run_metrics_logs()
         self.components["metrics_log_paths"] = metrics_log_paths
         logger.info(f"📊 指标日志目录: {metrics_log_paths['run_dir']}")
+
+        # 图节点追踪：逐节点墙钟耗时 / LLM tokens / 检索 / 锁等待，span 导出到运行目录
+        span_path = configure_node_tracing(Path(metrics_log_paths["run_dir"]) / "node_spans.jsonl")
+        if span_path:
+            self.components["node_spans_path"] = span_path
     
     def initialize_llm(self) -> Any:
         """初始化大语言模型
@@ -46,9 +60,16 @@ class SystemInitializer:
         Returns:
             LLM客户端实例
         """
+        from services.llm_client import build_llm_client
+        from services.prompt_budget import configure_prompt_budget
+
         logger.info(f"🤖 初始化 LLM ({self.config.llm.backend})")
+        configure_prompt_budget(
+            max_tokens=self.config.llm.prompt_token_budget,
+            encoding=self.config.llm.tokenizer_encoding,
+        )
         try:
-            llm_client = build_llm_client(self.config.llm.backend)
+            llm_client = build_llm_client(self.config.llm.backend, stream=self.config.llm.stream)
             self.components['llm'] = llm_client
             return llm_client
         except Exception as e:
@@ -102,12 +123,71 @@ class SystemInitializer:
             logger.error(f"❌ Adaptive RAG 初始化失败：{e}")
             raise
     
+    def start_rag_warmup(self, retriever: Any) -> bool:
+        """后台预热检索器（加载嵌入模型、并行打开各向量库），与后续初始化并行进行
+
+        Returns:
+            是否已启动预热
+        """
+        if not self.config.rag.warmup or not hasattr(retriever, "warm_up"):
+            return False
+        start = time.perf_counter()
+
+        def run() -> None:
+            try:
+                self._rag_warmup_result = retriever.warm_up()
+            except Exception as e:
+                self._rag_warmup_result = {"error": str(e)}
+            self._rag_warmup_result["wall_ms"] = (time.perf_counter() - start) * 1000
+
+        self._rag_warmup_thread = threading.Thread(target=run, name="rag-warmup", daemon=True)
+        self._rag_warmup_thread.start()
+        logger.info("🔥 后台预热嵌入模型与向量库")
+        return True
+
+    def wait_for_rag_ready(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """就绪屏障：等待检索器预热完成（调度患者前调用），并输出预热耗时
+
+        预热失败或超时不阻止运行，首次检索时仍会按需加载。
+
+        Returns:
+            预热结果（未启动预热时为空字典）
+        """
+        thread = self._rag_warmup_thread
+        if thread is None:
+            return {}
+        timeout = self.config.rag.warmup_timeout if timeout is None else timeout
+        wait_start = time.perf_counter()
+        thread.join(timeout)
+        waited_ms = (time.perf_counter() - wait_start) * 1000
+        if thread.is_alive():
+            logger.warning(f"⚠️  检索器预热 {timeout:.0f}s 内未完成，继续调度患者（首次检索可能较慢）")
+            return {}
+
+        result = self._rag_warmup_result
+        if "error" in result:
+            logger.warning(f"⚠️  检索器预热失败：{result['error']}")
+            return result
+        dbs = result.get("dbs", {})
+        ready = sum(1 for info in dbs.values() if info.get("ok"))
+        logger.info(
+            f"✅ 检索器就绪: 预热 {result.get('wall_ms', 0) / 1000:.1f}s"
+            f"（嵌入模型 {result.get('embeddings_ms', 0) / 1000:.1f}s，向量库 {ready}/{len(dbs)}），"
+            f"屏障等待 {waited_ms / 1000:.1f}s"
+        )
+        for name, info in dbs.items():
+            status = f"{info.get('count', 0)} 条" if info.get("ok") else "未加载"
+            logger.debug(f"   → {name}: {info.get('ms', 0):.0f}ms, {status}")
+        return result
+
     def initialize_business_services(self) -> Any:
         """初始化业务服务（预约、计费）
         
         Returns:
             业务服务集合
         """
+        from graphs.router import build_services
+
         logger.info("💼 初始化业务服务")
         services = build_services()
         self.components['services'] = services
@@ -122,6 +202,8 @@ class SystemInitializer:
         Returns:
             病例库服务实例
         """
+        from integration import get_medical_record_service
+
         logger.info("📋 初始化病例库")
         medical_record_service = get_medical_record_service(
             config=self.config,
@@ -146,6 +228,8 @@ class SystemInitializer:
         Returns:
             协调器实例
         """
+        from integration import get_coordinator
+
         logger.info("🏥 初始化协调器")
         coordinator = get_coordinator(medical_record_service=medical_record_service)
         self.components['coordinator'] = coordinator
@@ -0,0 +1,197 @@
+"""启动耗时剖析 - 基于 `python -X importtime` 的分子系统导入耗时统计
+
+在全新的子进程中导入 CLI 入口模块（默认 main），解析 -X importtime 输出，
+按顶层包（rag / services / graphs / environment / 第三方库 ...）汇总自身导入耗时，
+并检查重依赖（LangGraph、Chroma、pandas、SQLAlchemy、httpx 等）是否被提前加载。
+
+用法：
+    python -m core.startup_profile                  # 打印分子系统耗时表
+    python -m core.startup_profile --check          # 超出预算或提前加载重依赖时退出码为 1
+    python -m core.startup_profile --budget-ms 600 --top 30
+
+预算默认取 STARTUP_BUDGET_MS 环境变量，未设置时为 DEFAULT_BUDGET_MS。
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+# 入口模块导入耗时预算（毫秒，取多次运行的最小值比较）
+DEFAULT_BUDGET_MS = 300.0
+
+# 只应在真正使用时才加载的重依赖（顶层包名）
+HEAVY_MODULES = (
+    "langgraph",
+    "langchain_core",
+    "langchain_chroma",
+    "chromadb",
+    "sentence_transformers",
+    "torch",
+    "pandas",
+    "pyarrow",
+    "sqlalchemy",
+    "httpx",
+    "tiktoken",
+    "opentelemetry",
+)
+
+SRC_ROOT = Path(__file__).resolve().parent.parent
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+@dataclass
+class StartupProfile:
+    """一次启动剖析的结果"""
+
+    target: str
+    total_ms: float
+    by_package: Dict[str, float] = field(default_factory=dict)
+    top_modules: List[tuple] = field(default_factory=list)
+    loaded_packages: List[str] = field(default_factory=list)
+
+    @property
+    def heavy_loaded(self) -> List[str]:
+        return [name for name in HEAVY_MODULES if name in self.loaded_packages]
+
+
+def _local_packages() -> set:
+    """src 目录下的本项目顶层包 / 模块名"""
+    names = set()
+    for path in SRC_ROOT.iterdir():
+        if path.is_dir() and not path.name.startswith((".", "__")):
+            names.add(path.name)
+        elif path.suffix == ".py":
+            names.add(path.stem)
+    return names
+
+
+def parse_importtime(stderr: str) -> tuple:
+    """解析 -X importtime 输出
+
+    Returns:
+        (按顶层包汇总的自身耗时 ms, [(模块, 自身 ms, 累计 ms), ...], 总耗时 ms)
+    """
+    by_package: Dict[str, float] = {}
+    modules: List[tuple] = []
+    total_us = 0
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        self_us = int(self_us)
+        package = module.split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + self_us / 1000
+        modules.append((module, self_us / 1000, int(cumulative_us) / 1000))
+        total_us += self_us
+    return by_package, modules, total_us / 1000
+
+
+def profile_startup(target: str = "main", python: Optional[str] = None) -> StartupProfile:
+    """在全新子进程中导入 target 并剖析导入耗时"""
+    code = (
+        f"import {target}, sys, json; "
+        "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_ROOT), env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(SRC_ROOT), env=env, capture_output=True, text=True, encoding="utf-8",
+    )
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"导入 {target} 失败:\n" + "\n".join(errors[-20:]))
+    by_package, modules, total_ms = parse_importtime(proc.stderr)
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return StartupProfile(
+        target=target,
+        total_ms=total_ms,
+        by_package=by_package,
+        top_modules=modules,
+        loaded_packages=loaded,
+    )
+
+
+def format_profile(profile: StartupProfile, top: int = 15) -> str:
+    """生成分子系统耗时表"""
+    local = _local_packages()
+    lines = [
+        f"⏱️  启动导入耗时: import {profile.target} = {profile.total_ms:.1f} ms",
+        f"{'子系统/包':<28}{'类型':<8}{'自身ms':>10}{'占比':>8}",
+        "-" * 54,
+    ]
+    rows = sorted(profile.by_package.items(), key=lambda kv: kv[1], reverse=True)
+    for package, ms in rows[:top]:
+        kind = "项目" if package in local else "依赖"
+        share = ms / profile.total_ms if profile.total_ms else 0.0
+        lines.append(f"{package:<30}{kind:<8}{ms:>10.1f}{share:>9.0%}")
+    if len(rows) > top:
+        rest = sum(ms for _, ms in rows[top:])
+        lines.append(f"{'（其余 %d 个）' % (len(rows) - top):<30}{'':<8}{rest:>10.1f}")
+    lines.append("-" * 54)
+    lines.append("最慢模块（自身耗时）:")
+    for module, self_ms, cumulative_ms in profile.top_modules[:10]:
+        lines.append(f"  {module:<48}{self_ms:>8.1f} ms（累计 {cumulative_ms:.1f}）")
+    heavy = profile.heavy_loaded
+    lines.append(f"提前加载的重依赖: {', '.join(heavy) if heavy else '无'}")
+    return "\n".join(lines)
+
+
+def check_budget(
+    target: str = "main",
+    budget_ms: Optional[float] = None,
+    runs: int = 3,
+) -> tuple:
+    """检查启动导入是否超出预算（取多次运行的最小值，降低抖动）
+
+    Returns:
+        (是否通过, 最快一次的 StartupProfile, 问题列表)
+    """
+    if budget_ms is None:
+        budget_ms = float(os.environ.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+    profiles = [profile_startup(target) for _ in range(max(1, runs))]
+    best = min(profiles, key=lambda p: p.total_ms)
+    problems = []
+    if best.total_ms > budget_ms:
+        problems.append(f"导入耗时 {best.total_ms:.1f} ms 超出预算 {budget_ms:.0f} ms")
+    if best.heavy_loaded:
+        problems.append(f"启动时提前加载了重依赖: {', '.join(best.heavy_loaded)}")
+    return not problems, best, problems
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="启动导入耗时剖析")
+    parser.add_argument("--target", default="main", help="要剖析的入口模块（默认 main）")
+    parser.add_argument("--top", type=int, default=15, help="表中显示的包数量")
+    parser.add_argument("--check", action="store_true", help="检查耗时预算与重依赖，失败时退出码为 1")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help=f"耗时预算（默认 $STARTUP_BUDGET_MS 或 {DEFAULT_BUDGET_MS:.0f}）")
+    parser.add_argument("--runs", type=int, default=3, help="--check 时的运行次数（取最小值）")
+    args = parser.parse_args(argv)
+
+    if not args.check:
+        print(format_profile(profile_startup(args.target), top=args.top))
+        return 0
+
+    ok, profile, problems = check_budget(args.target, args.budget_ms, args.runs)
+    print(format_profile(profile, top=args.top))
+    for problem in problems:
+        print(f"❌ {problem}")
+    if ok:
+        print("✅ 启动耗时在预算内")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
 """输出格式化 - 格式化诊断结果和日志输出"""
 
+from __future__ import annotations
+
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any
 from utils import get_logger
-from state.schema import BaseState
+from logging_utils import format_node_trace_table, flush_patient_detail_logs
 from display.log_formatter import get_patient_color
 
+if TYPE_CHECKING:
+    from state.schema import BaseState
+
 logger = get_logger("hospital_agent.output")
 
 
@@ -107,6 +112,10 @@ def display_final_statistics(results: List[Dict[str, Any]], num_patients: int) -
         failed_count = len(results) - success_count
         logger.info(f"\n✅ 成功: {success_count}/{len(results)} | ❌ 失败: {failed_count}/{len(results)}")
 
+    node_table = format_node_trace_table()
+    if node_table:
+        logger.info("\n" + node_table)
+
 
 def display_log_files(num_results: int) -> None:
     """显示日志文件路径
@@ -114,6 +123,7 @@ def display_log_files(num_results: int) -> None:
     Args:
         num_results: 结果数量
     """
+    flush_patient_detail_logs()  # 后台写线程可能尚未写完
     patient_logs = sorted(
         Path("logs/patients").glob("*.log"),
         key=lambda x: x.stat().st_mtime,
@@ -1,18 +1,43 @@
 """
 医院物理环境模拟系统 - 基于 ScienceWorld 思想
+
+子模块按需加载：首次访问导出名时才导入对应子模块（PEP 562）。
 """
-from .hospital_world import HospitalWorld, Location, Equipment, PhysicalState
-from .command_system import CommandParser, InteractiveSession
-from .staff_tracker import StaffTracker
-from .simulation_clock import SimulationClock
-
-__all__ = [
-    'HospitalWorld',
-    'Location',
-    'Equipment',
-    'PhysicalState',
-    'CommandParser',
-    'InteractiveSession',
-    'StaffTracker',
-    'SimulationClock',
-]
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .hospital_world import HospitalWorld, Location, Equipment, PhysicalState
+    from .command_system import CommandParser, InteractiveSession
+    from .staff_tracker import StaffTracker
+    from .simulation_clock import SimulationClock
+    from .route_table import RouteTable
+
+_LAZY_IMPORTS = {
+    'HospitalWorld': '.hospital_world',
+    'Location': '.hospital_world',
+    'Equipment': '.hospital_world',
+    'PhysicalState': '.hospital_world',
+    'CommandParser': '.command_system',
+    'InteractiveSession': '.command_system',
+    'StaffTracker': '.staff_tracker',
+    'SimulationClock': '.simulation_clock',
+    'RouteTable': '.route_table',
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
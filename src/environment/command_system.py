@@ -211,9 +211,10 @@ class SmartHintSystem:
             hints.append("💡 你可以向医生描述症状，或进行体格检查")
         
         # 2. 可用设备提示
+        location_equipment = self.world.get_equipment_at(location_id)
         available_equipment = [
-            eq for eq in self.world.equipment.values()
-            if eq.location_id == location_id and eq.can_use(self.world.current_time)
+            eq for eq in location_equipment
+            if eq.can_use(self.world.current_time)
         ]
         if available_equipment:
             eq_names = [eq.name for eq in available_equipment[:3]]
@@ -221,8 +222,8 @@ class SmartHintSystem:
         
         # 3. 排队提示
         busy_equipment = [
-            eq for eq in self.world.equipment.values()
-            if eq.location_id == location_id and not eq.can_use(self.world.current_time)
+            eq for eq in location_equipment
+            if not eq.can_use(self.world.current_time)
         ]
         if busy_equipment:
             for eq in busy_equipment[:2]:
@@ -4,12 +4,20 @@
 """
 from __future__ import annotations
 
-import random
-import threading
+import heapq
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
+from .lock_monitor import TrackedLock
+from .physiology_engine import (
+    CONSCIOUSNESS_CODES,
+    DEFAULT_VITALS,
+    PhysiologyEngine,
+    Symptom,
+    VitalSign,
+)
+from .route_table import RouteTable
 from .simulation_clock import SimulationClock
 
 
@@ -42,6 +50,94 @@ class QueueEntry:
         return self.enqueue_time < other.enqueue_time  # 相同优先级按时间
 
 
+class EquipmentQueue:
+    """设备优先级队列 - 二叉堆 + 患者索引
+    
+    - push / remove: O(log n)（remove 为惰性删除，堆顶清理时摊还）
+    - contains / len: O(1)
+    - peek: 摊还 O(log n)
+    迭代按出队顺序（优先级、入队时间、入队序号）返回 QueueEntry。
+    """
+    
+    def __init__(self, entries: Optional[List[QueueEntry]] = None):
+        self._heap: List[Tuple[int, datetime, int, QueueEntry]] = []
+        self._index: Dict[str, Tuple[int, datetime, int, QueueEntry]] = {}  # patient_id -> 堆元素
+        self._seq = 0
+        for entry in entries or []:
+            self.push(entry)
+    
+    def push(self, entry: QueueEntry) -> bool:
+        """入队；患者已在队列中时返回 False"""
+        if entry.patient_id in self._index:
+            return False
+        item = (entry.priority, entry.enqueue_time, self._seq, entry)
+        self._seq += 1
+        self._index[entry.patient_id] = item
+        heapq.heappush(self._heap, item)
+        return True
+    
+    def remove(self, patient_id: str) -> Optional[QueueEntry]:
+        """移除患者（惰性删除），返回被移除的条目"""
+        item = self._index.pop(patient_id, None)
+        if item is None:
+            return None
+        self._prune()
+        return item[3]
+    
+    def _prune(self):
+        """清理堆顶已被移除的元素"""
+        heap = self._heap
+        while heap and self._index.get(heap[0][3].patient_id) is not heap[0]:
+            heapq.heappop(heap)
+        # 惰性删除过多时重建堆，避免堆无限膨胀
+        if len(heap) > 2 * len(self._index) + 16:
+            self._heap = list(self._index.values())
+            heapq.heapify(self._heap)
+    
+    def peek(self) -> Optional[QueueEntry]:
+        """查看队首（最高优先级）条目"""
+        self._prune()
+        return self._heap[0][3] if self._heap else None
+    
+    def pop(self) -> Optional[QueueEntry]:
+        """弹出队首条目"""
+        entry = self.peek()
+        if entry is not None:
+            self.remove(entry.patient_id)
+        return entry
+    
+    def position(self, patient_id: str) -> Optional[int]:
+        """患者在队列中的位置（0 表示队首），不在队列中返回 None；O(n) 计数，无需排序"""
+        item = self._index.get(patient_id)
+        if item is None:
+            return None
+        key = item[:3]
+        return sum(1 for other in self._index.values() if other[:3] < key)
+    
+    def __contains__(self, patient_id: str) -> bool:
+        return patient_id in self._index
+    
+    def __len__(self) -> int:
+        return len(self._index)
+    
+    def __bool__(self) -> bool:
+        return bool(self._index)
+    
+    def __iter__(self) -> Iterator[QueueEntry]:
+        return (item[3] for item in sorted(self._index.values()))
+    
+    def __repr__(self) -> str:
+        return f"EquipmentQueue({[entry.patient_id for entry in self]})"
+    
+    def __getitem__(self, position: int) -> QueueEntry:
+        if position == 0:
+            entry = self.peek()
+            if entry is None:
+                raise IndexError("queue is empty")
+            return entry
+        return list(self)[position]
+
+
 @dataclass
 class Equipment:
     """医疗设备 - 增强版，支持优先级队列、状态管理、预约系统"""
@@ -53,7 +149,7 @@ class Equipment:
     is_occupied: bool = False
     occupied_until: Optional[datetime] = None
     current_patient: Optional[str] = None  # 当前正在使用的患者ID
-    queue: List[QueueEntry] = field(default_factory=list)  # 优先级队列
+    queue: EquipmentQueue = field(default_factory=EquipmentQueue)  # 优先级队列（堆 + 患者索引）
     status: str = "available"  # available, occupied, maintenance, offline
     maintenance_until: Optional[datetime] = None  # 维护结束时间
     daily_usage_count: int = 0  # 当天使用次数
@@ -94,7 +190,7 @@ class Equipment:
         self.daily_usage_count += 1
         
         # 从队列中移除
-        self.queue = [entry for entry in self.queue if entry.patient_id != patient_id]
+        self.queue.remove(patient_id)
     
     def finish_exam(self, current_time: datetime) -> Optional[str]:
         """结束检查（如果时间到了），返回完成检查的患者ID"""
@@ -110,24 +206,20 @@ class Equipment:
     def add_to_queue(self, patient_id: str, priority: int = 5, current_time: datetime = None):
         """加入优先级队列"""
         # 检查是否已在队列
-        for entry in self.queue:
-            if entry.patient_id == patient_id:
-                return  # 已经在队列中
+        if patient_id in self.queue:
+            return  # 已经在队列中
         
         entry = QueueEntry(
             patient_id=patient_id,
             priority=priority,
             enqueue_time=current_time or datetime.now()
         )
-        self.queue.append(entry)
-        # 按优先级排序
-        self.queue.sort()
+        self.queue.push(entry)
     
     def get_next_patient(self) -> Optional[str]:
         """获取下一个应该检查的患者（最高优先级）"""
-        if self.queue:
-            return self.queue[0].patient_id
-        return None
+        entry = self.queue.peek()
+        return entry.patient_id if entry else None
     
     def get_wait_time(self, current_time: datetime, patient_id: str = None) -> int:
         """获取预计等待时间（分钟）"""
@@ -146,11 +238,7 @@ class Equipment:
         
         # 计算队列中该患者前面的等待时间
         if patient_id:
-            patient_position = None
-            for i, entry in enumerate(self.queue):
-                if entry.patient_id == patient_id:
-                    patient_position = i
-                    break
+            patient_position = self.queue.position(patient_id)
             
             if patient_position is not None:
                 # 只计算前面的人
@@ -183,172 +271,153 @@ class Equipment:
     
     def has_patient_in_queue(self, patient_id: str) -> bool:
         """检查患者是否在队列中"""
-        return any(entry.patient_id == patient_id for entry in self.queue)
+        return patient_id in self.queue
     
     def __contains__(self, patient_id: str) -> bool:
         """支持 'patient_id in equipment.queue' 语法（实际检查queue中的患者）"""
         return self.has_patient_in_queue(patient_id)
 
 
-@dataclass
-class Symptom:
-    """症状数据类 - Level 3 增强"""
-    name: str
-    severity: float = 5.0  # 0-10，浮点数更精确
-    trend: str = "stable"  # improving, stable, worsening
-    onset_time: datetime = field(default_factory=datetime.now)
-    last_update: datetime = field(default_factory=datetime.now)
-    progression_rate: float = 0.1  # 每小时变化率
-    treated: bool = False  # 是否已治疗
-    treatment_effectiveness: float = 0.0  # 治疗有效性 0-1
-    
-    def progress(self, hours: float):
-        """症状随时间演变"""
-        if self.treated:
-            # 治疗后症状改善
-            change = -self.progression_rate * self.treatment_effectiveness * hours
-        else:
-            # 未治疗时可能恶化
-            if self.severity > 7:
-                # 严重症状更容易恶化，确保恶化
-                change = self.progression_rate * hours * 1.5
-            elif self.severity > 4:
-                # 中度症状：轻微恶化或保持稳定
-                change = random.uniform(0.0, 0.2) * hours
-            else:
-                # 轻度症状可能自然波动（包括轻微改善）
-                change = random.uniform(-0.1, 0.3) * hours
-        
-        old_severity = self.severity
-        self.severity = max(0.0, min(10.0, self.severity + change))
-        
-        # 更新趋势
-        if self.severity > old_severity + 0.5:
-            self.trend = "worsening"
-        elif self.severity < old_severity - 0.5:
-            self.trend = "improving"
-        else:
-            self.trend = "stable"
-        
-        self.last_update = datetime.now()
-    
-    def apply_treatment(self, effectiveness: float = 0.8):
-        """应用治疗"""
-        self.treated = True
-        self.treatment_effectiveness = effectiveness
-
-
-@dataclass
-class VitalSign:
-    """生命体征数据类 - Level 3 增强"""
-    name: str
-    value: float
-    unit: str
-    normal_range: tuple[float, float]  # (min, max)
-    last_measured: datetime = field(default_factory=datetime.now)
-    history: List[tuple[datetime, float]] = field(default_factory=list)  # 历史记录
-    
-    def is_normal(self) -> bool:
-        """检查是否在正常范围"""
-        return self.normal_range[0] <= self.value <= self.normal_range[1]
-    
-    def get_status(self) -> str:
-        """获取状态描述"""
-        if self.value < self.normal_range[0]:
-            deviation = abs(self.value - self.normal_range[0]) / self.normal_range[0] * 100
-            if deviation > 20:
-                return "严重偏低"
-            elif deviation > 10:
-                return "偏低"
-            else:
-                return "略低"
-        elif self.value > self.normal_range[1]:
-            deviation = abs(self.value - self.normal_range[1]) / self.normal_range[1] * 100
-            if deviation > 20:
-                return "严重偏高"
-            elif deviation > 10:
-                return "偏高"
-            else:
-                return "略高"
-        return "正常"
-    
-    def update(self, new_value: float, current_time: datetime):
-        """更新生命体征"""
-        self.history.append((self.last_measured, self.value))
-        # 保留最近24小时的记录
-        cutoff = current_time - timedelta(hours=24)
-        self.history = [(t, v) for t, v in self.history if t >= cutoff]
-        
-        self.value = new_value
-        self.last_measured = current_time
-    
-    def simulate_change(self, hours: float, symptoms: Dict[str, Symptom]):
-        """根据症状模拟生命体征变化"""
-        # 简单模拟：症状越严重，生命体征越可能异常
-        total_severity = sum(s.severity for s in symptoms.values())
-        
-        if total_severity > 20:  # 多个重症状
-            # 向异常方向漂移
-            if random.random() > 0.5:
-                change = random.uniform(0.5, 2.0) * hours
-            else:
-                change = random.uniform(-2.0, -0.5) * hours
-        else:
-            # 轻微波动
-            change = random.uniform(-0.5, 0.5) * hours
-        
-        new_value = self.value + change
-        self.update(new_value, datetime.now())
-
-
-@dataclass
 class PhysicalState:
     """物理状态 - Level 3 增强版：动态生理模拟
     
     支持患者和医护人员的物理状态建模：
     - 患者：完整的生理状态（症状、生命体征、体力等）
     - 医护人员：工作状态（体力、工作负荷、连续工作时间）
+    
+    症状、生命体征、体力、疼痛与意识等数值保存在 PhysiologyEngine 的数组中，
+    本对象只是其中一行的视图；多个患者共享同一引擎时可由 HospitalWorld 一次性向量化推进。
     """
-    patient_id: str
-    vital_signs: Dict[str, VitalSign] = field(default_factory=dict)  # 生命体征（患者）
-    symptoms: Dict[str, Symptom] = field(default_factory=dict)  # 症状（患者）
-    last_update: Optional[datetime] = None  # 最后更新时间
-    energy_level: float = 10.0  # 体力水平 0-10
-    pain_level: float = 0.0  # 疼痛水平 0-10（患者）
-    consciousness_level: str = "alert"  # alert, drowsy, unconscious
-    diagnosis: Optional[str] = None  # 诊断（患者）
-    medications: List[Dict] = field(default_factory=list)  # 药物列表（患者）
-    treatments: List[Dict] = field(default_factory=list)  # 治疗记录
-    
-    # 【新增】医护人员专属属性
-    agent_type: str = "patient"  # patient, doctor, nurse, lab_technician
-    work_load: float = 0.0  # 工作负荷 0-10（医护人员）
-    consecutive_work_minutes: int = 0  # 连续工作时长（分钟）
-    patients_served_today: int = 0  # 今日服务患者数（医护人员）
-    last_rest_time: Optional[datetime] = None  # 上次休息时间
-    
-    def __post_init__(self):
-        """初始化默认生命体征"""
-        if self.last_update is None:
-            self.last_update = datetime.now()
-            
-        if not self.vital_signs:
-            self.vital_signs = {
-                "heart_rate": VitalSign("心率", 75.0, "次/分", (60, 100)),
-                "blood_pressure_systolic": VitalSign("收缩压", 120.0, "mmHg", (90, 140)),
-                "blood_pressure_diastolic": VitalSign("舒张压", 80.0, "mmHg", (60, 90)),
-                "temperature": VitalSign("体温", 36.5, "℃", (36.0, 37.5)),
-                "respiratory_rate": VitalSign("呼吸频率", 16.0, "次/分", (12, 20)),
-                "oxygen_saturation": VitalSign("血氧饱和度", 98.0, "%", (95, 100)),
-            }
+    
+    def __init__(
+        self,
+        patient_id: str,
+        vital_signs: Optional[Dict[str, float]] = None,
+        symptoms: Optional[Dict[str, float]] = None,
+        last_update: Optional[datetime] = None,
+        energy_level: float = 10.0,
+        pain_level: float = 0.0,
+        consciousness_level: str = "alert",
+        diagnosis: Optional[str] = None,
+        medications: Optional[List[Dict]] = None,
+        treatments: Optional[List[Dict]] = None,
+        agent_type: str = "patient",
+        work_load: float = 0.0,
+        consecutive_work_minutes: int = 0,
+        patients_served_today: int = 0,
+        last_rest_time: Optional[datetime] = None,
+        engine: Optional[PhysiologyEngine] = None,
+    ):
+        """
+        Args:
+            patient_id: 智能体ID
+            vital_signs: 初始生命体征 {key: value}，未提供时使用默认体征
+            symptoms: 初始症状 {name: severity}
+            engine: 共享的生理引擎；未提供时创建私有引擎（单独使用时）
+        """
+        self.patient_id = patient_id
+        self._engine = engine if engine is not None else PhysiologyEngine()
+        self._row_id = self._engine.add_patient(
+            last_update or datetime.now(),
+            with_default_vitals=not vital_signs,
+        )
+        self._generation = int(self._engine.row_generation[self._row_id])
+        self._vital_views: Dict[str, VitalSign] = {}
+        self._symptom_views: Dict[str, Symptom] = {}
+        
+        if vital_signs:
+            for name, value in vital_signs.items():
+                self.update_vital_sign(name, value)
+        else:
+            for key in DEFAULT_VITALS:
+                self._vital_views[key] = VitalSign(self._engine, self._row, self._engine.vital_col[key])
+        for name, severity in (symptoms or {}).items():
+            self.add_symptom(name, severity)
+        
+        self.energy_level = energy_level
+        self.pain_level = pain_level
+        self.consciousness_level = consciousness_level
+        self.diagnosis = diagnosis  # 诊断（患者）
+        self.medications: List[Dict] = medications if medications is not None else []  # 药物列表（患者）
+        self.treatments: List[Dict] = treatments if treatments is not None else []  # 治疗记录
+        
+        # 【新增】医护人员专属属性
+        self.agent_type = agent_type  # patient, doctor, nurse, lab_technician
+        self.work_load = work_load  # 工作负荷 0-10（医护人员）
+        self.consecutive_work_minutes = consecutive_work_minutes  # 连续工作时长（分钟）
+        self.patients_served_today = patients_served_today  # 今日服务患者数（医护人员）
+        self.last_rest_time = last_rest_time  # 上次休息时间
+    
+    # ===== 引擎数组视图 =====
+    
+    @property
+    def _row(self) -> int:
+        """本患者在引擎中的行号（release() 之后访问抛出 ReleasedRowError）"""
+        self._engine.check_row(self._row_id, self._generation)
+        return self._row_id
+    
+    @property
+    def released(self) -> bool:
+        """是否已归还引擎行"""
+        return int(self._engine.row_generation[self._row_id]) != self._generation
+    
+    @property
+    def vital_signs(self) -> Dict[str, VitalSign]:
+        """生命体征（患者）"""
+        return self._vital_views
+    
+    @property
+    def symptoms(self) -> Dict[str, Symptom]:
+        """症状（患者）"""
+        return self._symptom_views
+    
+    @property
+    def energy_level(self) -> float:
+        """体力水平 0-10"""
+        return float(self._engine.energy[self._row])
+    
+    @energy_level.setter
+    def energy_level(self, value: float):
+        with self._engine._lock:
+            self._engine.energy[self._row] = value
+    
+    @property
+    def pain_level(self) -> float:
+        """疼痛水平 0-10（患者）"""
+        return float(self._engine.pain[self._row])
+    
+    @pain_level.setter
+    def pain_level(self, value: float):
+        with self._engine._lock:
+            self._engine.pain[self._row] = value
+    
+    @property
+    def consciousness_level(self) -> str:
+        """意识水平：alert, drowsy, unconscious"""
+        return CONSCIOUSNESS_CODES[int(self._engine.consciousness[self._row])]
+    
+    @consciousness_level.setter
+    def consciousness_level(self, value: str):
+        with self._engine._lock:
+            self._engine.consciousness[self._row] = CONSCIOUSNESS_CODES.index(value)
+    
+    @property
+    def last_update(self) -> datetime:
+        """最后更新时间"""
+        return datetime.fromtimestamp(self._engine.last_update[self._row])
+    
+    @last_update.setter
+    def last_update(self, value: datetime):
+        with self._engine._lock:
+            self._engine.last_update[self._row] = value.timestamp()
     
     def add_symptom(self, name: str, severity: float = 5.0, progression_rate: float = 0.1):
         """添加症状"""
-        self.symptoms[name] = Symptom(
-            name=name,
-            severity=severity,
-            progression_rate=progression_rate
-        )
+        if name in self._symptom_views:
+            # 同名症状重新添加时替换原槽位
+            self._engine.remove_symptom(self._symptom_views[name]._slot)
+        slot = self._engine.add_symptom(self._row, name, severity, progression_rate)
+        self._symptom_views[name] = Symptom(self._engine, self._row, slot, name)
     
     def update_symptom(self, name: str, severity: float):
         """更新症状严重程度
@@ -372,109 +441,34 @@ class PhysicalState:
         if name in self.vital_signs:
             self.vital_signs[name].update(value, datetime.now())
         else:
-            # 如果不存在，创建新的生命体征（使用默认范围）
-            default_ranges = {
-                "heart_rate": (60, 100),
-                "blood_pressure_systolic": (90, 140),
-                "blood_pressure_diastolic": (60, 90),
-                "temperature": (36.0, 37.5),
-                "respiratory_rate": (12, 20),
-                "oxygen_saturation": (95, 100),
-            }
-            
-            default_units = {
-                "heart_rate": "次/分",
-                "blood_pressure_systolic": "mmHg",
-                "blood_pressure_diastolic": "mmHg",
-                "temperature": "℃",
-                "respiratory_rate": "次/分",
-                "oxygen_saturation": "%",
-            }
-            
-            unit = default_units.get(name, "")
-            normal_range = default_ranges.get(name, (0, 100))
-            
-            self.vital_signs[name] = VitalSign(name, value, unit, normal_range)
+            # 如果不存在，创建新的生命体征（默认体征沿用标准范围，其他使用 (0, 100)）
+            display_name, _default_value, unit, normal_range = DEFAULT_VITALS.get(
+                name, (name, value, "", (0, 100))
+            )
+            col = self._engine.add_vital(self._row, name, display_name, value, unit, normal_range)
+            self.vital_signs[name] = VitalSign(self._engine, self._row, col)
     
     def update_physiology(self, current_time: datetime):
-        """更新生理状态 - 核心动态模拟方法"""
-        elapsed_hours = (current_time - self.last_update).total_seconds() / 3600
-        
-        if elapsed_hours < 0.1:  # 至少10分钟更新一次
-            return
-        
-        # 1. 症状演变
-        for symptom in self.symptoms.values():
-            symptom.progress(elapsed_hours)
-        
-        # 2. 生命体征变化
-        for vital_sign in self.vital_signs.values():
-            vital_sign.simulate_change(elapsed_hours, self.symptoms)
-        
-        # 3. 体力消耗
-        # 症状越严重，体力消耗越快
-        total_severity = sum(s.severity for s in self.symptoms.values())
-        energy_loss = elapsed_hours * (1 + total_severity / 50)
-        self.energy_level = max(0.0, self.energy_level - energy_loss)
-        
-        # 4. 疼痛水平计算
-        pain_symptoms = ["疼痛", "头痛", "腹痛", "胸痛", "关节痛"]
-        self.pain_level = sum(
-            self.symptoms[s].severity 
-            for s in pain_symptoms 
-            if s in self.symptoms
-        ) / len(pain_symptoms) if pain_symptoms else 0.0
-        
-        # 5. 意识水平评估
-        self.assess_consciousness()
-        
-        # 6. 检查危急状态
-        self.check_critical_condition()
-        
-        self.last_update = current_time
+        """更新生理状态 - 核心动态模拟方法（仅推进本患者所在行）"""
+        self._engine.step(current_time, rows=[self._row])
+    
+    def release(self):
+        """归还引擎中的患者行（患者离开物理世界时调用，可重复调用）
+
+        之后访问生理数值（包括此前取得的 Symptom / VitalSign）会抛出 ReleasedRowError，
+        不会读写复用该行的其他患者的数据。
+        """
+        with self._engine._lock:
+            if not self.released:
+                self._engine.remove_patient(self._row_id)
     
     def assess_consciousness(self):
         """评估意识水平"""
-        # 基于生命体征和症状评估
-        vital_abnormalities = sum(
-            1 for vs in self.vital_signs.values() 
-            if not vs.is_normal()
-        )
-        
-        severe_symptoms = sum(
-            1 for s in self.symptoms.values() 
-            if s.severity > 8
-        )
-        
-        if vital_abnormalities >= 3 or severe_symptoms >= 2:
-            self.consciousness_level = "drowsy"
-        elif vital_abnormalities >= 4 or severe_symptoms >= 3:
-            self.consciousness_level = "unconscious"
-        else:
-            self.consciousness_level = "alert"
+        self._engine.assess_consciousness(self._row)
     
     def check_critical_condition(self) -> bool:
         """检查是否处于危急状态"""
-        # 检查生命体征是否危急
-        critical_vitals = []
-        
-        hr = self.vital_signs.get("heart_rate")
-        if hr and (hr.value < 40 or hr.value > 150):
-            critical_vitals.append("心率异常")
-        
-        bp_sys = self.vital_signs.get("blood_pressure_systolic")
-        if bp_sys and (bp_sys.value < 80 or bp_sys.value > 180):
-            critical_vitals.append("血压异常")
-        
-        temp = self.vital_signs.get("temperature")
-        if temp and (temp.value < 35.0 or temp.value > 40.0):
-            critical_vitals.append("体温异常")
-        
-        o2 = self.vital_signs.get("oxygen_saturation")
-        if o2 and o2.value < 90:
-            critical_vitals.append("血氧过低")
-        
-        return len(critical_vitals) > 0
+        return self._engine.is_critical(self._row)
     
     def apply_medication(self, medication: str, effectiveness: float = 0.8):
         """应用药物治疗"""
@@ -629,10 +623,26 @@ class PhysicalState:
 class HospitalWorld:
     """医院世界环境 - 物理空间模拟"""
     
-    def __init__(self, start_time: datetime = None):
-        """初始化医院世界"""
-        # ===== 线程安全：添加可重入锁保护共享状态 =====
-        self._lock = threading.RLock()
+    def __init__(self, start_time: datetime = None, lock_striping: bool = True):
+        """初始化医院世界
+        
+        Args:
+            start_time: 模拟起始时间（默认当天 08:00）
+            lock_striping: 是否启用分段锁；False 时所有资源共用一把全局锁（用于基准对比）
+        """
+        # ===== 线程安全：分段锁 =====
+        # _lock 仅保护结构性变更（路由表、科室注册等）；
+        # 设备按检查类型、医生资源池按科室各自加锁；
+        # 智能体位置采用写时复制快照，读取无需加锁；模拟时钟由 SimulationClock 原子推进。
+        self.lock_striping = lock_striping
+        self._lock = TrackedLock("world")
+        self._agents_lock = self._make_lock("agents")
+        self._equipment_locks: Dict[str, TrackedLock] = {}  # exam_type -> lock
+        self._dept_locks: Dict[str, TrackedLock] = {}  # dept -> lock
+        self._equipment_lock_groups: List[Tuple[TrackedLock, List[Equipment]]] = []
+        # 设备索引：按检查类型 / 位置分组，设备选择无需遍历全部设备
+        self._equipment_by_type: Dict[str, List[Equipment]] = {}
+        self._equipment_by_location: Dict[str, List[Equipment]] = {}
 
         # ===== Tick-based 模拟时钟（取代裸 datetime 字段）=====
         # 全局时钟驱动共享资源调度；个人时钟独立统计每位患者的有效就诊时长。
@@ -686,10 +696,19 @@ class HospitalWorld:
         # 定义允许的移动路径（有向图）
         # 按照真实就医流程设计：大厅→分诊→候诊→诊室→检验/收费→药房→大厅
         # allowed_moves 将在 _build_hospital() 中根据 Location.connected_to 自动构建
+        self._allowed_moves: Dict[str, List[str]] = {}
+        # 走廊步行耗时（分钟）：{(from, to): minutes}，未配置的走廊使用默认 0.5 分钟
+        self.corridor_minutes: Dict[Tuple[str, str], float] = {}
+        # 全源最短路径路由表（惰性构建，allowed_moves 变化时失效）
+        self._route_table: Optional[RouteTable] = None
         
         self.equipment: Dict[str, Equipment] = {}
+        # 智能体位置与生理状态：写时复制（写入时替换整个字典），读取方拿到的永远是一致快照
         self.agents: Dict[str, str] = {}  # agent_id -> location_id
+        self._agents_by_location: Dict[str, Tuple[str, ...]] = {}  # location_id -> agent_ids
         self.physical_states: Dict[str, PhysicalState] = {}
+        # 向量化生理引擎：所有患者的生理数值以结构数组保存，每个 tick 一次性推进
+        self.physiology = PhysiologyEngine(lock=self._make_lock("physiology"))
         self.event_log: List[Dict] = []  # 事件日志
         
         # ===== 性能优化：缓存和限制 =====
@@ -713,6 +732,7 @@ class HospitalWorld:
         self.doctor_pool: Dict[str, Dict[str, Dict]] = {}
         # 患者-医生映射
         self.patient_doctor_map: Dict[str, str] = {}  # patient_id -> doctor_id
+        self._doctor_dept: Dict[str, str] = {}  # doctor_id -> dept
         # 患者ID到数据集ID的映射（用于日志显示）
         self.patient_dataset_map: Dict[str, int] = {}  # patient_id -> dataset_id
         
@@ -730,6 +750,138 @@ class HospitalWorld:
         """资源调度时间（设备/队列/预约等）。"""
         return self.sim_clock.resource_datetime
 
+    # ─── 分段锁 ────────────────────────────────────────────────────────────────
+    def _make_lock(self, name: str) -> TrackedLock:
+        """创建分段锁；未启用分段锁时退化为全局锁"""
+        return TrackedLock(name) if self.lock_striping else self._lock
+
+    def _equipment_lock(self, exam_type: str) -> TrackedLock:
+        """获取某检查类型设备组的锁"""
+        lock = self._equipment_locks.get(exam_type)
+        if lock is None:
+            with self._lock:
+                lock = self._equipment_locks.get(exam_type)
+                if lock is None:
+                    lock = self._make_lock(f"equipment:{exam_type}")
+                    self._equipment_locks[exam_type] = lock
+        return lock
+
+    def _dept_lock(self, dept: str) -> TrackedLock:
+        """获取某科室医生资源池的锁"""
+        lock = self._dept_locks.get(dept)
+        if lock is None:
+            with self._lock:
+                lock = self._dept_locks.get(dept)
+                if lock is None:
+                    lock = self._make_lock(f"dept:{dept}")
+                    self._dept_locks[dept] = lock
+        return lock
+
+    def _all_locks(self) -> List[TrackedLock]:
+        """所有不重复的锁（未启用分段锁时只有全局锁）"""
+        locks = [self._lock, self._agents_lock, *self._equipment_locks.values(), *self._dept_locks.values()]
+        unique: Dict[int, TrackedLock] = {}
+        for lock in locks:
+            unique.setdefault(id(lock), lock)
+        return list(unique.values())
+
+    def get_lock_contention_report(self) -> List[Dict]:
+        """获取锁竞争报告（每把锁的获取次数、竞争次数与等待时长）"""
+        return [lock.stats() for lock in self._all_locks()]
+
+    def reset_lock_stats(self):
+        """清零所有锁的竞争统计"""
+        for lock in self._all_locks():
+            lock.reset_stats()
+
+    def _set_agent_location(self, agent_id: str, location_id: str) -> Optional[str]:
+        """写时复制地更新智能体位置及位置索引，返回原位置"""
+        with self._agents_lock:
+            prev_loc = self.agents.get(agent_id)
+            agents = dict(self.agents)
+            agents[agent_id] = location_id
+            by_location = dict(self._agents_by_location)
+            if prev_loc is not None:
+                by_location[prev_loc] = tuple(a for a in by_location.get(prev_loc, ()) if a != agent_id)
+            by_location[location_id] = by_location.get(location_id, ()) + (agent_id,)
+            # 先发布索引再发布位置表，读取方各自拿到的都是完整快照
+            self._agents_by_location = by_location
+            self.agents = agents
+            return prev_loc
+
+    def _location_occupancy(self, location_id: str) -> int:
+        """当前位置的在场人数"""
+        return len(self._agents_by_location.get(location_id, ()))
+
+    # ─── 路由表（全源最短路径）────────────────────────────────────────────────
+    @property
+    def allowed_moves(self) -> Dict[str, List[str]]:
+        """允许的移动路径（邻接表）。原地修改后需调用 invalidate_routes()。"""
+        return self._allowed_moves
+
+    @allowed_moves.setter
+    def allowed_moves(self, moves: Dict[str, List[str]]):
+        self._allowed_moves = moves
+        self.invalidate_routes()
+
+    def invalidate_routes(self):
+        """使路由表失效，下次查询时重建"""
+        self._route_table = None
+
+    @property
+    def route_table(self) -> RouteTable:
+        """全源最短路径路由表（惰性构建）"""
+        table = self._route_table
+        if table is None:
+            with self._lock:
+                if self._route_table is None:
+                    self._route_table = RouteTable(self._allowed_moves, self.corridor_minutes)
+                table = self._route_table
+        return table
+
+    def connect_locations(self, from_id: str, to_id: str,
+                          travel_minutes: Optional[float] = None, bidirectional: bool = True):
+        """新增（或更新）一条走廊，并使路由表失效
+        
+        Args:
+            from_id: 起点位置ID
+            to_id: 终点位置ID
+            travel_minutes: 步行耗时（分钟），None 表示使用默认值
+            bidirectional: 是否同时添加反向走廊
+        """
+        with self._lock:
+            pairs = [(from_id, to_id), (to_id, from_id)] if bidirectional else [(from_id, to_id)]
+            for src, dst in pairs:
+                neighbors = self._allowed_moves.setdefault(src, [])
+                if dst not in neighbors:
+                    neighbors.append(dst)
+                if travel_minutes is not None:
+                    self.corridor_minutes[(src, dst)] = travel_minutes
+            self.invalidate_routes()
+
+    def disconnect_locations(self, from_id: str, to_id: str, bidirectional: bool = True):
+        """移除一条走廊（如临时封闭），并使路由表失效"""
+        with self._lock:
+            pairs = [(from_id, to_id), (to_id, from_id)] if bidirectional else [(from_id, to_id)]
+            for src, dst in pairs:
+                neighbors = self._allowed_moves.get(src)
+                if neighbors and dst in neighbors:
+                    neighbors.remove(dst)
+                self.corridor_minutes.pop((src, dst), None)
+            self.invalidate_routes()
+
+    def get_next_hop(self, from_id: str, to_id: str) -> Optional[str]:
+        """O(1) 查询从 from_id 前往 to_id 的下一跳位置"""
+        return self.route_table.get_next_hop(from_id, to_id)
+
+    def get_route_distance(self, from_id: str, to_id: str) -> Optional[int]:
+        """O(1) 查询两位置间最短路径的步数，不可达返回 None"""
+        return self.route_table.get_hops(from_id, to_id)
+
+    def get_travel_minutes(self, from_id: str, to_id: str) -> Optional[float]:
+        """O(1) 查询两位置间最短路径的步行耗时（分钟），不可达返回 None"""
+        return self.route_table.get_travel_minutes(from_id, to_id)
+
     # ─── 患者个人时钟辅助方法 ──────────────────────────────────────────────────
     def register_patient_visit(self, patient_id: str) -> datetime:
         """
@@ -877,21 +1029,25 @@ class HospitalWorld:
             self.locations[loc.id] = loc
         
         # 根据Location的connected_to自动构建allowed_moves（双向图）
-        self.allowed_moves = {}
+        allowed_moves: Dict[str, List[str]] = {}
         for loc in locations:
-            if loc.id not in self.allowed_moves:
-                self.allowed_moves[loc.id] = []
+            if loc.id not in allowed_moves:
+                allowed_moves[loc.id] = []
             
             for connected_id in loc.connected_to:
                 # 添加单向连接
-                if connected_id not in self.allowed_moves[loc.id]:
-                    self.allowed_moves[loc.id].append(connected_id)
+                if connected_id not in allowed_moves[loc.id]:
+                    allowed_moves[loc.id].append(connected_id)
                 
                 # 添加反向连接（双向图）
-                if connected_id not in self.allowed_moves:
-                    self.allowed_moves[connected_id] = []
-                if loc.id not in self.allowed_moves[connected_id]:
-                    self.allowed_moves[connected_id].append(loc.id)
+                if connected_id not in allowed_moves:
+                    allowed_moves[connected_id] = []
+                if loc.id not in allowed_moves[connected_id]:
+                    allowed_moves[connected_id].append(loc.id)
+        
+        # 赋值会使路由表失效；地图建好后立即预计算全源最短路径
+        self.allowed_moves = allowed_moves
+        self._route_table = RouteTable(allowed_moves, self.corridor_minutes)
         
         # 创建设备 - 神经内科专科配置
         equipment_list = [
@@ -957,12 +1113,42 @@ class HospitalWorld:
         for eq in equipment_list:
             self.equipment[eq.id] = eq
         
+        self._rebuild_equipment_index()
+        
         # 重建位置名称缓存（因为locations被覆盖了）
         self._rebuild_location_cache()
         
         # 输出设备初始化统计
         self._log_equipment_initialization()
     
+    def _rebuild_equipment_index(self):
+        """重建 exam_type / location_id -> 设备列表索引及按类型分组的设备锁
+        
+        设备清单变更（增删设备）后需调用。
+        """
+        by_type: Dict[str, List[Equipment]] = {}
+        by_location: Dict[str, List[Equipment]] = {}
+        for eq in self.equipment.values():
+            by_type.setdefault(eq.exam_type, []).append(eq)
+            by_location.setdefault(eq.location_id, []).append(eq)
+        self._equipment_by_type = by_type
+        self._equipment_by_location = by_location
+        # 按检查类型分组的 (锁, 设备列表)，供时间推进时每组只加锁一次
+        self._equipment_lock_groups = [
+            (self._equipment_lock(exam_type), devices) for exam_type, devices in by_type.items()
+        ]
+    
+    def get_equipment_by_type(self, exam_type: str, location_id: str = None) -> List[Equipment]:
+        """按检查类型获取设备列表（O(1) 索引查找），可选按位置过滤"""
+        devices = self._equipment_by_type.get(exam_type, [])
+        if location_id is not None:
+            return [eq for eq in devices if eq.location_id == location_id]
+        return list(devices)
+    
+    def get_equipment_at(self, location_id: str) -> List[Equipment]:
+        """获取指定位置的设备列表（O(1) 索引查找）"""
+        return list(self._equipment_by_location.get(location_id, []))
+    
     def _log_equipment_initialization(self):
         """记录设备初始化统计信息"""
         import logging
@@ -1024,73 +1210,85 @@ class HospitalWorld:
         if affect_resource is None:
             affect_resource = patient_id is not None
 
-        with self._lock:
-            old_time = self.current_time
-            self.sim_clock.advance(
-                minutes=minutes,
-                patient_id=patient_id,
-                affect_resource=bool(affect_resource),
-                affect_system=affect_system,
-                resource_actor_id=patient_id,
-            )
-            
-            # 检查是否跨天
-            if old_time.date() != self.current_time.date():
-                self._reset_daily_counters()
-        
-        # 更新设备状态并自动推进队列
-        for equipment in self.equipment.values():
-            # 检查并更新维护状态
-            if equipment.status == "maintenance":
-                if equipment.maintenance_until and self.resource_time >= equipment.maintenance_until:
-                    equipment.status = "available"
-                    equipment.maintenance_until = None
-                    self._log_event("maintenance_complete", {
-                        "equipment": equipment.name,
-                        "time": self.resource_time.strftime("%H:%M")
-                    })
-            
-            finished_patient = equipment.finish_exam(self.resource_time)
-            
-            if finished_patient:
-                # 记录检查完成
-                self._log_event("exam_complete", {
-                    "patient_id": finished_patient,
-                    "equipment": equipment.name,
-                    "time": self.resource_time.strftime("%H:%M")
-                })
-                
-                # 自动开始下一个检查（如果有排队）
-                next_patient = equipment.get_next_patient()
-                if next_patient and equipment.can_use(self.resource_time):
-                    # 检查患者是否还在该位置
-                    if self.agents.get(next_patient) == equipment.location_id:
-                        equipment.start_exam(next_patient, self.resource_time)
-                        self._log_event("exam_auto_start", {
-                            "patient_id": next_patient,
-                            "equipment": equipment.name,
-                            "time": self.resource_time.strftime("%H:%M")
-                        })
-        
-        # 更新患者生理状态
-        for state in self.physical_states.values():
-            state.update_physiology(self.current_time)
+        # 时钟自身原子推进，无需持有世界锁
+        old_time, new_time = self.sim_clock.advance_span(
+            minutes=minutes,
+            patient_id=patient_id,
+            affect_resource=bool(affect_resource),
+            affect_system=affect_system,
+            resource_actor_id=patient_id,
+        )
+        
+        # 检查是否跨天
+        if old_time.date() != new_time.date():
+            self._reset_daily_counters()
+        
+        # 更新设备状态并自动推进队列（按检查类型分组加锁）
+        # 扫描是幂等的追赶操作：若该组正被其他线程持有则跳过，由下一次推进或 release_equipment 补上，
+        # 避免每个 tick 都在所有设备锁上排队
+        for lock, devices in self._equipment_lock_groups:
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                for equipment in devices:
+                    self._advance_equipment(equipment)
+            finally:
+                lock.release()
+        
+        # 更新患者生理状态（向量化一次推进全部患者；其他线程正在推进时跳过）
+        self.physiology.step(new_time, blocking=False)
         
         # 记录事件
         self._log_event("time_advance", {
             "from": old_time.strftime("%H:%M"),
-            "to": self.current_time.strftime("%H:%M"),
+            "to": new_time.strftime("%H:%M"),
             "minutes": minutes
         })
     
+    def _advance_equipment(self, equipment: Equipment):
+        """检查单台设备的维护/检查完成状态并自动推进队列（调用方需持有该设备类型的锁）"""
+        # 检查并更新维护状态
+        if equipment.status == "maintenance":
+            if equipment.maintenance_until and self.resource_time >= equipment.maintenance_until:
+                equipment.status = "available"
+                equipment.maintenance_until = None
+                self._log_event("maintenance_complete", {
+                    "equipment": equipment.name,
+                    "time": self.resource_time.strftime("%H:%M")
+                })
+        
+        finished_patient = equipment.finish_exam(self.resource_time)
+        
+        if finished_patient:
+            # 记录检查完成
+            self._log_event("exam_complete", {
+                "patient_id": finished_patient,
+                "equipment": equipment.name,
+                "time": self.resource_time.strftime("%H:%M")
+            })
+            
+            # 自动开始下一个检查（如果有排队）
+            next_patient = equipment.get_next_patient()
+            if next_patient and equipment.can_use(self.resource_time):
+                # 检查患者是否还在该位置
+                if self.agents.get(next_patient) == equipment.location_id:
+                    equipment.start_exam(next_patient, self.resource_time)
+                    self._log_event("exam_auto_start", {
+                        "patient_id": next_patient,
+                        "equipment": equipment.name,
+                        "time": self.resource_time.strftime("%H:%M")
+                    })
+    
     def _reset_daily_counters(self):
         """重置每日计数器"""
-        for equipment in self.equipment.values():
-            equipment.reset_daily_usage()
+        for lock, devices in self._equipment_lock_groups:
+            with lock:
+                for equipment in devices:
+                    equipment.reset_daily_usage()
         self._log_event("daily_reset", {"date": self.current_time.strftime("%Y-%m-%d")})
     
     def _find_path(self, start: str, end: str) -> List[str]:
-        """使用BFS查找两个位置之间的最短路径
+        """查找两个位置之间的最短路径（查预计算路由表）
         
         Args:
             start: 起始位置ID
@@ -1105,33 +1303,7 @@ class HospitalWorld:
         if start not in self.allowed_moves or end not in self.locations:
             return []
         
-        # BFS队列：(当前位置, 路径)
-        from collections import deque
-        queue = deque([(start, [])])
-        visited = {start}
-        
-        while queue:
-            current, path = queue.popleft()
-            
-            # 获取当前位置可到达的位置
-            neighbors = self.allowed_moves.get(current, [])
-            
-            for neighbor in neighbors:
-                if neighbor in visited:
-                    continue
-                
-                visited.add(neighbor)
-                new_path = path + [neighbor]
-                
-                # 找到目标
-                if neighbor == end:
-                    return new_path
-                
-                # 继续搜索
-                queue.append((neighbor, new_path))
-        
-        # 无法到达
-        return []
+        return self.route_table.path(start, end)
     
     def move_agent(self, agent_id: str, target_location: str) -> tuple[bool, str]:
         """移动智能体到目标位置（支持自动路径查找）
@@ -1143,19 +1315,19 @@ class HospitalWorld:
         Returns:
             (是否成功, 消息)
         """
-        with self._lock:
-            # ===== 步骤1：验证前置条件 =====
-            
-            # 检查智能体是否存在
-            if agent_id not in self.agents:
-                return False, "智能体不存在"
-            
-            # 检查目标房间是否存在
-            if target_location not in self.locations:
-                return False, "目标房间不存在"
+        # ===== 步骤1：验证前置条件（读取位置快照，无需加锁）=====
+        agents = self.agents
+        
+        # 检查智能体是否存在
+        if agent_id not in agents:
+            return False, "智能体不存在"
+        
+        # 检查目标房间是否存在
+        if target_location not in self.locations:
+            return False, "目标房间不存在"
         
         # 获取当前位置
-        current_loc = self.agents[agent_id]
+        current_loc = agents[agent_id]
         
         # 如果已经在目标位置
         if current_loc == target_location:
@@ -1167,11 +1339,13 @@ class HospitalWorld:
         if current_loc not in self.allowed_moves:
             return False, f"当前位置{self.get_location_name(current_loc)}未配置移动路径"
         
+        routes = self.route_table
+        
         # 尝试直接移动
-        if target_location in self.allowed_moves[current_loc]:
+        if routes.is_adjacent(current_loc, target_location):
             path = [target_location]
         else:
-            # 使用BFS查找路径
+            # 查预计算路由表
             path = self._find_path(current_loc, target_location)
             if not path:
                 allowed_names = [self.get_location_name(loc) for loc in self.allowed_moves[current_loc]]
@@ -1186,16 +1360,15 @@ class HospitalWorld:
         # 沿路径移动
         for step_idx, next_loc in enumerate(path, 1):
             # 验证每一步移动的合法性
-            if next_loc not in self.allowed_moves.get(self.agents[agent_id], []):
+            if not routes.is_adjacent(self.agents[agent_id], next_loc):
                 # 理论上不应该发生（路径已验证）
                 return False, f"路径执行失败：无法从{self.get_location_name(self.agents[agent_id])}到{self.get_location_name(next_loc)}"
             
             # 执行单步移动
-            prev_loc = self.agents[agent_id]
-            self.agents[agent_id] = next_loc
+            prev_loc = self._set_agent_location(agent_id, next_loc)
             
-            # 推进时间（每步30秒 = 0.5分钟）
-            self.advance_time(minutes=0.5, patient_id=agent_id)
+            # 推进时间（按走廊步行耗时，默认每步30秒 = 0.5分钟）
+            self.advance_time(minutes=routes.edge_cost(prev_loc, next_loc), patient_id=agent_id)
 
             # 消耗体力（每步0.2）
             if agent_id in self.physical_states:
@@ -1248,12 +1421,11 @@ class HospitalWorld:
         Returns:
             (是否成功, 消息)
         """
-        with self._lock:
-            # ===== 步骤1：验证 =====
-            
-            # 检查智能体是否存在
-            if agent_id not in self.agents:
-                return False, "智能体不存在"
+        # ===== 步骤1：验证 =====
+        
+        # 检查智能体是否存在
+        if agent_id not in self.agents:
+            return False, "智能体不存在"
         
         # 获取当前位置
         current_loc = self.agents.get(agent_id)
@@ -1478,58 +1650,56 @@ class HospitalWorld:
             return False, "患者位置未知"
         
         # 查找该类型的所有设备（在当前位置）
-        all_equipment = [
-            eq for eq in self.equipment.values()
-            if eq.exam_type == exam_type and eq.location_id == patient_loc
-        ]
+        all_equipment = self.get_equipment_by_type(exam_type, patient_loc)
         
         if not all_equipment:
             return False, f"当前位置没有 {exam_type} 设备，请移动到相应科室"
         
-        # 查找空闲设备
-        available_equipment = [eq for eq in all_equipment if eq.can_use(self.resource_time)]
+        with self._equipment_lock(exam_type):
+            # 查找空闲设备
+            available_equipment = [eq for eq in all_equipment if eq.can_use(self.resource_time)]
         
-        if available_equipment:
-            # 有空闲设备，直接使用（按优先级选择最空闲的）
-            equipment = min(available_equipment, key=lambda eq: eq.daily_usage_count)
-            equipment.start_exam(patient_id, self.resource_time, priority)
+            if available_equipment:
+                # 有空闲设备，直接使用（按优先级选择最空闲的）
+                equipment = min(available_equipment, key=lambda eq: eq.daily_usage_count)
+                equipment.start_exam(patient_id, self.resource_time, priority)
             
-            # 显示资源竞争状态
-            total_equipment = len(all_equipment)
-            busy_equipment = len([eq for eq in all_equipment if eq.is_occupied])
+                # 显示资源竞争状态
+                total_equipment = len(all_equipment)
+                busy_equipment = len([eq for eq in all_equipment if eq.is_occupied])
             
-            self._log_event("exam_start", {
-                "patient_id": patient_id,
-                "equipment": equipment.name,
-                "exam_type": exam_type,
-                "priority": priority,
-                "start_time": self.resource_time.strftime("%H:%M"),
-                "estimated_end": equipment.occupied_until.strftime("%H:%M") if equipment.occupied_until else "unknown",
-                "resource_status": f"{busy_equipment}/{total_equipment}设备使用中"
-            })
+                self._log_event("exam_start", {
+                    "patient_id": patient_id,
+                    "equipment": equipment.name,
+                    "exam_type": exam_type,
+                    "priority": priority,
+                    "start_time": self.resource_time.strftime("%H:%M"),
+                    "estimated_end": equipment.occupied_until.strftime("%H:%M") if equipment.occupied_until else "unknown",
+                    "resource_status": f"{busy_equipment}/{total_equipment}设备使用中"
+                })
             
-            return True, f"开始 {equipment.name} 检查，预计 {equipment.duration_minutes} 分钟（预计完成时间: {equipment.occupied_until.strftime('%H:%M')}）[资源: {busy_equipment+1}/{total_equipment}设备使用中]"
-        else:
-            # 所有设备都在使用中，加入排队
-            equipment = all_equipment[0]  # 选择第一个设备的队列
-            equipment.add_to_queue(patient_id, priority, self.resource_time)
-            wait_time = equipment.get_wait_time(self.resource_time, patient_id)
-            queue_position = next((i+1 for i, entry in enumerate(equipment.queue) if entry.patient_id == patient_id), 0)
+                return True, f"开始 {equipment.name} 检查，预计 {equipment.duration_minutes} 分钟（预计完成时间: {equipment.occupied_until.strftime('%H:%M')}）[资源: {busy_equipment+1}/{total_equipment}设备使用中]"
+            else:
+                # 所有设备都在使用中，加入排队
+                equipment = all_equipment[0]  # 选择第一个设备的队列
+                equipment.add_to_queue(patient_id, priority, self.resource_time)
+                wait_time = equipment.get_wait_time(self.resource_time, patient_id)
+                queue_position = (equipment.queue.position(patient_id) or 0) + 1
             
-            # 显示所有设备队列情况
-            total_queue = sum(len(eq.queue) for eq in all_equipment)
+                # 显示所有设备队列情况
+                total_queue = sum(len(eq.queue) for eq in all_equipment)
             
-            self._log_event("exam_queue", {
-                "patient_id": patient_id,
-                "equipment": equipment.name,
-                "exam_type": exam_type,
-                "queue_position": queue_position,
-                "queue_length": len(equipment.queue),
-                "total_queue": total_queue,
-                "resource_contention": "高" if total_queue > len(all_equipment) else "中"
-            })
+                self._log_event("exam_queue", {
+                    "patient_id": patient_id,
+                    "equipment": equipment.name,
+                    "exam_type": exam_type,
+                    "queue_position": queue_position,
+                    "queue_length": len(equipment.queue),
+                    "total_queue": total_queue,
+                    "resource_contention": "高" if total_queue > len(all_equipment) else "中"
+                })
             
-            return False, f"⚠️ 资源竞争: 所有{exam_type}设备繁忙({len(all_equipment)}台全部使用中)，已加入{equipment.name}队列（位置: {queue_position}/{len(equipment.queue)}，总排队: {total_queue}人，预计等待 {wait_time} 分钟）"
+                return False, f"⚠️ 资源竞争: 所有{exam_type}设备繁忙({len(all_equipment)}台全部使用中)，已加入{equipment.name}队列（位置: {queue_position}/{len(equipment.queue)}，总排队: {total_queue}人，预计等待 {wait_time} 分钟）"
     
     def get_observation(self, agent_id: str) -> Dict:
         """获取Agent当前观察"""
@@ -1547,7 +1717,7 @@ class HospitalWorld:
         nearby_info = []
         for loc_id in location.connected_to:
             nearby_loc = self.locations[loc_id]
-            occupancy = f"{len(nearby_loc.current_occupants)}/{nearby_loc.capacity}"
+            occupancy = f"{self._location_occupancy(loc_id)}/{nearby_loc.capacity}"
             nearby_info.append(f"{nearby_loc.name} ({occupancy})")
         
         observation = {
@@ -1558,12 +1728,12 @@ class HospitalWorld:
             "location_id": location_id,
             "available_actions": location.available_actions,
             "nearby_locations": nearby_info,
-            "occupants_count": len(location.current_occupants),
+            "occupants_count": self._location_occupancy(location_id),
             "capacity": location.capacity,
         }
         
         # 添加设备信息
-        location_equipment = [eq for eq in self.equipment.values() if eq.location_id == location_id]
+        location_equipment = self._equipment_by_location.get(location_id, [])
         if location_equipment:
             equipment_status = []
             for eq in location_equipment:
@@ -1592,11 +1762,6 @@ class HospitalWorld:
         Returns:
             是否成功添加
         """
-        with self._lock:
-            # 检查是否已存在
-            if agent_id in self.agents:
-                return False
-        
         # 检查初始位置是否存在
         if initial_location not in self.locations:
             self._log_event("add_agent_failed", {
@@ -1606,19 +1771,26 @@ class HospitalWorld:
             })
             return False
         
-        # 直接设置初始位置（首次进入不需要移动验证）
-        self.agents[agent_id] = initial_location
-        
-        # 根据Agent类型初始化不同的生理状态
-        if agent_type == "patient":
-            # 患者：完整的生理状态（症状、生命体征、体力等）
-            state = PhysicalState(
-                patient_id=agent_id, 
-                agent_type="patient",
-                last_update=self.current_time
-            )
-            self.physical_states[agent_id] = state
-            # 生理状态会在 __post_init__ 中自动初始化默认生命体征
+        with self._agents_lock:
+            # 检查是否已存在
+            if agent_id in self.agents:
+                return False
+            
+            # 直接设置初始位置（首次进入不需要移动验证）
+            self._set_agent_location(agent_id, initial_location)
+            
+            # 根据Agent类型初始化不同的生理状态
+            if agent_type == "patient":
+                # 患者：完整的生理状态（症状、生命体征、体力等）
+                state = PhysicalState(
+                    patient_id=agent_id, 
+                    agent_type="patient",
+                    last_update=self.current_time,
+                    engine=self.physiology,
+                )
+                # 写时复制，避免 advance_time 遍历时字典被并发修改
+                self.physical_states = {**self.physical_states, agent_id: state}
+                # 生理状态会在 __post_init__ 中自动初始化默认生命体征
             
         # 记录添加成功日志
         self._log_event("add_agent", {
@@ -1630,6 +1802,39 @@ class HospitalWorld:
         
         return True
     
+    def remove_agent(self, agent_id: str) -> bool:
+        """将Agent移出世界（患者离院），并归还其生理状态占用的引擎行
+        
+        Args:
+            agent_id: Agent唯一标识
+        
+        Returns:
+            是否成功移除
+        """
+        with self._agents_lock:
+            location_id = self.agents.get(agent_id)
+            if location_id is None:
+                return False
+            # 写时复制，与 _set_agent_location 一致
+            agents = dict(self.agents)
+            del agents[agent_id]
+            by_location = dict(self._agents_by_location)
+            by_location[location_id] = tuple(a for a in by_location.get(location_id, ()) if a != agent_id)
+            self._agents_by_location = by_location
+            self.agents = agents
+            state = self.physical_states.get(agent_id)
+            if state is not None:
+                self.physical_states = {k: v for k, v in self.physical_states.items() if k != agent_id}
+                state.release()
+        
+        self._log_event("remove_agent", {
+            "agent_id": agent_id,
+            "last_location": location_id,
+            "time": self.current_time.strftime("%H:%M")
+        })
+        
+        return True
+    
     def get_agent_location(self, agent_id: str) -> Optional[str]:
         """获取智能体当前位置
         
@@ -1653,7 +1858,7 @@ class HospitalWorld:
         用途：
             检查医患是否在同一房间（用于对话验证）
         """
-        return [aid for aid, loc in self.agents.items() if loc == location_id]
+        return list(self._agents_by_location.get(location_id, ()))
     
     def _rebuild_location_cache(self):
         """重建位置名称缓存（内部方法）"""
@@ -1747,7 +1952,7 @@ class HospitalWorld:
         if current_loc not in self.allowed_moves:
             return False, f"当前位置{self.get_location_name(current_loc)}未配置移动路径"
         
-        if target_location not in self.allowed_moves[current_loc]:
+        if not self.route_table.is_adjacent(current_loc, target_location):
             allowed_names = [self.get_location_name(loc) for loc in self.allowed_moves[current_loc]]
             return False, f"无法从{self.get_location_name(current_loc)}直接到达{self.get_location_name(target_location)}。可前往: {', '.join(allowed_names)}"
         
@@ -1888,8 +2093,9 @@ class HospitalWorld:
         ]
         
         for loc_id, loc in self.locations.items():
-            if loc.current_occupants:
-                lines.append(f"  - {loc.name}: {len(loc.current_occupants)}/{loc.capacity}")
+            occupancy = self._location_occupancy(loc_id)
+            if occupancy:
+                lines.append(f"  - {loc.name}: {occupancy}/{loc.capacity}")
         
         lines.append("")
         lines.append("设备使用情况:")
@@ -1927,7 +2133,7 @@ class HospitalWorld:
         }
         
         for exam_type, display_name in neuro_equipment_types.items():
-            equipment_list = [eq for eq in self.equipment.values() if eq.exam_type == exam_type]
+            equipment_list = self._equipment_by_type.get(exam_type, [])
             
             if not equipment_list:
                 continue
@@ -1962,7 +2168,7 @@ class HospitalWorld:
         recommendations = {}
         
         for exam_type in exam_types:
-            equipment_list = [eq for eq in self.equipment.values() if eq.exam_type == exam_type]
+            equipment_list = self._equipment_by_type.get(exam_type, [])
             
             if not equipment_list:
                 recommendations[exam_type] = "❌ 无此类型设备"
@@ -1984,9 +2190,10 @@ class HospitalWorld:
     # ========== Level 2 强化: 资源管理 ==========
     
     def get_equipment_status(self, exam_type: str = None, location_id: str = None) -> List[Dict]:
-        equipment_list = list(self.equipment.values())
         if exam_type:
-            equipment_list = [eq for eq in equipment_list if eq.exam_type == exam_type]
+            equipment_list = self.get_equipment_by_type(exam_type)
+        else:
+            equipment_list = list(self.equipment.values())
         if location_id:
             equipment_list = [eq for eq in equipment_list if eq.location_id == location_id]
         status_list = []
@@ -2014,7 +2221,9 @@ class HospitalWorld:
         with self._lock:
             if dept not in self.doctor_pool:
                 self.doctor_pool[dept] = {}
-            
+            self._doctor_dept[doctor_id] = dept
+        
+        with self._dept_lock(dept):
             self.doctor_pool[dept][doctor_id] = {
                 'status': 'available',  # available/busy
                 'current_patient': None,
@@ -2034,8 +2243,11 @@ class HospitalWorld:
         Returns:
             (医生ID, 预计等待分钟数)
         """
-        with self._lock:
-            if dept not in self.doctor_pool or not self.doctor_pool[dept]:
+        if dept not in self.doctor_pool:
+            return None, 0  # 无该科室
+        
+        with self._dept_lock(dept):
+            if not self.doctor_pool[dept]:
                 return None, 0  # 无可用医生
             
             # 查找最佳医生（空闲或队列最短）
@@ -2092,48 +2304,51 @@ class HospitalWorld:
         Returns:
             是否成功释放
         """
-        with self._lock:
-            # 查找患者对应的医生
-            if patient_id not in self.patient_doctor_map:
+        # 查找患者对应的医生及其科室
+        doctor_id = self.patient_doctor_map.get(patient_id)
+        if doctor_id is None:
+            return False
+        dept = self._doctor_dept.get(doctor_id)
+        if dept is None:
+            return False
+        
+        with self._dept_lock(dept):
+            # 持锁后复核（可能已被并发释放）
+            if self.patient_doctor_map.get(patient_id) != doctor_id:
                 return False
-            
-            doctor_id = self.patient_doctor_map[patient_id]
             del self.patient_doctor_map[patient_id]
             
-            # 查找医生所在科室
-            for dept, doctors in self.doctor_pool.items():
-                if doctor_id in doctors:
-                    doctor_info = doctors[doctor_id]
-                    
-                    # 清除当前患者
-                    if doctor_info['current_patient'] == patient_id:
-                        doctor_info['current_patient'] = None
-                    
-                    # 从队列中移除（如果在队列中）
-                    doctor_info['queue'] = [entry for entry in doctor_info['queue'] 
-                                           if entry.patient_id != patient_id]
-                    
-                    # 检查是否有等待的患者
-                    if doctor_info['queue']:
-                        # 分配给下一个患者
-                        next_entry = doctor_info['queue'].pop(0)
-                        doctor_info['status'] = 'busy'
-                        doctor_info['current_patient'] = next_entry.patient_id
-                        doctor_info['daily_patients'] += 1
-                        self.patient_doctor_map[next_entry.patient_id] = doctor_id
-                        
-                        # 添加日志
-                        import logging
-                        logger = logging.getLogger('hospital_agent.world')
-                        remaining = len(doctor_info['queue'])
-                        logger.info(f"🔄 [物理世界] 医生流转: {doctor_id} 完成 {patient_id}，接诊下一位 {next_entry.patient_id}（队列剩余{remaining}人）")
-                    else:
-                        # 无等待患者，医生变为空闲（后台状态，不输出日志）
-                        doctor_info['status'] = 'available'
-                    
-                    return True
+            doctor_info = self.doctor_pool.get(dept, {}).get(doctor_id)
+            if doctor_info is None:
+                return False
             
-            return False
+            # 清除当前患者
+            if doctor_info['current_patient'] == patient_id:
+                doctor_info['current_patient'] = None
+            
+            # 从队列中移除（如果在队列中）
+            doctor_info['queue'] = [entry for entry in doctor_info['queue'] 
+                                   if entry.patient_id != patient_id]
+            
+            # 检查是否有等待的患者
+            if doctor_info['queue']:
+                # 分配给下一个患者
+                next_entry = doctor_info['queue'].pop(0)
+                doctor_info['status'] = 'busy'
+                doctor_info['current_patient'] = next_entry.patient_id
+                doctor_info['daily_patients'] += 1
+                self.patient_doctor_map[next_entry.patient_id] = doctor_id
+                
+                # 添加日志
+                import logging
+                logger = logging.getLogger('hospital_agent.world')
+                remaining = len(doctor_info['queue'])
+                logger.info(f"🔄 [物理世界] 医生流转: {doctor_id} 完成 {patient_id}，接诊下一位 {next_entry.patient_id}（队列剩余{remaining}人）")
+            else:
+                # 无等待患者，医生变为空闲（后台状态，不输出日志）
+                doctor_info['status'] = 'available'
+            
+            return True
     
     def get_doctor_status(self, dept: str = None) -> List[Dict]:
         """获取医生状态
@@ -2152,7 +2367,10 @@ class HospitalWorld:
             if d not in self.doctor_pool:
                 continue
             
-            for doctor_id, info in self.doctor_pool[d].items():
+            with self._dept_lock(d):
+                doctors = list(self.doctor_pool[d].items())
+            
+            for doctor_id, info in doctors:
                 status_list.append({
                     'doctor_id': doctor_id,
                     'dept': d,
@@ -2178,14 +2396,14 @@ class HospitalWorld:
         Returns:
             (设备ID, 预计等待分钟数)
         """
-        with self._lock:
-            # 保存dataset_id映射
-            if dataset_id is not None:
-                self.patient_dataset_map[patient_id] = dataset_id
-                
+        # 保存dataset_id映射
+        if dataset_id is not None:
+            self.patient_dataset_map[patient_id] = dataset_id
+        
+        with self._equipment_lock(exam_type):
             # 查找该类型的所有设备
-            available_equipment = [eq for eq in self.equipment.values() 
-                                  if eq.exam_type == exam_type and eq.status != "offline"]
+            available_equipment = [eq for eq in self._equipment_by_type.get(exam_type, [])
+                                  if eq.status != "offline"]
             
             if not available_equipment:
                 return None, 0  # 无该类型设备
@@ -2225,7 +2443,7 @@ class HospitalWorld:
                 end_time = best_equipment.occupied_until.strftime("%H:%M") if best_equipment.occupied_until else "未知"
                 
                 # 统计当前使用情况
-                all_same_type = [eq for eq in self.equipment.values() if eq.exam_type == best_equipment.exam_type]
+                all_same_type = self._equipment_by_type.get(best_equipment.exam_type, [])
                 busy_count = len([eq for eq in all_same_type if eq.is_occupied])
                 total_count = len(all_same_type)
                 
@@ -2258,11 +2476,11 @@ class HospitalWorld:
         Returns:
             是否成功释放
         """
-        with self._lock:
-            if equipment_id not in self.equipment:
-                return False
-            
-            eq = self.equipment[equipment_id]
+        eq = self.equipment.get(equipment_id)
+        if eq is None:
+            return False
+        
+        with self._equipment_lock(eq.exam_type):
             finished_patient = eq.finish_exam(self.resource_time)
             
             if not finished_patient:
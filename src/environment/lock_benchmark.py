@@ -0,0 +1,123 @@
+"""
+HospitalWorld 多线程压力基准 - 对比单一全局锁与分段锁
+
+每个线程模拟一位患者，循环执行移动、设备申请/释放、医生分配/释放、
+位置读取与时间推进，统计吞吐量与各锁的等待时间。
+
+运行（在 src 目录下）：
+    python -m environment.lock_benchmark --threads 16 --ops 300
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List
+
+from .hospital_world import HospitalWorld
+from .lock_monitor import format_contention_report
+
+
+def _stress_worker(world, worker_idx: int, ops: int, depts: List[str], exam_types: List[str],
+                   barrier: threading.Barrier, io_ms: float = 0.0) -> None:
+    """单个压测线程：混合移动、设备申请/释放、医生分配/释放、时间推进和位置读取
+
+    io_ms 模拟每轮操作之间的 LLM/网络等待（释放 GIL），更接近真实患者线程的负载形态。
+    """
+    patient_id = f"stress_patient_{worker_idx}"
+    world.add_agent(patient_id, agent_type="patient", initial_location="lobby")
+    route = ["triage", "waiting_area", "neuro", "lab", "neuro", "imaging", "lobby"]
+    barrier.wait()
+
+    for i in range(ops):
+        world.move_agent(patient_id, route[i % len(route)])
+
+        exam_type = exam_types[(worker_idx + i) % len(exam_types)]
+        equipment_id, _ = world.request_equipment(patient_id, exam_type, priority=5)
+        if equipment_id:
+            world.release_equipment(equipment_id)
+
+        dept = depts[worker_idx % len(depts)]
+        world.assign_doctor(patient_id, dept)
+        world.release_doctor(patient_id)
+
+        world.get_agents_in_location(world.agents.get(patient_id, "lobby"))
+        world.get_observation(patient_id)
+        world.advance_time(minutes=1, patient_id=patient_id)
+        if io_ms:
+            time.sleep(io_ms / 1000)
+
+
+def _run_once(lock_striping: bool, threads: int, ops: int, io_ms: float = 0.0) -> Dict:
+    world = HospitalWorld(lock_striping=lock_striping)
+    depts = ["neurology", "internal_medicine", "surgery", "pediatrics"]
+    for dept in depts:
+        for n in range(3):
+            world.register_doctor(f"{dept}_doctor_{n}", dept)
+    exam_types = sorted({eq.exam_type for eq in world.equipment.values()})
+    world.reset_lock_stats()
+
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=_stress_worker, args=(world, idx, ops, depts, exam_types, barrier, io_ms))
+        for idx in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    report = world.get_lock_contention_report()
+    return {
+        "lock_striping": lock_striping,
+        "elapsed_seconds": elapsed,
+        "ops_per_second": threads * ops / elapsed if elapsed else 0.0,
+        "total_wait_ms": sum(row["total_wait_ms"] for row in report),
+        "report": report,
+    }
+
+
+def run_stress_benchmark(threads: int = 16, ops: int = 300, io_ms: float = 0.0,
+                         verbose: bool = True) -> Dict[str, Dict]:
+    """多线程压力基准：对比单一全局锁与分段锁的吞吐量和锁等待时间
+
+    Args:
+        threads: 并发线程数（每线程模拟一位患者）
+        ops: 每线程执行的操作轮数
+        io_ms: 每轮操作之间模拟的 I/O 等待（毫秒）
+
+    Returns:
+        {"single_lock": {...}, "striped": {...}}
+    """
+    results = {
+        "single_lock": _run_once(False, threads, ops, io_ms),
+        "striped": _run_once(True, threads, ops, io_ms),
+    }
+
+    if verbose:
+        for label, result in results.items():
+            print(f"\n=== {label}: {result['elapsed_seconds']:.3f}s, "
+                  f"{result['ops_per_second']:.0f} ops/s, 总等待 {result['total_wait_ms']:.1f}ms ===")
+            print(format_contention_report(result["report"]))
+        base, striped = results["single_lock"], results["striped"]
+        if striped["elapsed_seconds"]:
+            print(f"\n加速比: {base['elapsed_seconds'] / striped['elapsed_seconds']:.2f}x, "
+                  f"锁等待减少: {base['total_wait_ms'] - striped['total_wait_ms']:.1f}ms")
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    logging.getLogger("hospital_agent.world").setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="HospitalWorld 锁竞争压力基准")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=300)
+    parser.add_argument("--io-ms", type=float, default=0.0, help="每轮操作间模拟的 I/O 等待（毫秒）")
+    args = parser.parse_args()
+    run_stress_benchmark(threads=args.threads, ops=args.ops, io_ms=args.io_ms)
@@ -0,0 +1,96 @@
+"""
+锁竞争监控 - HospitalWorld 细粒度锁的等待时间统计
+
+- TrackedLock：包装 threading.RLock，记录获取次数、竞争次数与等待时长
+- format_contention_report：把各锁统计格式化为可读表格
+
+压力基准见 environment/lock_benchmark.py
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List
+
+from logging_utils.node_tracing import record_lock_wait
+
+
+class TrackedLock:
+    """可重入锁 + 竞争统计
+
+    先尝试非阻塞获取（无竞争快路径，不计时）；失败时才计时阻塞等待。
+    统计字段只在持锁期间更新，因此无需额外的保护锁。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.RLock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(blocking=False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+
+        start = time.perf_counter()
+        acquired = self._lock.acquire(timeout=timeout) if timeout >= 0 else self._lock.acquire()
+        if acquired:
+            waited = time.perf_counter() - start
+            self.acquisitions += 1
+            self.contended += 1
+            self.total_wait_seconds += waited
+            if waited > self.max_wait_seconds:
+                self.max_wait_seconds = waited
+            record_lock_wait(waited)
+        return acquired
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> "TrackedLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    def reset_stats(self) -> None:
+        """清零统计（持锁执行，避免与更新交错）"""
+        with self._lock:
+            self.acquisitions = 0
+            self.contended = 0
+            self.total_wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def stats(self) -> Dict:
+        """返回该锁的统计快照"""
+        acquisitions = self.acquisitions
+        total_wait_ms = self.total_wait_seconds * 1000
+        return {
+            "lock": self.name,
+            "acquisitions": acquisitions,
+            "contended": self.contended,
+            "contention_rate": (self.contended / acquisitions) if acquisitions else 0.0,
+            "total_wait_ms": round(total_wait_ms, 3),
+            "avg_wait_ms": round(total_wait_ms / acquisitions, 4) if acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+def format_contention_report(report: List[Dict]) -> str:
+    """将锁竞争统计格式化为文本表格（按总等待时间降序）"""
+    lines = [
+        f"{'锁':<32} {'获取次数':>10} {'竞争次数':>10} {'竞争率':>8} {'总等待ms':>12} {'最大等待ms':>12}",
+        "-" * 90,
+    ]
+    for row in sorted(report, key=lambda r: r["total_wait_ms"], reverse=True):
+        lines.append(
+            f"{row['lock']:<32} {row['acquisitions']:>10} {row['contended']:>10} "
+            f"{row['contention_rate']:>8.1%} {row['total_wait_ms']:>12.2f} {row['max_wait_ms']:>12.2f}"
+        )
+    return "\n".join(lines)
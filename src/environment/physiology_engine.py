@@ -0,0 +1,580 @@
+"""
+向量化患者生理引擎 - 结构数组（struct-of-arrays）实现
+
+所有患者的症状严重程度、生命体征、体力/疼痛/意识等状态都保存在 NumPy 数组中，
+HospitalWorld.advance_time 每个 tick 只需调用一次 step() 即可完成全体患者的生理演变，
+不再逐个患者、逐个症状/体征地执行 Python 循环。
+
+- 患者行（row）：体力、疼痛、意识、上次更新时间、危急标志
+- 生命体征列（col）：按体征 key 分列，正常范围按列共享；最近历史保存在环形缓冲区
+- 症状槽（slot）：每个症状占一个槽位，记录所属患者、严重程度、进展速率、治疗状态等
+
+Symptom / VitalSign 是指向数组中某个槽位的轻量视图，PhysicalState 通过它们对外保持原有接口。
+"""
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+MIN_UPDATE_HOURS: float = 0.1  # 至少间隔 6 分钟才更新一次生理状态
+HISTORY_LEN: int = 256  # 每项体征保留的历史条数上限（24小时窗口在读取时过滤）
+PAIN_SYMPTOMS: Tuple[str, ...] = ("疼痛", "头痛", "腹痛", "胸痛", "关节痛")
+
+TREND_CODES: Tuple[str, ...] = ("stable", "improving", "worsening")
+CONSCIOUSNESS_CODES: Tuple[str, ...] = ("alert", "drowsy", "unconscious")
+
+# 默认生命体征：key -> (名称, 初始值, 单位, 正常范围)
+DEFAULT_VITALS: Dict[str, Tuple[str, float, str, Tuple[float, float]]] = {
+    "heart_rate": ("心率", 75.0, "次/分", (60, 100)),
+    "blood_pressure_systolic": ("收缩压", 120.0, "mmHg", (90, 140)),
+    "blood_pressure_diastolic": ("舒张压", 80.0, "mmHg", (60, 90)),
+    "temperature": ("体温", 36.5, "℃", (36.0, 37.5)),
+    "respiratory_rate": ("呼吸频率", 16.0, "次/分", (12, 20)),
+    "oxygen_saturation": ("血氧饱和度", 98.0, "%", (95, 100)),
+}
+
+# 危急值阈值：key -> (下限, 上限)，None 表示该侧不检查
+CRITICAL_THRESHOLDS: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    "heart_rate": (40, 150),
+    "blood_pressure_systolic": (80, 180),
+    "temperature": (35.0, 40.0),
+    "oxygen_saturation": (90, None),
+}
+
+
+def _to_ts(value: datetime) -> float:
+    return value.timestamp()
+
+
+def _from_ts(value: float) -> datetime:
+    return datetime.fromtimestamp(value)
+
+
+class ReleasedRowError(RuntimeError):
+    """视图指向的患者行或症状槽已释放（可能已分配给其他患者）"""
+
+
+class PhysiologyEngine:
+    """全体患者生理状态的结构数组存储与向量化推进"""
+
+    def __init__(self, lock=None, seed: Optional[int] = None, initial_capacity: int = 16):
+        self._lock = lock if lock is not None else threading.RLock()
+        self._rng = np.random.default_rng(seed)
+
+        # ----- 患者行 -----
+        self.n_rows = 0
+        cap = max(1, initial_capacity)
+        self.active = np.zeros(cap, dtype=bool)
+        self.energy = np.zeros(cap)
+        self.pain = np.zeros(cap)
+        self.consciousness = np.zeros(cap, dtype=np.int8)
+        self.last_update = np.zeros(cap)  # POSIX 时间戳（秒）
+        self.critical = np.zeros(cap, dtype=bool)
+        self.row_generation = np.zeros(cap, dtype=np.int64)  # 每次释放 +1，旧视图据此识别行已被复用
+
+        # ----- 生命体征列 -----
+        self.vital_keys: List[str] = []
+        self.vital_col: Dict[str, int] = {}
+        self.vital_names: List[str] = []
+        self.vital_units: List[str] = []
+        self.vital_low = np.zeros(0)
+        self.vital_high = np.zeros(0)
+        self.vitals = np.zeros((cap, 0))
+        self.vital_present = np.zeros((cap, 0), dtype=bool)
+        self.vital_measured = np.zeros((cap, 0))
+        self.hist_values = np.zeros((cap, 0, HISTORY_LEN))
+        self.hist_times = np.zeros((cap, 0, HISTORY_LEN))
+        self.hist_count = np.zeros((cap, 0), dtype=np.int32)  # 累计写入条数（环形指针 = count % HISTORY_LEN）
+        for key, (name, _value, unit, normal_range) in DEFAULT_VITALS.items():
+            self._ensure_vital_column(key, name, unit, normal_range)
+
+        # ----- 症状槽 -----
+        self.n_slots = 0
+        scap = max(1, initial_capacity * 4)
+        self.sym_owner = np.zeros(scap, dtype=np.int64)
+        self.sym_severity = np.zeros(scap)
+        self.sym_rate = np.zeros(scap)
+        self.sym_treated = np.zeros(scap, dtype=bool)
+        self.sym_effectiveness = np.zeros(scap)
+        self.sym_trend = np.zeros(scap, dtype=np.int8)
+        self.sym_is_pain = np.zeros(scap, dtype=bool)
+        self.sym_active = np.zeros(scap, dtype=bool)
+        self.sym_generation = np.zeros(scap, dtype=np.int64)
+
+        # ----- 已释放、可复用的行与症状槽 -----
+        self._free_rows: List[int] = []
+        self._free_slots: List[int] = []
+
+    # ------------------------------------------------------------------ 容量管理
+
+    @staticmethod
+    def _grow(array: np.ndarray, size: int) -> np.ndarray:
+        """沿第 0 维扩容到至少 size（按倍增）"""
+        if array.shape[0] >= size:
+            return array
+        new_cap = max(size, array.shape[0] * 2)
+        grown = np.zeros((new_cap, *array.shape[1:]), dtype=array.dtype)
+        grown[: array.shape[0]] = array
+        return grown
+
+    def _ensure_row_capacity(self, size: int) -> None:
+        for attr in ("active", "energy", "pain", "consciousness", "last_update", "critical", "row_generation",
+                     "vitals", "vital_present", "vital_measured", "hist_values", "hist_times", "hist_count"):
+            setattr(self, attr, self._grow(getattr(self, attr), size))
+
+    def _ensure_slot_capacity(self, size: int) -> None:
+        for attr in ("sym_owner", "sym_severity", "sym_rate", "sym_treated",
+                     "sym_effectiveness", "sym_trend", "sym_is_pain", "sym_active", "sym_generation"):
+            setattr(self, attr, self._grow(getattr(self, attr), size))
+
+    def _ensure_vital_column(self, key: str, name: str, unit: str,
+                             normal_range: Tuple[float, float]) -> int:
+        """确保体征列存在，返回列号（新列追加在末尾）"""
+        col = self.vital_col.get(key)
+        if col is not None:
+            return col
+        col = len(self.vital_keys)
+        self.vital_keys.append(key)
+        self.vital_col[key] = col
+        self.vital_names.append(name)
+        self.vital_units.append(unit)
+        self.vital_low = np.append(self.vital_low, float(normal_range[0]))
+        self.vital_high = np.append(self.vital_high, float(normal_range[1]))
+
+        rows = self.vitals.shape[0]
+        self.vitals = np.hstack([self.vitals, np.zeros((rows, 1))])
+        self.vital_present = np.hstack([self.vital_present, np.zeros((rows, 1), dtype=bool)])
+        self.vital_measured = np.hstack([self.vital_measured, np.zeros((rows, 1))])
+        self.hist_values = np.concatenate([self.hist_values, np.zeros((rows, 1, HISTORY_LEN))], axis=1)
+        self.hist_times = np.concatenate([self.hist_times, np.zeros((rows, 1, HISTORY_LEN))], axis=1)
+        self.hist_count = np.hstack([self.hist_count, np.zeros((rows, 1), dtype=np.int32)])
+        return col
+
+    # ------------------------------------------------------------------ 注册
+
+    def add_patient(self, last_update: datetime, with_default_vitals: bool = True) -> int:
+        """分配一个患者行并初始化默认生命体征，返回行号（优先复用已释放的行）"""
+        with self._lock:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self.vitals[row] = 0.0
+                self.vital_present[row] = False
+                self.vital_measured[row] = 0.0
+                self.hist_count[row] = 0
+            else:
+                row = self.n_rows
+                self._ensure_row_capacity(row + 1)
+                self.n_rows = row + 1
+            self.active[row] = True
+            self.energy[row] = 10.0
+            self.pain[row] = 0.0
+            self.consciousness[row] = 0
+            self.last_update[row] = _to_ts(last_update)
+            self.critical[row] = False
+            if with_default_vitals:
+                ts = _to_ts(datetime.now())
+                for key, (_name, value, _unit, _range) in DEFAULT_VITALS.items():
+                    col = self.vital_col[key]
+                    self.vitals[row, col] = value
+                    self.vital_present[row, col] = True
+                    self.vital_measured[row, col] = ts
+            return row
+
+    def remove_patient(self, row: int) -> None:
+        """释放患者行及其全部症状槽（不再参与 step，之后的 add_patient / add_symptom 复用）
+
+        释放后指向该行的 PhysicalState / Symptom / VitalSign 视图再访问时抛出 ReleasedRowError。
+        """
+        with self._lock:
+            if row >= self.n_rows or not self.active[row]:
+                return
+            self.active[row] = False
+            self.critical[row] = False
+            self.row_generation[row] += 1
+            n = self.n_slots
+            slots = np.nonzero(self.sym_owner[:n] == row)[0]
+            self.sym_active[slots] = False
+            self.sym_generation[slots] += 1
+            self._free_slots.extend(int(slot) for slot in slots)
+            self._free_rows.append(row)
+
+    def add_vital(self, row: int, key: str, name: str, value: float, unit: str,
+                  normal_range: Tuple[float, float]) -> int:
+        """为患者添加一项生命体征，返回列号"""
+        with self._lock:
+            col = self._ensure_vital_column(key, name, unit, normal_range)
+            self.vitals[row, col] = value
+            self.vital_present[row, col] = True
+            self.vital_measured[row, col] = _to_ts(datetime.now())
+            return col
+
+    def add_symptom(self, row: int, name: str, severity: float, progression_rate: float) -> int:
+        """为患者添加一个症状，返回槽位号"""
+        with self._lock:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = self.n_slots
+                self._ensure_slot_capacity(slot + 1)
+                self.n_slots = slot + 1
+            self.sym_owner[slot] = row
+            self.sym_severity[slot] = severity
+            self.sym_rate[slot] = progression_rate
+            self.sym_treated[slot] = False
+            self.sym_effectiveness[slot] = 0.0
+            self.sym_trend[slot] = 0
+            self.sym_is_pain[slot] = name in PAIN_SYMPTOMS
+            self.sym_active[slot] = True
+            return slot
+
+    def remove_symptom(self, slot: int) -> None:
+        """释放单个症状槽（同名症状重新添加时替换原槽位）"""
+        with self._lock:
+            if slot < self.n_slots and self.sym_active[slot]:
+                self.sym_active[slot] = False
+                self.sym_generation[slot] += 1
+                self._free_slots.append(slot)
+
+    def check_row(self, row: int, generation: int) -> None:
+        """视图有效性检查：行在视图创建后被释放过时抛出 ReleasedRowError"""
+        if self.row_generation[row] != generation:
+            raise ReleasedRowError(f"患者行 {row} 已释放，视图不再可用")
+
+    def check_slot(self, slot: int, generation: int) -> None:
+        """视图有效性检查：症状槽在视图创建后被释放过时抛出 ReleasedRowError"""
+        if self.sym_generation[slot] != generation:
+            raise ReleasedRowError(f"症状槽 {slot} 已释放，视图不再可用")
+
+    # ------------------------------------------------------------------ 单项更新
+
+    def record_vital(self, row: int, col: int, value: float, measured_at: datetime) -> None:
+        """写入单项体征新值，旧值进入历史环形缓冲区"""
+        with self._lock:
+            pos = self.hist_count[row, col] % HISTORY_LEN
+            self.hist_values[row, col, pos] = self.vitals[row, col]
+            self.hist_times[row, col, pos] = self.vital_measured[row, col]
+            self.hist_count[row, col] += 1
+            self.vitals[row, col] = value
+            self.vital_measured[row, col] = _to_ts(measured_at)
+
+    def vital_history(self, row: int, col: int, window_end: Optional[datetime] = None) -> List[Tuple[datetime, float]]:
+        """读取单项体征的历史（按时间顺序，仅保留最近24小时）"""
+        count = int(self.hist_count[row, col])
+        n = min(count, HISTORY_LEN)
+        if n == 0:
+            return []
+        start = count - n
+        idx = [(start + i) % HISTORY_LEN for i in range(n)]
+        end_ts = _to_ts(window_end) if window_end else self.vital_measured[row, col]
+        cutoff = end_ts - 24 * 3600
+        return [
+            (_from_ts(self.hist_times[row, col, i]), float(self.hist_values[row, col, i]))
+            for i in idx
+            if self.hist_times[row, col, i] >= cutoff
+        ]
+
+    # ------------------------------------------------------------------ 向量化推进
+
+    def step(self, current_time: datetime, rows: Optional[Sequence[int]] = None,
+             blocking: bool = True) -> int:
+        """向量化推进生理状态
+
+        Args:
+            current_time: 当前模拟时间
+            rows: 仅推进这些患者行（None 表示全部患者）
+            blocking: False 时若其他线程正在推进则直接跳过（推进是幂等的追赶操作）
+
+        Returns:
+            本次实际更新的患者数
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return 0
+        try:
+            return self._step_locked(_to_ts(current_time), rows)
+        finally:
+            self._lock.release()
+
+    def _step_locked(self, now_ts: float, rows: Optional[Sequence[int]]) -> int:
+        n = self.n_rows
+        if n == 0:
+            return 0
+
+        elapsed_hours = (now_ts - self.last_update[:n]) / 3600.0
+        eligible = self.active[:n] & (elapsed_hours >= MIN_UPDATE_HOURS)
+        if rows is not None:
+            selected = np.zeros(n, dtype=bool)
+            selected[np.asarray(rows, dtype=np.int64)] = True
+            eligible &= selected
+        if not eligible.any():
+            return 0
+        hours_by_row = np.where(eligible, elapsed_hours, 0.0)
+        rng = self._rng
+
+        # 1. 症状演变
+        m = self.n_slots
+        owner = self.sym_owner[:m]
+        sym_mask = self.sym_active[:m] & eligible[owner] if m else np.zeros(0, dtype=bool)
+        if sym_mask.any():
+            idx = np.nonzero(sym_mask)[0]
+            hours = hours_by_row[owner[idx]]
+            severity = self.sym_severity[idx]
+            treated = self.sym_treated[idx]
+            k = idx.size
+            change = np.where(
+                treated,
+                -self.sym_rate[idx] * self.sym_effectiveness[idx] * hours,           # 治疗后改善
+                np.where(
+                    severity > 7,
+                    self.sym_rate[idx] * hours * 1.5,                                 # 重度：确定恶化
+                    np.where(
+                        severity > 4,
+                        rng.uniform(0.0, 0.2, k) * hours,                             # 中度：轻微恶化或稳定
+                        rng.uniform(-0.1, 0.3, k) * hours,                            # 轻度：自然波动
+                    ),
+                ),
+            )
+            new_severity = np.clip(severity + change, 0.0, 10.0)
+            self.sym_trend[idx] = np.where(
+                new_severity > severity + 0.5, 2, np.where(new_severity < severity - 0.5, 1, 0)
+            )
+            self.sym_severity[idx] = new_severity
+
+        live = self.sym_active[:m]
+        sev_live = np.where(live, self.sym_severity[:m], 0.0)
+        total_severity = np.bincount(owner, weights=sev_live, minlength=n)[:n] if m else np.zeros(n)
+
+        # 2. 生命体征变化（旧值写入历史）
+        v = len(self.vital_keys)
+        vital_mask = self.vital_present[:n] & eligible[:, None]
+        rr, cc = np.nonzero(vital_mask)
+        if rr.size:
+            k = rr.size
+            hours = hours_by_row[rr]
+            severe = total_severity[rr] > 20  # 多个重症状：向异常方向漂移
+            drift = rng.uniform(0.5, 2.0, k) * np.where(rng.random(k) > 0.5, 1.0, -1.0)
+            change = np.where(severe, drift, rng.uniform(-0.5, 0.5, k)) * hours
+
+            pos = self.hist_count[rr, cc] % HISTORY_LEN
+            self.hist_values[rr, cc, pos] = self.vitals[rr, cc]
+            self.hist_times[rr, cc, pos] = self.vital_measured[rr, cc]
+            self.hist_count[rr, cc] += 1
+            self.vitals[rr, cc] += change
+            self.vital_measured[rr, cc] = now_ts
+
+        # 3. 体力消耗（症状越严重消耗越快）
+        energy_loss = hours_by_row * (1 + total_severity / 50)
+        self.energy[:n] = np.where(eligible, np.maximum(0.0, self.energy[:n] - energy_loss), self.energy[:n])
+
+        # 4. 疼痛水平
+        pain_sev = np.where(live & self.sym_is_pain[:m], self.sym_severity[:m], 0.0)
+        pain = (np.bincount(owner, weights=pain_sev, minlength=n)[:n] if m else np.zeros(n)) / len(PAIN_SYMPTOMS)
+        self.pain[:n] = np.where(eligible, pain, self.pain[:n])
+
+        # 5. 意识水平评估
+        vitals = self.vitals[:n, :v]
+        abnormal = self.vital_present[:n, :v] & ((vitals < self.vital_low) | (vitals > self.vital_high))
+        vital_abnormalities = abnormal.sum(axis=1)
+        severe_symptoms = (
+            np.bincount(owner, weights=(live & (self.sym_severity[:m] > 8)).astype(float), minlength=n)[:n]
+            if m else np.zeros(n)
+        )
+        consciousness = np.where(
+            (vital_abnormalities >= 3) | (severe_symptoms >= 2), 1,
+            np.where((vital_abnormalities >= 4) | (severe_symptoms >= 3), 2, 0),
+        )
+        self.consciousness[:n] = np.where(eligible, consciousness, self.consciousness[:n])
+
+        # 6. 危急状态
+        self.critical[:n] = np.where(eligible, self._critical_mask(n), self.critical[:n])
+
+        self.last_update[:n] = np.where(eligible, now_ts, self.last_update[:n])
+        return int(eligible.sum())
+
+    def _critical_mask(self, n: int) -> np.ndarray:
+        """按危急值阈值判定每位患者是否处于危急状态"""
+        critical = np.zeros(n, dtype=bool)
+        for key, (low, high) in CRITICAL_THRESHOLDS.items():
+            col = self.vital_col.get(key)
+            if col is None:
+                continue
+            values = self.vitals[:n, col]
+            present = self.vital_present[:n, col]
+            if low is not None:
+                critical |= present & (values < low)
+            if high is not None:
+                critical |= present & (values > high)
+        return critical
+
+    def is_critical(self, row: int) -> bool:
+        """即时判定单个患者是否处于危急状态（不依赖上次 step 的缓存）"""
+        return bool(self._critical_mask(self.n_rows)[row]) if row < self.n_rows else False
+
+    def assess_consciousness(self, row: int) -> None:
+        """即时重新评估单个患者的意识水平"""
+        with self._lock:
+            v = len(self.vital_keys)
+            present = self.vital_present[row, :v]
+            values = self.vitals[row, :v]
+            vital_abnormalities = int((present & ((values < self.vital_low) | (values > self.vital_high))).sum())
+            m = self.n_slots
+            mine = self.sym_active[:m] & (self.sym_owner[:m] == row)
+            severe_symptoms = int((mine & (self.sym_severity[:m] > 8)).sum())
+            if vital_abnormalities >= 3 or severe_symptoms >= 2:
+                self.consciousness[row] = 1
+            elif vital_abnormalities >= 4 or severe_symptoms >= 3:
+                self.consciousness[row] = 2
+            else:
+                self.consciousness[row] = 0
+
+
+class Symptom:
+    """症状视图 - 指向 PhysiologyEngine 中的一个症状槽位（槽位释放后访问抛出 ReleasedRowError）"""
+
+    __slots__ = ("name", "onset_time", "_engine", "_slot_id", "_row_id", "_generation")
+
+    def __init__(self, engine: PhysiologyEngine, row: int, slot: int, name: str,
+                 onset_time: Optional[datetime] = None):
+        self.name = name
+        self.onset_time = onset_time or datetime.now()
+        self._engine = engine
+        self._row_id = row
+        self._slot_id = slot
+        self._generation = int(engine.sym_generation[slot])
+
+    @property
+    def _slot(self) -> int:
+        self._engine.check_slot(self._slot_id, self._generation)
+        return self._slot_id
+
+    @property
+    def _row(self) -> int:
+        self._engine.check_slot(self._slot_id, self._generation)
+        return self._row_id
+
+    @property
+    def severity(self) -> float:
+        return float(self._engine.sym_severity[self._slot])
+
+    @severity.setter
+    def severity(self, value: float) -> None:
+        with self._engine._lock:
+            self._engine.sym_severity[self._slot] = value
+
+    @property
+    def progression_rate(self) -> float:
+        return float(self._engine.sym_rate[self._slot])
+
+    @progression_rate.setter
+    def progression_rate(self, value: float) -> None:
+        with self._engine._lock:
+            self._engine.sym_rate[self._slot] = value
+
+    @property
+    def trend(self) -> str:
+        return TREND_CODES[int(self._engine.sym_trend[self._slot])]
+
+    @trend.setter
+    def trend(self, value: str) -> None:
+        with self._engine._lock:
+            self._engine.sym_trend[self._slot] = TREND_CODES.index(value)
+
+    @property
+    def treated(self) -> bool:
+        return bool(self._engine.sym_treated[self._slot])
+
+    @property
+    def treatment_effectiveness(self) -> float:
+        return float(self._engine.sym_effectiveness[self._slot])
+
+    @property
+    def last_update(self) -> datetime:
+        return _from_ts(self._engine.last_update[self._row])
+
+    def apply_treatment(self, effectiveness: float = 0.8):
+        """应用治疗"""
+        with self._engine._lock:
+            self._engine.sym_treated[self._slot] = True
+            self._engine.sym_effectiveness[self._slot] = effectiveness
+
+    def __repr__(self) -> str:
+        return f"Symptom(name={self.name!r}, severity={self.severity:.2f}, trend={self.trend!r})"
+
+
+class VitalSign:
+    """生命体征视图 - 指向 PhysiologyEngine 中某患者的一个体征列（患者行释放后访问抛出 ReleasedRowError）"""
+
+    __slots__ = ("_engine", "_row_id", "_col", "_generation")
+
+    def __init__(self, engine: PhysiologyEngine, row: int, col: int):
+        self._engine = engine
+        self._row_id = row
+        self._col = col
+        self._generation = int(engine.row_generation[row])
+
+    @property
+    def _row(self) -> int:
+        self._engine.check_row(self._row_id, self._generation)
+        return self._row_id
+
+    @property
+    def name(self) -> str:
+        return self._engine.vital_names[self._col]
+
+    @property
+    def unit(self) -> str:
+        return self._engine.vital_units[self._col]
+
+    @property
+    def normal_range(self) -> Tuple[float, float]:
+        return float(self._engine.vital_low[self._col]), float(self._engine.vital_high[self._col])
+
+    @property
+    def value(self) -> float:
+        return float(self._engine.vitals[self._row, self._col])
+
+    @property
+    def last_measured(self) -> datetime:
+        return _from_ts(self._engine.vital_measured[self._row, self._col])
+
+    @property
+    def history(self) -> List[Tuple[datetime, float]]:
+        return self._engine.vital_history(self._row, self._col)
+
+    def is_normal(self) -> bool:
+        """检查是否在正常范围"""
+        low, high = self.normal_range
+        return low <= self.value <= high
+
+    def get_status(self) -> str:
+        """获取状态描述"""
+        low, high = self.normal_range
+        value = self.value
+        if value < low:
+            deviation = abs(value - low) / low * 100
+            if deviation > 20:
+                return "严重偏低"
+            elif deviation > 10:
+                return "偏低"
+            else:
+                return "略低"
+        elif value > high:
+            deviation = abs(value - high) / high * 100
+            if deviation > 20:
+                return "严重偏高"
+            elif deviation > 10:
+                return "偏高"
+            else:
+                return "略高"
+        return "正常"
+
+    def update(self, new_value: float, current_time: datetime):
+        """更新生命体征（旧值进入历史）"""
+        self._engine.record_vital(self._row, self._col, new_value, current_time)
+
+    def __repr__(self) -> str:
+        return f"VitalSign(name={self.name!r}, value={self.value:.2f}, unit={self.unit!r})"
+
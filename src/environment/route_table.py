@@ -0,0 +1,111 @@
+"""
+医院地图全源最短路径路由表
+
+医院地图在 HospitalWorld._build_hospital() 中一次性构建且基本静态，
+因此在建图时预先计算所有位置对之间的：
+- 下一跳表 next_hop[src][dst]
+- 跳数矩阵 hops[src][dst]
+- 步行耗时矩阵 travel_minutes[src][dst]（按走廊耗时加权的最短路）
+
+查询下一跳与距离均为 O(1)；路径重建为 O(路径长度)。
+仅当 allowed_moves 发生变化时才需要重建。
+"""
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+
+DEFAULT_STEP_MINUTES: float = 0.5  # 默认每段走廊步行耗时（分钟）
+
+
+class RouteTable:
+    """基于 Dijkstra 的全源最短路径表（以步行耗时为权重，跳数为次序键）。"""
+
+    def __init__(
+        self,
+        allowed_moves: Mapping[str, Sequence[str]],
+        edge_minutes: Optional[Mapping[Tuple[str, str], float]] = None,
+        default_step_minutes: float = DEFAULT_STEP_MINUTES,
+    ) -> None:
+        self.default_step_minutes = default_step_minutes
+        self._edge_minutes: Dict[Tuple[str, str], float] = dict(edge_minutes or {})
+
+        # 邻接集合：O(1) 判断是否可直接移动
+        self.adjacency: Dict[str, frozenset] = {
+            src: frozenset(dsts) for src, dsts in allowed_moves.items()
+        }
+        self._neighbors: Dict[str, Tuple[str, ...]] = {
+            src: tuple(dsts) for src, dsts in allowed_moves.items()
+        }
+
+        self.next_hop: Dict[str, Dict[str, str]] = {}
+        self.hops: Dict[str, Dict[str, int]] = {}
+        self.travel_minutes: Dict[str, Dict[str, float]] = {}
+
+        for src in self._neighbors:
+            self._build_from(src)
+
+    def edge_cost(self, src: str, dst: str) -> float:
+        """单段走廊的步行耗时（分钟）"""
+        return self._edge_minutes.get((src, dst), self.default_step_minutes)
+
+    def _build_from(self, src: str) -> None:
+        """以 src 为源点运行 Dijkstra，填充该行的下一跳/跳数/耗时"""
+        next_hop: Dict[str, str] = {}
+        hops: Dict[str, int] = {src: 0}
+        minutes: Dict[str, float] = {src: 0.0}
+
+        # 堆元素：(累计耗时, 跳数, 当前位置, 第一跳)；相同耗时优先跳数少的路径
+        heap: List[Tuple[float, int, str, str]] = []
+        for neighbor in self._neighbors.get(src, ()):
+            heapq.heappush(heap, (self.edge_cost(src, neighbor), 1, neighbor, neighbor))
+
+        while heap:
+            cost, n_hops, node, first = heapq.heappop(heap)
+            if node in minutes:
+                continue
+            minutes[node] = cost
+            hops[node] = n_hops
+            next_hop[node] = first
+            for neighbor in self._neighbors.get(node, ()):
+                if neighbor not in minutes:
+                    heapq.heappush(
+                        heap,
+                        (cost + self.edge_cost(node, neighbor), n_hops + 1, neighbor, first),
+                    )
+
+        self.next_hop[src] = next_hop
+        self.hops[src] = hops
+        self.travel_minutes[src] = minutes
+
+    def is_adjacent(self, src: str, dst: str) -> bool:
+        """是否可直接移动（一步可达）"""
+        return dst in self.adjacency.get(src, ())
+
+    def get_next_hop(self, src: str, dst: str) -> Optional[str]:
+        """获取从 src 前往 dst 的下一跳；不可达或 src == dst 时返回 None"""
+        return self.next_hop.get(src, {}).get(dst)
+
+    def get_hops(self, src: str, dst: str) -> Optional[int]:
+        """获取最短路径跳数；不可达返回 None"""
+        return self.hops.get(src, {}).get(dst)
+
+    def get_travel_minutes(self, src: str, dst: str) -> Optional[float]:
+        """获取最短路径步行耗时（分钟）；不可达返回 None"""
+        return self.travel_minutes.get(src, {}).get(dst)
+
+    def path(self, src: str, dst: str) -> List[str]:
+        """重建路径（不包含起点，包含终点）；不可达或 src == dst 返回空列表"""
+        if src == dst:
+            return []
+        row = self.next_hop.get(src)
+        if row is None or dst not in row:
+            return []
+
+        path: List[str] = []
+        current = src
+        while current != dst:
+            current = self.next_hop[current][dst]
+            path.append(current)
+        return path
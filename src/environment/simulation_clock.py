@@ -15,7 +15,7 @@ from __future__ import annotations
 import threading
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 
 DEFAULT_TICK_MINUTES: int = 1
@@ -120,8 +120,27 @@ class SimulationClock:
         affect_system: bool = False,
         resource_actor_id: Optional[str] = None,
     ) -> datetime:
+        """推进模拟时间，返回推进后的全局时间（规则见 advance_span）。"""
+        return self.advance_span(
+            minutes,
+            patient_id,
+            affect_resource=affect_resource,
+            affect_system=affect_system,
+            resource_actor_id=resource_actor_id,
+        )[1]
+
+    def advance_span(
+        self,
+        minutes: float,
+        patient_id: Optional[str] = None,
+        *,
+        affect_resource: bool = False,
+        affect_system: bool = False,
+        resource_actor_id: Optional[str] = None,
+    ) -> Tuple[datetime, datetime]:
         """
-        推进模拟时间。
+        原子地推进模拟时间，返回 (推进前全局时间, 推进后全局时间)。
+        调用方无需额外加锁即可判断是否跨天等。
 
                 规则：
                 - patient_id：推进患者个人时间轴（就诊有效时长）。
@@ -133,6 +152,7 @@ class SimulationClock:
         ticks = max(1, round(minutes / self.tick_minutes))
 
         with self._lock:
+            before = self.current_datetime
             touched = False
 
             if patient_id is not None:
@@ -171,7 +191,7 @@ class SimulationClock:
 
             self._recompute_global_tick()
 
-            return self.current_datetime
+            return before, self.current_datetime
 
     def patient_elapsed_minutes(self, patient_id: str) -> float:
         """获取患者有效就诊时长（分钟）。"""
@@ -7,12 +7,18 @@ from __future__ import annotations
 - 通用后置：
   若 need_aux_tests=True：C8 开单并解释准备 -> C9 缴费与预约 -> C10 执行检查取报告 -> C11 回诊
   最终：C12 综合分析明确诊断/制定方案 -> C13 处置 -> C14 文书 -> C15 宣教随访 -> C16 结束
+  （agent.parallel_post_diagnosis：C14 / C15 的检索与生成在 C13 结束时并行开始，节点按原顺序取回结果）
 """
 
+import contextvars
+import copy
+import functools
+import threading
 import time
 import json
 import re
 import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any, Callable
 
@@ -25,9 +31,12 @@ from rag.keyword_generator import RAGKeywordGenerator, NodeContext
 from services.appointment import AppointmentService
 from services.billing import BillingService
 from services.llm_client import LLMClient
+from services.prompt_budget import PromptBudget, count_tokens, dedupe_chunks, format_chunks
+from services.lab_catalog import equipment_type_for
 from state.schema import BaseState, make_audit_entry
 from logging_utils import should_log, get_output_level, OutputFilter, SUPPRESS_UNCHECKED_LOGS
-from logging_utils import compute_groundedness_similarity, log_groundedness
+from logging_utils import compute_groundedness_similarity, log_groundedness, traced_node
+from logging_utils import capture_node_usage, merge_node_usage
 from utils import (
     parse_json_with_retry,
     get_logger,
@@ -62,21 +71,90 @@ class Services:
     billing: BillingService
 
 
+class _PostDiagnosisFanOut:
+    """诊后生成的 fan-out / fan-in（agent.parallel_post_diagnosis）
+
+    C13 给出处置决定后，C14 文书与 C15 宣教随访的检索与 LLM 生成只读取同一份输入快照、互不依赖，
+    C13 结束时一起提交到后台线程；C14 / C15 节点取回各自结果后再写日志、推进模拟时间、更新状态，
+    输出与顺序执行一致。后台生成中的 LLM / 检索消耗在取回时归属到 C14 / C15 节点。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._jobs: dict[tuple[str, str, str], Future] = {}
+
+    @staticmethod
+    def _key(state: BaseState, node_id: str) -> tuple[str, str, str]:
+        return (state.run_id, str(state.patient_id or ""), node_id)
+
+    def submit(self, state: BaseState, jobs: dict[str, Callable[[], Any]]) -> None:
+        """为每个节点提交一个后台生成任务（每个任务一个线程，任务结束后线程退出）"""
+        executor = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="post-diagnosis")
+        try:
+            with self._lock:
+                for node_id, job in jobs.items():
+                    self._jobs[self._key(state, node_id)] = executor.submit(
+                        contextvars.copy_context().run, capture_node_usage, job
+                    )
+        finally:
+            executor.shutdown(wait=False)
+
+    def take(self, state: BaseState, node_id: str, generate: Callable[[], Any]) -> Any:
+        """取回 node_id 的生成结果；没有预先提交的任务时在当前线程执行 generate()"""
+        with self._lock:
+            future = self._jobs.pop(self._key(state, node_id), None)
+        if future is None:
+            return generate()
+        result, usage = future.result()
+        merge_node_usage(usage)
+        return result
+
+    def discard(self, state: BaseState) -> int:
+        """取消并丢弃本次就诊尚未取回的全部任务（已在运行的任务结束后结果直接丢弃），返回丢弃数"""
+        prefix = self._key(state, "")[:2]
+        with self._lock:
+            keys = [key for key in self._jobs if key[:2] == prefix]
+            futures = [self._jobs.pop(key) for key in keys]
+        for future in futures:
+            future.cancel()
+        return len(futures)
+
+    def discard_on_error(self, node: Callable[[BaseState], BaseState]) -> Callable[[BaseState], BaseState]:
+        """包装取回结果的节点：节点异常时丢弃本次就诊其余未取回的任务，避免其 Future 滞留"""
+        @functools.wraps(node)
+        def wrapper(state: BaseState) -> BaseState:
+            try:
+                return node(state)
+            except BaseException:
+                self.discard(state)
+                raise
+        return wrapper
+
+
 def _default_channel() -> str:
     return "APP"  # 默认使用APP预约
 
 
-def _chunks_for_prompt(chunks: list[dict[str, Any]], *, max_chars: int = 1600) -> str:
-    lines: list[str] = []
-    total = 0
-    for c in chunks:
-        text = str(c.get("text") or "").replace("\n", " ").strip()
-        line = f"[{c.get('doc_id')}#{c.get('chunk_id')}] {text[:260]}"
-        lines.append(line)
-        total += len(line) + 1
-        if total >= max_chars:
-            break
-    return "\n".join(lines)
+def _chunks_for_prompt(chunks: list[dict[str, Any]], *, max_tokens: int = 1200) -> str:
+    """引用片段：去重后按相关度顺序拼接，单条不超过 240 tokens，整体不超过 max_tokens"""
+    return format_chunks(chunks, max_tokens, max_chunk_tokens=240)
+
+
+def _budget_evidence_and_chunks(
+    evidence: dict[str, Any], chunks: list[dict[str, Any]], *, fixed_text: str
+) -> tuple[str, str]:
+    """C12 诊断提示词的可变部分：扣除模板等固定文本后，结构化证据优先、引用片段其次分配 token 预算"""
+    lines = [
+        f"[{c.get('doc_id')}#{c.get('chunk_id')}] " + str(c.get("text") or "").replace("\n", " ").strip()
+        for c in dedupe_chunks(chunks)
+    ]
+    parts = (
+        PromptBudget(reserved_tokens=count_tokens(fixed_text))
+        .add("evidence", json.dumps(evidence, ensure_ascii=False, indent=2), priority=2)
+        .add_items("chunks", lines, priority=1, min_tokens=400, max_item_tokens=240, dedupe=False)
+        .build()
+    )
+    return parts["evidence"], parts["chunks"]
 
 
 class CommonOPDGraph:
@@ -108,6 +186,7 @@ class CommonOPDGraph:
         self.lab_agent = lab_agent
         self.max_questions = max_questions
         self.world = world
+        self._post_diagnosis = _PostDiagnosisFanOut()  # C14 / C15 并行生成
         
         # 初始化 RAG 关键词生成器
         self.keyword_generator = RAGKeywordGenerator()
@@ -123,76 +202,12 @@ class CommonOPDGraph:
         Returns:
             设备类型字符串，对应 hospital_world.py 中的 exam_type
         """
-        test_lower = test_name.lower()
         type_lower = test_type.lower()
         
-        # ========== 影像检查设备 ==========
-        if any(keyword in test_lower for keyword in ["头颅ct", "颅脑ct", "ct头", "head ct", "头部ct"]):
-            return "ct_head"
-        if any(keyword in test_lower for keyword in ["脑mri", "颅脑mri", "mri脑", "brain mri", "头部mri", "mri头"]):
-            return "mri_brain"
-        
-        # ========== 神经电生理检查设备 ==========
-        if any(keyword in test_lower for keyword in ["脑电图", "eeg", "脑电", "脑波"]):
-            return "eeg"
-        if any(keyword in test_lower for keyword in ["肌电图", "emg", "神经传导", "肌电"]):
-            return "emg"
-        if any(keyword in test_lower for keyword in ["tcd", "经颅多普勒", "脑血流", "颅内多普勒"]):
-            return "tcd"
-        
-        # ========== 检验科检查设备（按检验项目分类）==========
-        # 血常规
-        if any(keyword in test_lower for keyword in ["血常规", "cbc", "血细胞", "血液常规", "全血细胞"]):
-            return "cbc"
-        
-        # 基础生化（肝肾功能、血糖、血脂等）
-        if any(keyword in test_lower for keyword in [
-            "生化", "肝功", "肾功", "血糖", "血脂", "尿酸", "肌酐", "尿素氮", 
-            "转氨酶", "胆红素", "白蛋白", "总蛋白", "甘油三酯", "胆固醇",
-            "biochem", "liver", "kidney", "glucose", "lipid"
-        ]):
-            return "biochem_basic"
-        
-        # 电解质
-        if any(keyword in test_lower for keyword in ["电解质", "钠", "钾", "氯", "钙", "镁", "electrolyte", "na+", "k+"]):
-            return "electrolyte"
-        
-        # 凝血功能
-        if any(keyword in test_lower for keyword in [
-            "凝血", "pt", "aptt", "inr", "d-二聚体", "纤维蛋白", 
-            "凝血酶原", "活化部分凝血活酶", "coagulation", "d-dimer"
-        ]):
-            return "coagulation"
-        
-        # 炎症/感染指标
-        if any(keyword in test_lower for keyword in [
-            "crp", "c反应蛋白", "降钙素原", "pct", "血沉", "esr", 
-            "炎症", "感染", "inflammation", "infection"
-        ]):
-            return "inflammation"
-        
-        # 心肌与血管风险指标（卒中相关）
-        if any(keyword in test_lower for keyword in [
-            "心肌酶", "肌钙蛋白", "troponin", "bnp", "nt-probnp", 
-            "同型半胱氨酸", "脂蛋白", "lp(a)", "homocysteine", 
-            "心脑血管", "卒中标志", "cardiac", "stroke marker"
-        ]):
-            return "cardiac_stroke_markers"
-        
-        # 自身免疫抗体
-        if any(keyword in test_lower for keyword in [
-            "自免", "抗体", "自身免疫", "ana", "抗核抗体", "抗神经", 
-            "抗磷脂", "autoimmune", "antibody", "抗nmda", "抗mog"
-        ]):
-            return "autoimmune_antibody"
-        
-        # ========== 神经功能评估检查 ==========
-        if any(keyword in test_lower for keyword in [
-            "言语功能", "语言评估", "吞咽功能", "吞咽评估", "认知功能", "认知评估",
-            "记忆评估", "智力测验", "神经心理", "运动功能", "平衡功能", "步态分析",
-            "speech assessment", "swallowing", "cognitive", "neuropsych", "balance"
-        ]):
-            return "general_exam"
+        # 关键词映射（影像 / 神经电生理 / 检验 / 功能评估，词表见 services.lab_catalog）
+        exam_type = equipment_type_for(test_name)
+        if exam_type:
+            return exam_type
         
         # ========== 默认映射（根据类型）==========
         # 功能检查类：使用通用检查设备
@@ -985,8 +1000,8 @@ class CommonOPDGraph:
 
                     if self.world:
                         matching_equip = [
-                            eq for eq in self.world.equipment.values()
-                            if eq.exam_type == exam_type and eq.status != "offline"
+                            eq for eq in self.world.get_equipment_by_type(exam_type)
+                            if eq.status != "offline"
                         ]
                         if matching_equip:
                             # 选等待时间最短的设备
@@ -1057,8 +1072,8 @@ class CommonOPDGraph:
                     }
                     if self.world:
                         matching_equip = [
-                            eq for eq in self.world.equipment.values()
-                            if eq.exam_type == exam_type and eq.status != "offline"
+                            eq for eq in self.world.get_equipment_by_type(exam_type)
+                            if eq.status != "offline"
                         ]
                         if matching_equip:
                             best_eq = min(
@@ -1191,7 +1206,7 @@ class CommonOPDGraph:
                     if equipment_id:
                         eq = self.world.equipment.get(equipment_id)
                         if eq:
-                            all_same_type = [e for e in self.world.equipment.values() if e.exam_type == eq.exam_type]
+                            all_same_type = self.world.get_equipment_by_type(eq.exam_type)
                             busy_count = len([e for e in all_same_type if e.is_occupied])
                             total_count = len(all_same_type)
 
@@ -1259,31 +1274,34 @@ class CommonOPDGraph:
 
                 # ── 阶段二：统一生成检查报告（LLM 调用集中在此，不夹在移动之间）─
                 _log_detail(f"\n  📝 生成检查报告（{len(pending_tests)}项）...", state, 2, "C10")
-                for pt in pending_tests:
+                # 检验科一次处理全部检查：病例中已有的结果直接引用，其余合并为一次 LLM 调用
+                lab_results: list[dict[str, Any]] = []
+                if self.lab_agent and pending_tests:
+                    try:
+                        lab_context = {
+                            "ordered_tests": [pt["test"] for pt in pending_tests],
+                            "chief_complaint": state.chief_complaint,
+                            "case_info": state.patient_profile.get("case_text", ""),
+                            "real_tests_reference": real_diagnostic_tests if real_diagnostic_tests else None,
+                            "dept": state.dept,
+                            "patient_id": state.patient_id,
+                        }
+                        lab_results = self.lab_agent.generate_test_results(lab_context) or []
+                        if not isinstance(lab_results, list):
+                            lab_results = []
+                    except Exception as e:
+                        logger.error(f"    ❌ 检验科Agent生成失败: {e}")
+                for idx, pt in enumerate(pending_tests):
                     test = pt["test"]
-                    single_result = None
-                    if self.lab_agent:
-                        try:
-                            single_test_context = {
-                                "ordered_tests": [test],
-                                "chief_complaint": state.chief_complaint,
-                                "case_info": state.patient_profile.get("case_text", ""),
-                                "real_tests_reference": real_diagnostic_tests if real_diagnostic_tests else None,
-                                "dept": state.dept,
-                                "patient_id": state.patient_id,
-                            }
-                            lab_results = self.lab_agent.generate_test_results(single_test_context)
-                            if lab_results and isinstance(lab_results, list) and len(lab_results) > 0:
-                                single_result = lab_results[0]
-                                single_result["source"] = "lab_agent"
-                                if real_diagnostic_tests:
-                                    single_result["reference_data"] = "dataset"
-                                abnormal = single_result.get("abnormal", False)
-                                status = "⚠️ 异常" if abnormal else "✓ 正常"
-                                test_name = test.get("test_name", test.get("name", ""))
-                                _log_detail(f"    {status} {test_name} 结果已生成", state, 2, "C10")
-                        except Exception as e:
-                            logger.error(f"    ❌ 检验科Agent生成失败: {e}")
+                    single_result = lab_results[idx] if idx < len(lab_results) else None
+                    if single_result:
+                        single_result["source"] = "lab_agent"
+                        if real_diagnostic_tests:
+                            single_result["reference_data"] = "dataset"
+                        abnormal = single_result.get("abnormal", False)
+                        status = "⚠️ 异常" if abnormal else "✓ 正常"
+                        test_name = test.get("test_name", test.get("name", ""))
+                        _log_detail(f"    {status} {test_name} 结果已生成", state, 2, "C10")
 
                     if not single_result:
                         single_result = {
@@ -2040,10 +2058,9 @@ class CommonOPDGraph:
                     + "- uncertainty: 诊断确定程度（high/medium/low）\n"
                     + "- rule_out: 已排除的诊断及排除依据\n\n"
                     + "【输入结构化信息】\n"
-                    + json.dumps(evidence_summary, ensure_ascii=False, indent=2)
-                    + "\n\n【引用片段（可追溯）】\n"
-                    + _chunks_for_prompt(all_chunks)
-                    + "\n\n请仅输出 JSON，必须包含以下字段：\n"
+                )
+                prompt_tail = (
+                    "\n\n请仅输出 JSON，必须包含以下字段：\n"
                     + "- diagnosis: {\n"
                     + "    name, evidence: [列表], reasoning,\n"
                     + "    uncertainty, rule_out: [列表]\n"
@@ -2052,6 +2069,10 @@ class CommonOPDGraph:
                     + "- followup_plan: {when, monitoring, emergency, long_term_goals}\n"
                     + "- escalations: [列表，可选]"
                 )
+                evidence_text, chunks_text = _budget_evidence_and_chunks(
+                    evidence_summary, all_chunks, fixed_text=system_prompt + user_prompt + prompt_tail
+                )
+                user_prompt += evidence_text + "\n\n【引用片段（可追溯）】\n" + chunks_text + prompt_tail
                 
                 # 调用LLM生成诊断
                 obj, used_fallback, _raw = self.llm.generate_json(
@@ -2190,18 +2211,11 @@ class CommonOPDGraph:
                                 + "- uncertainty: 诊断确定程度（high/medium/low）\n"
                                 + "- rule_out: 已排除的诊断及排除依据\n\n"
                                 + "【输入结构化信息】\n"
-                                + json.dumps(evidence_summary, ensure_ascii=False, indent=2)
-                                + "\n\n【引用片段（可追溯）】\n"
-                                + _chunks_for_prompt(all_chunks)
-                                + "\n\n请仅输出 JSON，必须包含以下字段：\n"
-                                + "- diagnosis: {\n"
-                                + "    name, evidence: [列表], reasoning,\n"
-                                + "    uncertainty, rule_out: [列表]\n"
-                                + "  }\n"
-                                + "- treatment_plan: {symptomatic, etiology, tests, referral, admission, followup}\n"
-                                + "- followup_plan: {when, monitoring, emergency, long_term_goals}\n"
-                                + "- escalations: [列表，可选]"
                             )
+                            evidence_text, chunks_text = _budget_evidence_and_chunks(
+                                evidence_summary, all_chunks, fixed_text=system_prompt + user_prompt_updated + prompt_tail
+                            )
+                            user_prompt_updated += evidence_text + "\n\n【引用片段（可追溯）】\n" + chunks_text + prompt_tail
                             
                             # 重新调用LLM
                             obj_updated, used_fallback_updated, _raw_updated = self.llm.generate_json(
@@ -2371,6 +2385,262 @@ class CommonOPDGraph:
             _log_node_end("C12", state)
             return state
 
+        # ===== 诊后生成：C14 文书 / C15 宣教随访 =====
+        # 生成部分（检索 + LLM）只读取 C13 结束时的输入快照，可在后台线程执行（agent.parallel_post_diagnosis）；
+        # 日志、模拟时间推进与状态更新留在各自节点中按原顺序进行
+
+        # 神经内科默认宣教内容
+        default_education = [
+            "监测：头痛/眩晕频率与诱因记录",
+            "如有癫痫样发作风险，避免危险作业并按医嘱用药",
+            "出现意识障碍/肢体无力/言语不清等立即急诊",
+        ]
+        document_types = ["门诊病历", "诊断证明", "病假条", "宣教单"]
+
+        def _post_diagnosis_inputs(state: BaseState) -> dict[str, Any]:
+            """C14 / C15 生成所需的输入快照（C13 处置决定之后、C15 更新随访计划之前）"""
+            profile = state.patient_profile or {}
+            # 获取就诊日期（从物理世界时间）
+            visit_date = "未知日期"
+            if self.world and self.world.current_time:
+                visit_date = self.world.current_time.strftime("%Y年%m月%d日")
+            return copy.deepcopy({
+                "parallel": bool(state.agent_config.get("parallel_post_diagnosis", True)),
+                "patient_id": state.patient_id,
+                "dept": state.dept,
+                "dept_name": state.dept_name if hasattr(state, "dept_name") else None,
+                "chief_complaint": state.chief_complaint,
+                "patient_name": profile.get("name", state.patient_id),
+                "patient_age": profile.get("age", "未知"),
+                "patient_gender": profile.get("gender", "未知"),
+                "visit_date": visit_date,
+                "doctor_name": state.assigned_doctor_name if state.assigned_doctor_name else "主治医师",
+                "history": state.history,
+                "exam_findings": state.exam_findings,
+                "diagnosis": state.diagnosis,
+                "treatment_plan": state.treatment_plan,
+                "test_results": [{
+                    "test": r.get("test_name"),
+                    "result": r.get("summary")
+                } for r in state.test_results] if state.test_results else [],
+                "followup_plan": state.followup_plan,
+                "escalations": state.escalations,
+            })
+
+        def _post_diagnosis_node_ctx(inputs: dict[str, Any], node_id: str, node_name: str) -> NodeContext:
+            return NodeContext(
+                node_id=node_id,
+                node_name=node_name,
+                dept=inputs["dept"],
+                dept_name=inputs["dept_name"],
+                chief_complaint=inputs["chief_complaint"],
+                preliminary_diagnosis=inputs["diagnosis"].get("name") if inputs["diagnosis"] else None,
+            )
+
+        def _document_prompt(doc_type: str, context: dict[str, Any], patient_history_context: str) -> str:
+            user_prompt = (
+                f"请生成一份专业的{doc_type}。\n\n"
+                + "【患者信息】\n"
+                + json.dumps(context, ensure_ascii=False, indent=2)
+                + patient_history_context  # 添加患者历史上下文
+                + "\n\n【文书要求】\n"
+            )
+            if doc_type == "门诊病历":
+                user_prompt += (
+                    "1. 包含：主诉、现病史、体格检查、辅助检查、诊断、治疗计划\n"
+                    "2. 格式规范，使用医学术语\n"
+                    "3. 内容完整准确\n"
+                    "4. **重要**：必须使用上述提供的实际患者信息（姓名、年龄、性别、日期、医生等），不要使用【待补充】或【请填写】等占位符\n"
+                )
+            elif doc_type == "诊断证明":
+                user_prompt += (
+                    "1. 简洁明了，突出诊断\n"
+                    "2. 包含就诊日期、诊断名称\n"
+                    "3. 医学术语准确\n"
+                    "4. **重要**：必须使用上述提供的实际患者信息和就诊日期，不要使用【待补充】或【请填写】等占位符\n"
+                )
+            elif doc_type == "病假条":
+                user_prompt += (
+                    "1. 根据诊断建议合理休息天数\n"
+                    "2. 格式正式\n"
+                    "3. 包含就诊日期和诊断\n"
+                    "4. **重要**：必须使用上述提供的实际患者信息和就诊日期，不要使用【待补充】或【请填写】等占位符\n"
+                )
+            elif doc_type == "宣教单":
+                user_prompt += (
+                    "1. 通俗易懂，便于患者理解\n"
+                    "2. 包含疾病知识、注意事项、复诊提醒\n"
+                    "3. 强调红旗症状\n"
+                    "4. 可以省略患者姓名和个人信息，但如果提到就诊相关内容，必须使用实际提供的信息\n"
+                )
+            return user_prompt + "\n请直接输出文书内容，不要添加标题或其他说明。"
+
+        def _generate_documents(inputs: dict[str, Any]) -> dict[str, Any]:
+            """C14 生成：检索文书模板与患者历史病历，再用 LLM 生成各种文书（并行模式下各份文书同时生成）"""
+            node_ctx_c14 = _post_diagnosis_node_ctx(inputs, "C14", "生成文书")
+            # 【增强RAG】1. 检索文书模板（使用关键词生成器）
+            # C14节点用途：检索规则流程库获取门诊病历/诊断证明/病假条/宣教单模板，综合患者信息和医学指南和相关案例得出
+            # 使用：规则流程库(HospitalProcess_db) - 检索病历/证明/病假条模板
+            template_query = self.keyword_generator.generate_keywords(node_ctx_c14, "HospitalProcess_db")
+            # 【单一数据库检索】只查询规则流程库
+            template_chunks = self.retriever.retrieve(
+                template_query,
+                filters={"db_name": "HospitalProcess_db"},
+                k=6,
+            )
+
+            # 【增强RAG】2. 检索患者历史病历（使用关键词生成器）
+            history_query, history_chunks = "", []
+            patient_history_context = ""
+            if inputs["patient_id"]:
+                history_query = self.keyword_generator.generate_keywords(node_ctx_c14, "UserHistory_db")
+                # 【单一数据库检索】只查询患者历史库
+                history_chunks = self.retriever.retrieve(
+                    history_query,
+                    filters={"db_name": "UserHistory_db", "patient_id": inputs["patient_id"]},
+                    k=3,
+                )
+                if history_chunks:
+                    # 构建历史上下文（每条截取前200字符）
+                    history_texts = [chunk.get("text", "")[:200] for chunk in history_chunks if chunk.get("text", "")]
+                    patient_history_context = "\n\n【患者历史病历摘要】\n" + "\n".join(history_texts)
+
+            # 准备文书生成所需的上下文
+            context = {
+                # 患者基本信息
+                "patient_id": inputs["patient_id"],
+                "patient_name": inputs["patient_name"],
+                "patient_age": inputs["patient_age"],
+                "patient_gender": inputs["patient_gender"],
+                "visit_date": inputs["visit_date"],
+                "doctor_name": inputs["doctor_name"],
+                # 医疗信息
+                "dept": inputs["dept"],
+                "chief_complaint": inputs["chief_complaint"],
+                "history": inputs["history"],
+                "exam_findings": inputs["exam_findings"],
+                "diagnosis": inputs["diagnosis"],
+                "treatment_plan": inputs["treatment_plan"],
+                "test_results": inputs["test_results"],
+                "followup_plan": inputs["followup_plan"],
+            }
+            system_prompt = load_prompt("common_system.txt")
+
+            def generate(doc_type: str) -> dict[str, Any]:
+                # 根据文书类型设置合适的token限制
+                max_tokens = 2000 if doc_type == "宣教单" else 1200 if doc_type == "门诊病历" else 800
+                try:
+                    content = self.llm.generate_text(
+                        system_prompt=system_prompt,
+                        user_prompt=_document_prompt(doc_type, context, patient_history_context),
+                        temperature=0.2,
+                        max_tokens=max_tokens
+                    )
+                    return {"doc_type": doc_type, "content": content.strip(), "generated_by": "llm"}
+                except Exception as e:
+                    return {
+                        "doc_type": doc_type,
+                        "content": f"{doc_type}生成失败",
+                        "generated_by": "fallback",
+                        "error": str(e)
+                    }
+
+            if inputs["parallel"]:
+                docs = []
+                with ThreadPoolExecutor(max_workers=len(document_types), thread_name_prefix="c14-docs") as pool:
+                    futures = [
+                        pool.submit(contextvars.copy_context().run, capture_node_usage, generate, doc_type)
+                        for doc_type in document_types
+                    ]
+                    for future in futures:
+                        doc, usage = future.result()
+                        merge_node_usage(usage)
+                        docs.append(doc)
+            else:
+                docs = [generate(doc_type) for doc_type in document_types]
+
+            return {
+                "template_query": template_query,
+                "template_chunks": template_chunks,
+                "history_query": history_query,
+                "history_chunks": history_chunks,
+                "docs": docs,
+            }
+
+        def _generate_education(inputs: dict[str, Any]) -> dict[str, Any]:
+            """C15 生成：检索宣教知识并用 LLM 生成宣教内容与随访计划"""
+            node_ctx_c15 = _post_diagnosis_node_ctx(inputs, "C15", "宣教与随访")
+            # 【增强RAG】C15: 检索规则流程库（使用关键词生成器）
+            # C15节点用途：检索规则流程库获取疾病科普材料、生活方式指导、健康宣教和随访计划模板，并综合患者信息得出最后内容
+            # 使用：规则流程库(HospitalProcess_db) - 为患者提供个性化健康教育和长期管理建议
+            query = self.keyword_generator.generate_keywords(node_ctx_c15, "HospitalProcess_db")
+            # 【单一数据库检索】只查询规则流程库
+            all_chunks = self.retriever.retrieve(
+                query,
+                filters={"db_name": "HospitalProcess_db"},
+                k=8,
+            )
+            result: dict[str, Any] = {"query": query, "chunks": all_chunks, "raw": None, "error": None}
+
+            education = list(default_education)
+            followup_plan = inputs["followup_plan"]
+            if self.llm is None:
+                llm_text = json.dumps(
+                    {"education": education, "disclaimer": disclaimer_text()}, ensure_ascii=False
+                )
+                result["parsed"], result["used_fallback"] = parse_json_with_retry(
+                    llm_text,
+                    fallback=lambda: {"education": education, "disclaimer": disclaimer_text()},
+                )
+                return result
+
+            system_prompt = load_prompt("common_system.txt")
+            user_prompt = (
+                load_prompt("common_education.txt")
+                + "\n\n【输入结构化信息】\n"
+                + json.dumps(
+                    {
+                        "dept": inputs["dept"],
+                        "diagnosis": inputs["diagnosis"],
+                        "treatment_plan": inputs["treatment_plan"],
+                        "followup_plan": followup_plan,
+                        "escalations": inputs["escalations"],
+                        "education_fallback": education,
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n\n【参考宣教片段（可追溯）】\n"
+                + _chunks_for_prompt(all_chunks)
+                + "\n\n请仅输出 JSON，可包含 education(list) 与 followup_plan(dict)。"
+            )
+            try:
+                result["parsed"], result["used_fallback"], result["raw"] = self.llm.generate_json(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    fallback=lambda: {
+                        "education": education,
+                        "followup_plan": {
+                            "when": followup_plan.get("when", "1-2周内复诊"),
+                            "monitoring": followup_plan.get("monitoring", ["症状变化"]),
+                            "emergency": followup_plan.get("emergency", ["出现红旗症状立即急诊"])[:3],  # 限制最多3项
+                            "long_term_goals": followup_plan.get("long_term_goals", ["明确诊断", "症状控制"]),
+                        },
+                        "disclaimer": disclaimer_text(),
+                    },
+                    temperature=0.2,
+                    max_tokens=1500,  # 增加token限制，确保JSON完整
+                )
+            except Exception as e:
+                # 使用fallback
+                result["parsed"] = {
+                    "education": education,
+                    "followup_plan": followup_plan,
+                    "disclaimer": disclaimer_text(),
+                }
+                result["used_fallback"] = True
+                result["error"] = e
+            return result
+
         def c13_disposition(state: BaseState) -> BaseState:
             state.world_context = self.world
             state.node_log_time = ""  # 清除继承的旧时间戳
@@ -2502,6 +2772,14 @@ class CommonOPDGraph:
                     chunks=[],
                 )
             )
+
+            # 诊后 fan-out：C14 文书与 C15 宣教随访只依赖上面的诊断、方案与处置决定，从这里开始并行生成
+            if state.agent_config.get("parallel_post_diagnosis", True):
+                inputs = _post_diagnosis_inputs(state)
+                self._post_diagnosis.submit(state, {
+                    "C14": lambda: _generate_documents(inputs),
+                    "C15": lambda: _generate_education(inputs),
+                })
             _log_node_end("C13", state)
             return state
 
@@ -2515,68 +2793,28 @@ class CommonOPDGraph:
             # 显示物理环境状态
             _log_physical_state(state, "C14", level=2)
             
-            # 获取查询优化器
-            query_optimizer = get_query_optimizer()
-            
-            # 构建查询上下文
-            query_ctx = QueryContext(
-                patient_id=state.patient_id,
-                age=state.patient_profile.get("age") if state.patient_profile else None,
-                gender=state.patient_profile.get("gender") if state.patient_profile else None,
-                chief_complaint=state.chief_complaint,
-                dept=state.dept,
-                preliminary_diagnosis=state.diagnosis.get("name") if state.diagnosis else None,
+            # 检索与文书生成：并行模式下已在 C13 结束时开始，这里取回结果
+            generated = self._post_diagnosis.take(
+                state, "C14", lambda: _generate_documents(_post_diagnosis_inputs(state))
             )
-            
-            # 【增强RAG】1. 检索文书模板（使用关键词生成器）
-            # C14节点用途：检索规则流程库获取门诊病历/诊断证明/病假条/宣教单模板，综合患者信息和医学指南和相关案例得出
-            # 使用：规则流程库(HospitalProcess_db) - 检索病历/证明/病假条模板
+
             _log_detail("\n🔍 检索文书模板[规则流程库]...", state, 1, "C14")
-            node_ctx_c14 = NodeContext(
-                node_id="C14",
-                node_name="生成文书",
-                dept=state.dept,
-                dept_name=state.dept_name if hasattr(state, "dept_name") else None,
-                chief_complaint=state.chief_complaint,
-                preliminary_diagnosis=state.diagnosis.get("name") if state.diagnosis else None,
-            )
-            query = self.keyword_generator.generate_keywords(node_ctx_c14, "HospitalProcess_db")
-            # 【单一数据库检索】只查询规则流程库
-            template_chunks = self.retriever.retrieve(
-                query,
-                filters={"db_name": "HospitalProcess_db"},
-                k=6,
-            )
-            _log_rag_retrieval(query, template_chunks, state,
+            template_chunks = generated["template_chunks"]
+            _log_rag_retrieval(generated["template_query"], template_chunks, state,
                              filters={"db_name": "HospitalProcess_db"},
                              node_name="C14", purpose="文书模板[规则流程库]")
             state.add_retrieved_chunks(template_chunks)
             
-            # 【增强RAG】2. 检索患者历史病历（使用关键词生成器）
-            patient_history_context = ""
             if state.patient_id:
                 _log_detail("\n🔍 检索患者历史病历信息...", state, 1, "C14")
-                query = self.keyword_generator.generate_keywords(node_ctx_c14, "UserHistory_db")
-                # 【单一数据库检索】只查询患者历史库
-                history_chunks = self.retriever.retrieve(
-                    query,
-                    filters={"db_name": "UserHistory_db", "patient_id": state.patient_id},
-                    k=3,
-                )
+                history_chunks = generated["history_chunks"]
                 # 无论是否有结果，都记录检索日志
-                _log_rag_retrieval(query, history_chunks, state,
+                _log_rag_retrieval(generated["history_query"], history_chunks, state,
                                  filters={"db_name": "UserHistory_db", "patient_id": state.patient_id},
                                  node_name="C14", purpose="历史病历[患者对话历史库]")
                 if history_chunks:
                     _log_detail(f"  ✅ 找到 {len(history_chunks)} 条历史病历记录", state, 1, "C14")
                     state.add_retrieved_chunks(history_chunks)
-                    # 构建历史上下文
-                    history_texts = []
-                    for chunk in history_chunks:
-                        text = chunk.get('text', '')
-                        if text:
-                            history_texts.append(text[:200])  # 截取前200字符
-                    patient_history_context = "\n\n【患者历史病历摘要】\n" + "\n".join(history_texts)
                     _log_detail(f"     • 已整合历史病历信息用于生成文书", state, 2, "C14")
                 else:
                     _log_detail(f"  ℹ️  首次就诊，无历史病历", state, 2, "C14")
@@ -2587,9 +2825,6 @@ class CommonOPDGraph:
             _log_detail(f"  • 科室: {state.dept}", state, 1, "C14")
             _log_detail(f"  • 治疗方案: 已制定", state, 1, "C14")
             
-            docs = []
-            doc_types = ["门诊病历", "诊断证明", "病假条", "宣教单"]
-            
             # 在 LLM 调用前推进模拟时间并记录意图时间戳
             if self.world:
                 self.world.advance_time(minutes=3, patient_id=state.patient_id)
@@ -2597,115 +2832,15 @@ class CommonOPDGraph:
                 state.node_log_time = self.world.patient_current_time(state.patient_id).strftime('%H:%M')
             
             logger.info("\n🤖 使用LLM生成专业医疗文书...")
-            
-            # 提取患者基本信息
-            patient_name = state.patient_profile.get("name", state.patient_id)
-            patient_age = state.patient_profile.get("age", "未知")
-            patient_gender = state.patient_profile.get("gender", "未知")
-            
-            # 获取就诊日期（从物理世界时间）
-            visit_date = "未知日期"
-            if self.world and self.world.current_time:
-                visit_date = self.world.current_time.strftime("%Y年%m月%d日")
-            
-            # 获取医生姓名
-            doctor_name = state.assigned_doctor_name if state.assigned_doctor_name else "主治医师"
-            
-            # 准备文书生成所需的上下文
-            context = {
-                # 患者基本信息
-                "patient_id": state.patient_id,
-                "patient_name": patient_name,
-                "patient_age": patient_age,
-                "patient_gender": patient_gender,
-                "visit_date": visit_date,
-                "doctor_name": doctor_name,
-                # 医疗信息
-                "dept": state.dept,
-                "chief_complaint": state.chief_complaint,
-                "history": state.history,
-                "exam_findings": state.exam_findings,
-                "diagnosis": state.diagnosis,
-                "treatment_plan": state.treatment_plan,
-                "test_results": [{
-                    "test": r.get("test_name"),
-                    "result": r.get("summary")
-                } for r in state.test_results] if state.test_results else [],
-                "followup_plan": state.followup_plan,
-            }
-            
-            system_prompt = load_prompt("common_system.txt")
-            
-            # 逐个生成每种文书
-            for idx, doc_type in enumerate(doc_types, 1):
-                logger.info(f"  [{idx}/{len(doc_types)}] 📝 正在生成{doc_type}...")
-                
-                user_prompt = (
-                    f"请生成一份专业的{doc_type}。\n\n"
-                    + "【患者信息】\n"
-                    + json.dumps(context, ensure_ascii=False, indent=2)
-                    + patient_history_context  # 添加患者历史上下文
-                    + "\n\n【文书要求】\n"
-                )
-                
-                if doc_type == "门诊病历":
-                    user_prompt += (
-                        "1. 包含：主诉、现病史、体格检查、辅助检查、诊断、治疗计划\n"
-                        "2. 格式规范，使用医学术语\n"
-                        "3. 内容完整准确\n"
-                        "4. **重要**：必须使用上述提供的实际患者信息（姓名、年龄、性别、日期、医生等），不要使用【待补充】或【请填写】等占位符\n"
-                    )
-                elif doc_type == "诊断证明":
-                    user_prompt += (
-                        "1. 简洁明了，突出诊断\n"
-                        "2. 包含就诊日期、诊断名称\n"
-                        "3. 医学术语准确\n"
-                        "4. **重要**：必须使用上述提供的实际患者信息和就诊日期，不要使用【待补充】或【请填写】等占位符\n"
-                    )
-                elif doc_type == "病假条":
-                    user_prompt += (
-                        "1. 根据诊断建议合理休息天数\n"
-                        "2. 格式正式\n"
-                        "3. 包含就诊日期和诊断\n"
-                        "4. **重要**：必须使用上述提供的实际患者信息和就诊日期，不要使用【待补充】或【请填写】等占位符\n"
-                    )
-                elif doc_type == "宣教单":
-                    user_prompt += (
-                        "1. 通俗易懂，便于患者理解\n"
-                        "2. 包含疾病知识、注意事项、复诊提醒\n"
-                        "3. 强调红旗症状\n"
-                        "4. 可以省略患者姓名和个人信息，但如果提到就诊相关内容，必须使用实际提供的信息\n"
-                    )
-                
-                user_prompt += "\n请直接输出文书内容，不要添加标题或其他说明。"
-                
-                # 根据文书类型设置合适的token限制
-                max_tokens = 2000 if doc_type == "宣教单" else 1200 if doc_type == "门诊病历" else 800
-                
-                try:
-                    content = self.llm.generate_text(
-                        system_prompt=system_prompt,
-                        user_prompt=user_prompt,
-                        temperature=0.2,
-                        max_tokens=max_tokens
-                    )
-                    
-                    docs.append({
-                        "doc_type": doc_type,
-                        "content": content.strip(),
-                        "generated_by": "llm"
-                    })
+            docs = generated["docs"]
+            for idx, doc in enumerate(docs, 1):
+                logger.info(f"  [{idx}/{len(docs)}] 📝 {doc['doc_type']}")
+                if doc["generated_by"] == "llm":
                     # 显示文书预览
-                    preview = content[:60].replace('\n', ' ')
-                    _log_detail(f"      ✅ 完成 ({len(content)}字): {preview}...", state, 1, "C14")
-                except Exception as e:
-                    logger.warning(f"      ❌ 生成失败: {e}，使用简化版本")
-                    docs.append({
-                        "doc_type": doc_type,
-                        "content": f"{doc_type}生成失败",
-                        "generated_by": "fallback",
-                        "error": str(e)
-                    })
+                    preview = doc["content"][:60].replace('\n', ' ')
+                    _log_detail(f"      ✅ 完成 ({len(doc['content'])}字): {preview}...", state, 1, "C14")
+                else:
+                    logger.warning(f"      ❌ 生成失败: {doc.get('error')}，使用简化版本")
             
             state.discharge_docs = docs
             
@@ -2770,44 +2905,23 @@ class CommonOPDGraph:
             _log_detail(f"  • 科室: {state.dept}", state, 1, "C15")
             _log_detail(f"  • 治疗方案: 已制定", state, 1, "C15")
             
-            # 【增强RAG】C15: 检索规则流程库（使用关键词生成器）
-            # C15节点用途：检索规则流程库获取疾病科普材料、生活方式指导、健康宣教和随访计划模板，并综合患者信息得出最后内容
-            # 使用：规则流程库(HospitalProcess_db) - 为患者提供个性化健康教育和长期管理建议
             _log_detail("\n🔍 检索宣教知识[规则流程库]...", state, 1, "C15")
-            
-            node_ctx_c15 = NodeContext(
-                node_id="C15",
-                node_name="宣教与随访",
-                dept=state.dept,
-                dept_name=state.dept_name if hasattr(state, "dept_name") else None,
-                chief_complaint=state.chief_complaint,
-                preliminary_diagnosis=state.diagnosis.get("name") if state.diagnosis else None,
-            )
-            
-            # 使用关键词生成器生成检索关键词
-            query = self.keyword_generator.generate_keywords(node_ctx_c15, "HospitalProcess_db")
-            # 【单一数据库检索】只查询规则流程库
-            all_chunks = self.retriever.retrieve(
-                query,
-                filters={"db_name": "HospitalProcess_db"},
-                k=8,
+            # 检索与宣教生成：并行模式下已在 C13 结束时开始，这里取回结果
+            generated = self._post_diagnosis.take(
+                state, "C15", lambda: _generate_education(_post_diagnosis_inputs(state))
             )
+            all_chunks = generated["chunks"]
             
             # 使用详细的 RAG 日志记录
-            _log_rag_retrieval(query, all_chunks, state, 
+            _log_rag_retrieval(generated["query"], all_chunks, state, 
                              filters={"db_name": "HospitalProcess_db"}, 
                              node_name="C15", purpose="宣教与随访[规则流程库]")
             
             state.add_retrieved_chunks(all_chunks)
 
-            # 神经内科默认宣教内容
-            education = [
-                "监测：头痛/眩晕频率与诱因记录",
-                "如有癫痫样发作风险，避免危险作业并按医嘱用药",
-                "出现意识障碍/肢体无力/言语不清等立即急诊",
-            ]
-
-            used_fallback = False
+            education = list(default_education)
+            parsed = generated["parsed"]
+            used_fallback = generated["used_fallback"]
             # 在 LLM 调用前推进模拟时间并记录意图时间戳
             if self.world:
                 self.world.advance_time(minutes=8, patient_id=state.patient_id)
@@ -2815,76 +2929,21 @@ class CommonOPDGraph:
                 state.node_log_time = self.world.patient_current_time(state.patient_id).strftime('%H:%M')
             if self.llm is not None:
                 logger.info("\n🤖 使用LLM生成宣教内容...")
-                system_prompt = load_prompt("common_system.txt")
-                user_prompt = (
-                    load_prompt("common_education.txt")
-                    + "\n\n【输入结构化信息】\n"
-                    + json.dumps(
-                        {
-                            "dept": state.dept,
-                            "diagnosis": state.diagnosis,
-                            "treatment_plan": state.treatment_plan,
-                            "followup_plan": state.followup_plan,
-                            "escalations": state.escalations,
-                            "education_fallback": education,
-                        },
-                        ensure_ascii=False,
-                    )
-                    + "\n\n【参考宣教片段（可追溯）】\n"
-                    + _chunks_for_prompt(all_chunks)
-                    + "\n\n请仅输出 JSON，可包含 education(list) 与 followup_plan(dict)。"
-                )
-                try:
-                    obj, used_fallback, _raw = self.llm.generate_json(
-                        system_prompt=system_prompt,
-                        user_prompt=user_prompt,
-                        fallback=lambda: {
-                            "education": education,
-                            "followup_plan": {
-                                "when": state.followup_plan.get("when", "1-2周内复诊"),
-                                "monitoring": state.followup_plan.get("monitoring", ["症状变化"]),
-                                "emergency": state.followup_plan.get("emergency", ["出现红旗症状立即急诊"])[:3],  # 限制最多3项
-                                "long_term_goals": state.followup_plan.get("long_term_goals", ["明确诊断", "症状控制"]),
-                            },
-                            "disclaimer": disclaimer_text(),
-                        },
-                        temperature=0.2,
-                        max_tokens=1500,  # 增加token限制，确保JSON完整
-                    )
-                    parsed = obj
-                    if used_fallback:
-                        logger.warning("  ⚠️  LLM生成失败，使用默认宣教内容")
-                        # 显示原始响应以便调试（warning级别，便于排查问题）
-                        if _raw:
-                            logger.warning(f"  原始响应长度: {len(_raw)} 字符")
-                            logger.warning(f"  原始响应前300字符: {str(_raw)[:300]}...")
-                            logger.warning(f"  原始响应后100字符: ...{str(_raw)[-100:]}")
-                    else:
-                        logger.info("  ✅ LLM生成成功")
-                        logger.info(f"  • 生成教育项目: {len(parsed.get('education', []))}条")
-                except Exception as e:
-                    logger.error(f"  ❌ LLM调用异常: {e}")
-                    parsed = {
-                        "education": education,
-                        "followup_plan": state.followup_plan,
-                    }
-                    used_fallback = True
-                    # 使用fallback
-                    parsed = {
-                        "education": education,
-                        "followup_plan": state.followup_plan,
-                        "disclaimer": disclaimer_text(),
-                    }
-                    used_fallback = True
+                _raw = generated["raw"]
+                if generated["error"] is not None:
+                    logger.error(f"  ❌ LLM调用异常: {generated['error']}")
+                elif used_fallback:
+                    logger.warning("  ⚠️  LLM生成失败，使用默认宣教内容")
+                    # 显示原始响应以便调试（warning级别，便于排查问题）
+                    if _raw:
+                        logger.warning(f"  原始响应长度: {len(_raw)} 字符")
+                        logger.warning(f"  原始响应前300字符: {str(_raw)[:300]}...")
+                        logger.warning(f"  原始响应后100字符: ...{str(_raw)[-100:]}")
+                else:
+                    logger.info("  ✅ LLM生成成功")
+                    logger.info(f"  • 生成教育项目: {len(parsed.get('education', []))}条")
             else:
                 logger.warning("\n⚠️  未配置LLM，使用默认宣教内容")
-                llm_text = json.dumps(
-                    {"education": education, "disclaimer": disclaimer_text()}, ensure_ascii=False
-                )
-                parsed, used_fallback = parse_json_with_retry(
-                    llm_text,
-                    fallback=lambda: {"education": education, "disclaimer": disclaimer_text()},
-                )
 
             state.followup_plan.setdefault("education", [])
             state.followup_plan["education"] = list(parsed.get("education", education))
@@ -3322,22 +3381,22 @@ class CommonOPDGraph:
             return state
 
         # 添加所有节点（C0已移至初始化阶段）
-        graph.add_node("C1", c1_start)
-        graph.add_node("C2", c2_registration)
-        graph.add_node("C3", c3_checkin_waiting)
-        graph.add_node("C4", c4_call_in)
-        graph.add_node("C5", c5_prepare_intake)  # 更名：准确反映其准备问诊的功能
-        graph.add_node("C6", c6_specialty_dispatch)
-        graph.add_node("C7", c7_decide_path)
-        graph.add_node("C8", c8_order_explain_tests)
-        graph.add_node("C9", c9_billing_scheduling)
-        graph.add_node("C10", c10_execute_tests)
-        graph.add_node("C11", c11_return_visit)
-        graph.add_node("C12", c12_final_synthesis)
-        graph.add_node("C13", c13_disposition)
-        graph.add_node("C14", c14_documents)
-        graph.add_node("C15", c15_education_followup)
-        graph.add_node("C16", c16_end)
+        graph.add_node("C1", traced_node("C1", c1_start))
+        graph.add_node("C2", traced_node("C2", c2_registration))
+        graph.add_node("C3", traced_node("C3", c3_checkin_waiting))
+        graph.add_node("C4", traced_node("C4", c4_call_in))
+        graph.add_node("C5", traced_node("C5", c5_prepare_intake))  # 更名：准确反映其准备问诊的功能
+        graph.add_node("C6", traced_node("C6", c6_specialty_dispatch))
+        graph.add_node("C7", traced_node("C7", c7_decide_path))
+        graph.add_node("C8", traced_node("C8", c8_order_explain_tests))
+        graph.add_node("C9", traced_node("C9", c9_billing_scheduling))
+        graph.add_node("C10", traced_node("C10", c10_execute_tests))
+        graph.add_node("C11", traced_node("C11", c11_return_visit))
+        graph.add_node("C12", traced_node("C12", c12_final_synthesis))
+        graph.add_node("C13", traced_node("C13", c13_disposition))
+        graph.add_node("C14", traced_node("C14", self._post_diagnosis.discard_on_error(c14_documents)))
+        graph.add_node("C15", traced_node("C15", self._post_diagnosis.discard_on_error(c15_education_followup)))
+        graph.add_node("C16", traced_node("C16", c16_end))
 
         # 设置入口点和连接边（C0已移至初始化阶段，直接从C1开始）
         graph.set_entry_point("C1")
@@ -1,9 +1,14 @@
 """通用专科子图：支持所有科室的专科问诊、体检、初步判断"""
 from __future__ import annotations
 
+import contextvars
+import copy
 import json
 import random
-from typing import Any
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
 
 from langgraph.graph import END, StateGraph
 
@@ -12,9 +17,11 @@ from rag import AdaptiveRAGRetriever, DialogueQualityEvaluator
 from rag.query_optimizer import QueryContext, get_query_optimizer
 from rag.keyword_generator import RAGKeywordGenerator, NodeContext
 from services.llm_client import LLMClient
+from services.prompt_budget import format_chunks
 from state.schema import BaseState, make_audit_entry
 from utils import load_prompt, contains_any_positive, get_logger
 from logging_utils import should_log, OutputFilter, SUPPRESS_UNCHECKED_LOGS  # 导入输出配置
+from logging_utils import traced_node
 
 # 初始化logger
 logger = get_logger("hospital_agent.specialty_subgraph")
@@ -94,17 +101,74 @@ def _validate_and_normalize_test(test: dict[str, Any], dept: str, dept_config: d
     }
 
 
-def _chunks_for_prompt(chunks: list[dict[str, Any]], *, max_chars: int = 1400) -> str:
-    lines: list[str] = []
-    total = 0
-    for c in chunks:
-        text = str(c.get("text") or "").replace("\n", " ").strip()
-        line = f"[{c.get('doc_id')}#{c.get('chunk_id')}] {text[:240]}"
-        lines.append(line)
-        total += len(line) + 1
-        if total >= max_chars:
-            break
-    return "\n".join(lines)
+def _chunks_for_prompt(chunks: list[dict[str, Any]], *, max_tokens: int = 1000) -> str:
+    """引用片段：去重后按相关度顺序拼接，单条不超过 200 tokens，整体不超过 max_tokens"""
+    return format_chunks(chunks, max_tokens, max_chunk_tokens=200)
+
+
+class _InterviewPipeline:
+    """S1 问诊流水线：与下一次医生提问无依赖的工作放到后台线程，和下一轮 LLM 调用重叠执行
+
+    - 回答信息抽取（DoctorAgent.extract_answer_info）与下一问的生成并行，下一问返回后再合并，
+      医生生成下一问时已能在对话历史中看到原始回答，只有结构化信息滞后一轮
+    - 对话质量评估与高质量对话入库在后台执行，问诊结束后按轮次顺序收集
+    未启用时任务在调用线程中立即执行，与串行流程一致。
+    每轮节省的墙钟时间 = 该轮后台任务耗时 - S1 线程等待其结果的时间。
+    """
+
+    def __init__(self, enabled: bool, max_workers: int = 2):
+        self.enabled = enabled
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s1-pipeline") if enabled else None
+        )
+        self._lock = threading.Lock()
+        self._busy_ms: dict[int, float] = {}
+        self._waited_ms: dict[int, float] = {}
+
+    def submit(self, round_no: int, fn: Callable[..., Any], *args: Any) -> Future:
+        def run() -> Any:
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._busy_ms[round_no] = self._busy_ms.get(round_no, 0.0) + (time.perf_counter() - start) * 1000
+
+        if self._executor is None:
+            future: Future = Future()
+            try:
+                future.set_result(run())
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        # 复制 contextvars 上下文：后台任务中的 LLM 调用仍计入 S1 / C6 的节点统计
+        return self._executor.submit(contextvars.copy_context().run, run)
+
+    def result(self, round_no: int, future: Future) -> Any:
+        start = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            if self.enabled:
+                with self._lock:
+                    self._waited_ms[round_no] = self._waited_ms.get(round_no, 0.0) + (time.perf_counter() - start) * 1000
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def round_savings(self) -> list[dict[str, Any]]:
+        """逐轮统计：后台任务耗时、等待时间与节省的墙钟时间（毫秒）"""
+        with self._lock:
+            return [
+                {
+                    "round": round_no,
+                    "background_ms": round(busy, 1),
+                    "waited_ms": round(self._waited_ms.get(round_no, 0.0), 1),
+                    "saved_ms": round(max(0.0, busy - self._waited_ms.get(round_no, 0.0)), 1),
+                }
+                for round_no, busy in sorted(self._busy_ms.items())
+            ]
 
 
 # 科室配置映射（当前只保留 neurology，其他科室配置已删除以减少冗余）
@@ -326,118 +390,168 @@ def build_common_specialty_subgraph(
                 except Exception as e:
                     logger.warning(f"  ⚠️  对话质量评估器初始化失败: {e}")
             
-            for i in range(remaining_questions):
-                # 终端只显示简洁信息
-                if should_log(1, "specialty_subgraph", "S1"):
-                    logger.info(f"  💬 问诊第 {questions_asked_this_node + i + 1} 轮")
-                
-                # 医生基于当前信息生成一个问题
-                context_desc = f"{dept_name}专科问诊，关注：{', '.join(interview_keys)}"
-                if alarm_keywords:
-                    context_desc += f"，警报症状：{', '.join(alarm_keywords)}"
-                
-                # 第一个问题：医生总是先用开放式问题询问患者哪里不舒服
-                # 这符合真实医疗场景：医生首先让患者自己描述主要症状
-                if i == 0 and not doctor_agent.questions_asked:
-                    question = "您好，请问您哪里不舒服？"
-                else:
-                    # 后续问题：使用收集到的信息生成针对性问题
-                    # 【增强】传入检索到的知识片段（包括高质量问诊库）作为参考
-                    # 注意：不直接使用state.chief_complaint，而是使用doctor_agent已收集的信息
-                    question = doctor_agent.generate_one_question(
-                        chief_complaint=doctor_agent.collected_info.get("chief_complaint", ""),
-                        context=context_desc,
-                        rag_chunks=chunks + qa_chunks + case_chunks  # 合并所有检索结果
+            # 流水线模式（agent.pipeline_interview）：回答信息抽取与质量评估和下一问的生成重叠执行
+            pipeline = _InterviewPipeline(enabled=bool(state.agent_config.get("pipeline_interview")))
+            pending_extraction: tuple[int, Future] | None = None  # 尚未合并的回答信息抽取
+            quality_futures: list[tuple[int, Future]] = []
+            
+            def evaluate_round(question: str, answer: str, round_no: int, context: dict[str, Any]):
+                """对话质量评估与存储，返回 (评分, 是否已入库)；失败时返回 None"""
+                try:
+                    # 准备患者信息（用于忠实性评估）
+                    patient_info = {
+                        "chief_complaint": state.chief_complaint,
+                        "history": state.history,
+                        "patient_profile": state.patient_profile,
+                    }
+                    
+                    # 评估对话质量
+                    dialogue_score = qa_evaluator.evaluate_dialogue(
+                        question=question,
+                        answer=answer,
+                        patient_info=patient_info,
+                        context=context
                     )
-                
-                if not question:
+                    
+                    # 如果是高质量对话，存储到向量库
+                    stored = False
+                    if dialogue_score.is_high_quality():
+                        stored = qa_evaluator.store_high_quality_dialogue(
+                            dialogue_score=dialogue_score,
+                            patient_id=state.patient_id,
+                            metadata={
+                                "dept": dept,
+                                "stage": "specialty_interview",
+                                "round": round_no
+                            }
+                        )
+                    
+                    # 详细日志（仅在debug级别显示）
+                    if should_log(3, "specialty_subgraph", "S1"):
+                        logger.debug(
+                            f"  📊 Q{round_no} 质量评分: "
+                            f"医生={dialogue_score.doctor_metrics.quality:.2f}, "
+                            f"患者={dialogue_score.patient_metrics.ability:.2f}, "
+                            f"综合={dialogue_score.overall_score:.2f}"
+                        )
+                    return dialogue_score, stored
+                except Exception as e:
+                    logger.warning(f"  ⚠️  对话质量评估失败 (Q{round_no}): {e}")
+                    return None
+            
+            try:
+                for i in range(remaining_questions):
+                    round_no = questions_asked_this_node + i + 1
+                    # 终端只显示简洁信息
                     if should_log(1, "specialty_subgraph", "S1"):
-                        logger.info("  ℹ️  医生提前结束问诊")
+                        logger.info(f"  💬 问诊第 {round_no} 轮")
+                    
+                    # 医生基于当前信息生成一个问题
+                    context_desc = f"{dept_name}专科问诊，关注：{', '.join(interview_keys)}"
+                    if alarm_keywords:
+                        context_desc += f"，警报症状：{', '.join(alarm_keywords)}"
+                    
+                    # 第一个问题：医生总是先用开放式问题询问患者哪里不舒服
+                    # 这符合真实医疗场景：医生首先让患者自己描述主要症状
+                    if i == 0 and not doctor_agent.questions_asked:
+                        question = "您好，请问您哪里不舒服？"
+                    else:
+                        # 后续问题：使用收集到的信息生成针对性问题
+                        # 【增强】传入检索到的知识片段（包括高质量问诊库）作为参考
+                        # 注意：不直接使用state.chief_complaint，而是使用doctor_agent已收集的信息
+                        question = doctor_agent.generate_one_question(
+                            chief_complaint=doctor_agent.collected_info.get("chief_complaint", ""),
+                            context=context_desc,
+                            rag_chunks=chunks + qa_chunks + case_chunks  # 合并所有检索结果
+                        )
+                    
+                    # 流水线模式：上一轮回答的信息抽取与本轮提问并行，提问返回后再合并
+                    if pending_extraction is not None:
+                        doctor_agent.merge_extracted_info(pipeline.result(*pending_extraction))
+                        pending_extraction = None
+                    
+                    if not question:
+                        if should_log(1, "specialty_subgraph", "S1"):
+                            logger.info("  ℹ️  医生提前结束问诊")
+                        if detail_logger:
+                            detail_logger.info("医生判断信息已充足，提前结束问诊")
+                        break
+                    
+                    # 患者回答（传入物理状态）
+                    physical_state = state.physical_state_snapshot if state.world_context else None
+                    answer = patient_agent.respond_to_doctor(question, physical_state=physical_state)
+                    
+                    # 详细日志：记录完整的问诊对话
                     if detail_logger:
-                        detail_logger.info("医生判断信息已充足，提前结束问诊")
-                    break
-                
-                # 患者回答（传入物理状态）
-                physical_state = state.physical_state_snapshot if state.world_context else None
-                answer = patient_agent.respond_to_doctor(question, physical_state=physical_state)
-                
-                # 详细日志：记录完整的问诊对话
-                if detail_logger:
-                    detail_logger.qa_round(questions_asked_this_node + i + 1, question, answer)
-                
-                # 医生处理回答
-                doctor_agent.process_patient_answer(question, answer)
-                
-                # 【重要】同步更新医生的对话历史记录（用于下次生成问题时参考）
-                doctor_agent.collected_info.setdefault("conversation_history", [])
-                doctor_agent.collected_info["conversation_history"].append({
-                    "question": question,
-                    "answer": answer
-                })
-                
-                # 记录对话到state
-                qa_list.append({
-                    "question": question, 
-                    "answer": answer, 
-                    "stage": f"{dept}_specialty"
-                })
-                
-                # 【新增】对话质量评估与存储
-                if qa_evaluator and question and answer:
-                    try:
-                        # 准备患者信息（用于忠实性评估）
-                        patient_info = {
-                            "chief_complaint": state.chief_complaint,
-                            "history": state.history,
-                            "patient_profile": state.patient_profile,
-                        }
-                        
-                        # 准备问诊上下文（用于医生提问评估）
+                        detail_logger.qa_round(round_no, question, answer)
+                    
+                    # 医生处理回答（记录问题后，用LLM提取结构化信息）
+                    doctor_agent.record_answer(question, answer)
+                    extraction = pipeline.submit(round_no, doctor_agent.extract_answer_info, question, answer)
+                    if pipeline.enabled:
+                        pending_extraction = (round_no, extraction)
+                    else:
+                        doctor_agent.merge_extracted_info(pipeline.result(round_no, extraction))
+                    
+                    # 【重要】同步更新医生的对话历史记录（用于下次生成问题时参考）
+                    doctor_agent.collected_info.setdefault("conversation_history", [])
+                    doctor_agent.collected_info["conversation_history"].append({
+                        "question": question,
+                        "answer": answer
+                    })
+                    
+                    # 记录对话到state
+                    qa_list.append({
+                        "question": question, 
+                        "answer": answer, 
+                        "stage": f"{dept}_specialty"
+                    })
+                    
+                    # 【新增】对话质量评估与存储（流水线模式下在后台执行，问诊上下文取本轮快照）
+                    if qa_evaluator and question and answer:
                         context = {
                             "dept": dept,
                             "dept_name": dept_name,
                             "stage": "specialty_interview",
-                            "collected_info": doctor_agent.collected_info if doctor_agent else {}
+                            "collected_info": copy.deepcopy(doctor_agent.collected_info) if doctor_agent else {}
                         }
-                        
-                        # 评估对话质量
-                        dialogue_score = qa_evaluator.evaluate_dialogue(
-                            question=question,
-                            answer=answer,
-                            patient_info=patient_info,
-                            context=context
+                        quality_futures.append(
+                            (round_no, pipeline.submit(round_no, evaluate_round, question, answer, round_no, context))
                         )
-                        
-                        qa_scores.append(dialogue_score)
-                        
-                        # 如果是高质量对话，存储到向量库
-                        if dialogue_score.is_high_quality():
-                            success = qa_evaluator.store_high_quality_dialogue(
-                                dialogue_score=dialogue_score,
-                                patient_id=state.patient_id,
-                                metadata={
-                                    "dept": dept,
-                                    "stage": "specialty_interview",
-                                    "round": questions_asked_this_node + i + 1
-                                }
-                            )
-                            if success:
-                                high_quality_count += 1
-                        
-                        # 详细日志（仅在debug级别显示）
-                        if should_log(3, "specialty_subgraph", "S1"):
-                            logger.debug(
-                                f"  📊 Q{i+1} 质量评分: "
-                                f"医生={dialogue_score.doctor_metrics.quality:.2f}, "
-                                f"患者={dialogue_score.patient_metrics.ability:.2f}, "
-                                f"综合={dialogue_score.overall_score:.2f}"
-                            )
-                    except Exception as e:
-                        logger.warning(f"  ⚠️  对话质量评估失败 (Q{i+1}): {e}")
+                    
+                    # 更新该节点和全局计数器
+                    state.node_qa_counts[node_key] = questions_asked_this_node + i + 1
+                    state.node_qa_counts["global_total"] = global_qa_count + i + 1
+                
+                # 最后一轮的信息抽取在总结主诉前合并
+                if pending_extraction is not None:
+                    doctor_agent.merge_extracted_info(pipeline.result(*pending_extraction))
+                    pending_extraction = None
                 
-                # 更新该节点和全局计数器
-                state.node_qa_counts[node_key] = questions_asked_this_node + i + 1
-                state.node_qa_counts["global_total"] = global_qa_count + i + 1
+                # 按轮次顺序收集质量评估结果
+                for round_no, future in quality_futures:
+                    evaluated = pipeline.result(round_no, future)
+                    if evaluated is None:
+                        continue
+                    dialogue_score, stored = evaluated
+                    qa_scores.append(dialogue_score)
+                    if stored:
+                        high_quality_count += 1
+            finally:
+                pipeline.close()
+            
+            if pipeline.enabled:
+                rounds = pipeline.round_savings()
+                saved_total = sum(r["saved_ms"] for r in rounds)
+                state.agent_interactions["s1_pipeline"] = {"rounds": rounds, "saved_ms_total": round(saved_total, 1)}
+                if detail_logger:
+                    for r in rounds:
+                        detail_logger.info(
+                            f"⏩ 流水线第 {r['round']} 轮: 后台任务 {r['background_ms']:.0f}ms，"
+                            f"等待 {r['waited_ms']:.0f}ms，节省 {r['saved_ms']:.0f}ms"
+                        )
+                if should_log(2, "specialty_subgraph", "S1"):
+                    logger.info(f"  ⏩ 问诊流水线: {len(rounds)} 轮共节省 {saved_total / 1000:.1f}s")
             
             state.agent_interactions["doctor_patient_qa"] = qa_list
             
@@ -528,9 +642,9 @@ def build_common_specialty_subgraph(
                 
                 # 更新数据库中的chief_complaint字段
                 if hasattr(state, 'medical_record_integration') and state.medical_record_integration:
-                    record = state.medical_record_integration.mrs.get_record(state.patient_id)
-                    if record:
-                        state.medical_record_integration.mrs.dao.update_medical_case(record.record_id, {
+                    mrs = state.medical_record_integration.mrs
+                    if hasattr(mrs, 'update_case_fields'):
+                        mrs.update_case_fields(state.patient_id, {
                             "chief_complaint": summarized_cc
                         })
             
@@ -1167,9 +1281,9 @@ def build_common_specialty_subgraph(
         return state
 
     # 构建图结构
-    graph.add_node("S1", s1_specialty_interview)
-    graph.add_node("S2", s2_physical_exam)
-    graph.add_node("S3", s3_preliminary_judgment)
+    graph.add_node("S1", traced_node("S1", s1_specialty_interview))
+    graph.add_node("S2", traced_node("S2", s2_physical_exam))
+    graph.add_node("S3", traced_node("S3", s3_preliminary_judgment))
 
     graph.set_entry_point("S1")
     graph.add_edge("S1", "S2")
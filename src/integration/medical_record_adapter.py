@@ -31,6 +31,16 @@ def get_medical_record_service(
     """
     from services.medical_record import MedicalRecordService
     
+    mr_config = getattr(config, 'medical_record', None)
+    persistence_kwargs = {}
+    if mr_config is not None:
+        persistence_kwargs = {
+            "write_behind": mr_config.write_behind,
+            "flush_interval": mr_config.flush_interval,
+            "compact_every": mr_config.compact_every,
+            "codec": mr_config.codec,
+        }
+    
     # 如果启用数据库，使用DatabaseMedicalRecordService
     if hasattr(config, 'database') and config.database.enabled:
         from services.medical_record_db_service import DatabaseMedicalRecordService
@@ -38,8 +48,13 @@ def get_medical_record_service(
         return DatabaseMedicalRecordService(
             connection_string=config.database.connection_string,
             storage_dir=storage_dir,
-            backup_to_file=config.database.backup_to_file
+            backup_to_file=config.database.backup_to_file,
+            async_writes=config.database.async_writes,
+            write_batch_size=config.database.write_batch_size,
+            write_flush_interval=config.database.write_flush_interval,
+            write_max_retries=config.database.write_max_retries,
+            **persistence_kwargs
         )
     else:
         # 否则使用本地文件存储
-        return MedicalRecordService(storage_dir=storage_dir)
+        return MedicalRecordService(storage_dir=storage_dir, **persistence_kwargs)
@@ -1,24 +1,51 @@
-"""数据加载器模块 - 从本地 Excel 文件加载患者数据"""
+"""数据加载器模块 - 从本地 Excel 文件加载患者数据
+
+Excel 只在源文件变化后解析一次：解析结果（逐字段清洗后的字符串）编译为列式缓存
+<excel 同名>.cases.parquet，元数据记录源文件的 mtime / 大小 / SHA-256。
+之后每个进程直接内存映射读取 Parquet，并预先构建每个病例的
+full_case / known_case / medical_data / ground_truth，get_case(case_id) 为 O(1) 字典查找。
+
+未安装 pyarrow 时退化为每个进程解析一次 Excel（仍预构建病例，查找同样为 O(1)）。
+
+手动重建缓存：
+    python loaders.py --rebuild
+"""
 from __future__ import annotations
 
+import hashlib
 import json
+import math
 import os
 import threading
 from pathlib import Path
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 
-import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 from utils import get_logger
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 # 初始化logger
 logger = get_logger("hospital_agent.dataset_loader")
 
 # Excel文件路径（与loaders.py在同一目录，即src目录）
 DEFAULT_EXCEL_PATH = Path(__file__).parent / "patient_text.xlsx"
 
+# 列式病例缓存文件后缀（与 Excel 同目录）
+CASE_CACHE_SUFFIX = ".cases.parquet"
+_CASE_CACHE_VERSION = "1"
+
 # 全局数据集缓存（避免重复加载）
 _DATASET_CACHE: dict[str, pd.DataFrame] = {}
+_CASE_TABLES: dict[str, list[dict[str, dict[str, Any]]]] = {}  # Excel 路径 -> 按病例索引预构建的病例包
+_CASE_TABLE_KEYS: dict[str, str] = {}  # 调用方传入的路径 -> 解析后的缓存键（避免每次查找都 resolve）
 _CACHE_ENABLED = True  # 是否启用内存缓存
 _CACHE_LOCK = threading.RLock()  # 缓存锁，防止并发加载
 
@@ -47,6 +74,8 @@ def _load_excel_data(excel_path: str | Path = DEFAULT_EXCEL_PATH) -> pd.DataFram
         if not excel_path.exists():
             raise FileNotFoundError(f"患者数据文件不存在: {excel_path}")
         
+        import pandas as pd
+
         logger.info(f"📂 从Excel文件加载患者数据: {excel_path.name}")
         df = pd.read_excel(excel_path)
         
@@ -223,6 +252,199 @@ def _build_case_info_text(case: dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
+# full_case 中的全部字段（Excel 列顺序，不含 id）
+_ALL_CASE_FIELDS: list[str] = _CORE_PATIENT_FIELDS + _FUTURE_USE_FIELDS
+
+
+def _clean_value(val: Any) -> str:
+    """单元格值转为字符串；缺失或 NaN 返回空字符串"""
+    if val is None or (isinstance(val, float) and math.isnan(val)):
+        return ""
+    return str(val).strip()
+
+
+def _build_case_bundle(case_id: int, values: dict[str, str]) -> dict[str, dict[str, Any]]:
+    """由一行清洗后的字段构建病例包（full_case / known_case / medical_data / ground_truth）"""
+    # 完整病例数据（仅新版结构化字段）
+    full_case: dict[str, Any] = {"id": case_id}
+    for field in _ALL_CASE_FIELDS:
+        full_case[field] = values.get(field) or ""
+
+    # 患者可见部分（基本信息 + 主诉 + 现病史 + 既往史 + 个人史 + 婚育史 + 家族史）
+    known_case: dict[str, Any] = {
+        "id": case_id,
+        **{k: full_case[k] for k in _KNOWN_CASE_FIELDS},
+        # 标准病历参考及教学字段属于医生侧评估材料，患者不可见，保持为空
+        **{k: "" for k in _FUTURE_USE_FIELDS},
+    }
+
+    # 患者不可见的医疗数据：所有体格检查 + 辅助检查（供医生/系统参考，患者智能体不可见）
+    medical_data: dict[str, Any] = {k: full_case[k] for k in _MEDICAL_DATA_FIELDS}
+
+    # 标准答案（仅含初步诊断，用于后期评估）
+    # 诊断依据/治疗原则/随访计划/治疗方案/治疗药物/医嘱由系统运行后LLM生成并写入数据库
+    ground_truth: dict[str, Any] = {"初步诊断": full_case["初步诊断"]}
+
+    return {
+        "full_case": full_case,
+        "known_case": known_case,
+        "medical_data": medical_data,
+        "ground_truth": ground_truth,
+    }
+
+
+# ---------------------------------------------------------------------------
+# 列式病例缓存（Parquet）
+# ---------------------------------------------------------------------------
+
+def case_cache_path(excel_path: str | Path = DEFAULT_EXCEL_PATH) -> Path:
+    """Excel 对应的列式缓存路径（同目录，<stem>.cases.parquet）"""
+    excel_path = Path(excel_path).resolve()
+    return excel_path.with_name(excel_path.stem + CASE_CACHE_SUFFIX)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fields_key() -> bytes:
+    """字段列表指纹：字段定义变化时缓存自动失效"""
+    return hashlib.sha256("\x1f".join(_ALL_CASE_FIELDS).encode("utf-8")).hexdigest().encode()
+
+
+def _cache_is_fresh(cache_path: Path, excel_path: Path) -> bool:
+    """缓存与 Excel 一致：大小与 mtime 相同；mtime 变化时按 SHA-256 确认内容"""
+    if not cache_path.exists():
+        return False
+    try:
+        meta = pq.read_schema(cache_path).metadata or {}
+    except Exception:
+        return False
+    if meta.get(b"version") != _CASE_CACHE_VERSION.encode() or meta.get(b"fields") != _fields_key():
+        return False
+    stat = excel_path.stat()
+    if meta.get(b"source_size") != str(stat.st_size).encode():
+        return False
+    if meta.get(b"source_mtime_ns") == str(stat.st_mtime_ns).encode():
+        return True
+    # 仅 mtime 变化（如重新拷贝）时内容可能未变
+    return meta.get(b"source_sha256") == _file_sha256(excel_path).encode()
+
+
+def _compile_case_rows(excel_path: Path) -> list[dict[str, str]]:
+    """解析 Excel 并逐字段清洗为字符串"""
+    df = _load_excel_data(excel_path)
+    return [
+        {field: _clean_value(record.get(field)) for field in _ALL_CASE_FIELDS}
+        for record in df.to_dict("records")
+    ]
+
+
+def _write_case_cache(cache_path: Path, excel_path: Path, rows: list[dict[str, str]]) -> None:
+    """原子写入列式缓存（临时文件 + os.replace）"""
+    stat = excel_path.stat()
+    table = pa.table({
+        field: pa.array([row[field] for row in rows], type=pa.string())
+        for field in _ALL_CASE_FIELDS
+    })
+    table = table.replace_schema_metadata({
+        "version": _CASE_CACHE_VERSION,
+        "fields": _fields_key(),
+        "source": excel_path.name,
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+        "source_sha256": _file_sha256(excel_path),
+    })
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, cache_path)
+
+
+def _read_case_cache(cache_path: Path) -> list[dict[str, str]]:
+    # ParquetFile.read 不处理 pandas 元数据，命中缓存时无需导入 pandas
+    return pq.ParquetFile(cache_path, memory_map=True).read(use_pandas_metadata=False).to_pylist()
+
+
+def _load_case_table(excel_path: str | Path = DEFAULT_EXCEL_PATH) -> list[dict[str, dict[str, Any]]]:
+    """获取预构建的病例包列表（按病例索引）；首次调用时读取缓存或编译 Excel"""
+    table = _CASE_TABLES.get(_CASE_TABLE_KEYS.get(str(excel_path), ""))
+    if table is not None:
+        return table
+
+    requested = str(excel_path)
+    excel_path = Path(excel_path).resolve()
+    cache_key = str(excel_path)
+
+    with _CACHE_LOCK:
+        if cache_key in _CASE_TABLES:
+            _CASE_TABLE_KEYS[requested] = cache_key
+            return _CASE_TABLES[cache_key]
+        if not excel_path.exists():
+            raise FileNotFoundError(f"患者数据文件不存在: {excel_path}")
+
+        rows = None
+        if HAS_PYARROW:
+            cache_path = case_cache_path(excel_path)
+            if _cache_is_fresh(cache_path, excel_path):
+                try:
+                    rows = _read_case_cache(cache_path)
+                    logger.debug(f"📂 使用列式病例缓存: {cache_path.name}（{len(rows)} 条）")
+                except Exception as e:
+                    logger.warning(f"⚠️  读取病例缓存失败，重新解析 Excel: {e}")
+            if rows is None:
+                rows = _compile_case_rows(excel_path)
+                try:
+                    _write_case_cache(cache_path, excel_path, rows)
+                    logger.info(f"📦 已编译列式病例缓存: {cache_path.name}（{len(rows)} 条）")
+                except OSError as e:
+                    logger.warning(f"⚠️  写入病例缓存失败（本进程仍可使用）: {e}")
+        else:
+            rows = _compile_case_rows(excel_path)
+
+        table = [_build_case_bundle(i, row) for i, row in enumerate(rows)]
+        if _CACHE_ENABLED:
+            _CASE_TABLES[cache_key] = table
+            _CASE_TABLE_KEYS[requested] = cache_key
+        return table
+
+
+def build_case_cache(excel_path: str | Path = DEFAULT_EXCEL_PATH, force: bool = False) -> Path:
+    """编译（或在 force 时强制重建）列式病例缓存，返回缓存路径"""
+    if not HAS_PYARROW:
+        raise ImportError("列式病例缓存需要安装 pyarrow")
+    excel_path = Path(excel_path).resolve()
+    cache_path = case_cache_path(excel_path)
+    with _CACHE_LOCK:
+        _CASE_TABLES.pop(str(excel_path), None)
+        if force and cache_path.exists():
+            cache_path.unlink()
+        _load_case_table(excel_path)
+    return cache_path
+
+
+def get_case(case_id: int, excel_path: str | Path = DEFAULT_EXCEL_PATH) -> dict[str, dict[str, Any]]:
+    """按病例索引获取病例包（O(1) 查找）
+
+    返回各部分字典的浅拷贝，调用方修改不会影响缓存。
+
+    Raises:
+        ValueError: case_id 超出范围
+    """
+    table = _load_case_table(excel_path)
+    if case_id < 0 or case_id >= len(table):
+        raise ValueError(f"case_id {case_id} 超出范围 [0, {len(table)-1}]")
+    return {part: dict(fields) for part, fields in table[case_id].items()}
+
+
+def get_case_count(excel_path: str | Path = DEFAULT_EXCEL_PATH) -> int:
+    """数据集中的病例数"""
+    return len(_load_case_table(excel_path))
+
+
 def load_diagnosis_arena_case(case_id: int | None = None, excel_path: str | Path = DEFAULT_EXCEL_PATH) -> dict[str, Any]:
     """
     从本地Excel文件加载患者数据（支持新版结构化字段格式）
@@ -254,145 +476,19 @@ def load_diagnosis_arena_case(case_id: int | None = None, excel_path: str | Path
         }
     """
     try:
-        # 加载Excel数据
-        df = _load_excel_data(excel_path)
+        case_count = get_case_count(excel_path)
         
         # 确定使用的病例索引
         if case_id is not None:
-            if case_id < 0 or case_id >= len(df):
-                raise ValueError(f"case_id {case_id} 超出范围 [0, {len(df)-1}]")
             actual_case_id = case_id
             logger.debug(f"📚 加载患者数据 - 索引: {case_id}")
         else:
             # 随机选择
             import random
-            actual_case_id = random.randint(0, len(df) - 1)
+            actual_case_id = random.randint(0, case_count - 1)
             logger.info(f"🎲 随机选择患者 - 索引: {actual_case_id}")
         
-        # 获取该行数据
-        row = df.iloc[actual_case_id]
-        
-        # 安全获取字段值的辅助函数
-        def _get(field: str) -> str:
-            """从行数据中安全获取字符串值，若列不存在或值为 NaN 则返回空字符串"""
-            if field not in df.columns:
-                return ""
-            val = row.get(field, "")
-            if val is None or (isinstance(val, float) and __import__("math").isnan(val)):
-                return ""
-            return str(val).strip()
-        
-        # 构建完整病例数据（仅新版结构化字段）
-        full_case: dict[str, Any] = {
-                "id": actual_case_id,
-                # 基本信息
-                "姓名": _get("姓名"),
-                "性别": _get("性别"),
-                "年龄": _get("年龄"),
-                "民族": _get("民族"),
-                "职业": _get("职业"),
-                "病史陈述者": _get("病史陈述者"),
-                # 主诉
-                "主诉": _get("主诉"),
-                # 现病史
-                "现病史_详细描述": _get("现病史_详细描述"),
-                "现病史_起病情况": _get("现病史_起病情况"),
-                "现病史_病程": _get("现病史_病程"),
-                "现病史_病情发展": _get("现病史_病情发展"),
-                # 既往史
-                "既往史_疾病史": _get("既往史_疾病史"),
-                "既往史_手术史": _get("既往史_手术史"),
-                "既往史_过敏史": _get("既往史_过敏史"),
-                "既往史_预防接种史": _get("既往史_预防接种史"),
-                "既往史_外伤史": _get("既往史_外伤史"),
-                # 个人史
-                "个人史": _get("个人史"),
-                "个人史_饮酒史": _get("个人史_饮酒史"),
-                "个人史_抽烟史": _get("个人史_抽烟史"),
-                "个人史_月经史": _get("个人史_月经史"),
-                # 婚育史
-                "婚育史": _get("婚育史"),
-                # 家族史
-                "家族史_父亲": _get("家族史_父亲"),
-                "家族史_母亲": _get("家族史_母亲"),
-                "家族史_兄弟姐妹": _get("家族史_兄弟姐妹"),
-                "家族史_疾病": _get("家族史_疾病"),
-                # 体格检查
-                "体格检查_生命体征": _get("体格检查_生命体征"),
-                "体格检查_皮肤黏膜": _get("体格检查_皮肤黏膜"),
-                "体格检查_浅表淋巴结": _get("体格检查_浅表淋巴结"),
-                "体格检查_头颈部": _get("体格检查_头颈部"),
-                "体格检查_心肺血管": _get("体格检查_心肺血管"),
-                "体格检查_腹部": _get("体格检查_腹部"),
-                "体格检查_脊柱四肢": _get("体格检查_脊柱四肢"),
-                "体格检查_神经系统": _get("体格检查_神经系统"),
-                # 辅助检查
-                "辅助检查": _get("辅助检查"),
-                # 诊断与治疗
-                "初步诊断": _get("初步诊断"),
-                "诊断依据": _get("诊断依据"),
-                "治疗原则": _get("治疗原则"),
-                # 医患问答参考
-                "医患问答参考_问": _get("医患问答参考_问"),
-                "医患问答参考_答": _get("医患问答参考_答"),
-                # 标准病历参考及教学扩展字段（从 Excel 读取）
-                "标准病历参考_主诉": _get("标准病历参考_主诉"),
-                "标准病历参考_现病史": _get("标准病历参考_现病史"),
-                "标准病历参考_既往史": _get("标准病历参考_既往史"),
-                "标准病历参考_体格检查": _get("标准病历参考_体格检查"),
-                "标准病历参考_辅助检查": _get("标准病历参考_辅助检查"),
-                "标准病历参考_诊断结果": _get("标准病历参考_诊断结果"),
-                "高级问题题目": _get("高级问题题目"),
-                "高级问题答案": _get("高级问题答案"),
-                "考试题目": _get("考试题目"),
-                "考试题目答案": _get("考试题目答案"),
-        }
-
-        # 患者可见部分（基本信息 + 主诉 + 现病史 + 既往史 + 个人史 + 婚育史 + 家族史）
-        known_case: dict[str, Any] = {
-                "id": full_case["id"],
-                # 患者可见的结构化字段
-                **{k: full_case[k] for k in _KNOWN_CASE_FIELDS},
-                # 标准病历参考及教学字段属于医生侧评估材料，患者不可见，保持为空
-                "标准病历参考_主诉": "",
-                "标准病历参考_现病史": "",
-                "标准病历参考_既往史": "",
-                "标准病历参考_体格检查": "",
-                "标准病历参考_辅助检查": "",
-                "标准病历参考_诊断结果": "",
-                "高级问题题目": "",
-                "高级问题答案": "",
-                "考试题目": "",
-                "考试题目答案": "",
-        }
-
-        # 患者不可见的医疗数据：所有体格检查 + 辅助检查（供医生/系统参考，患者智能体不可见）
-        medical_data: dict[str, Any] = {
-                # 体格检查（全部8项）
-                "体格检查_生命体征": full_case["体格检查_生命体征"],
-                "体格检查_皮肤黏膜": full_case["体格检查_皮肤黏膜"],
-                "体格检查_浅表淋巴结": full_case["体格检查_浅表淋巴结"],
-                "体格检查_头颈部": full_case["体格检查_头颈部"],
-                "体格检查_心肺血管": full_case["体格检查_心肺血管"],
-                "体格检查_腹部": full_case["体格检查_腹部"],
-                "体格检查_脊柱四肢": full_case["体格检查_脊柱四肢"],
-                "体格检查_神经系统": full_case["体格检查_神经系统"],
-                # 辅助检查
-                "辅助检查": full_case["辅助检查"],
-        }
-
-        # 标准答案（仅含初步诊断，用于后期评估）
-        # 诊断依据/治疗原则/随访计划/治疗方案/治疗药物/医嘱由系统运行后LLM生成并写入数据库
-        ground_truth: dict[str, Any] = {
-                "初步诊断": full_case["初步诊断"],
-        }
-        
-        return {
-            "full_case": full_case,
-            "known_case": known_case,
-            "medical_data": medical_data,
-            "ground_truth": ground_truth,
-        }
+        return get_case(actual_case_id, excel_path)
         
     except FileNotFoundError as e:
         error_msg = f"❌ 错误：找不到患者数据文件 {excel_path}"
@@ -414,9 +510,10 @@ def load_diagnosis_arena_case(case_id: int | None = None, excel_path: str | Path
 
 def clear_dataset_cache():
     """清除内存中的数据集缓存"""
-    global _DATASET_CACHE
     with _CACHE_LOCK:
         _DATASET_CACHE.clear()
+        _CASE_TABLES.clear()
+        _CASE_TABLE_KEYS.clear()
     logger.info("🗑️ 数据集内存缓存已清除")
 
 
@@ -426,6 +523,8 @@ def get_cache_info() -> dict[str, Any]:
         "enabled": _CACHE_ENABLED,
         "cached_datasets": list(_DATASET_CACHE.keys()),
         "cache_size": len(_DATASET_CACHE),
+        "case_tables": {path: len(table) for path, table in _CASE_TABLES.items()},
+        "columnar_cache": HAS_PYARROW,
     }
 
 
@@ -443,8 +542,7 @@ def _get_dataset_size(excel_path: str | Path | None = None) -> int:
         # 如果传入None，使用默认路径
         if excel_path is None:
             excel_path = DEFAULT_EXCEL_PATH
-        df = _load_excel_data(excel_path)
-        return len(df)
+        return get_case_count(excel_path)
     except Exception as e:
         logger.warning(f"获取数据集大小失败: {e}")
         return 100  # 默认值
@@ -452,6 +550,10 @@ def _get_dataset_size(excel_path: str | Path | None = None) -> int:
 
 __all__ = [
     "load_diagnosis_arena_case",
+    "get_case",
+    "get_case_count",
+    "build_case_cache",
+    "case_cache_path",
     "clear_dataset_cache",
     "get_cache_info",
     "_get_dataset_size",
@@ -461,3 +563,15 @@ __all__ = [
     "_KNOWN_CASE_FIELDS",
     "_MEDICAL_DATA_FIELDS",
 ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="病例数据集列式缓存工具")
+    parser.add_argument("--excel", default=str(DEFAULT_EXCEL_PATH), help="患者数据 Excel 路径")
+    parser.add_argument("--rebuild", action="store_true", help="忽略现有缓存，强制重新编译")
+    args = parser.parse_args()
+
+    path = build_case_cache(args.excel, force=args.rebuild)
+    print(f"病例缓存: {path}（{get_case_count(args.excel)} 条）")
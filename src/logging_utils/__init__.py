@@ -1,6 +1,6 @@
 """
 日志工具模块 - Logging Utilities Module
-患者详细日志、输出级别配置
+患者详细日志、输出级别配置、异步指标日志、图节点追踪
 """
 
 from .detail_logger import (
@@ -9,6 +9,9 @@ from .detail_logger import (
     create_patient_detail_logger,
     close_patient_detail_logger,
     close_all_patient_detail_loggers,
+    configure_patient_detail_logging,
+    flush_patient_detail_logs,
+    get_patient_detail_log_stats,
     PATIENT_LOGS_DIR,
 )
 
@@ -40,6 +43,26 @@ from .metrics_logger import (
     log_diagnosis_accuracy_summary,
     log_avg_rounds_summary,
     flush_rag_metric_summaries,
+    flush_metrics,
+    get_metrics_pipeline_stats,
+    get_runtime_metric_summaries,
+)
+
+from .streaming_stats import StreamingStats
+
+from .node_tracing import (
+    traced_node,
+    configure_node_tracing,
+    shutdown_node_tracing,
+    record_llm_call,
+    record_llm_stream,
+    record_retrieval,
+    record_prompt_budget,
+    record_lock_wait,
+    capture_node_usage,
+    merge_node_usage,
+    get_node_trace_summary,
+    format_node_trace_table,
 )
 
 __all__ = [
@@ -49,6 +72,9 @@ __all__ = [
     'create_patient_detail_logger',
     'close_patient_detail_logger',
     'close_all_patient_detail_loggers',
+    'configure_patient_detail_logging',
+    'flush_patient_detail_logs',
+    'get_patient_detail_log_stats',
     'PATIENT_LOGS_DIR',
     # output_config
     'should_log',
@@ -76,4 +102,22 @@ __all__ = [
     'log_diagnosis_accuracy_summary',
     'log_avg_rounds_summary',
     'flush_rag_metric_summaries',
+    'flush_metrics',
+    'get_metrics_pipeline_stats',
+    'get_runtime_metric_summaries',
+    # streaming_stats
+    'StreamingStats',
+    # node_tracing
+    'traced_node',
+    'configure_node_tracing',
+    'shutdown_node_tracing',
+    'record_llm_call',
+    'record_llm_stream',
+    'record_retrieval',
+    'record_prompt_budget',
+    'record_lock_wait',
+    'capture_node_usage',
+    'merge_node_usage',
+    'get_node_trace_summary',
+    'format_node_trace_table',
 ]
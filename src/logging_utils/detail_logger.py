@@ -1,28 +1,188 @@
 """
 患者详细日志记录器 - Patient Detail Logger
 为每个患者创建独立的详细日志文件，记录完整的就诊过程
+
+写入为异步批量：每次调用（section / qa_round / prescription 等）在调用线程拼好整段文本，
+作为一条记录放入队列；后台写线程批量取出，按文件合并后一次写入。
+打开的文件句柄按 LRU 复用，数量受 max_open_files 限制（被淘汰的文件下次以追加模式重新打开）。
+可选同时输出结构化 JSONL（与 .log 同名的 .jsonl），每条记录含 kind 与结构化字段。
 """
 
-import logging
+import atexit
+import json
+import queue
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 # 患者详细日志存储目录
 PATIENT_LOGS_DIR = Path("logs/patients")
 PATIENT_LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
 
+class _DetailLogWriter:
+    """患者日志后台写线程：批量合并写入，限制同时打开的文件数"""
+
+    _STOP = object()
+
+    def __init__(self, max_open_files: int = 32, batch_size: int = 1024):
+        self.max_open_files = max(1, max_open_files)
+        self.batch_size = batch_size
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 仅写线程访问
+        self._handles: "OrderedDict[Path, Any]" = OrderedDict()
+        self._created: set = set()
+        self.records_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="patient-log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, path: Path, text: str) -> None:
+        self._ensure_started()
+        self._queue.put((path, text))
+
+    def release(self, path: Path) -> None:
+        """写完已提交内容后关闭该文件"""
+        self._ensure_started()
+        self._queue.put((path, None))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            chunks: "OrderedDict[Path, List[str]]" = OrderedDict()
+            releases: List[Path] = []
+            stop = False
+            for item in batch:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    self._write_chunks(chunks, releases)
+                    chunks, releases = OrderedDict(), []
+                    item.set()
+                else:
+                    path, text = item
+                    if text is None:
+                        releases.append(path)
+                    else:
+                        chunks.setdefault(path, []).append(text)
+            self._write_chunks(chunks, releases)
+            if stop:
+                for handle in self._handles.values():
+                    handle.close()
+                self._handles.clear()
+                return
+
+    def _open(self, path: Path):
+        handle = self._handles.get(path)
+        if handle is not None:
+            self._handles.move_to_end(path)
+            return handle
+        while len(self._handles) >= self.max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        # 首次打开时覆盖（与原 FileHandler mode='w' 一致），淘汰后重新打开则追加
+        mode = "a" if path in self._created else "w"
+        handle = path.open(mode, encoding="utf-8")
+        self._created.add(path)
+        self._handles[path] = handle
+        return handle
+
+    def _write_chunks(self, chunks: "OrderedDict[Path, List[str]]", releases: List[Path]) -> None:
+        for path, parts in chunks.items():
+            try:
+                handle = self._open(path)
+                handle.write("".join(parts))
+                handle.flush()
+                self.records_written += len(parts)
+            except OSError:
+                self.write_errors += 1
+        for path in releases:
+            handle = self._handles.pop(path, None)
+            if handle is not None:
+                handle.close()
+            self._created.discard(path)
+        if chunks:
+            self.batches_written += 1
+
+
+_WRITER = _DetailLogWriter()
+atexit.register(_WRITER.close)
+
+# 是否默认同时输出结构化 JSONL
+_JSONL_DEFAULT = False
+
+
+def configure_patient_detail_logging(jsonl: Optional[bool] = None, max_open_files: Optional[int] = None) -> None:
+    """
+    配置患者详细日志
+
+    Args:
+        jsonl: 新建的日志记录器是否同时输出 .jsonl
+        max_open_files: 同时打开的日志文件上限
+    """
+    global _JSONL_DEFAULT
+    if jsonl is not None:
+        _JSONL_DEFAULT = bool(jsonl)
+    if max_open_files is not None:
+        _WRITER.max_open_files = max(1, int(max_open_files))
+
+
+def flush_patient_detail_logs(timeout: float = 5.0) -> bool:
+    """等待已提交的患者日志全部写入文件"""
+    return _WRITER.flush(timeout)
+
+
+def get_patient_detail_log_stats() -> Dict[str, int]:
+    """患者日志写线程统计"""
+    return {
+        "pending": _WRITER._queue.qsize(),
+        "records_written": _WRITER.records_written,
+        "batches_written": _WRITER.batches_written,
+        "write_errors": _WRITER.write_errors,
+    }
+
+
 class PatientDetailLogger:
     """为每个患者创建独立的详细日志记录器"""
     
-    def __init__(self, patient_id: str, case_id: int):
+    def __init__(self, patient_id: str, case_id: int, jsonl: Optional[bool] = None):
         """
         初始化患者详细日志记录器
         
         Args:
             patient_id: 患者ID
             case_id: 病例ID
+            jsonl: 是否同时输出结构化 JSONL（None 表示使用 configure_patient_detail_logging 的默认值）
         """
         self.patient_id = patient_id
         self.case_id = case_id
@@ -30,89 +190,88 @@ class PatientDetailLogger:
         # 创建日志文件路径：logs/patients/patient_<case_id>_<timestamp>.log
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.log_file = PATIENT_LOGS_DIR / f"patient_{case_id}_{timestamp}.log"
-        
-        # 创建独立的logger
-        self.logger = logging.getLogger(f"patient_detail.{patient_id}")
-        self.logger.setLevel(logging.DEBUG)
-        self.logger.propagate = False  # 不传播到父logger（避免在终端显示）
-        
-        # 清除已有的处理器
-        self.logger.handlers.clear()
-        
-        # 创建文件处理器
-        file_handler = logging.FileHandler(
-            self.log_file,
-            mode='w',
-            encoding='utf-8'
-        )
-        file_handler.setLevel(logging.DEBUG)
-        
-        # 设置格式 - 移除时间戳，因为会导致日志冗长
-        formatter = logging.Formatter(
-            '%(message)s'  # 只记录消息内容，不含时间戳和级别
-        )
-        file_handler.setFormatter(formatter)
-        
-        self.logger.addHandler(file_handler)
+        use_jsonl = _JSONL_DEFAULT if jsonl is None else jsonl
+        self.jsonl_file: Optional[Path] = self.log_file.with_suffix(".jsonl") if use_jsonl else None
+        self._closed = False
         
         # 写入文件头信息
         self._write_header()
     
+    def _emit(self, lines: List[str], kind: str, level: str = "INFO", **fields: Any) -> None:
+        """提交一段日志：多行文本合并为一条记录（一次入队）"""
+        if self._closed:
+            return
+        _WRITER.write(self.log_file, "\n".join(lines) + "\n")
+        if self.jsonl_file is not None:
+            record = {
+                "ts": datetime.now().isoformat(),
+                "patient_id": self.patient_id,
+                "case_id": self.case_id,
+                "kind": kind,
+                "level": level,
+                **fields,
+            }
+            _WRITER.write(self.jsonl_file, json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    
     def _write_header(self):
         """写入日志文件头信息"""
-        self.logger.info("╔" + "═"*78 + "╗")
-        self.logger.info("║" + " "*25 + "患者就诊详细记录" + " "*37 + "║")
-        self.logger.info("╠" + "═"*78 + "╣")
-        self.logger.info(f"║  患者ID: {self.patient_id:<67}║")
-        self.logger.info(f"║  病例ID: {self.case_id:<67}║")
-        self.logger.info(f"║  记录时间: {datetime.now().strftime('%Y年%m月%d日 %H:%M:%S'):<64}║")
-        self.logger.info("╚" + "═"*78 + "╝")
-        self.logger.info("")
+        self._emit([
+            "╔" + "═"*78 + "╗",
+            "║" + " "*25 + "患者就诊详细记录" + " "*37 + "║",
+            "╠" + "═"*78 + "╣",
+            f"║  患者ID: {self.patient_id:<67}║",
+            f"║  病例ID: {self.case_id:<67}║",
+            f"║  记录时间: {datetime.now().strftime('%Y年%m月%d日 %H:%M:%S'):<64}║",
+            "╚" + "═"*78 + "╝",
+            "",
+        ], "header")
     
     def info(self, message: str):
         """记录INFO级别日志"""
-        self.logger.info(message)
+        self._emit([message], "message", "INFO", message=message)
     
     def debug(self, message: str):
         """记录DEBUG级别日志"""
-        self.logger.debug(message)
+        self._emit([message], "message", "DEBUG", message=message)
     
     def warning(self, message: str):
         """记录WARNING级别日志"""
-        self.logger.warning(message)
+        self._emit([message], "message", "WARNING", message=message)
     
     def error(self, message: str):
         """记录ERROR级别日志"""
-        self.logger.error(message)
+        self._emit([message], "message", "ERROR", message=message)
     
     def section(self, title: str):
         """记录分节标题"""
-        self.logger.info("")
-        self.logger.info("┏" + "━"*78 + "┓")
-        self.logger.info(f"┃  {title:<74}  ┃")
-        self.logger.info("┗" + "━"*78 + "┛")
-        self.logger.info("")
+        self._emit([
+            "",
+            "┏" + "━"*78 + "┓",
+            f"┃  {title:<74}  ┃",
+            "┗" + "━"*78 + "┛",
+            "",
+        ], "section", title=title)
     
     def subsection(self, title: str):
         """记录子节标题"""
-        self.logger.info("")
-        self.logger.info(f"┌─ {title} " + "─"*(74-len(title)))
-        self.logger.info("")
+        self._emit(["", f"┌─ {title} " + "─"*(74-len(title)), ""], "subsection", title=title)
     
     def qa_round(self, round_num: int, question: str, answer: str):
         """记录问诊对话"""
-        self.logger.info("")
-        self.logger.info(f"📝 第 {round_num} 轮问诊:")
-        self.logger.info(f" � 第 {round_num} 轮问诊")
-        self.logger.info(f"   ┌─ 医生问：")
+        lines = []
+        lines.append("")
+        lines.append(f"📝 第 {round_num} 轮问诊:")
+        lines.append(f" � 第 {round_num} 轮问诊")
+        lines.append(f"   ┌─ 医生问：")
         # 对长文本进行换行处理
         for line in self._wrap_text(question, 70):
-            self.logger.info(f"   │  {line}")
-        self.logger.info(f"   │")
-        self.logger.info(f"   └─ 患者答：")
+            lines.append(f"   │  {line}")
+        lines.append(f"   │")
+        lines.append(f"   └─ 患者答：")
         for line in self._wrap_text(answer, 70):
-            self.logger.info(f"      {line}")
-        self.logger.info("")
+            lines.append(f"      {line}")
+        lines.append("")
+        self._emit(lines, "qa_round", round=round_num, question=question, answer=answer)
     
     def _wrap_text(self, text: str, width: int) -> list:
         """将长文本按宽度换行"""
@@ -130,122 +289,133 @@ class PatientDetailLogger:
         return lines if lines else [""]
     def diagnosis_result(self, diagnosis: dict):
         """记录诊断结果"""
-        self.logger.info("")
-        self.logger.info("╭─ 🔬 诊断结果 " + "─"*63)
+        lines = []
+        lines.append("")
+        lines.append("╭─ 🔬 诊断结果 " + "─"*63)
         if diagnosis.get('diagnoses'):
-            self.logger.info(f"│  💊 诊断: {', '.join(diagnosis['diagnoses'])}")
+            lines.append(f"│  💊 诊断: {', '.join(diagnosis['diagnoses'])}")
         if diagnosis.get('confidence'):
-            self.logger.info(f"│  📊 置信度: {diagnosis['confidence']}")
+            lines.append(f"│  📊 置信度: {diagnosis['confidence']}")
         if diagnosis.get('reasoning'):
-            self.logger.info(f"│  💭 诊断依据:")
+            lines.append(f"│  💭 诊断依据:")
             for line in self._wrap_text(diagnosis['reasoning'], 70):
-                self.logger.info(f"│     {line}")
-        self.logger.info("╰" + "─"*78)
+                lines.append(f"│     {line}")
+        lines.append("╰" + "─"*78)
+        self._emit(lines, "diagnosis", diagnosis=diagnosis)
     
     def prescription(self, medications: list):
         """记录处方信息"""
-        self.logger.info("")
-        self.logger.info("╭─ 💊 处方药物 " + "─"*63)
+        lines = []
+        lines.append("")
+        lines.append("╭─ 💊 处方药物 " + "─"*63)
         for i, med in enumerate(medications, 1):
             if isinstance(med, dict):
                 name = med.get('name', med.get('药品', '未知'))
                 dosage = med.get('dosage', med.get('剂量', ''))
                 frequency = med.get('frequency', med.get('频次', ''))
-                self.logger.info(f"│  {i}. {name}")
+                lines.append(f"│  {i}. {name}")
                 if dosage:
-                    self.logger.info(f"│     剂量: {dosage}")
+                    lines.append(f"│     剂量: {dosage}")
                 if frequency:
-                    self.logger.info(f"│     频次: {frequency}")
+                    lines.append(f"│     频次: {frequency}")
             else:
-                self.logger.info(f"│  {i}. {med}")
-        self.logger.info("╰" + "─"*78)
-        self.logger.info("")
+                lines.append(f"│  {i}. {med}")
+        lines.append("╰" + "─"*78)
+        lines.append("")
+        self._emit(lines, "prescription", medications=medications)
     
     def lab_test(self, test_name: str, results: dict):
         """记录检验检查结果"""
-        self.logger.info("")
-        self.logger.info(f"╭─ 🔬 {test_name} " + "─"*(75-len(test_name)))
+        lines = []
+        lines.append("")
+        lines.append(f"╭─ 🔬 {test_name} " + "─"*(75-len(test_name)))
         if isinstance(results, dict):
             for key, value in results.items():
                 # 对长值进行换行
                 if isinstance(value, str) and len(str(value)) > 60:
-                    self.logger.info(f"│  {key}:")
+                    lines.append(f"│  {key}:")
                     for line in self._wrap_text(str(value), 70):
-                        self.logger.info(f"│    {line}")
+                        lines.append(f"│    {line}")
                 else:
-                    self.logger.info(f"│  {key}: {value}")
+                    lines.append(f"│  {key}: {value}")
         else:
             for line in self._wrap_text(str(results), 70):
-                self.logger.info(f"│  {line}")
-        self.logger.info("╰" + "─"*78)
-        self.logger.info("")
+                lines.append(f"│  {line}")
+        lines.append("╰" + "─"*78)
+        lines.append("")
+        self._emit(lines, "lab_test", test_name=test_name, results=results)
     
     def staff_info(self, role: str, staff_id: str, staff_name: str):
         """记录医护人员信息"""
-        self.logger.info(f"│  👨‍⚕️ {role}: {staff_name} ({staff_id})")
+        self._emit([f"│  👨‍⚕️ {role}: {staff_name} ({staff_id})"], "staff", role=role, staff_id=staff_id, staff_name=staff_name)
     
     def timing(self, stage: str, duration: float):
         """记录时间统计"""
         minutes = int(duration // 60)
         seconds = int(duration % 60)
-        self.logger.info(f"│  ⏱️  {stage} 耗时: {minutes}分{seconds}秒")
+        self._emit([f"│  ⏱️  {stage} 耗时: {minutes}分{seconds}秒"], "timing", stage=stage, duration_seconds=duration)
     
     def medical_advice(self, advice: str):
         """记录医嘱"""
-        self.logger.info("")
-        self.logger.info("╭─ 📋 医嘱 " + "─"*67)
+        lines = []
+        lines.append("")
+        lines.append("╭─ 📋 医嘱 " + "─"*67)
         for line in advice.split('\n'):
             if line.strip():
                 for wrapped_line in self._wrap_text(line.strip(), 70):
-                    self.logger.info(f"│  • {wrapped_line}")
-        self.logger.info("╰" + "─"*78)
-        self.logger.info("")
+                    lines.append(f"│  • {wrapped_line}")
+        lines.append("╰" + "─"*78)
+        lines.append("")
+        self._emit(lines, "medical_advice", advice=advice)
     
     def followup_plan(self, plan: dict):
         """记录随访计划"""
-        self.logger.info("")
-        self.logger.info("╭─ 📅 随访计划 " + "─"*63)
+        lines = []
+        lines.append("")
+        lines.append("╭─ 📅 随访计划 " + "─"*63)
         if plan.get('when'):
-            self.logger.info(f"│  ⏰ 随访时间: {plan['when']}")
+            lines.append(f"│  ⏰ 随访时间: {plan['when']}")
         if plan.get('what'):
-            self.logger.info(f"│  📝 随访内容:")
+            lines.append(f"│  📝 随访内容:")
             for line in self._wrap_text(plan['what'], 70):
-                self.logger.info(f"│     {line}")
+                lines.append(f"│     {line}")
         if plan.get('why'):
-            self.logger.info(f"│  💡 随访原因:")
+            lines.append(f"│  💡 随访原因:")
             for line in self._wrap_text(plan['why'], 70):
-                self.logger.info(f"│     {line}")
-        self.logger.info("╰" + "─"*78)
-        self.logger.info("")
+                lines.append(f"│     {line}")
+        lines.append("╰" + "─"*78)
+        lines.append("")
+        self._emit(lines, "followup_plan", plan=plan)
     
     def node_start(self, node_name: str, node_display_name: str = ""):
         """记录节点开始"""
         display = node_display_name if node_display_name else node_name
-        self.logger.info("")
-        self.logger.info("┌─ ▶️  " + display + " " + "─"*(73 - len(display)))
+        self._emit(["", "┌─ ▶️  " + display + " " + "─"*(73 - len(display))], "node_start", node=node_name, display=display)
     
     def node_end(self, node_name: str, node_display_name: str = ""):
         """记录节点结束"""
         display = node_display_name if node_display_name else node_name
-        self.logger.info(f"└─ ✅ {display} 完成")
-        self.logger.info("")
+        self._emit([f"└─ ✅ {display} 完成", ""], "node_end", node=node_name, display=display)
     
     def get_log_file_path(self) -> str:
         """获取日志文件路径"""
         return str(self.log_file)
     
     def close(self):
-        """关闭日志记录器"""
-        self.logger.info("")
-        self.logger.info("")
-        self.logger.info("╔" + "═"*78 + "╗")
-        self.logger.info("║" + " "*28 + "就诊记录结束" + " "*38 + "║")
-        self.logger.info("╚" + "═"*78 + "╝")
-        
-        # 关闭所有处理器
-        for handler in self.logger.handlers:
-            handler.close()
-            self.logger.removeHandler(handler)
+        """关闭日志记录器（写入结束标记；文件在后台写完后关闭，不阻塞调用方）"""
+        if self._closed:
+            return
+        self._emit([
+            "",
+            "",
+            "╔" + "═"*78 + "╗",
+            "║" + " "*28 + "就诊记录结束" + " "*38 + "║",
+            "╚" + "═"*78 + "╝",
+        ], "footer")
+        self._closed = True
+        _WRITER.release(self.log_file)
+        if self.jsonl_file is not None:
+            _WRITER.release(self.jsonl_file)
 
 
 # 全局字典，用于存储每个患者的日志记录器
@@ -303,3 +473,4 @@ def close_all_patient_detail_loggers():
     """关闭所有患者的详细日志记录器"""
     for patient_id in list(_patient_loggers.keys()):
         close_patient_detail_logger(patient_id)
+    flush_patient_detail_logs()
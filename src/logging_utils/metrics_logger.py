@@ -1,57 +1,203 @@
-"""按运行批次初始化与写入指标日志（中文输出）。"""
+"""按运行批次初始化与写入指标日志（中文输出）。
+
+写入为异步流水线：各 log_* 函数只在调用线程格式化记录并放入队列（无文件 I/O、无全局写锁），
+后台线程批量取出后按文件合并写入——人类可读的分段文本日志（格式不变）与结构化的
+metrics.jsonl（每行一条记录，含 category / kind 字段）。运行级聚合使用固定内存的
+StreamingStats（count / mean / p50 / p95 / p99），不再保存全部样本。
+
+flush_metrics() 等待队列写完；进程正常退出时会自动刷盘。
+"""
 
 from __future__ import annotations
 
+import atexit
+import json
 import math
 import os
+import queue
 import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+from .streaming_stats import StreamingStats
+
 
 METRICS_ROOT_DIR = Path("logs/metrics")
 METRICS_RUNS_DIR = METRICS_ROOT_DIR / "runs"
+METRICS_JSONL_NAME = "metrics.jsonl"
 _CURRENT_METRICS_LOG_PATHS: dict[str, str] = {}
-_WRITE_LOCK = threading.Lock()
 _EMBED_LOCK = threading.Lock()
 _EMBEDDINGS = None
 
 _RAG_STATS = {
-    "latencies_ms": [],
+    "latency_ms": StreamingStats(),
     "recall_queries": 0,
     "recall_hits": 0,
-    "grounded_scores": [],
+    "grounded": StreamingStats(),
 }
 
 _CONSULT_STATS = {
-    "total_rounds": [],
-    "effective_rounds": [],
+    "total_rounds": StreamingStats(),
+    "effective_rounds": StreamingStats(),
     "diag_total": 0,
     "diag_correct": 0,
 }
 
+# 计数器更新（+=）非原子，用一把短锁保护；StreamingStats 自带锁
+_COUNTER_LOCK = threading.Lock()
 
-def _reset_runtime_stats() -> None:
-    _RAG_STATS["latencies_ms"] = []
-    _RAG_STATS["recall_queries"] = 0
-    _RAG_STATS["recall_hits"] = 0
-    _RAG_STATS["grounded_scores"] = []
 
-    _CONSULT_STATS["total_rounds"] = []
-    _CONSULT_STATS["effective_rounds"] = []
-    _CONSULT_STATS["diag_total"] = 0
-    _CONSULT_STATS["diag_correct"] = 0
+def _reset_runtime_stats() -> None:
+    _RAG_STATS["latency_ms"].reset()
+    _RAG_STATS["grounded"].reset()
+    _CONSULT_STATS["total_rounds"].reset()
+    _CONSULT_STATS["effective_rounds"].reset()
+    with _COUNTER_LOCK:
+        _RAG_STATS["recall_queries"] = 0
+        _RAG_STATS["recall_hits"] = 0
+        _CONSULT_STATS["diag_total"] = 0
+        _CONSULT_STATS["diag_correct"] = 0
 
 
 def _now_iso() -> str:
     return datetime.now().isoformat()
 
 
-def _append_lines(file_path: str, lines: list[str]) -> None:
-    with _WRITE_LOCK:
-        with Path(file_path).open("a", encoding="utf-8") as f:
-            f.write("\n".join(lines) + "\n")
+class _MetricsWriter:
+    """后台写线程：从队列批量取出记录，按文件合并后一次性追加写入。"""
+
+    _STOP = object()
+
+    def __init__(self, batch_size: int = 512):
+        self.batch_size = batch_size
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self.records_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, text_path: str, lines: list[str], jsonl_path: str | None, record: dict[str, Any]) -> None:
+        self._ensure_started()
+        self._queue.put((text_path, lines, jsonl_path, record))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待此前提交的记录全部写入；超时返回 False。"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            pending: list[tuple] = []
+            stop = False
+            for item in batch:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    # 屏障：先写完它之前的记录再通知等待方
+                    self._write(pending)
+                    pending = []
+                    item.set()
+                else:
+                    pending.append(item)
+            self._write(pending)
+            if stop:
+                return
+
+    def _write(self, items: list[tuple]) -> None:
+        if not items:
+            return
+        chunks: dict[str, list[str]] = {}
+        for text_path, lines, jsonl_path, record in items:
+            chunks.setdefault(text_path, []).append("\n".join(lines) + "\n")
+            if jsonl_path:
+                chunks.setdefault(jsonl_path, []).append(
+                    json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                )
+        for path, parts in chunks.items():
+            try:
+                with Path(path).open("a", encoding="utf-8") as f:
+                    f.write("".join(parts))
+            except OSError:
+                self.write_errors += 1
+        self.records_written += len(items)
+        self.batches_written += 1
+
+
+_WRITER = _MetricsWriter()
+atexit.register(_WRITER.close)
+
+
+def _emit(category: str, kind: str, lines: list[str], **fields: Any) -> None:
+    """提交一条指标记录：文本段落写入对应分类日志，结构化字段写入 metrics.jsonl。"""
+    paths = _CURRENT_METRICS_LOG_PATHS
+    text_path = paths.get(category)
+    if not text_path:
+        return
+    record = {"category": category, "kind": kind, **fields}
+    _WRITER.submit(text_path, lines, paths.get("jsonl"), record)
+
+
+def flush_metrics(timeout: float = 5.0) -> bool:
+    """阻塞直到已提交的指标全部落盘（超时返回 False）。"""
+    return _WRITER.flush(timeout)
+
+
+def get_metrics_pipeline_stats() -> dict[str, Any]:
+    """指标写入流水线状态：队列积压、已写记录数、批次数、写入错误数。"""
+    return {
+        "pending": _WRITER.pending(),
+        "records_written": _WRITER.records_written,
+        "batches_written": _WRITER.batches_written,
+        "write_errors": _WRITER.write_errors,
+    }
+
+
+def get_runtime_metric_summaries() -> dict[str, Any]:
+    """本次运行的实时聚合（流式估计，内存占用固定）。"""
+    with _COUNTER_LOCK:
+        recall_queries = _RAG_STATS["recall_queries"]
+        recall_hits = _RAG_STATS["recall_hits"]
+        diag_total = _CONSULT_STATS["diag_total"]
+        diag_correct = _CONSULT_STATS["diag_correct"]
+    return {
+        "retrieval_latency_ms": _RAG_STATS["latency_ms"].summary(),
+        "groundedness": _RAG_STATS["grounded"].summary(),
+        "recall_at_k": recall_hits / recall_queries if recall_queries else None,
+        "recall_queries": recall_queries,
+        "total_rounds": _CONSULT_STATS["total_rounds"].summary(),
+        "effective_rounds": _CONSULT_STATS["effective_rounds"].summary(),
+        "diagnosis_accuracy": diag_correct / diag_total if diag_total else None,
+        "diagnosis_cases": diag_total,
+    }
 
 
 def _safe_text(value: Any) -> str:
@@ -66,7 +212,9 @@ def get_current_metrics_log_paths() -> dict[str, str]:
 
 
 def create_run_metrics_logs() -> dict[str, str]:
-    """为当前运行创建三类指标日志文件。"""
+    """为当前运行创建三类指标日志文件（及结构化 metrics.jsonl）。"""
+    # 上一批次尚未写完的记录先落盘，避免与新批次交错
+    flush_metrics()
     METRICS_RUNS_DIR.mkdir(parents=True, exist_ok=True)
 
     run_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -107,6 +255,8 @@ def create_run_metrics_logs() -> dict[str, str]:
 
     for key, path in files.items():
         path.write_text(header + sections[key], encoding="utf-8")
+    jsonl_path = run_dir / METRICS_JSONL_NAME
+    jsonl_path.touch()
 
     global _CURRENT_METRICS_LOG_PATHS
 
@@ -115,6 +265,7 @@ def create_run_metrics_logs() -> dict[str, str]:
         "rag": str(files["rag"]),
         "performance": str(files["performance"]),
         "consultation": str(files["consultation"]),
+        "jsonl": str(jsonl_path),
     }
     _reset_runtime_stats()
     return dict(_CURRENT_METRICS_LOG_PATHS)
@@ -132,18 +283,18 @@ def log_retrieval_latency(
     case_id: str = "",
     node_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    rag_log = paths.get("rag")
-    if not rag_log:
+    if not _CURRENT_METRICS_LOG_PATHS.get("rag"):
         return
 
-    _RAG_STATS["latencies_ms"].append(float(latency_ms))
+    _RAG_STATS["latency_ms"].add(latency_ms)
 
-    _append_lines(
-        rag_log,
+    ts = _now_iso()
+    _emit(
+        "rag",
+        "retrieval_latency",
         [
             "[检索时延]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
@@ -155,6 +306,16 @@ def log_retrieval_latency(
             f"查询文本={_safe_text(query)}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        node_id=node_id,
+        db_name=db_name,
+        k=int(k),
+        result_count=int(result_count),
+        latency_ms=float(latency_ms),
+        query=_safe_text(query),
     )
 
 
@@ -171,20 +332,21 @@ def log_recall_at_k(
     case_id: str = "",
     node_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    rag_log = paths.get("rag")
-    if not rag_log:
+    if not _CURRENT_METRICS_LOG_PATHS.get("rag"):
         return
 
-    _RAG_STATS["recall_queries"] += 1
-    if bool(hit):
-        _RAG_STATS["recall_hits"] += 1
+    with _COUNTER_LOCK:
+        _RAG_STATS["recall_queries"] += 1
+        if bool(hit):
+            _RAG_STATS["recall_hits"] += 1
 
-    _append_lines(
-        rag_log,
+    ts = _now_iso()
+    _emit(
+        "rag",
+        "recall_at_k",
         [
             "[检索召回率]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
@@ -197,6 +359,17 @@ def log_recall_at_k(
             f"查询文本={_safe_text(query)}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        node_id=node_id,
+        k=int(k),
+        hit=bool(hit),
+        recall_at_k=float(recall_at_k),
+        retrieved_doc_ids=list(retrieved_doc_ids),
+        gold_doc_ids=list(gold_doc_ids),
+        query=_safe_text(query),
     )
 
 
@@ -297,27 +470,36 @@ def log_groundedness(
     case_id: str = "",
     node_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    rag_log = paths.get("rag")
-    if not rag_log:
+    if not _CURRENT_METRICS_LOG_PATHS.get("rag"):
         return
 
-    _RAG_STATS["grounded_scores"].append(float(semantic_similarity))
+    _RAG_STATS["grounded"].add(semantic_similarity)
 
-    _append_lines(
-        rag_log,
+    ts = _now_iso()
+    answer = _safe_text(answer_text)[:2000]
+    _emit(
+        "rag",
+        "groundedness",
         [
             "[引用一致性]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
             f"节点ID={_safe_text(node_id)}",
             f"语义相似度={float(semantic_similarity):.6f}",
             f"引用文档ID={citation_doc_ids}",
-            f"回答文本={_safe_text(answer_text)[:2000]}",
+            f"回答文本={answer}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        node_id=node_id,
+        semantic_similarity=float(semantic_similarity),
+        citation_doc_ids=list(citation_doc_ids),
+        answer_text=answer,
     )
 
 
@@ -332,16 +514,13 @@ def log_treatment_duration(
     patient_id: str = "",
     case_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    perf_log = paths.get("performance")
-    if not perf_log:
-        return
-
-    _append_lines(
-        perf_log,
+    ts = _now_iso()
+    _emit(
+        "performance",
+        "treatment_duration",
         [
             "[平均诊疗时长-单病例]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
@@ -352,6 +531,15 @@ def log_treatment_duration(
             f"系统运行秒数={'' if wall_time_seconds is None else f'{float(wall_time_seconds):.3f}'}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        visit_start_time=_safe_text(visit_start_time),
+        visit_end_time=_safe_text(visit_end_time),
+        visit_duration_minutes=visit_duration_minutes,
+        simulated_duration_minutes=simulated_duration_minutes,
+        wall_time_seconds=wall_time_seconds,
     )
 
 
@@ -361,21 +549,22 @@ def log_treatment_duration_summary(
     patient_count: int,
     run_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    perf_log = paths.get("performance")
-    if not perf_log:
-        return
-
-    _append_lines(
-        perf_log,
+    ts = _now_iso()
+    _emit(
+        "performance",
+        "treatment_duration_summary",
         [
             "[平均诊疗时长-汇总]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者数量={int(patient_count)}",
             f"平均诊疗时长分钟={float(avg_duration_minutes):.3f}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_count=int(patient_count),
+        avg_duration_minutes=float(avg_duration_minutes),
     )
 
 
@@ -390,16 +579,13 @@ def log_throughput(
     peak_throughput_req_per_sec: float | None = None,
     run_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    perf_log = paths.get("performance")
-    if not perf_log:
-        return
-
-    _append_lines(
-        perf_log,
+    ts = _now_iso()
+    _emit(
+        "performance",
+        "throughput",
         [
             "[并发吞吐量]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"测试开始={_safe_text(test_start)}",
             f"测试结束={_safe_text(test_end)}",
@@ -410,6 +596,15 @@ def log_throughput(
             f"峰值吞吐量(请求/秒)={'' if peak_throughput_req_per_sec is None else f'{float(peak_throughput_req_per_sec):.6f}'}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        test_start=_safe_text(test_start),
+        test_end=_safe_text(test_end),
+        total_requests=int(total_requests),
+        completed_requests=int(completed_requests),
+        test_duration_seconds=float(test_duration_seconds),
+        throughput_req_per_sec=float(throughput_req_per_sec),
+        peak_throughput_req_per_sec=peak_throughput_req_per_sec,
     )
 
 
@@ -428,16 +623,13 @@ def log_consultation_quality(
     patient_id: str = "",
     case_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
-        return
-
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    _emit(
+        "consultation",
+        "consultation_quality",
         [
             "[问诊质量]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
@@ -452,6 +644,19 @@ def log_consultation_quality(
             f"问诊质量综合分={float(consultation_quality_score):.6f}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        doctor_specificity=float(doctor_specificity),
+        doctor_purposefulness=float(doctor_purposefulness),
+        doctor_professionalism=float(doctor_professionalism),
+        doctor_information_coverage=float(doctor_information_coverage),
+        patient_relevance=float(patient_relevance),
+        patient_faithfulness=float(patient_faithfulness),
+        patient_information_completeness=float(patient_information_completeness),
+        patient_consistency_robustness=float(patient_consistency_robustness),
+        consultation_quality_score=float(consultation_quality_score),
     )
 
 
@@ -464,19 +669,19 @@ def log_effective_rounds(
     patient_id: str = "",
     case_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
+    if not _CURRENT_METRICS_LOG_PATHS.get("consultation"):
         return
 
-    _CONSULT_STATS["total_rounds"].append(int(total_rounds))
-    _CONSULT_STATS["effective_rounds"].append(int(effective_rounds))
+    _CONSULT_STATS["total_rounds"].add(int(total_rounds))
+    _CONSULT_STATS["effective_rounds"].add(int(effective_rounds))
 
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    _emit(
+        "consultation",
+        "effective_rounds",
         [
             "[有效问诊轮次]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
@@ -485,6 +690,13 @@ def log_effective_rounds(
             f"每病例平均有效轮次={float(avg_effective_rounds):.6f}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        total_rounds=int(total_rounds),
+        effective_rounds=int(effective_rounds),
+        avg_effective_rounds=float(avg_effective_rounds),
     )
 
 
@@ -495,22 +707,24 @@ def log_avg_rounds(
     patient_id: str = "",
     case_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
-        return
-
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    _emit(
+        "consultation",
+        "rounds",
         [
             "[问诊总轮次]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
             f"轮次数={int(rounds)}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        rounds=int(rounds),
     )
 
 
@@ -520,21 +734,22 @@ def log_effective_rounds_summary(
     avg_effective_rounds: float,
     run_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
-        return
-
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    _emit(
+        "consultation",
+        "effective_rounds_summary",
         [
             "[有效问诊轮次-汇总]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者数量={int(patient_count)}",
             f"平均有效问诊轮次={float(avg_effective_rounds):.6f}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_count=int(patient_count),
+        avg_effective_rounds=float(avg_effective_rounds),
     )
 
 
@@ -547,20 +762,21 @@ def log_diagnosis_accuracy(
     patient_id: str = "",
     case_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
+    if not _CURRENT_METRICS_LOG_PATHS.get("consultation"):
         return
 
-    _CONSULT_STATS["diag_total"] += 1
-    if bool(is_correct):
-        _CONSULT_STATS["diag_correct"] += 1
+    with _COUNTER_LOCK:
+        _CONSULT_STATS["diag_total"] += 1
+        if bool(is_correct):
+            _CONSULT_STATS["diag_correct"] += 1
 
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    _emit(
+        "consultation",
+        "diagnosis_accuracy",
         [
             "[诊断准确率-单病例]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"患者ID={_safe_text(patient_id)}",
             f"病例ID={_safe_text(case_id)}",
@@ -569,6 +785,13 @@ def log_diagnosis_accuracy(
             f"是否正确={str(bool(is_correct)).lower()}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        patient_id=patient_id,
+        case_id=case_id,
+        predicted_diagnosis=_safe_text(predicted_diagnosis),
+        ground_truth_diagnosis=_safe_text(ground_truth_diagnosis),
+        is_correct=bool(is_correct),
     )
 
 
@@ -579,100 +802,127 @@ def log_diagnosis_accuracy_summary(
     accuracy: float,
     run_id: str = "",
 ) -> None:
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
-        return
-
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    _emit(
+        "consultation",
+        "diagnosis_accuracy_summary",
         [
             "[诊断准确率-汇总]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
             f"病例总数={int(total_cases)}",
             f"正确病例数={int(correct_cases)}",
             f"准确率={float(accuracy):.6f}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        total_cases=int(total_cases),
+        correct_cases=int(correct_cases),
+        accuracy=float(accuracy),
     )
 
 
 def log_avg_rounds_summary(*, run_id: str = "") -> None:
     """按病例总问诊轮次写入 AvgRounds 汇总。"""
-    paths = get_current_metrics_log_paths()
-    consultation_log = paths.get("consultation")
-    if not consultation_log:
+    totals = _CONSULT_STATS["total_rounds"]
+    if not totals.count:
         return
 
-    totals = _CONSULT_STATS.get("total_rounds", [])
-    if not totals:
-        return
-
-    avg_rounds = sum(float(x) for x in totals) / len(totals)
-    _append_lines(
-        consultation_log,
+    ts = _now_iso()
+    summary = totals.summary()
+    _emit(
+        "consultation",
+        "rounds_summary",
         [
             "[问诊总轮次-汇总]",
-            f"时间戳={_now_iso()}",
+            f"时间戳={ts}",
             f"运行ID={_safe_text(run_id)}",
-            f"病例数量={len(totals)}",
-            f"AvgRounds={avg_rounds:.6f}",
+            f"病例数量={summary['count']}",
+            f"AvgRounds={summary['mean']:.6f}",
+            f"P50轮次={summary['p50']:.2f}",
+            f"P95轮次={summary['p95']:.2f}",
             "---",
         ],
+        ts=ts,
+        run_id=run_id,
+        **summary,
     )
 
 
 def flush_rag_metric_summaries(*, run_id: str = "") -> None:
-    """写入 RAG 运行级汇总：Recall@k、Groundedness、检索时延。"""
-    paths = get_current_metrics_log_paths()
-    rag_log = paths.get("rag")
-    if not rag_log:
+    """写入 RAG 运行级汇总：Recall@k、Groundedness、检索时延；随后等待指标队列全部落盘。"""
+    if not _CURRENT_METRICS_LOG_PATHS.get("rag"):
         return
 
-    latencies = _RAG_STATS.get("latencies_ms", [])
-    if latencies:
-        avg_latency = sum(float(x) for x in latencies) / len(latencies)
-        _append_lines(
-            rag_log,
+    latency = _RAG_STATS["latency_ms"]
+    if latency.count:
+        ts = _now_iso()
+        summary = latency.summary()
+        _emit(
+            "rag",
+            "retrieval_latency_summary",
             [
                 "[检索时延-汇总]",
-                f"时间戳={_now_iso()}",
+                f"时间戳={ts}",
                 f"运行ID={_safe_text(run_id)}",
-                f"查询次数={len(latencies)}",
-                f"平均检索时延毫秒={avg_latency:.6f}",
+                f"查询次数={summary['count']}",
+                f"平均检索时延毫秒={summary['mean']:.6f}",
+                f"P50检索时延毫秒={summary['p50']:.3f}",
+                f"P95检索时延毫秒={summary['p95']:.3f}",
+                f"P99检索时延毫秒={summary['p99']:.3f}",
+                f"最大检索时延毫秒={summary['max']:.3f}",
                 "---",
             ],
+            ts=ts,
+            run_id=run_id,
+            **summary,
         )
 
-    recall_queries = int(_RAG_STATS.get("recall_queries", 0))
-    recall_hits = int(_RAG_STATS.get("recall_hits", 0))
+    with _COUNTER_LOCK:
+        recall_queries = int(_RAG_STATS["recall_queries"])
+        recall_hits = int(_RAG_STATS["recall_hits"])
     if recall_queries > 0:
         recall_at_k = recall_hits / recall_queries
-        _append_lines(
-            rag_log,
+        ts = _now_iso()
+        _emit(
+            "rag",
+            "recall_at_k_summary",
             [
                 "[检索召回率-汇总]",
-                f"时间戳={_now_iso()}",
+                f"时间戳={ts}",
                 f"运行ID={_safe_text(run_id)}",
                 f"查询总数={recall_queries}",
                 f"命中查询数={recall_hits}",
                 f"Recall@k={recall_at_k:.6f}",
                 "---",
             ],
+            ts=ts,
+            run_id=run_id,
+            recall_queries=recall_queries,
+            recall_hits=recall_hits,
+            recall_at_k=recall_at_k,
         )
 
-    grounded_scores = _RAG_STATS.get("grounded_scores", [])
-    if grounded_scores:
-        avg_grounded = sum(float(x) for x in grounded_scores) / len(grounded_scores)
-        _append_lines(
-            rag_log,
+    grounded = _RAG_STATS["grounded"]
+    if grounded.count:
+        ts = _now_iso()
+        summary = grounded.summary()
+        _emit(
+            "rag",
+            "groundedness_summary",
             [
                 "[引用一致性-汇总]",
-                f"时间戳={_now_iso()}",
+                f"时间戳={ts}",
                 f"运行ID={_safe_text(run_id)}",
-                f"样本数={len(grounded_scores)}",
-                f"平均Groundedness={avg_grounded:.6f}",
+                f"样本数={summary['count']}",
+                f"平均Groundedness={summary['mean']:.6f}",
+                f"P50 Groundedness={summary['p50']:.6f}",
                 "---",
             ],
+            ts=ts,
+            run_id=run_id,
+            **summary,
         )
+
+    flush_metrics()
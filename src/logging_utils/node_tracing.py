@@ -0,0 +1,396 @@
+"""图节点追踪：逐节点、逐患者记录真实耗时与资源消耗。
+
+CommonOPDGraph（C1–C16）与专科子图（S1–S3）的每个节点由 traced_node 包装，
+节点执行期间的以下消耗归属到该节点：
+- 墙钟耗时（wall time，区别于 node_time_map 的模拟时钟）
+- LLM 调用次数、prompt / completion tokens 及命中上下文缓存的 prompt tokens
+  （取自接口返回的 usage 字段）、LLM 耗时
+- 检索次数与检索耗时
+- 流式调用：首 token 延迟（TTFT）、提前终止次数与估计节省的 completion tokens
+- 提示词预算：组装后的 prompt tokens 与因超出预算被裁剪的 tokens（services.prompt_budget）
+- 锁等待时间（TrackedLock 竞争路径）
+
+节点提前交给后台线程的工作（如 C13 之后并行生成的 C14 文书 / C15 宣教）用 capture_node_usage
+暂存消耗，取用结果的节点调用 merge_node_usage 归属到自身。
+
+埋点方（LLM 客户端、检索器、锁）调用 record_llm_call / record_retrieval / record_lock_wait，
+当前线程（contextvars 上下文）没有活动节点时为空操作。子图节点嵌套在 C6 内执行，
+计数同时累加到所有活动节点（C6 的数值包含 S1–S3）。
+
+安装了 OpenTelemetry SDK 时每个节点导出为一个 span（子图节点为 C6 的子 span），
+通过本地文件导出器逐行写入 JSON；未安装时仅做进程内聚合。
+运行级汇总由 format_node_trace_table() 生成，在 display_final_statistics 中输出。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import importlib.util
+import json
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .streaming_stats import StreamingStats
+
+# OpenTelemetry SDK 导入较重，只在 configure_node_tracing 启用导出时才加载
+# （对顶层包 find_spec 不会执行导入）
+HAS_OTEL = importlib.util.find_spec("opentelemetry") is not None
+
+
+@dataclass
+class _NodeSpan:
+    """单个节点一次执行的累加器"""
+
+    node_id: str
+    patient_id: str
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    llm_ms: float = 0.0
+    retrievals: int = 0
+    retrieval_ms: float = 0.0
+    lock_wait_ms: float = 0.0
+    budget_tokens: int = 0
+    trimmed_tokens: int = 0
+    stream_calls: int = 0
+    ttft_ms: float = 0.0
+    early_stops: int = 0
+    saved_tokens: int = 0
+
+
+@dataclass
+class _NodeAggregate:
+    """节点的运行级聚合"""
+
+    wall_ms: StreamingStats = field(default_factory=StreamingStats)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    llm_ms: float = 0.0
+    retrievals: int = 0
+    retrieval_ms: float = 0.0
+    lock_wait_ms: float = 0.0
+    budget_tokens: int = 0
+    trimmed_tokens: int = 0
+    stream_calls: int = 0
+    ttft_ms: float = 0.0
+    early_stops: int = 0
+    saved_tokens: int = 0
+    errors: int = 0
+
+
+_ACTIVE_SPANS: contextvars.ContextVar[tuple[_NodeSpan, ...]] = contextvars.ContextVar(
+    "active_node_spans", default=()
+)
+_AGG_LOCK = threading.Lock()
+_NODE_AGGREGATES: dict[str, _NodeAggregate] = {}
+_PATIENT_WALL_MS: dict[str, float] = {}
+
+_TRACER = None
+_PROVIDER = None
+_EXPORT_FILE = None
+
+
+# ===== 配置 =====
+
+def configure_node_tracing(export_path: Optional[str | Path] = None) -> Optional[str]:
+    """初始化（或重置）节点追踪；export_path 为 span 导出文件（JSON Lines）。
+
+    Returns:
+        实际启用的导出文件路径；未安装 OpenTelemetry 或未指定路径时返回 None
+    """
+    global _TRACER, _PROVIDER, _EXPORT_FILE
+    shutdown_node_tracing()
+    reset_node_trace_stats()
+    if not HAS_OTEL or export_path is None:
+        return None
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        return None
+
+    path = Path(export_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _EXPORT_FILE = path.open("a", encoding="utf-8")
+    exporter = ConsoleSpanExporter(
+        out=_EXPORT_FILE,
+        formatter=lambda span: json.dumps(json.loads(span.to_json()), ensure_ascii=False) + "\n",
+    )
+    # 使用独立的 TracerProvider，不覆盖全局 provider
+    _PROVIDER = TracerProvider(resource=Resource.create({"service.name": "hospital-agent"}))
+    _PROVIDER.add_span_processor(BatchSpanProcessor(exporter))
+    _TRACER = _PROVIDER.get_tracer("hospital_agent.graph")
+    return str(path)
+
+
+def shutdown_node_tracing() -> None:
+    """刷出并关闭 span 导出器（可重复调用）"""
+    global _TRACER, _PROVIDER, _EXPORT_FILE
+    if _PROVIDER is not None:
+        _PROVIDER.shutdown()
+    if _EXPORT_FILE is not None:
+        _EXPORT_FILE.close()
+    _TRACER = _PROVIDER = _EXPORT_FILE = None
+
+
+def reset_node_trace_stats() -> None:
+    with _AGG_LOCK:
+        _NODE_AGGREGATES.clear()
+        _PATIENT_WALL_MS.clear()
+
+
+# ===== 节点包装 =====
+
+def traced_node(node_id: str, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """包装图节点函数：节点执行期间的消耗归属到 node_id"""
+
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        patient_id = str(getattr(state, "patient_id", "") or "")
+        span = _NodeSpan(node_id=node_id, patient_id=patient_id)
+        token = _ACTIVE_SPANS.set(_ACTIVE_SPANS.get() + (span,))
+        otel_cm = otel_span = None
+        if _TRACER is not None:
+            otel_cm = _TRACER.start_as_current_span(f"node.{node_id}")
+            otel_span = otel_cm.__enter__()
+        start = time.perf_counter()
+        failed = False
+        try:
+            return fn(state, *args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000
+            _ACTIVE_SPANS.reset(token)
+            _finish(span, wall_ms, failed)
+            if otel_cm is not None:
+                if otel_span.is_recording():
+                    otel_span.set_attributes({
+                        "node.id": node_id,
+                        "patient.id": patient_id,
+                        "run.id": str(getattr(state, "run_id", "") or ""),
+                        "dept": str(getattr(state, "dept", "") or ""),
+                        "wall_ms": round(wall_ms, 3),
+                        "llm.calls": span.llm_calls,
+                        "llm.prompt_tokens": span.prompt_tokens,
+                        "llm.cached_tokens": span.cached_tokens,
+                        "llm.completion_tokens": span.completion_tokens,
+                        "llm.latency_ms": round(span.llm_ms, 3),
+                        "retrieval.count": span.retrievals,
+                        "retrieval.latency_ms": round(span.retrieval_ms, 3),
+                        "lock.wait_ms": round(span.lock_wait_ms, 3),
+                        "prompt.budget_tokens": span.budget_tokens,
+                        "prompt.trimmed_tokens": span.trimmed_tokens,
+                        "llm.stream_calls": span.stream_calls,
+                        "llm.ttft_ms": span.ttft_ms,
+                        "llm.early_stops": span.early_stops,
+                        "llm.saved_tokens": span.saved_tokens,
+                        "error": failed,
+                    })
+                otel_cm.__exit__(None, None, None)
+
+    return wrapper
+
+
+def _finish(span: _NodeSpan, wall_ms: float, failed: bool) -> None:
+    with _AGG_LOCK:
+        agg = _NODE_AGGREGATES.get(span.node_id)
+        if agg is None:
+            agg = _NODE_AGGREGATES[span.node_id] = _NodeAggregate()
+        agg.llm_calls += span.llm_calls
+        agg.prompt_tokens += span.prompt_tokens
+        agg.cached_tokens += span.cached_tokens
+        agg.completion_tokens += span.completion_tokens
+        agg.llm_ms += span.llm_ms
+        agg.retrievals += span.retrievals
+        agg.retrieval_ms += span.retrieval_ms
+        agg.lock_wait_ms += span.lock_wait_ms
+        agg.budget_tokens += span.budget_tokens
+        agg.trimmed_tokens += span.trimmed_tokens
+        agg.stream_calls += span.stream_calls
+        agg.ttft_ms += span.ttft_ms
+        agg.early_stops += span.early_stops
+        agg.saved_tokens += span.saved_tokens
+        agg.errors += int(failed)
+        # 嵌套节点（S1–S3）已计入外层 C6，患者总耗时只累加最外层节点
+        if not _ACTIVE_SPANS.get():
+            _PATIENT_WALL_MS[span.patient_id] = _PATIENT_WALL_MS.get(span.patient_id, 0.0) + wall_ms
+    agg.wall_ms.add(wall_ms)
+
+
+# ===== 埋点接口 =====
+
+def record_llm_call(
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    latency_ms: float = 0.0,
+    cached_tokens: int = 0,
+) -> None:
+    """记录一次 LLM 调用（无活动节点时忽略）；cached_tokens 为命中上下文缓存的 prompt tokens"""
+    for span in _ACTIVE_SPANS.get():
+        span.llm_calls += 1
+        span.prompt_tokens += int(prompt_tokens or 0)
+        span.cached_tokens += int(cached_tokens or 0)
+        span.completion_tokens += int(completion_tokens or 0)
+        span.llm_ms += latency_ms
+
+
+def record_llm_stream(ttft_ms: float, saved_tokens: int = 0, cut: bool = False) -> None:
+    """记录一次流式 LLM 调用的首 token 延迟与提前终止（无活动节点时忽略）"""
+    for span in _ACTIVE_SPANS.get():
+        span.stream_calls += 1
+        span.ttft_ms += ttft_ms
+        span.early_stops += int(cut)
+        span.saved_tokens += int(saved_tokens or 0)
+
+
+def record_retrieval(latency_ms: float, result_count: int = 0) -> None:
+    """记录一次知识库检索（无活动节点时忽略）"""
+    for span in _ACTIVE_SPANS.get():
+        span.retrievals += 1
+        span.retrieval_ms += latency_ms
+
+
+def record_prompt_budget(used_tokens: int, trimmed_tokens: int = 0) -> None:
+    """记录一次提示词预算分配（组装后 tokens / 被裁剪 tokens；无活动节点时忽略）"""
+    for span in _ACTIVE_SPANS.get():
+        span.budget_tokens += int(used_tokens)
+        span.trimmed_tokens += int(trimmed_tokens)
+
+
+def record_lock_wait(wait_seconds: float) -> None:
+    """记录一次锁等待（无活动节点时忽略）"""
+    for span in _ACTIVE_SPANS.get():
+        span.lock_wait_ms += wait_seconds * 1000
+
+
+# ===== 后台任务 =====
+
+_USAGE_FIELDS = tuple(f.name for f in fields(_NodeSpan) if f.name not in ("node_id", "patient_id"))
+
+
+def capture_node_usage(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> tuple[Any, _NodeSpan]:
+    """在后台线程执行 fn，期间的 LLM / 检索 / 锁等待消耗记入独立的暂存 span
+
+    Returns:
+        (fn 的返回值, 暂存的消耗)；由取用结果的节点调用 merge_node_usage 归属到该节点
+    """
+    usage = _NodeSpan(node_id="", patient_id="")
+    token = _ACTIVE_SPANS.set((usage,))
+    try:
+        return fn(*args, **kwargs), usage
+    finally:
+        _ACTIVE_SPANS.reset(token)
+
+
+def merge_node_usage(usage: _NodeSpan) -> None:
+    """把 capture_node_usage 暂存的消耗累加到当前活动节点（无活动节点时忽略）"""
+    for span in _ACTIVE_SPANS.get():
+        for name in _USAGE_FIELDS:
+            setattr(span, name, getattr(span, name) + getattr(usage, name))
+
+
+# ===== 汇总 =====
+
+def _node_sort_key(node_id: str) -> tuple:
+    prefix = node_id.rstrip("0123456789")
+    number = node_id[len(prefix):]
+    return (prefix != "C", prefix, int(number) if number else 0)
+
+
+def get_node_trace_summary() -> list[dict[str, Any]]:
+    """按节点返回运行级汇总（节点顺序 C1..C16, S1..S3）"""
+    with _AGG_LOCK:
+        items = sorted(_NODE_AGGREGATES.items(), key=lambda kv: _node_sort_key(kv[0]))
+        rows = []
+        for node_id, agg in items:
+            wall = agg.wall_ms.summary()
+            rows.append({
+                "node": node_id,
+                "calls": wall["count"],
+                "wall_ms_mean": wall["mean"],
+                "wall_ms_p95": wall["p95"],
+                "wall_ms_total": agg.wall_ms.total,
+                "llm_calls": agg.llm_calls,
+                "prompt_tokens": agg.prompt_tokens,
+                "cached_tokens": agg.cached_tokens,
+                "completion_tokens": agg.completion_tokens,
+                "llm_ms": agg.llm_ms,
+                "retrievals": agg.retrievals,
+                "retrieval_ms": agg.retrieval_ms,
+                "lock_wait_ms": agg.lock_wait_ms,
+                "budget_tokens": agg.budget_tokens,
+                "trimmed_tokens": agg.trimmed_tokens,
+                "stream_calls": agg.stream_calls,
+                "ttft_ms": agg.ttft_ms,
+                "early_stops": agg.early_stops,
+                "saved_tokens": agg.saved_tokens,
+                "errors": agg.errors,
+            })
+    return rows
+
+
+def get_patient_wall_times() -> dict[str, float]:
+    """各患者在图节点内的总墙钟耗时（毫秒）"""
+    with _AGG_LOCK:
+        return dict(_PATIENT_WALL_MS)
+
+
+def format_node_trace_table() -> str:
+    """生成节点耗时/资源汇总表；无数据时返回空字符串"""
+    rows = get_node_trace_summary()
+    if not rows:
+        return ""
+    header = (
+        f"{'节点':<5}{'次数':>5}{'平均s':>8}{'P95 s':>8}{'LLM次':>6}"
+        f"{'LLM s':>8}{'输入tok':>9}{'缓存命中':>6}{'输出tok':>8}{'检索':>5}{'检索s':>7}{'锁等ms':>8}"
+    )
+    lines = ["⏱️  节点耗时与资源消耗（墙钟；C6 含 S1–S3）", header, "-" * 90]
+    top_level = [r for r in rows if r["node"].startswith("C")]
+    for r in rows:
+        lines.append(
+            f"{r['node']:<6}{r['calls']:>6}{r['wall_ms_mean'] / 1000:>9.2f}{r['wall_ms_p95'] / 1000:>9.2f}"
+            f"{r['llm_calls']:>7}{r['llm_ms'] / 1000:>9.1f}{r['prompt_tokens']:>10}"
+            f"{_cache_hit_rate(r['cached_tokens'], r['prompt_tokens']):>10}{r['completion_tokens']:>9}"
+            f"{r['retrievals']:>6}{r['retrieval_ms'] / 1000:>8.2f}{r['lock_wait_ms']:>9.1f}"
+        )
+    total_wall = sum(r["wall_ms_total"] for r in top_level)
+    total_llm = sum(r["llm_ms"] for r in top_level)
+    total_prompt = sum(r["prompt_tokens"] for r in top_level)
+    total_cached = sum(r["cached_tokens"] for r in top_level)
+    total_completion = sum(r["completion_tokens"] for r in top_level)
+    total_trimmed = sum(r["trimmed_tokens"] for r in top_level)
+    lines.append("-" * 90)
+    if total_wall > 0:
+        lines.append(
+            f"合计: 节点耗时 {total_wall / 1000:.1f}s，其中 LLM {total_llm / 1000:.1f}s"
+            f"（{total_llm / total_wall:.0%}），tokens 输入 {total_prompt}"
+            f"（缓存命中 {total_cached}，{_cache_hit_rate(total_cached, total_prompt)}）/ 输出 {total_completion}"
+        )
+    total_stream = sum(r["stream_calls"] for r in top_level)
+    if total_stream:
+        total_ttft = sum(r["ttft_ms"] for r in top_level)
+        total_stops = sum(r["early_stops"] for r in top_level)
+        total_saved = sum(r["saved_tokens"] for r in top_level)
+        lines.append(
+            f"流式调用: {total_stream} 次，平均首 token {total_ttft / total_stream / 1000:.2f}s，"
+            f"提前终止 {total_stops} 次（约节省输出 {total_saved} tokens）"
+        )
+    if total_trimmed:
+        trimmed_nodes = "，".join(f"{r['node']} {r['trimmed_tokens']}" for r in rows if r["trimmed_tokens"])
+        lines.append(f"提示词预算裁剪: {total_trimmed} tokens（{trimmed_nodes}）")
+    return "\n".join(lines)
+
+
+def _cache_hit_rate(cached_tokens: int, prompt_tokens: int) -> str:
+    return f"{cached_tokens / prompt_tokens:.0%}" if prompt_tokens else "-"
@@ -0,0 +1,105 @@
+"""固定内存的流式统计：count / mean / min / max / 分位数。
+
+分位数采用对数分桶草图（DDSketch 思路）：桶边界按 (1+α)/(1-α) 几何增长，
+任一分位数估计值的相对误差不超过 α（默认 1%）。桶数只与数值范围有关
+（1μs ~ 1e7 秒量级的毫秒值约 2000 个桶），与样本数无关，可替代无界的样本列表。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from typing import Iterable
+
+
+class StreamingStats:
+    """线程安全的流式统计量（非负数值，如时延、分数、轮次）。"""
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-6):
+        """
+        Args:
+            relative_accuracy: 分位数相对误差上界 α
+            min_value: 小于该值的样本计入零桶（估计值记为 0）
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy 必须在 (0, 1) 之间")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets: dict[int, int] = {}
+            self._zero_count = 0
+            self.count = 0
+            self.total = 0.0
+            self.min = math.inf
+            self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        value = float(value)
+        if math.isnan(value):
+            return
+        with self._lock:
+            self.count += 1
+            self.total += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+            if value < self.min_value:
+                self._zero_count += 1
+            else:
+                key = math.ceil(math.log(value) / self._log_gamma)
+                self._buckets[key] = self._buckets.get(key, 0) + 1
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """估计 q 分位数（0 ≤ q ≤ 1）；无样本时返回 0。"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            if q <= 0:
+                return self.min
+            if q >= 1:
+                return self.max
+            rank = q * (self.count - 1)
+            seen = self._zero_count
+            if rank < seen:
+                return 0.0
+            for key in sorted(self._buckets):
+                seen += self._buckets[key]
+                if seen > rank:
+                    # 桶 (γ^(k-1), γ^k] 的中点估计，相对误差 ≤ α
+                    estimate = 2 * self._gamma ** key / (1 + self._gamma)
+                    return min(max(estimate, self.min), self.max)
+            return self.max
+
+    def summary(self, quantiles: Iterable[float] = (0.5, 0.95, 0.99)) -> dict[str, float]:
+        """返回 count / mean / min / max 与各分位数（键如 p50 / p95 / p99）。"""
+        result: dict[str, float] = {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+        }
+        for q in quantiles:
+            result[f"p{q * 100:g}"] = self.quantile(q)
+        return result
+
+    def bucket_count(self) -> int:
+        """当前占用的桶数（内存占用指标）。"""
+        return len(self._buckets) + (1 if self._zero_count else 0)
@@ -8,7 +8,6 @@ from dotenv import load_dotenv
 
 from config import Config
 from core import SystemInitializer
-from services.workflow import MultiPatientWorkflow
 from display import (
     display_startup_banner,
     display_mode_info,
@@ -34,12 +33,20 @@ def main(
         Optional[Path],
         typer.Option("--config", help="配置文件路径 (默认: src/config.yaml)"),
     ] = None,
+    profile_startup: Annotated[
+        bool,
+        typer.Option("--profile-startup", help="仅剖析启动导入耗时（按子系统汇总）后退出"),
+    ] = False,
 ) -> None:
     """医院智能体系统 - 三智能体医疗诊断系统
     
     所有配置请在 config.yaml 中修改
     配置优先级: 环境变量 > config.yaml > 默认值
     """
+    if profile_startup:
+        from core.startup_profile import main as run_startup_profile
+        raise typer.Exit(run_startup_profile([]))
+
     # 1. 加载配置
     config = Config.load(config_file=config_file)
     
@@ -60,14 +67,17 @@ def main(
     patient_interval = config.mode.patient_interval
     display_mode_info(num_patients, patient_interval)
     
-    # 6. 初始化核心组件
-    llm = initializer.initialize_llm()
+    # 6. 初始化核心组件（检索器预热在后台与其余初始化并行）
     retriever = initializer.initialize_rag()
+    initializer.start_rag_warmup(retriever)
+    llm = initializer.initialize_llm()
     services = initializer.initialize_business_services()
     medical_record_service = initializer.initialize_medical_record(Path("./medical_records"))
     coordinator = initializer.initialize_coordinator(medical_record_service)
     
-    # 7. 创建并执行工作流
+    # 7. 创建并执行工作流（LangGraph 等重依赖在此处才加载）
+    from services.workflow import MultiPatientWorkflow
+
     workflow = MultiPatientWorkflow(
         config=config,
         coordinator=coordinator,
@@ -89,6 +99,9 @@ def main(
         interval_display = f"{patient_interval} 秒" if patient_interval < 60 else f"{patient_interval/60:.1f} 分钟"
         logger.info(f"⏰ 患者将每隔 {interval_display} 进入医院环境\n")
     
+    # 就绪屏障：检索器预热完成后再调度患者，避免首位患者承担冷启动
+    initializer.wait_for_rag_ready()
+
     logger.info("="*80)
     workflow.schedule_patients(case_ids, patient_interval)
     
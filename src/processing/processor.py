@@ -161,6 +161,8 @@ class LangGraphPatientExecutor:
         services: Any,
         medical_record_service: MedicalRecordService,
         max_questions: int = 3,  # 最底层默认值，通常从config传入
+        pipeline_interview: bool = False,  # S1 问诊流水线
+        parallel_post_diagnosis: bool = True,  # C14 / C15 并行生成
         shared_world: HospitalWorld = None,  # 新增：共享物理环境
         shared_nurse_agent: NurseAgent = None,  # 新增：共享护士
         shared_lab_agent: LabAgent = None,  # 新增：共享检验科
@@ -176,6 +178,8 @@ class LangGraphPatientExecutor:
         self.services = services
         self.medical_record_service = medical_record_service
         self.max_questions = max_questions
+        self.pipeline_interview = pipeline_interview
+        self.parallel_post_diagnosis = parallel_post_diagnosis
         self.logger = get_logger(f"patient.{patient_id}")
         
         # 使用共享资源
@@ -487,6 +491,8 @@ class LangGraphPatientExecutor:
                 agent_config={
                     "max_questions": self.max_questions,
                     "use_agents": True,
+                    "pipeline_interview": self.pipeline_interview,
+                    "parallel_post_diagnosis": self.parallel_post_diagnosis,
                 },
             )
             
@@ -1363,6 +1369,10 @@ class LangGraphPatientExecutor:
                         # 资源清理日志移到详细日志中
                         if hasattr(self, 'detail_logger') and self.detail_logger:
                             self.detail_logger.info(f"清理资源：已释放医生 {doctor_id}")
+                
+                # 患者离开物理世界，归还生理引擎中的行
+                if self.world:
+                    self.world.remove_agent(self.patient_id)
             except Exception as cleanup_error:
                 self.logger.error(f"⚠️ 资源清理失败: {cleanup_error}")
     
@@ -1397,6 +1407,8 @@ class LangGraphMultiPatientProcessor:
         medical_record_service: MedicalRecordService,
         max_questions: int = 3,
         max_workers: int = 10,
+        pipeline_interview: bool = False,
+        parallel_post_diagnosis: bool = True,
     ):
         """
         初始化处理器
@@ -1409,6 +1421,8 @@ class LangGraphMultiPatientProcessor:
             medical_record_service: 病例库服务
             max_questions: 最大问题数
             max_workers: 最大并发数
+            pipeline_interview: 是否启用 S1 问诊流水线
+            parallel_post_diagnosis: 是否在 C13 后并行生成 C14 文书与 C15 宣教随访
         """
         self.coordinator = coordinator
         self.retriever = retriever
@@ -1417,6 +1431,8 @@ class LangGraphMultiPatientProcessor:
         self.medical_record_service = medical_record_service
         self.max_questions = max_questions
         self.max_workers = max_workers
+        self.pipeline_interview = pipeline_interview
+        self.parallel_post_diagnosis = parallel_post_diagnosis
         
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
         self.active_tasks: Dict[str, concurrent.futures.Future] = {}
@@ -1517,6 +1533,8 @@ class LangGraphMultiPatientProcessor:
             medical_record_service=self.medical_record_service,
 
             max_questions=self.max_questions,
+            pipeline_interview=self.pipeline_interview,
+            parallel_post_diagnosis=self.parallel_post_diagnosis,
             shared_world=self.shared_world,  # 传入共享 world
             shared_nurse_agent=self.shared_nurse_agent,  # 传入共享 nurse
             shared_lab_agent=self.shared_lab_agent,  # 传入共享 lab agent
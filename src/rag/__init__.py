@@ -12,28 +12,67 @@
 - 动态分块策略
 - 分层检索策略
 - 自进化机制
+
+子模块按需加载：导入 rag 包本身不会加载 Chroma / 嵌入模型等重依赖，
+首次访问某个导出名（如 rag.AdaptiveRAGRetriever）时才导入对应子模块。
 """
 from __future__ import annotations
 
-from typing import Any
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .adaptive_rag_retriever import AdaptiveRAGRetriever
+    from .hybrid_retriever import HybridRetriever
+    from .enhanced_rag_retriever import EnhancedRAGRetriever, QueryType
+    from .dynamic_chunker import (
+        DynamicChunker,
+        ChunkConfig,
+        ChunkStrategy,
+        create_chunker_for_medical_documents,
+    )
+    from .qa_evaluator import (
+        DialogueQualityEvaluator,
+        DialogueQualityScore,
+        PatientAnswerMetrics,
+        DoctorQuestionMetrics,
+    )
+    from .query_optimizer import RAGQueryOptimizer, QueryContext, get_query_optimizer
+    from .keyword_generator import RAGKeywordGenerator, NodeContext
+
+# 导出名 -> 所在子模块（按需导入）
+_LAZY_IMPORTS = {
+    "AdaptiveRAGRetriever": ".adaptive_rag_retriever",
+    "HybridRetriever": ".hybrid_retriever",
+    "EnhancedRAGRetriever": ".enhanced_rag_retriever",
+    "QueryType": ".enhanced_rag_retriever",
+    "DynamicChunker": ".dynamic_chunker",
+    "ChunkConfig": ".dynamic_chunker",
+    "ChunkStrategy": ".dynamic_chunker",
+    "create_chunker_for_medical_documents": ".dynamic_chunker",
+    "DialogueQualityEvaluator": ".qa_evaluator",
+    "DialogueQualityScore": ".qa_evaluator",
+    "PatientAnswerMetrics": ".qa_evaluator",
+    "DoctorQuestionMetrics": ".qa_evaluator",
+    "RAGQueryOptimizer": ".query_optimizer",
+    "QueryContext": ".query_optimizer",
+    "get_query_optimizer": ".query_optimizer",
+    "RAGKeywordGenerator": ".keyword_generator",
+    "NodeContext": ".keyword_generator",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # 缓存，后续访问不再经过 __getattr__
+    return value
+
 
-from .adaptive_rag_retriever import AdaptiveRAGRetriever
-from .hybrid_retriever import HybridRetriever
-from .enhanced_rag_retriever import EnhancedRAGRetriever, QueryType
-from .dynamic_chunker import (
-    DynamicChunker,
-    ChunkConfig,
-    ChunkStrategy,
-    create_chunker_for_medical_documents,
-)
-from .qa_evaluator import (
-    DialogueQualityEvaluator,
-    DialogueQualityScore,
-    PatientAnswerMetrics,
-    DoctorQuestionMetrics,
-)
-from .query_optimizer import RAGQueryOptimizer, QueryContext, get_query_optimizer
-from .keyword_generator import RAGKeywordGenerator, NodeContext
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
 
 
 class DummyRetriever:
@@ -10,7 +10,7 @@ import time
 from pathlib import Path
 from typing import Any
 import logging
-from logging_utils import log_retrieval_latency, log_recall_at_k
+from logging_utils import log_retrieval_latency, log_recall_at_k, record_retrieval
 
 # 强制使用离线模式（在导入 HuggingFace 库之前设置）
 os.environ['HF_HUB_OFFLINE'] = '1'
@@ -42,6 +42,15 @@ class AdaptiveRAGRetriever:
         - 支持高质量问答参考
         - 支持医学指南和临床案例检索
     """
+
+    # 数据库名称到collection名称的映射（与create_database_general.py保持一致）
+    DB_COLLECTIONS = {
+        "MedicalGuide_db": "MedicalGuide",
+        "HospitalProcess_db": "HospitalProcess",
+        "ClinicalCase_db": "ClinicalCase",
+        "HighQualityQA_db": "HighQualityQA",
+        "UserHistory_db": "UserHistory",
+    }
     
     def __init__(
         self,
@@ -71,8 +80,11 @@ class AdaptiveRAGRetriever:
         
         # 延迟导入（避免启动时加载模型）
         self._embeddings = None
+        self._warm_vector = None
         self._dbs = {}
         self._init_lock = threading.Lock()  # 防止并发初始化导致日志 handler 重复注册
+        self._db_locks = {name: threading.Lock() for name in self.DB_COLLECTIONS}  # 每个向量库单独加锁，不同库可并行打开
+        self._db_locks_guard = threading.Lock()
         
         # 日志
         self._logger = logging.getLogger("hospital_agent.adaptive_rag")
@@ -113,8 +125,9 @@ class AdaptiveRAGRetriever:
                     cache_folder=str(self.cache_folder)
                 )
                 
-                # 测试嵌入
+                # 测试嵌入（向量留作预热查询）
                 test_vec = self._embeddings.embed_query("测试")
+                self._warm_vector = test_vec
                 self._logger.debug(f"✅ 嵌入模型加载成功（维度={len(test_vec)}）")
             except Exception as e:
                 self._logger.error(f"❌ 嵌入模型初始化失败: {e}")
@@ -134,17 +147,17 @@ class AdaptiveRAGRetriever:
             return self._dbs[db_name]
         
         self._init_embeddings()
-        
-        # 数据库名称到collection名称的映射（与create_database_general.py保持一致）
-        db_to_collection = {
-            "MedicalGuide_db": "MedicalGuide",
-            "HospitalProcess_db": "HospitalProcess",
-            "ClinicalCase_db": "ClinicalCase",
-            "HighQualityQA_db": "HighQualityQA",
-            "UserHistory_db": "UserHistory"
-        }
-        
-        collection_name = db_to_collection.get(db_name, db_name.replace("_db", ""))
+
+        with self._db_locks_guard:
+            db_lock = self._db_locks.setdefault(db_name, threading.Lock())
+        with db_lock:
+            # 持锁后再次检查：并发的首次检索只打开一次
+            if db_name in self._dbs:
+                return self._dbs[db_name]
+            return self._open_db(db_name)
+
+    def _open_db(self, db_name: str):
+        collection_name = self.DB_COLLECTIONS.get(db_name, db_name.replace("_db", ""))
         
         try:
             from langchain_chroma import Chroma
@@ -166,6 +179,58 @@ class AdaptiveRAGRetriever:
         except Exception as e:
             self._logger.error(f"❌ 向量库 {db_name} 加载失败: {e}")
             return None
+
+    def warm_up(self, db_names: list[str] | None = None, max_workers: int | None = None) -> dict[str, Any]:
+        """预热：加载嵌入模型并并行打开各向量库（默认全部五个）
+
+        嵌入模型加载与 Chroma 依赖导入并行进行；模型就绪后各向量库并行打开，
+        并各执行一次 k=1 的向量查询，使 HNSW 索引在首位患者检索前载入内存。
+
+        Returns:
+            {"total_ms", "embeddings_ms", "dbs": {库名: {"ms", "ok", "count"}}}
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        db_names = list(db_names or self.DB_COLLECTIONS)
+        start = time.perf_counter()
+        result: dict[str, Any] = {"dbs": {}}
+
+        def load_embeddings() -> None:
+            t0 = time.perf_counter()
+            self._init_embeddings()
+            result["embeddings_ms"] = (time.perf_counter() - t0) * 1000
+
+        def import_chroma() -> None:
+            # 与模型加载重叠，打开向量库时不再付导入开销；缺失时由 _open_db 报错
+            try:
+                import langchain_chroma  # noqa: F401
+            except ImportError:
+                pass
+
+        def open_db(db_name: str) -> None:
+            t0 = time.perf_counter()
+            db = self._get_db(db_name)
+            info = {"ok": db is not None, "count": 0}
+            if db is not None:
+                try:
+                    info["count"] = db._collection.count()
+                    if info["count"] and self._warm_vector is not None:
+                        db.similarity_search_by_vector(self._warm_vector, k=1)
+                except Exception as e:
+                    self._logger.warning(f"⚠️  向量库 {db_name} 预热查询失败: {e}")
+            info["ms"] = (time.perf_counter() - t0) * 1000
+            result["dbs"][db_name] = info
+
+        workers = max_workers or len(db_names) + 1
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-warmup") as pool:
+            phase1 = [pool.submit(load_embeddings), pool.submit(import_chroma)]
+            for future in phase1:
+                future.result()
+            for future in [pool.submit(open_db, name) for name in db_names]:
+                future.result()
+
+        result["total_ms"] = (time.perf_counter() - start) * 1000
+        return result
     
     def retrieve(
         self,
@@ -288,6 +353,7 @@ class AdaptiveRAGRetriever:
         db_name: str,
     ) -> None:
         """Write retrieval latency and optional Recall@k metrics."""
+        record_retrieval(elapsed_ms, len(results))
         try:
             run_id = str(filters.get("run_id", ""))
             patient_id = str(filters.get("patient_id", ""))
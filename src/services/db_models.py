@@ -62,6 +62,7 @@ class Visit(Base):
     # 索引
     __table_args__ = (
         Index('idx_visits_patient_id', 'patient_id'),
+        Index('idx_visits_patient_date', 'patient_id', 'visit_date'),
         Index('idx_visits_outpatient_no', 'outpatient_no'),
         Index('idx_visits_visit_date', 'visit_date'),
         Index('idx_visits_status', 'status'),
@@ -178,6 +179,8 @@ class Examination(Base):
     # 索引
     __table_args__ = (
         Index('idx_exams_case_id', 'case_id'),
+        # 按病历聚合读取时按开单时间排序，复合索引避免额外排序
+        Index('idx_exams_case_ordered', 'case_id', 'ordered_at'),
         Index('idx_exams_status', 'status'),
         Index('idx_exams_type', 'exam_type'),
     )
@@ -205,6 +208,7 @@ class ExamItem(Base):
     # 索引
     __table_args__ = (
         Index('idx_items_exam_id', 'exam_id'),
+        Index('idx_items_exam_created', 'exam_id', 'created_at'),
     )
 
 
@@ -225,4 +229,5 @@ class CaseQARecord(Base):
     # 索引
     __table_args__ = (
         Index('idx_qa_case_id', 'case_id'),
+        Index('idx_qa_case_round', 'case_id', 'round_index', 'created_at'),
     )
@@ -0,0 +1,396 @@
+"""
+数据库异步批量写入队列
+DB Write Queue - batched, asynchronous writes for MedicalRecordDAO
+
+图节点只把写操作放入内存队列（O(1)，不触达数据库）；后台写线程按批次大小或时间窗口取出操作：
+- 同一行（表 + 主键）的多次写入先在内存中合并（后写覆盖先写）
+- 按外键依赖顺序（patients → visits → medical_cases → examinations → ...）逐表处理
+- 每表一次主键 IN 查询区分新增/更新，然后 bulk_insert_mappings / bulk_update_mappings（executemany）
+- 整批一个事务提交；瞬时故障（断连、锁等待超时等）指数退避重试，
+  非瞬时故障（如外键/唯一约束冲突）退化为逐条写入，坏数据不会拖垮整批
+
+统计：队列深度、批次数、写入行数、刷盘延迟（最近/平均/最大）、重试与失败次数。
+
+本地 SQLite 冒烟测试 / 基准（不依赖 MySQL）：
+    python -m services.db_write_queue --db sqlite:///./db_queue_bench.db --patients 50
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import exc as sa_exc
+
+from .db_models import Base, Patient, Visit, MedicalCase, CaseQARecord
+from utils import get_logger
+
+logger = get_logger("hospital_agent.dao")
+
+# 写操作类型
+OP_UPSERT = "upsert"  # 不存在则插入，存在则更新（对应 DAO 的 create_* / add_examination）
+OP_UPDATE = "update"  # 仅更新已存在的行（对应 DAO 的 update_*）
+OP_INSERT = "insert"  # 纯插入（主键在入队时生成，对应 add_case_qa_record / add_exam_item）
+
+# 按外键依赖排序的表 -> 模型
+_MODELS_BY_TABLE = {
+    mapper.class_.__tablename__: mapper.class_ for mapper in Base.registry.mappers
+}
+_TABLE_ORDER = [table.name for table in Base.metadata.sorted_tables]
+
+# 更新时不允许覆盖的字段
+_IMMUTABLE_ON_UPDATE = {"created_at"}
+
+
+def _is_transient(error: Exception) -> bool:
+    """是否为可重试的瞬时数据库故障"""
+    if isinstance(error, (sa_exc.DisconnectionError, sa_exc.TimeoutError)):
+        return True
+    if isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated:
+        return True
+    if isinstance(error, sa_exc.OperationalError):
+        # MySQL: 1205 锁等待超时 / 1213 死锁 / 2006、2013 连接断开；SQLite: database is locked
+        text = str(error.orig) if error.orig is not None else str(error)
+        return any(code in text for code in ("1205", "1213", "2006", "2013", "locked", "timeout"))
+    return False
+
+
+@dataclass
+class WriteOp:
+    """单个写操作"""
+    kind: str
+    table: str
+    pk: str
+    data: Dict[str, Any]
+
+
+class DBWriteQueue:
+    """MedicalRecordDAO 的异步批量写入队列"""
+
+    def __init__(
+        self,
+        dao: Any,
+        batch_size: int = 200,
+        flush_interval: float = 0.2,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+    ):
+        """
+        Args:
+            dao: MedicalRecordDAO 实例（使用其 SessionLocal）
+            batch_size: 单批最多写操作数（达到即立即刷盘）
+            flush_interval: 时间窗口（秒），窗口内的写操作合并为一批
+            max_retries: 瞬时故障最大重试次数
+            retry_backoff: 重试退避基数（秒），按 2^n 递增
+        """
+        self.dao = dao
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._pending: Deque[WriteOp] = deque()
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._completed = 0  # 已处理（成功或最终失败）的写操作数
+        self._closed = False
+
+        # 统计
+        self.batches = 0
+        self.rows_written = 0
+        self.retries = 0
+        self.failed_ops = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="db-write-queue", daemon=True)
+        self._thread.start()
+
+    # ===== 生产者接口 =====
+
+    def _put(self, op: WriteOp) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DBWriteQueue 已关闭")
+            self._pending.append(op)
+            self._enqueued += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def upsert(self, model: type, data: Dict[str, Any]) -> str:
+        """插入或更新（按主键）"""
+        pk_name = model.__mapper__.primary_key[0].name
+        pk = data[pk_name]
+        self._put(WriteOp(OP_UPSERT, model.__tablename__, pk, dict(data)))
+        return pk
+
+    def update(self, model: type, pk: str, data: Dict[str, Any]) -> None:
+        """仅更新已存在的行；行不存在时忽略（与 DAO.update_* 一致）"""
+        pk_name = model.__mapper__.primary_key[0].name
+        payload = {k: v for k, v in data.items() if k != pk_name}
+        self._put(WriteOp(OP_UPDATE, model.__tablename__, pk, payload))
+
+    def insert(self, model: type, data: Dict[str, Any]) -> str:
+        """纯插入；未提供主键时生成 uuid"""
+        pk_name = model.__mapper__.primary_key[0].name
+        payload = dict(data)
+        payload[pk_name] = payload.get(pk_name) or str(uuid.uuid4())
+        self._put(WriteOp(OP_INSERT, model.__tablename__, payload[pk_name], payload))
+        return payload[pk_name]
+
+    # ===== 刷盘 =====
+
+    def depth(self) -> int:
+        """当前队列深度（未提交的写操作数）"""
+        with self._cond:
+            return self._enqueued - self._completed
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到调用时已入队的写操作全部处理完
+
+        Returns:
+            是否在超时前完成
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._enqueued
+            self._cond.notify_all()
+            while self._completed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.5)
+        return True
+
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        """处理完剩余写操作并停止后台线程（可重复调用）"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # 时间窗口：等待更多写操作凑批（达到批次大小、有人 flush 或关闭时提前返回）
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                count = min(len(self._pending), self.batch_size)
+                batch = [self._pending.popleft() for _ in range(count)]
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: List[WriteOp]) -> None:
+        start = time.perf_counter()
+        groups = self._coalesce(batch)
+        try:
+            rows = self._apply_with_retry(groups)
+        except Exception as e:
+            logger.warning(f"⚠️  [数据库] 批量写入失败，改为逐条写入: {e}")
+            rows = self._apply_one_by_one(batch)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._cond:
+            self.batches += 1
+            self.rows_written += rows
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            self._completed += len(batch)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _coalesce(batch: List[WriteOp]) -> Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]]:
+        """合并同一行的多次写入：table -> pk -> (kind, data)
+
+        upsert/insert 之后的 update 并入同一映射；update 之后的 upsert 升级为 upsert。
+        """
+        groups: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]] = {}
+        for op in batch:
+            rows = groups.setdefault(op.table, {})
+            prev = rows.get(op.pk)
+            if prev is None:
+                rows[op.pk] = (op.kind, dict(op.data))
+                continue
+            prev_kind, prev_data = prev
+            prev_data.update(op.data)
+            kind = prev_kind if op.kind == OP_UPDATE else (
+                OP_UPSERT if prev_kind == OP_UPDATE else prev_kind
+            )
+            rows[op.pk] = (kind, prev_data)
+        return groups
+
+    def _apply_with_retry(self, groups: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]]) -> int:
+        attempt = 0
+        while True:
+            try:
+                return self._apply(groups)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_transient(e):
+                    raise
+                attempt += 1
+                with self._cond:
+                    self.retries += 1
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                logger.warning(f"⚠️  [数据库] 瞬时故障，{delay:.1f}秒后重试({attempt}/{self.max_retries}): {e}")
+                time.sleep(delay)
+
+    def _apply(self, groups: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]]) -> int:
+        """单事务按外键顺序写入所有表"""
+        rows = 0
+        with self.dao.get_session() as session:
+            for table in _TABLE_ORDER:
+                table_rows = groups.get(table)
+                if table_rows:
+                    rows += self._apply_table(session, _MODELS_BY_TABLE[table], table_rows)
+        return rows
+
+    @staticmethod
+    def _apply_table(session: Any, model: type, table_rows: Dict[str, Tuple[str, Dict[str, Any]]]) -> int:
+        pk_name = model.__mapper__.primary_key[0].name
+        pk_col = getattr(model, pk_name)
+        has_updated_at = hasattr(model, "updated_at")
+
+        # upsert / update 需要知道哪些主键已存在：一次 IN 查询
+        lookup_pks = [pk for pk, (kind, _) in table_rows.items() if kind != OP_INSERT]
+        existing = set()
+        if lookup_pks:
+            existing = {
+                row[0] for row in session.query(pk_col).filter(pk_col.in_(lookup_pks)).all()
+            }
+
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        now = datetime.now()
+        for pk, (kind, data) in table_rows.items():
+            if kind == OP_INSERT or (kind == OP_UPSERT and pk not in existing):
+                inserts.append({**data, pk_name: pk})
+            elif pk not in existing:
+                # 与 DAO.update_* 一致：目标行不存在时忽略
+                logger.warning(f"记录不存在，跳过更新: {model.__tablename__}[{pk}]")
+            else:
+                mapping = {k: v for k, v in data.items() if k not in _IMMUTABLE_ON_UPDATE}
+                mapping[pk_name] = pk
+                if has_updated_at:
+                    mapping["updated_at"] = now
+                updates.append(mapping)
+
+        if inserts:
+            session.bulk_insert_mappings(model, inserts)
+        if updates:
+            session.bulk_update_mappings(model, updates)
+        return len(inserts) + len(updates)
+
+    def _apply_one_by_one(self, batch: List[WriteOp]) -> int:
+        """逐条写入（每条独立事务），隔离坏数据"""
+        rows = 0
+        for op in batch:
+            try:
+                rows += self._apply_with_retry({op.table: {op.pk: (op.kind, dict(op.data))}})
+            except Exception as e:
+                with self._cond:
+                    self.failed_ops += 1
+                logger.error(f"❌ [数据库] 写入失败已丢弃: {op.table}[{op.pk}] {op.kind}: {e}")
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        """队列统计"""
+        with self._cond:
+            return {
+                "queue_depth": self._enqueued - self._completed,
+                "enqueued": self._enqueued,
+                "batches": self.batches,
+                "rows_written": self.rows_written,
+                "retries": self.retries,
+                "failed_ops": self.failed_ops,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "avg_flush_ms": round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 3),
+            }
+
+
+def _run_benchmark(connection_string: str, patients: int, qa_rounds: int) -> None:
+    """同步 DAO 写入 vs 队列写入的对比（调用方感知的耗时）"""
+    from .medical_record_dao import MedicalRecordDAO
+
+    dao = MedicalRecordDAO(connection_string)
+    run_tag = uuid.uuid4().hex[:6]
+
+    def events(prefix: str):
+        for i in range(patients):
+            pid = f"{prefix}_{run_tag}_{i}"
+            visit_id = f"VISIT-{pid}"
+            case_id = f"MR-{pid}"
+            yield "patient", {"patient_id": pid, "name": f"患者{i}", "age": 40}
+            yield "visit", {"visit_id": visit_id, "patient_id": pid, "visit_date": datetime.now(), "status": "ongoing"}
+            yield "case", {"case_id": case_id, "visit_id": visit_id, "status": "draft"}
+            for r in range(qa_rounds):
+                yield "qa", {"case_id": case_id, "role": "doctor", "content": f"问题{r}", "round_index": r + 1}
+                yield "qa", {"case_id": case_id, "role": "patient", "content": f"回答{r}", "round_index": r + 1}
+            yield "case_update", (case_id, {"preliminary_diagnosis": "偏头痛", "status": "final"})
+            yield "visit_update", (visit_id, {"status": "completed"})
+
+    start = time.perf_counter()
+    for kind, payload in events("sync"):
+        if kind == "patient":
+            dao.create_patient(payload)
+        elif kind == "visit":
+            dao.create_visit(payload)
+        elif kind == "case":
+            dao.create_medical_case(payload)
+        elif kind == "qa":
+            dao.add_case_qa_record(payload)
+        elif kind == "case_update":
+            dao.update_medical_case(*payload)
+        else:
+            dao.update_visit(*payload)
+    sync_s = time.perf_counter() - start
+
+    queue = DBWriteQueue(dao)
+    start = time.perf_counter()
+    for kind, payload in events("queued"):
+        if kind == "patient":
+            queue.upsert(Patient, payload)
+        elif kind == "visit":
+            queue.upsert(Visit, payload)
+        elif kind == "case":
+            queue.upsert(MedicalCase, payload)
+        elif kind == "qa":
+            queue.insert(CaseQARecord, payload)
+        elif kind == "case_update":
+            queue.update(MedicalCase, *payload)
+        else:
+            queue.update(Visit, *payload)
+    enqueue_s = time.perf_counter() - start
+    queue.close()
+    drain_s = time.perf_counter() - start
+
+    sample = dao.get_medical_case(f"MR-queued_{run_tag}_0")
+    print(f"同步写入:   {sync_s * 1000:9.1f} ms（全部在调用线程）")
+    print(f"队列入队:   {enqueue_s * 1000:9.1f} ms（调用线程感知）")
+    print(f"队列落库:   {drain_s * 1000:9.1f} ms（含后台批量提交）")
+    print(f"抽样校验:   status={sample and sample['status']} diagnosis={sample and sample['preliminary_diagnosis']}")
+    print(f"队列统计:   {queue.get_stats()}")
+    dao.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DBWriteQueue 冒烟测试 / 基准")
+    parser.add_argument("--db", default="sqlite:///./db_queue_bench.db", help="数据库连接字符串")
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--qa-rounds", type=int, default=5)
+    args = parser.parse_args()
+    _run_benchmark(args.db, args.patients, args.qa_rounds)
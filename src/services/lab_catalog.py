@@ -0,0 +1,210 @@
+"""检查项目名称匹配 - 名称变体表、设备类型关键词与预编译匹配器
+
+- TEST_NAME_VARIANTS   常见检查的多种写法（检验科在病例辅助检查中查找已有结果）
+- EQUIPMENT_KEYWORDS   检查项目 → 物理设备类型（exam_type）的关键词表，按判断优先级排列
+- equipment_type_for   检查名称 → 设备类型：一次正则扫描，结果与逐组 any(keyword in name) 判断一致
+- aliases_for          检查项目在病例文本中可能的写法（原名、名称变体、单一检查设备的关键词）
+- CaseExamIndex        对一份辅助检查文本扫描一次，记录所有检查名称出现位置与段落边界，
+                       之后每个检查项目的查找只是位置查表，结果与逐个 str.find 截取段落一致
+
+正则按前瞻方式编译（每个位置都尝试匹配、不消耗字符），相邻或重叠的出现都能找到。
+病例文本中的查找区分大小写（与 str.find 一致），避免 "CT" 命中英文单词中的 "ct"（如 structure）。
+"""
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Iterable, Optional, Sequence
+
+# 检查名称的多种可能写法
+TEST_NAME_VARIANTS: dict[str, tuple[str, ...]] = {
+    "血常规": ("血常规", "血细胞分析", "全血细胞计数", "CBC"),
+    "尿常规": ("尿常规", "尿液分析", "尿检"),
+    "肝功能": ("肝功能", "肝功", "肝酶", "转氨酶"),
+    "肾功能": ("肾功能", "肾功", "肌酐", "尿素氮"),
+    "血糖": ("血糖", "空腹血糖", "餐后血糖", "GLU"),
+    "CT": ("CT", "计算机断层扫描", "电子计算机断层扫描"),
+    "MRI": ("MRI", "核磁共振", "磁共振成像"),
+    "X光": ("X光", "X线", "胸片", "X-ray"),
+    "心电图": ("心电图", "ECG", "EKG"),
+    "B超": ("B超", "超声", "超声检查", "彩超"),
+    "胃镜": ("胃镜", "上消化道内镜", "食管胃十二指肠镜"),
+    "肠镜": ("肠镜", "结肠镜", "纤维结肠镜"),
+}
+
+# 检查项目 → 设备类型（对应 hospital_world.py 中的 exam_type；小写关键词，靠前的类别优先）
+EQUIPMENT_KEYWORDS: tuple[tuple[str, tuple[str, ...]], ...] = (
+    # 影像检查设备
+    ("ct_head", ("头颅ct", "颅脑ct", "ct头", "head ct", "头部ct")),
+    ("mri_brain", ("脑mri", "颅脑mri", "mri脑", "brain mri", "头部mri", "mri头")),
+    # 神经电生理检查设备
+    ("eeg", ("脑电图", "eeg", "脑电", "脑波")),
+    ("emg", ("肌电图", "emg", "神经传导", "肌电")),
+    ("tcd", ("tcd", "经颅多普勒", "脑血流", "颅内多普勒")),
+    # 检验科检查设备（按检验项目分类）
+    ("cbc", ("血常规", "cbc", "血细胞", "血液常规", "全血细胞")),
+    ("biochem_basic", (
+        "生化", "肝功", "肾功", "血糖", "血脂", "尿酸", "肌酐", "尿素氮",
+        "转氨酶", "胆红素", "白蛋白", "总蛋白", "甘油三酯", "胆固醇",
+        "biochem", "liver", "kidney", "glucose", "lipid",
+    )),
+    ("electrolyte", ("电解质", "钠", "钾", "氯", "钙", "镁", "electrolyte", "na+", "k+")),
+    ("coagulation", (
+        "凝血", "pt", "aptt", "inr", "d-二聚体", "纤维蛋白",
+        "凝血酶原", "活化部分凝血活酶", "coagulation", "d-dimer",
+    )),
+    ("inflammation", (
+        "crp", "c反应蛋白", "降钙素原", "pct", "血沉", "esr",
+        "炎症", "感染", "inflammation", "infection",
+    )),
+    # 心肌与血管风险指标（卒中相关）
+    ("cardiac_stroke_markers", (
+        "心肌酶", "肌钙蛋白", "troponin", "bnp", "nt-probnp",
+        "同型半胱氨酸", "脂蛋白", "lp(a)", "homocysteine",
+        "心脑血管", "卒中标志", "cardiac", "stroke marker",
+    )),
+    ("autoimmune_antibody", (
+        "自免", "抗体", "自身免疫", "ana", "抗核抗体", "抗神经",
+        "抗磷脂", "autoimmune", "antibody", "抗nmda", "抗mog",
+    )),
+    # 神经功能评估检查
+    ("general_exam", (
+        "言语功能", "语言评估", "吞咽功能", "吞咽评估", "认知功能", "认知评估",
+        "记忆评估", "智力测验", "神经心理", "运动功能", "平衡功能", "步态分析",
+        "speech assessment", "swallowing", "cognitive", "neuropsych", "balance",
+    )),
+)
+
+# 一个设备类型只对应一种检查的类别，其关键词可作为该检查在病例文本中的写法
+# （biochem_basic 等类别混合了多种检验，关键词不能互相替代）
+SINGLE_TEST_EQUIPMENT = frozenset({"ct_head", "mri_brain", "eeg", "emg", "tcd", "cbc"})
+
+# 检查结果段落的结束标记（下一项检查或病例其他部分开始）
+SEGMENT_END_MARKERS = (
+    "\n\n", "。\n", "。 ",
+    "诊断：", "治疗：", "讨论：",
+    "血常规", "尿常规", "肝功能", "肾功能",
+    "CT", "MRI", "X光", "心电图", "B超",
+)
+MAX_SEGMENT_CHARS = 500  # 单项结果最多截取的字符数
+MIN_RESULT_EXTRA_CHARS = 5  # 段落至少比检查名称多出的字符数（否则视为只提到了名称）
+
+
+def _lookahead_pattern(words: Sequence[str], flags: int = 0) -> re.Pattern:
+    """每个位置按 words 顺序取第一个匹配的词（前瞻匹配，重叠出现也能找到）"""
+    return re.compile("(?=(" + "|".join(map(re.escape, words)) + "))", flags)
+
+
+# 同一位置上高优先级类别先匹配；关键词 → 所属类别的最小下标
+_EQUIPMENT_PRIORITY: dict[str, int] = {}
+for _index, (_, _keywords) in enumerate(EQUIPMENT_KEYWORDS):
+    for _keyword in _keywords:
+        _EQUIPMENT_PRIORITY.setdefault(_keyword, _index)
+_EQUIPMENT_RE = _lookahead_pattern(
+    sorted(_EQUIPMENT_PRIORITY, key=lambda k: (_EQUIPMENT_PRIORITY[k], -len(k)))
+)
+_SEGMENT_END_RE = _lookahead_pattern(sorted(set(SEGMENT_END_MARKERS), key=len, reverse=True))
+
+def _case_alias(keyword: str) -> str:
+    """设备关键词 → 病例文本中的写法（关键词表为小写，英文缩写在病例中为大写，如 eeg → EEG）"""
+    return keyword.upper() if keyword.isascii() else keyword
+
+
+# 病例文本中需要定位的全部静态写法（区分大小写）
+_STATIC_ALIASES = frozenset(
+    [variant for variants in TEST_NAME_VARIANTS.values() for variant in variants]
+    + [
+        _case_alias(keyword)
+        for exam_type, keywords in EQUIPMENT_KEYWORDS
+        if exam_type in SINGLE_TEST_EQUIPMENT
+        for keyword in keywords
+    ]
+)
+
+
+def equipment_type_for(test_name: str) -> Optional[str]:
+    """检查名称 → 设备类型；没有关键词命中时返回 None（由调用方按检查类型兜底）"""
+    best: Optional[int] = None
+    for match in _EQUIPMENT_RE.finditer(str(test_name or "").lower()):
+        priority = _EQUIPMENT_PRIORITY[match.group(1)]
+        if best is None or priority < best:
+            best = priority
+    return EQUIPMENT_KEYWORDS[best][0] if best is not None else None
+
+
+@lru_cache(maxsize=512)
+def aliases_for(test_name: str) -> tuple[str, ...]:
+    """检查项目在病例文本中可能的写法（按查找优先级）
+
+    原名在前；其次是名称变体表中的写法（原名是标准名，或包含某个变体，如"头颅CT"含"CT"）；
+    最后是单一检查设备类别的关键词（如"脑电图检查" → 脑电图 / EEG / 脑电 / 脑波）。
+    返回的写法区分大小写，按原样在病例文本中查找。
+    """
+    name = str(test_name or "").strip()
+    if not name:
+        return ()
+    lowered = name.lower()
+    aliases = [name]
+    if name in TEST_NAME_VARIANTS:
+        aliases.extend(TEST_NAME_VARIANTS[name])
+    else:
+        for variants in TEST_NAME_VARIANTS.values():
+            if any(variant.lower() in lowered for variant in variants):
+                aliases.extend(variants)
+    exam_type = equipment_type_for(name)
+    if exam_type in SINGLE_TEST_EQUIPMENT:
+        aliases.extend(_case_alias(keyword) for keyword in dict(EQUIPMENT_KEYWORDS)[exam_type])
+    return tuple(dict.fromkeys(aliases))
+
+
+@lru_cache(maxsize=256)
+def _alias_pattern(extra_aliases: frozenset[str]) -> re.Pattern:
+    words = sorted(_STATIC_ALIASES | extra_aliases, key=len, reverse=True)
+    return _lookahead_pattern(words)
+
+
+class CaseExamIndex:
+    """一份辅助检查文本的检查名称索引（构建时扫描一次文本）"""
+
+    def __init__(self, text: str, test_names: Iterable[str] = ()):
+        """
+        Args:
+            text: 辅助检查文本
+            test_names: 本次要查找的检查项目（其写法不在静态词表中时加入匹配器）
+        """
+        self.text = str(text or "")
+        extra = frozenset(
+            alias for name in test_names for alias in aliases_for(name)
+        ) - _STATIC_ALIASES
+        # 每个位置上匹配到的最长写法：更短的写法 A 在该位置出现 ⇔ 最长写法以 A 开头
+        self._occurrences: list[tuple[int, str]] = (
+            [(m.start(), m.group(1)) for m in _alias_pattern(extra).finditer(self.text)]
+            if self.text else []
+        )
+        self._boundaries = [m.start() for m in _SEGMENT_END_RE.finditer(self.text)]
+
+    def first_occurrence(self, alias: str) -> Optional[int]:
+        for position, longest in self._occurrences:
+            if longest.startswith(alias):
+                return position
+        return None
+
+    def segment_at(self, start: int, name_length: int) -> str:
+        """从 start 开始截取结果段落：到检查名称之后的第一个结束标记为止，最多 MAX_SEGMENT_CHARS 字符"""
+        end = start + MAX_SEGMENT_CHARS
+        i = bisect_left(self._boundaries, start + name_length + 1)
+        if i < len(self._boundaries):
+            end = min(end, self._boundaries[i])
+        return self.text[start:end].strip()
+
+    def find(self, test_name: str) -> Optional[str]:
+        """查找检查项目的结果段落；按 aliases_for 顺序取每种写法的首次出现，段落过短时换下一种写法"""
+        for alias in aliases_for(test_name):
+            start = self.first_occurrence(alias)
+            if start is None:
+                continue
+            segment = self.segment_at(start, len(alias))
+            if len(segment) > len(alias) + MIN_RESULT_EXTRA_CHARS:
+                return segment
+        return None
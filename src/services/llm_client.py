@@ -1,14 +1,27 @@
 from __future__ import annotations
 
+import atexit
+import json
 import logging
 import os
+import re
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any, Callable, Protocol
+import weakref
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Optional, Protocol
 
 import httpx
 
+try:
+    from httpx_sse import connect_sse
+    HAS_HTTPX_SSE = True
+except ImportError:
+    HAS_HTTPX_SSE = False
+
 from utils import parse_json_with_retry, get_logger
+from logging_utils.node_tracing import record_llm_call, record_llm_stream
+from services.prompt_budget import count_message_tokens, get_prompt_token_budget
 
 logger = get_logger(__name__)
 
@@ -16,15 +29,23 @@ logger = get_logger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
+ChatMessage = dict[str, str]
+
+# 提前终止判定：输入已生成的文本，返回应保留的前缀长度（None 表示继续生成）
+StopPredicate = Callable[[str], Optional[int]]
+
+
 class LLMClient(Protocol):
     def generate_json(
         self,
         *,
         system_prompt: str,
-        user_prompt: str,
+        user_prompt: str = "",
         fallback: Callable[[], dict[str, Any]],
         temperature: float = 0.2,
         max_tokens: int = 1200,
+        messages: list[ChatMessage] | None = None,
+        stop: StopPredicate | None = None,
     ) -> tuple[dict[str, Any], bool, str]:
         """Return (json_obj, used_fallback, raw_text)."""
     
@@ -32,13 +53,88 @@ class LLMClient(Protocol):
         self,
         *,
         system_prompt: str,
-        user_prompt: str,
+        user_prompt: str = "",
         temperature: float = 0.7,
         max_tokens: int = 500,
+        messages: list[ChatMessage] | None = None,
+        stop: StopPredicate | None = None,
     ) -> str:
         """Generate plain text response."""
 
 
+def build_messages(
+    system_prompt: str,
+    user_prompt: str = "",
+    messages: list[ChatMessage] | None = None,
+) -> list[ChatMessage]:
+    """组装请求消息：[system] + 历史多轮消息 + [本轮 user]
+
+    服务端上下文缓存按请求前缀命中：system_prompt 应只包含跨轮次不变的内容
+    （角色规则、病例、知识库参考），逐轮增长的对话放在 messages 中，
+    每轮变化的状态放在最后的 user_prompt 里。
+    """
+    result: list[ChatMessage] = [{"role": "system", "content": system_prompt}]
+    if messages:
+        result.extend({"role": m["role"], "content": m["content"]} for m in messages)
+    if user_prompt:
+        result.append({"role": "user", "content": user_prompt})
+    return result
+
+
+def cached_prompt_tokens(usage: dict[str, Any]) -> int:
+    """从 usage 中读取命中上下文缓存的 prompt tokens
+
+    DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+    OpenAI 兼容接口返回 prompt_tokens_details.cached_tokens；都没有时为 0。
+    """
+    hit = usage.get("prompt_cache_hit_tokens")
+    if hit is None:
+        details = usage.get("prompt_tokens_details") or {}
+        hit = details.get("cached_tokens") if isinstance(details, dict) else None
+    try:
+        return int(hit or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+_SENTENCE_END_RE = re.compile(r"[。！？!?\n]+[”\"’'）)]*")
+
+
+def stop_after_sentences(n: int) -> StopPredicate:
+    """生成满 n 句（以 。！？!? 或换行结尾）后终止；句末标点后的引号/括号一并保留"""
+
+    def predicate(text: str) -> Optional[int]:
+        count = 0
+        for match in _SENTENCE_END_RE.finditer(text):
+            # 流式生成时句末标点可能还没输出完（如"？！"），到达文本末尾时先不判定
+            if match.end() == len(text):
+                break
+            if match.start() == 0:
+                continue
+            count += 1
+            if count >= n:
+                return match.end()
+        return None
+
+    return predicate
+
+
+def stop_after_json_fields(*fields: str) -> StopPredicate:
+    """JSON 输出中指定的字符串字段全部生成完毕后终止（返回最后一个字段值的结束位置）"""
+    patterns = [re.compile(r'"%s"\s*:\s*"(?:[^"\\]|\\.)*"' % re.escape(f)) for f in fields]
+
+    def predicate(text: str) -> Optional[int]:
+        end = 0
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match is None:
+                return None
+            end = max(end, match.end())
+        return end
+
+    return predicate
+
+
 @dataclass(frozen=True)
 class DeepSeekConfig:
     api_key: str
@@ -47,6 +143,7 @@ class DeepSeekConfig:
     timeout_s: float = 120.0
     max_retries: int = 3
     retry_delay: float = 2.0
+    stream: bool = True  # 调用方传入 stop 时使用 SSE 流式输出并提前终止
 
 
 class DeepSeekLLMClient:
@@ -59,6 +156,37 @@ class DeepSeekLLMClient:
 
     def __init__(self, config: DeepSeekConfig) -> None:
         self.config = config
+        self._client: httpx.Client | None = None
+        self._client_lock = threading.Lock()
+
+    def _http(self) -> httpx.Client:
+        """进程内共享的连接池客户端（线程安全，复用 TCP/TLS 连接）"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        timeout=httpx.Timeout(
+                            connect=10.0,  # 连接超时
+                            read=self.config.timeout_s,  # 读取超时（流式时为相邻两块数据的间隔）
+                            write=10.0,  # 写入超时
+                            pool=self.config.timeout_s,  # 等待空闲连接（并发患者多时连接池可能排队）
+                        ),
+                        limits=httpx.Limits(
+                            max_keepalive_connections=20,
+                            max_connections=100,
+                        ),
+                    )
+                    # 兜底：解释器正常退出时关闭连接池（弱引用，避免阻止回收）
+                    self_ref = weakref.ref(self)
+                    atexit.register(lambda: self_ref() and self_ref().close())
+        return self._client
+
+    def close(self) -> None:
+        """关闭连接池（可重复调用；之后再发请求会重新建立连接池）"""
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
 
     @staticmethod
     def from_env() -> "DeepSeekLLMClient":
@@ -138,7 +266,21 @@ class DeepSeekLLMClient:
             )
         )
 
-    def _chat(self, *, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int, json_mode: bool = True) -> str:
+    def _chat(
+        self,
+        *,
+        messages: list[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        json_mode: bool = True,
+        stop: StopPredicate | None = None,
+    ) -> str:
+        """发送请求并返回回复文本
+
+        stop 不为空时，若启用流式（config.stream 且安装了 httpx-sse）则以 SSE 接收，
+        stop 返回保留长度时立即断开连接；否则等完整回复后按 stop 截断，两种方式返回的文本一致。
+        """
+        use_stream = stop is not None and self.config.stream and HAS_HTTPX_SSE
         url = self.config.base_url.rstrip("/") + "/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.config.api_key}",
@@ -148,16 +290,22 @@ class DeepSeekLLMClient:
             "model": self.config.model,
             "temperature": float(temperature),
             "max_tokens": int(max_tokens),
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            "stream": False,  # 明确禁用流式输出
+            "messages": messages,
+            "stream": use_stream,
         }
+        if use_stream:
+            payload["stream_options"] = {"include_usage": True}
         # Add JSON mode only when requested (某些API可能不支持)
         if json_mode:
             payload["response_format"] = {"type": "json_object"}
         
+        # 本地计数 prompt tokens：接口未返回 usage 时用于节点统计，并提示超出预算的调用
+        estimated_prompt_tokens = count_message_tokens(messages)
+        if estimated_prompt_tokens > get_prompt_token_budget():
+            logger.warning(
+                f"⚠️  prompt 约 {estimated_prompt_tokens} tokens，超出预算 {get_prompt_token_budget()}"
+            )
+        
         # 调试日志
         logger.debug(f"📡 API请求: {url}")
         logger.debug(f"🔑 API Key (前8位): {self.config.api_key[:8]}...")
@@ -165,30 +313,28 @@ class DeepSeekLLMClient:
         
         # 重试机制
         last_exception = None
+        call_start = time.perf_counter()
         for attempt in range(self.config.max_retries):
             try:
-                # 配置httpx客户端，增加连接池和超时设置
-                with httpx.Client(
-                    timeout=httpx.Timeout(
-                        connect=10.0,  # 连接超时
-                        read=self.config.timeout_s,  # 读取超时
-                        write=10.0,  # 写入超时
-                        pool=5.0  # 连接池超时
-                    ),
-                    limits=httpx.Limits(
-                        max_keepalive_connections=5,
-                        max_connections=10
-                    )
-                ) as client:
-                    resp = client.post(url, headers=headers, json=payload)
+                if use_stream:
+                    content, usage = self._post_stream(url, headers, payload, stop)
+                else:
+                    resp = self._http().post(url, headers=headers, json=payload)
                     resp.raise_for_status()
-                    data = resp.json()
+                    content, usage = self._parse_completion(resp.json())
+                    if stop is not None:
+                        keep = stop(content)
+                        if keep is not None:
+                            content = content[:keep]
                 
-                # 成功获取响应
-                try:
-                    return str(data["choices"][0]["message"]["content"])
-                except Exception as e:  # noqa: BLE001
-                    raise RuntimeError(f"Unexpected DeepSeek response shape: {data}") from e
+                # 成功获取响应；usage 计入当前图节点的 token 统计
+                record_llm_call(
+                    prompt_tokens=usage.get("prompt_tokens") or estimated_prompt_tokens,
+                    completion_tokens=usage.get("completion_tokens", 0),
+                    latency_ms=(time.perf_counter() - call_start) * 1000,
+                    cached_tokens=cached_prompt_tokens(usage),
+                )
+                return content
                     
             except (httpx.RemoteProtocolError, httpx.ReadTimeout, httpx.ConnectTimeout, httpx.NetworkError) as e:
                 last_exception = e
@@ -242,22 +388,94 @@ class DeepSeekLLMClient:
         else:
             raise RuntimeError("DeepSeek API调用失败（原因未知）")
 
+    @staticmethod
+    def _parse_completion(data: Any) -> tuple[str, dict[str, Any]]:
+        """非流式响应 -> (回复文本, usage)"""
+        usage = (data.get("usage") if isinstance(data, dict) else None) or {}
+        try:
+            return str(data["choices"][0]["message"]["content"]), usage
+        except Exception as e:  # noqa: BLE001
+            raise RuntimeError(f"Unexpected DeepSeek response shape: {data}") from e
+
+    def _post_stream(
+        self,
+        url: str,
+        headers: dict[str, str],
+        payload: dict[str, Any],
+        stop: StopPredicate,
+    ) -> tuple[str, dict[str, Any]]:
+        """SSE 流式请求：逐块累积 delta，stop 给出保留长度时断开连接（服务端随之停止生成）
+
+        Returns:
+            (回复文本, usage)；提前终止时服务端不会返回 usage，completion_tokens 取已收到的块数
+        """
+        start = time.perf_counter()
+        text = ""
+        usage: dict[str, Any] = {}
+        ttft_ms: float | None = None
+        received = 0  # 已收到的内容块数（每块通常为 1 个 token）
+        cut = False
+        with connect_sse(self._http(), "POST", url, headers=headers, json=payload) as event_source:
+            response = event_source.response
+            if response.is_error:
+                response.read()  # 读出错误内容，供 HTTPStatusError 处理时查看
+                response.raise_for_status()
+            if "text/event-stream" not in response.headers.get("content-type", ""):
+                # 服务端不支持流式时返回普通 JSON
+                response.read()
+                text, usage = self._parse_completion(response.json())
+                keep = stop(text)
+                return (text if keep is None else text[:keep]), usage
+            for event in event_source.iter_sse():
+                if event.data.strip() == "[DONE]":
+                    break
+                chunk = json.loads(event.data)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices") or []:
+                    piece = (choice.get("delta") or {}).get("content")
+                    if piece:
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - start) * 1000
+                        received += 1
+                        text += piece
+                keep = stop(text) if text else None
+                if keep is not None:
+                    text = text[:keep]
+                    cut = True
+                    break
+        usage = dict(usage)
+        usage.setdefault("completion_tokens", received)
+        # 节省量以 max_tokens 为上限估计（模型本身也可能在上限前结束）
+        saved_tokens = max(0, int(payload.get("max_tokens", 0)) - received) if cut else 0
+        record_llm_stream(ttft_ms=ttft_ms or 0.0, saved_tokens=saved_tokens, cut=cut)
+        logger.debug(
+            f"📶 流式响应: 首 token {ttft_ms or 0:.0f}ms，收到 {received} 块"
+            + (f"，提前终止（约节省 {saved_tokens} tokens）" if cut else "")
+        )
+        return text, usage
+
     def generate_json(
         self,
         *,
         system_prompt: str,
-        user_prompt: str,
+        user_prompt: str = "",
         fallback: Callable[[], dict[str, Any]],
         temperature: float = 0.2,
         max_tokens: int = 1200,
+        messages: list[ChatMessage] | None = None,
+        stop: StopPredicate | None = None,
     ) -> tuple[dict[str, Any], bool, str]:
         raw = self._chat(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
+            messages=build_messages(system_prompt, user_prompt, messages),
             temperature=temperature,
             max_tokens=max_tokens,
             json_mode=True,
+            stop=stop,
         )
+        if stop is not None and not raw.rstrip().endswith("}"):
+            # 提前终止的 JSON 截在某个字段值之后，补上右括号
+            raw = raw.rstrip().rstrip(",") + "}"
         obj, used_fallback = parse_json_with_retry(raw, fallback=fallback)
         return obj, used_fallback, raw
     
@@ -265,26 +483,35 @@ class DeepSeekLLMClient:
         self,
         *,
         system_prompt: str,
-        user_prompt: str,
+        user_prompt: str = "",
         temperature: float = 0.7,
         max_tokens: int = 500,
+        messages: list[ChatMessage] | None = None,
+        stop: StopPredicate | None = None,
     ) -> str:
-        """Generate plain text response (not JSON)."""
+        """Generate plain text response (not JSON); `stop` enables early termination."""
         return self._chat(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
+            messages=build_messages(system_prompt, user_prompt, messages),
             temperature=temperature,
             max_tokens=max_tokens,
             json_mode=False,
+            stop=stop,
         )
 
 
-def build_llm_client(mode: str | None) -> LLMClient:
-    """Factory used by CLI/router. `mode` can be: 'deepseek'/'chatgpt'."""
+def build_llm_client(mode: str | None, *, stream: bool | None = None) -> LLMClient:
+    """Factory used by CLI/router. `mode` can be: 'deepseek'/'chatgpt'.
+
+    `stream` overrides DeepSeekConfig.stream (SSE streaming for calls that pass `stop`).
+    """
 
     if mode == "deepseek":
-        return DeepSeekLLMClient.from_env()
-    if mode == "chatgpt":
-        return DeepSeekLLMClient.from_env_chatgpt()
-    raise ValueError(f"Unknown LLM mode: {mode!r}，可选值: deepseek / chatgpt")
+        client = DeepSeekLLMClient.from_env()
+    elif mode == "chatgpt":
+        client = DeepSeekLLMClient.from_env_chatgpt()
+    else:
+        raise ValueError(f"Unknown LLM mode: {mode!r}，可选值: deepseek / chatgpt")
+    if stream is not None:
+        client.config = replace(client.config, stream=stream)
+    return client
 
@@ -4,14 +4,17 @@ Medical Record Service - Patient Electronic Medical Record Management
 """
 from __future__ import annotations
 
-import json
 from datetime import datetime
 from pathlib import Path
+import threading
 from typing import Any, Dict, List, Optional
 from dataclasses import dataclass, field, asdict
 import uuid
 
 from utils import now_iso, get_logger
+from .record_codec import find_snapshot, get_codec, iter_snapshot_files, read_snapshot, write_snapshot
+from .record_index import RecordIndex
+from .record_journal import RecordWriteBehind, log_path, replay_log
 
 logger = get_logger("hospital_agent.medical_record")
 
@@ -112,18 +115,41 @@ class MedicalRecord:
 class MedicalRecordService:
     """医疗病例库服务"""
     
-    def __init__(self, storage_dir: Optional[Path] = None):
+    def __init__(self, storage_dir: Optional[Path] = None, write_behind: bool = True,
+                 flush_interval: float = 2.0, compact_every: int = 50,
+                 codec: str = "json-pretty"):
         """
         初始化病例库服务
         
         Args:
             storage_dir: 病例存储目录，默认为 ./medical_records/
+            write_behind: 是否启用写回缓存（后台线程追加日志 + 定期压缩）；False 时每次修改同步重写整个病例文件
+            flush_interval: 写回缓存刷盘间隔（秒）
+            compact_every: 单个病例日志达到多少行后压缩为快照
+            codec: 快照编码（json-pretty / orjson / msgpack-zstd），读取时自动识别历史格式
         """
         self.storage_dir = storage_dir or Path("./medical_records")
+        self.codec = get_codec(codec)
         
         # 内存缓存（当前会话的活跃病例）
         self._active_records: Dict[str, MedicalRecord] = {}
         
+        # 元数据侧车索引（首次使用时打开），供 search_records 查询
+        self._record_index: Optional[RecordIndex] = None
+        self._index_lock = threading.Lock()  # 保护索引的首次打开与关闭
+        self._closed = False
+        
+        # 写回缓存：add_* 只标记脏病例，由后台线程批量落盘（并批量更新索引）
+        self._writer: Optional[RecordWriteBehind] = None
+        if write_behind:
+            self._writer = RecordWriteBehind(
+                self.storage_dir,
+                flush_interval=flush_interval,
+                compact_every=compact_every,
+                codec=self.codec,
+                on_persisted=lambda records: self.record_index.upsert_many(records),
+            )
+        
         # 不显示初始化提示，由initializer统一管理
     
     def create_record(self, patient_id: str, patient_profile: Dict[str, Any]) -> MedicalRecord:
@@ -598,7 +624,7 @@ class MedicalRecordService:
             notes="患者出院"
         )
         
-        self._save_record(record)
+        self._save_record(record, compact=True)
         
         # 获取患者标识（优先使用case_id）
         case_id = record.patient_profile.get("case_id") if record.patient_profile else None
@@ -639,38 +665,61 @@ class MedicalRecordService:
             "total_entries": len(record.entries),
         }
     
-    def search_records(self, **criteria) -> List[MedicalRecord]:
+    @property
+    def record_index(self) -> RecordIndex:
+        """病例元数据索引（首次访问时打开；索引为空而目录中已有病例时自动重建）
+        
+        Raises:
+            RuntimeError: 服务已 close()
         """
-        搜索病例（简单实现，可扩展）
+        index = self._record_index
+        if index is not None:
+            return index
+        with self._index_lock:
+            if self._closed:
+                raise RuntimeError("病例库服务已关闭，不能再访问元数据索引")
+            if self._record_index is None:
+                index = RecordIndex(self.storage_dir)
+                if index.is_empty() and any(iter_snapshot_files(self.storage_dir)):
+                    index.rebuild(self._load_record_from_file)
+                self._record_index = index
+            return self._record_index
+    
+    def rebuild_index(self) -> int:
+        """扫描存储目录重建元数据索引，返回索引的病例数"""
+        self.flush()
+        return self.record_index.rebuild(self._load_record_from_file)
+    
+    def search_records(self, limit: Optional[int] = None, offset: int = 0,
+                       **criteria) -> List[MedicalRecord]:
+        """
+        搜索病例（查询元数据索引，只加载命中的病例）
         
         Args:
-            **criteria: 搜索条件（如 dept='neurology', status='active'）
+            limit: 每页条数（None 表示不限）
+            offset: 分页偏移量
+            **criteria: 搜索条件（如 dept='neurology', status='active'），
+                        支持的条件见 RecordIndex.query
             
         Returns:
-            符合条件的病例列表
+            符合条件的病例列表（按最近就诊时间倒序）
         """
         results = []
         
-        # 遍历所有病例文件
-        for record_file in self.storage_dir.glob("*.json"):
+        # 先落盘待写病例，保证索引与磁盘数据是最新的
+        self.flush()
+        
+        for meta in self.record_index.query(limit=limit, offset=offset, **criteria):
+            patient_id = meta["patient_id"]
             try:
-                record = self._load_record_from_file(record_file)
-                
-                # 检查搜索条件
-                match = True
-                for key, value in criteria.items():
-                    if key == "dept" and record.current_dept != value:
-                        match = False
-                        break
-                    elif key == "status" and record.current_status != value:
-                        match = False
-                        break
-                
-                if match:
+                # 活跃病例以内存为准
+                record = self._active_records.get(patient_id) or self._load_record_from_file(
+                    find_snapshot(self.storage_dir, patient_id, self.codec)
+                )
+                if record:
                     results.append(record)
-                    
             except Exception as e:
-                logger.error(f"加载病例文件失败: {record_file}, 错误: {e}")
+                logger.error(f"加载病例失败: {patient_id}, 错误: {e}")
         
         return results
     
@@ -702,13 +751,55 @@ class MedicalRecordService:
         record.entries.append(entry)
         record.last_updated = now_iso()
     
-    def _save_record(self, record: MedicalRecord):
-        """保存病例到磁盘"""
-        file_path = self.storage_dir / f"{record.patient_id}.json"
+    def flush(self, patient_id: Optional[str] = None, compact: bool = False) -> int:
+        """
+        同步落盘写回缓存中的病例
+        
+        Args:
+            patient_id: 仅落盘指定患者；None 表示全部
+            compact: 是否同时压缩为快照
+            
+        Returns:
+            写入的病例数
+        """
+        if self._writer is None:
+            return 0
+        return self._writer.flush([patient_id] if patient_id else None, compact=compact)
+    
+    def close(self):
+        """停止写回线程并将全部病例压缩落盘（崩溃安全：快照原子替换）；之后不能再访问元数据索引"""
+        if self._writer is not None:
+            self._writer.close(compact=True)
+        with self._index_lock:
+            self._closed = True
+            index, self._record_index = self._record_index, None
+        if index is not None:
+            index.close()
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """写回缓存统计（待写病例数、刷盘次数、压缩次数等）"""
+        if self._writer is None:
+            return {"write_behind": False}
+        return {"write_behind": True, **self._writer.get_stats()}
+    
+    def _save_record(self, record: MedicalRecord, compact: bool = False):
+        """
+        保存病例
+        
+        启用写回缓存时仅标记为脏（O(1)），由后台线程落盘；compact=True 时尽快压缩为快照。
+        """
+        if self._writer is not None:
+            if compact:
+                self._writer.request_compaction(record)
+            else:
+                self._writer.mark_dirty(record)
+            return
+        
+        file_path = self.storage_dir / f"{record.patient_id}{self.codec.suffix}"
         
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(record.to_dict(), f, ensure_ascii=False, indent=2)
+            write_snapshot(file_path, record.to_dict(), self.codec)
+            self.record_index.upsert(record)
                 
             logger.debug(f"病例已保存: {file_path}")
             
@@ -717,20 +808,32 @@ class MedicalRecordService:
     
     def _load_record(self, patient_id: str) -> Optional[MedicalRecord]:
         """从磁盘加载病例"""
-        file_path = self.storage_dir / f"{patient_id}.json"
+        file_path = find_snapshot(self.storage_dir, patient_id, self.codec)
         
-        if not file_path.exists():
+        if not file_path.exists() and not log_path(self.storage_dir, patient_id).exists():
             return None
         
-        return self._load_record_from_file(file_path)
+        return self._load_record_from_file(file_path, track=True)
     
-    def _load_record_from_file(self, file_path: Path) -> Optional[MedicalRecord]:
-        """从文件加载病例"""
+    def _load_record_from_file(self, file_path: Path, track: bool = False) -> Optional[MedicalRecord]:
+        """从文件加载病例（快照 + 写回日志）
+        
+        Args:
+            file_path: 快照文件路径
+            track: 是否登记到写回缓存（作为活跃病例继续追加时需要）
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data: Dict[str, Any] = {}
+            if file_path.exists():
+                data = read_snapshot(file_path)
+            
+            # 重放写回日志中尚未压缩的增量
+            patient_id = data.get("patient_id") or file_path.stem
+            data, seq, log_lines = replay_log(data, log_path(file_path.parent, patient_id))
             
             record = MedicalRecord.from_dict(data)
+            if track and self._writer is not None:
+                self._writer.mark_loaded(record, seq=seq, log_lines=log_lines)
             logger.debug(f"病例已加载: {file_path}")
             
             return record
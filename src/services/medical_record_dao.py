@@ -7,13 +7,14 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime, date
-from typing import Optional, List, Dict, Any
+from decimal import Decimal
+from typing import Optional, List, Dict, Any, Iterable
 from contextlib import contextmanager
-from collections.abc import Iterator
+from collections.abc import Iterator, Mapping
 
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import create_engine, inspect, text, select
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.schema import CreateColumn
 
 from .db_models import Base, Patient, Visit, MedicalCase, Examination, ExamItem, CaseQARecord
@@ -21,6 +22,43 @@ from utils import get_logger, now_iso
 
 logger = get_logger("hospital_agent.dao")
 
+# 聚合读取直接查询表列并返回行映射（不构造 ORM 实体、不进入 identity map）
+_CASES = MedicalCase.__table__
+_EXAMS = Examination.__table__
+_ITEMS = ExamItem.__table__
+_QA = CaseQARecord.__table__
+
+_EXAM_COLUMNS = (
+    _EXAMS.c.exam_id, _EXAMS.c.case_id, _EXAMS.c.exam_name, _EXAMS.c.exam_type,
+    _EXAMS.c.lab_doctor_id, _EXAMS.c.lab_doctor_name, _EXAMS.c.ordered_at, _EXAMS.c.reported_at,
+    _EXAMS.c.result_text, _EXAMS.c.summary, _EXAMS.c.is_abnormal, _EXAMS.c.status,
+)
+_ITEM_COLUMNS = (
+    _ITEMS.c.item_id, _ITEMS.c.item_name, _ITEMS.c.value_numeric, _ITEMS.c.value_text,
+    _ITEMS.c.value_type, _ITEMS.c.unit, _ITEMS.c.ref_range, _ITEMS.c.is_abnormal,
+)
+_QA_COLUMNS = (
+    _QA.c.qa_id, _QA.c.case_id, _QA.c.role, _QA.c.content, _QA.c.round_index, _QA.c.created_at,
+)
+
+# 聚合读取把父表与子表 LEFT JOIN 成一次查询，子表列加前缀，避免与父表列（case_id、is_abnormal 等）重名
+_VISIT_PREFIX = "visit__"
+_EXAM_PREFIX = "exam__"
+_ITEM_PREFIX = "item__"
+
+
+def _row_to_dict(row: Mapping, keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """行映射转普通字典：时间转 ISO 字符串，Decimal 转 float"""
+    result: Dict[str, Any] = {}
+    for key in (keys if keys is not None else row.keys()):
+        value = row[key]
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = float(value)
+        result[key] = value
+    return result
+
 
 class MedicalRecordDAO:
     """医疗记录数据访问对象"""
@@ -36,13 +74,20 @@ class MedicalRecordDAO:
         """
         self.connection_string = connection_string
 
-        self.engine = create_engine(
-            connection_string,
-            pool_pre_ping=True,
-            poolclass=QueuePool,
-            pool_size=10,
-            max_overflow=20,
-        )
+        if connection_string.startswith("sqlite"):
+            # SQLite（本地测试替代 MySQL）：允许跨线程使用连接；内存库需共享单连接
+            engine_kwargs: Dict[str, Any] = {"connect_args": {"check_same_thread": False}}
+            if ":memory:" in connection_string or connection_string.rstrip("/") == "sqlite:":
+                engine_kwargs["poolclass"] = StaticPool
+            self.engine = create_engine(connection_string, **engine_kwargs)
+        else:
+            self.engine = create_engine(
+                connection_string,
+                pool_pre_ping=True,
+                poolclass=QueuePool,
+                pool_size=10,
+                max_overflow=20,
+            )
 
         self.SessionLocal = sessionmaker(
             bind=self.engine,
@@ -293,87 +338,145 @@ class MedicalRecordDAO:
             return case.case_id
 
     def get_medical_case(self, case_id: str) -> Optional[Dict[str, Any]]:
-        """获取完整病历"""
+        """获取完整病历（含检查记录摘要）"""
         with self.get_session() as session:
-            case = session.query(MedicalCase).filter_by(case_id=case_id).first()
-            if not case:
+            case = session.execute(
+                select(_CASES).where(_CASES.c.case_id == case_id)
+            ).mappings().first()
+            if case is None:
                 return None
 
-            result = {
-                "case_id": case.case_id,
-                "visit_id": case.visit_id,
-                "history_narrator": case.history_narrator,
-                "chief_complaint": case.chief_complaint,
-                "present_illness_detail": case.present_illness_detail,
-                "present_illness_onset": case.present_illness_onset,
-                "present_illness_course": case.present_illness_course,
-                "present_illness_progression": case.present_illness_progression,
-                "past_history_disease": case.past_history_disease,
-                "past_history_surgery": case.past_history_surgery,
-                "past_history_allergy": case.past_history_allergy,
-                "past_history_vaccination": case.past_history_vaccination,
-                "past_history_trauma": case.past_history_trauma,
-                "personal_history": case.personal_history,
-                "alcohol_history": case.alcohol_history,
-                "smoking_history": case.smoking_history,
-                "menstrual_history": case.menstrual_history,
-                "marital_fertility_history": case.marital_fertility_history,
-                "family_history_father": case.family_history_father,
-                "family_history_mother": case.family_history_mother,
-                "family_history_siblings": case.family_history_siblings,
-                "family_history_disease": case.family_history_disease,
-                "pe_vital_signs": case.pe_vital_signs,
-                "pe_skin_mucosa": case.pe_skin_mucosa,
-                "pe_superficial_lymph_nodes": case.pe_superficial_lymph_nodes,
-                "pe_head_neck": case.pe_head_neck,
-                "pe_cardiopulmonary_vascular": case.pe_cardiopulmonary_vascular,
-                "pe_abdomen": case.pe_abdomen,
-                "pe_spine_limbs": case.pe_spine_limbs,
-                "pe_nervous_system": case.pe_nervous_system,
-                "auxiliary_examination": case.auxiliary_examination,
-                "preliminary_diagnosis": case.preliminary_diagnosis,
-                "diagnosis_basis": case.diagnosis_basis,
-                "treatment_principle": case.treatment_principle,
-                "treatment_plan": case.treatment_plan,
-                "medications": case.medications,
-                "medical_advice": case.medical_advice,
-                "followup_plan": case.followup_plan,
-                "doctor_patient_qa_ref_question": case.doctor_patient_qa_ref_question,
-                "doctor_patient_qa_ref_answer": case.doctor_patient_qa_ref_answer,
-                "std_record_chief_complaint": case.std_record_chief_complaint,
-                "std_record_present_illness": case.std_record_present_illness,
-                "std_record_past_history": case.std_record_past_history,
-                "std_record_physical_exam": case.std_record_physical_exam,
-                "std_record_aux_exam": case.std_record_aux_exam,
-                "std_record_diagnosis_result": case.std_record_diagnosis_result,
-                "advanced_question": case.advanced_question,
-                "advanced_answer": case.advanced_answer,
-                "exam_question": case.exam_question,
-                "exam_answer": case.exam_answer,
-                "status": case.status,
-                "created_at": case.created_at.isoformat() if case.created_at else None,
-                "updated_at": case.updated_at.isoformat() if case.updated_at else None,
-            }
-
-            # 关联检查记录
-            examinations = session.query(Examination).filter_by(case_id=case_id).all()
+            result = _row_to_dict(case)
+            exams = session.execute(
+                select(*_EXAM_COLUMNS)
+                .where(_EXAMS.c.case_id == case_id)
+                .order_by(_EXAMS.c.ordered_at)
+            ).mappings().all()
             result["examinations"] = [
-                {
-                    "exam_id": e.exam_id,
-                    "exam_name": e.exam_name,
-                    "exam_type": e.exam_type,
-                    "ordered_at": e.ordered_at.isoformat() if e.ordered_at else None,
-                    "reported_at": e.reported_at.isoformat() if e.reported_at else None,
-                    "result_text": e.result_text,
-                    "summary": e.summary,
-                    "is_abnormal": e.is_abnormal,
-                    "status": e.status,
-                }
-                for e in examinations
+                _row_to_dict(e, ("exam_id", "exam_name", "exam_type", "ordered_at", "reported_at",
+                                 "result_text", "summary", "is_abnormal", "status"))
+                for e in exams
             ]
+            return result
+
+    def get_case_bundle(self, case_id: str, include_items: bool = True,
+                        include_qa: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        聚合读取单份病历：病历 + 检查记录 + 检查明细 + 问答记录
 
+        共 2 次查询（病历 LEFT JOIN 检查 LEFT JOIN 明细 1 次，问答 1 次），不随检查数量增长；
+        替代 get_medical_case → get_examinations_by_case_id → get_exam_items 的 N+1 调用。
+        问答单独查询，避免与检查明细做笛卡尔积。
+        """
+        bundles = self.get_case_bundles([case_id], include_items=include_items, include_qa=include_qa)
+        return bundles[0] if bundles else None
+
+    def get_case_bundles(self, case_ids: Iterable[str], include_items: bool = True,
+                         include_qa: bool = True) -> List[Dict[str, Any]]:
+        """批量聚合读取多份病历（IN 查询，查询次数与病历数无关），按传入顺序返回存在的病历"""
+        case_ids = list(dict.fromkeys(case_ids))
+        if not case_ids:
+            return []
+        columns, joined, order_by = self._case_tree(include_items)
+        with self.get_session() as session:
+            rows = session.execute(
+                select(*columns).select_from(joined)
+                .where(_CASES.c.case_id.in_(case_ids))
+                .order_by(_CASES.c.case_id, *order_by)
+            ).mappings()
+            by_id = self._collect_case_tree(rows, include_items)
+            if include_qa:
+                self._attach_qa_records(session, by_id)
+            return [by_id[cid] for cid in case_ids if cid in by_id]
+
+    def get_visit_bundle(self, visit_id: str, include_items: bool = True,
+                         include_qa: bool = True) -> Optional[Dict[str, Any]]:
+        """聚合读取一次就诊：就诊记录 + 其下全部病历（含检查、明细、问答）
+
+        共 2 次查询：就诊 LEFT JOIN 病历 LEFT JOIN 检查 LEFT JOIN 明细 1 次，问答 1 次。
+        """
+        visits = Visit.__table__
+        visit_columns = [c.label(f"{_VISIT_PREFIX}{c.name}") for c in visits.c]
+        columns, joined, order_by = self._case_tree(include_items)
+        with self.get_session() as session:
+            rows = session.execute(
+                select(*visit_columns, *columns)
+                .select_from(visits.outerjoin(joined, _CASES.c.visit_id == visits.c.visit_id))
+                .where(visits.c.visit_id == visit_id)
+                .order_by(_CASES.c.created_at, _CASES.c.case_id, *order_by)
+            ).mappings().all()
+            if not rows:
+                return None
+            result = {
+                key[len(_VISIT_PREFIX):]: value
+                for key, value in _row_to_dict(rows[0], [c.name for c in visit_columns]).items()
+            }
+            by_id = self._collect_case_tree((row for row in rows if row["case_id"] is not None), include_items)
+            if include_qa:
+                self._attach_qa_records(session, by_id)
+            result["medical_cases"] = list(by_id.values())
             return result
 
+    @staticmethod
+    def _case_tree(include_items: bool) -> tuple:
+        """病历 LEFT JOIN 检查（LEFT JOIN 明细）的列、连接与子表排序；病历列保持原名，检查 / 明细列加前缀"""
+        columns = [*_CASES.c, *(c.label(f"{_EXAM_PREFIX}{c.name}") for c in _EXAM_COLUMNS)]
+        joined = _CASES.outerjoin(_EXAMS, _EXAMS.c.case_id == _CASES.c.case_id)
+        order_by = [_EXAMS.c.ordered_at, _EXAMS.c.exam_id]
+        if include_items:
+            columns += [c.label(f"{_ITEM_PREFIX}{c.name}") for c in _ITEM_COLUMNS]
+            joined = joined.outerjoin(_ITEMS, _ITEMS.c.exam_id == _EXAMS.c.exam_id)
+            order_by.append(_ITEMS.c.created_at)
+        return columns, joined, order_by
+
+    @staticmethod
+    def _collect_case_tree(rows: Iterable[Mapping], include_items: bool) -> Dict[str, Dict[str, Any]]:
+        """把 _case_tree 查询的扁平行还原为 {case_id: 病历（含 examinations / items）}，保持行顺序"""
+        case_keys = [c.name for c in _CASES.c]
+        exam_keys = [f"{_EXAM_PREFIX}{c.name}" for c in _EXAM_COLUMNS]
+        item_keys = [f"{_ITEM_PREFIX}{c.name}" for c in _ITEM_COLUMNS]
+        cases: Dict[str, Dict[str, Any]] = {}
+        exams: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            case = cases.get(row["case_id"])
+            if case is None:
+                case = _row_to_dict(row, case_keys)
+                case["examinations"] = []
+                cases[row["case_id"]] = case
+            exam_id = row[f"{_EXAM_PREFIX}exam_id"]
+            if exam_id is None:
+                continue
+            exam = exams.get(exam_id)
+            if exam is None:
+                exam = {k[len(_EXAM_PREFIX):]: v for k, v in _row_to_dict(row, exam_keys).items()}
+                if include_items:
+                    exam["items"] = []
+                exams[exam_id] = exam
+                case["examinations"].append(exam)
+            if include_items and row[f"{_ITEM_PREFIX}item_id"] is not None:
+                exam["items"].append({k[len(_ITEM_PREFIX):]: v for k, v in _row_to_dict(row, item_keys).items()})
+        return cases
+
+    @staticmethod
+    def _attach_qa_records(session: Session, cases: Dict[str, Dict[str, Any]]) -> None:
+        """为病历字典挂载 qa_records（一次 IN 查询）"""
+        for case in cases.values():
+            case["qa_records"] = []
+        if not cases:
+            return
+        qa_rows = session.execute(
+            select(*_QA_COLUMNS)
+            .where(_QA.c.case_id.in_(list(cases)))
+            .order_by(_QA.c.case_id, _QA.c.round_index, _QA.c.created_at)
+        ).mappings()
+        for row in qa_rows:
+            cases[row["case_id"]]["qa_records"].append(_row_to_dict(row))
+
+    def medical_case_exists(self, case_id: str) -> bool:
+        """病历是否存在（仅查询主键）"""
+        with self.get_session() as session:
+            return session.query(MedicalCase.case_id).filter_by(case_id=case_id).first() is not None
+
     def update_medical_case(self, case_id: str, update_data: Dict[str, Any]) -> bool:
         """更新病历信息"""
         with self.get_session() as session:
@@ -441,21 +544,14 @@ class MedicalRecordDAO:
     def get_examinations_by_case_id(self, case_id: str) -> List[Dict[str, Any]]:
         """获取某病历的所有检查记录"""
         with self.get_session() as session:
-            exams = session.query(Examination)\
-                .filter_by(case_id=case_id)\
-                .order_by(Examination.ordered_at)\
-                .all()
+            exams = session.execute(
+                select(*_EXAM_COLUMNS)
+                .where(_EXAMS.c.case_id == case_id)
+                .order_by(_EXAMS.c.ordered_at)
+            ).mappings().all()
             return [
-                {
-                    "exam_id": e.exam_id,
-                    "exam_name": e.exam_name,
-                    "exam_type": e.exam_type,
-                    "result_text": e.result_text,
-                    "summary": e.summary,
-                    "is_abnormal": e.is_abnormal,
-                    "status": e.status,
-                    "ordered_at": e.ordered_at.isoformat() if e.ordered_at else None,
-                }
+                _row_to_dict(e, ("exam_id", "exam_name", "exam_type", "result_text", "summary",
+                                 "is_abnormal", "status", "ordered_at"))
                 for e in exams
             ]
 
@@ -474,20 +570,12 @@ class MedicalRecordDAO:
     def get_exam_items(self, exam_id: str) -> List[Dict[str, Any]]:
         """获取某检查的所有项目明细"""
         with self.get_session() as session:
-            items = session.query(ExamItem).filter_by(exam_id=exam_id).all()
-            return [
-                {
-                    "item_id": i.item_id,
-                    "item_name": i.item_name,
-                    "value_numeric": float(i.value_numeric) if i.value_numeric is not None else None,
-                    "value_text": i.value_text,
-                    "value_type": i.value_type,
-                    "unit": i.unit,
-                    "ref_range": i.ref_range,
-                    "is_abnormal": i.is_abnormal,
-                }
-                for i in items
-            ]
+            items = session.execute(
+                select(*_ITEM_COLUMNS)
+                .where(_ITEMS.c.exam_id == exam_id)
+                .order_by(_ITEMS.c.created_at)
+            ).mappings().all()
+            return [_row_to_dict(i) for i in items]
 
     # ===== 医患问答记录操作 =====
 
@@ -504,18 +592,13 @@ class MedicalRecordDAO:
     def get_qa_records_by_case(self, case_id: str) -> List[Dict[str, Any]]:
         """获取某病历的所有问答记录"""
         with self.get_session() as session:
-            records = session.query(CaseQARecord)\
-                .filter_by(case_id=case_id)\
-                .order_by(CaseQARecord.round_index, CaseQARecord.created_at)\
-                .all()
+            records = session.execute(
+                select(*_QA_COLUMNS)
+                .where(_QA.c.case_id == case_id)
+                .order_by(_QA.c.round_index, _QA.c.created_at)
+            ).mappings().all()
             return [
-                {
-                    "qa_id": r.qa_id,
-                    "role": r.role,
-                    "content": r.content,
-                    "round_index": r.round_index,
-                    "created_at": r.created_at.isoformat() if r.created_at else None,
-                }
+                _row_to_dict(r, ("qa_id", "role", "content", "round_index", "created_at"))
                 for r in records
             ]
 
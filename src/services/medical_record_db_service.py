@@ -12,6 +12,8 @@ from typing import Any, Dict, List, Optional
 
 from .medical_record import MedicalRecordService, MedicalRecord, MedicalRecordEntry
 from .medical_record_dao import MedicalRecordDAO
+from .db_models import Patient, Visit, MedicalCase, Examination, CaseQARecord
+from .db_write_queue import DBWriteQueue
 from utils import now_iso, get_logger
 
 logger = get_logger("hospital_agent.medical_record_db")
@@ -21,7 +23,10 @@ class DatabaseMedicalRecordService(MedicalRecordService):
     """基于数据库的医疗记录服务（双写模式：数据库 + 文件备份）"""
     
     def __init__(self, connection_string: str, storage_dir: Optional[Path] = None, 
-                 backup_to_file: bool = True):
+                 backup_to_file: bool = True, write_behind: bool = True,
+                 flush_interval: float = 2.0, compact_every: int = 50,
+                 codec: str = "json-pretty", async_writes: bool = True, write_batch_size: int = 200,
+                 write_flush_interval: float = 0.2, write_max_retries: int = 3):
         """
         初始化数据库医疗记录服务
         
@@ -29,14 +34,40 @@ class DatabaseMedicalRecordService(MedicalRecordService):
             connection_string: 数据库连接字符串
             storage_dir: 文件备份目录（可选）
             backup_to_file: 是否同时备份到文件（双保险）
+            write_behind: 文件备份是否使用写回缓存（见 MedicalRecordService）
+            flush_interval: 写回缓存刷盘间隔（秒）
+            compact_every: 单个病例日志达到多少行后压缩为快照
+            codec: 文件备份的快照编码（见 MedicalRecordService）
+            async_writes: 是否通过后台队列批量异步写库（False 时每个事件同步提交）
+            write_batch_size: 异步写入单批最大操作数
+            write_flush_interval: 异步写入时间窗口（秒）
+            write_max_retries: 瞬时故障最大重试次数
         """
-        # 初始化父类（文件存储）
-        super().__init__(storage_dir or Path("./medical_records"))
+        # 初始化父类（文件存储）；不备份到文件时无需启动写回线程
+        super().__init__(
+            storage_dir or Path("./medical_records"),
+            write_behind=write_behind and backup_to_file,
+            flush_interval=flush_interval,
+            compact_every=compact_every,
+            codec=codec,
+        )
         
         # 初始化数据库DAO
         self.dao = MedicalRecordDAO(connection_string)
         self.backup_to_file = backup_to_file
         
+        # 异步批量写入队列：数据库延迟不再落在患者的关键路径上
+        self.db_writer: Optional[DBWriteQueue] = None
+        if async_writes:
+            self.db_writer = DBWriteQueue(
+                self.dao,
+                batch_size=write_batch_size,
+                flush_interval=write_flush_interval,
+                max_retries=write_max_retries,
+            )
+        # 本次会话已写入（或已入队）的病历号，避免逐次查库确认病历存在
+        self._known_case_ids: set = set()
+        
         # 就诊流水号缓存（键：patient_id:YYYYMMDD）
         self._visit_daily_seq_cache: Dict[str, int] = {}
         # 当前就诊 visit_id 缓存（键：patient_id）
@@ -44,13 +75,90 @@ class DatabaseMedicalRecordService(MedicalRecordService):
         
         # 不显示初始化提示，由initializer统一管理
     
-    def _save_record(self, record: MedicalRecord):
+    def _save_record(self, record: MedicalRecord, compact: bool = False):
         """覆盖父类方法：仅在启用备份时才保存到文件"""
         if self.backup_to_file:
             # 调用父类的文件保存方法
-            super()._save_record(record)
+            super()._save_record(record, compact=compact)
         # 如果不备份，则什么都不做（数据已在数据库中）
     
+    # ===== 数据库写入（异步队列 / 同步 DAO）=====
+    
+    def _db_create_patient(self, data: Dict[str, Any]) -> None:
+        if self.db_writer:
+            self.db_writer.upsert(Patient, data)
+        else:
+            self.dao.create_patient(data)
+    
+    def _db_create_visit(self, data: Dict[str, Any]) -> None:
+        if self.db_writer:
+            self.db_writer.upsert(Visit, data)
+        else:
+            self.dao.create_visit(data)
+    
+    def _db_update_visit(self, visit_id: str, data: Dict[str, Any]) -> None:
+        if self.db_writer:
+            self.db_writer.update(Visit, visit_id, data)
+        else:
+            self.dao.update_visit(visit_id, data)
+    
+    def _db_create_medical_case(self, data: Dict[str, Any]) -> str:
+        self._known_case_ids.add(data["case_id"])
+        if self.db_writer:
+            return self.db_writer.upsert(MedicalCase, data)
+        return self.dao.create_medical_case(data)
+    
+    def _db_update_medical_case(self, case_id: str, data: Dict[str, Any]) -> None:
+        if self.db_writer:
+            self.db_writer.update(MedicalCase, case_id, data)
+        else:
+            self.dao.update_medical_case(case_id, data)
+    
+    def _db_add_examination(self, data: Dict[str, Any]) -> None:
+        if self.db_writer:
+            self.db_writer.upsert(Examination, data)
+        else:
+            self.dao.add_examination(data)
+    
+    def _db_add_case_qa_record(self, data: Dict[str, Any]) -> None:
+        if self.db_writer:
+            self.db_writer.insert(CaseQARecord, data)
+        else:
+            self.dao.add_case_qa_record(data)
+    
+    def _case_exists(self, case_id: str) -> bool:
+        """病历是否存在：优先查本会话已写入集合，否则查主键"""
+        if case_id in self._known_case_ids:
+            return True
+        if self.dao.medical_case_exists(case_id):
+            self._known_case_ids.add(case_id)
+            return True
+        return False
+    
+    def update_case_fields(self, patient_id: str, update_data: Dict[str, Any]) -> bool:
+        """更新患者当前病历的数据库字段（如医生总结的主诉）"""
+        record = self.get_record(patient_id)
+        if not record:
+            return False
+        try:
+            self._db_update_medical_case(record.record_id, update_data)
+            return True
+        except Exception as e:
+            logger.error(f"❌ [数据库] 病历字段更新失败: {e}")
+            return False
+    
+    def flush_db_writes(self, timeout: Optional[float] = None) -> bool:
+        """等待已入队的数据库写入全部提交"""
+        if self.db_writer is None:
+            return True
+        return self.db_writer.flush(timeout=timeout)
+    
+    def get_db_write_stats(self) -> Dict[str, Any]:
+        """异步写入队列统计（队列深度、刷盘延迟等）"""
+        if self.db_writer is None:
+            return {"async_writes": False}
+        return {"async_writes": True, **self.db_writer.get_stats()}
+    
     def _get_visit_id_and_outpatient_no(self, patient_id: str) -> tuple:
         """生成就诊 visit_id 与门诊号（每次就诊唯一）
 
@@ -177,7 +285,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
             self._current_visit_id[patient_id] = visit_id
             
             # 创建/更新患者记录（patient_id 为主键）
-            self.dao.create_patient({
+            self._db_create_patient({
                 "patient_id": patient_id,
                 "name": patient_profile.get("name"),
                 "age": self._safe_int(patient_profile.get("age")),
@@ -188,7 +296,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
             })
 
             # 创建就诊记录
-            self.dao.create_visit({
+            self._db_create_visit({
                 "visit_id": visit_id,
                 "patient_id": patient_id,
                 "outpatient_no": outpatient_no,
@@ -203,7 +311,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
             
             # 创建病历记录
             structured_case_payload = self._build_structured_case_payload(patient_profile)
-            actual_case_id = self.dao.create_medical_case({
+            actual_case_id = self._db_create_medical_case({
                 "case_id": record.record_id,
                 "visit_id": visit_id,
                 "status": "draft",
@@ -256,14 +364,14 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                 # 更新就诊记录中的科室和分诊护士信息
                 visit_id = self._current_visit_id.get(patient_id, "")
                 if visit_id:
-                    self.dao.update_visit(visit_id, {
+                    self._db_update_visit(visit_id, {
                         "dept": dept,
                         "triage_nurse_id": nurse_id,
                         "triage_nurse_name": nurse_name,
                     })
 
                 # 更新病历中的现病史描述
-                self.dao.update_medical_case(record.record_id, {
+                self._db_update_medical_case(record.record_id, {
                     "present_illness_detail": latest_complaint,
                 })
                 
@@ -301,7 +409,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                     content = msg.get("content", "")
                     # 按成对计算轮次（doctor+patient 为一轮）
                     if role == "doctor":
-                        self.dao.add_case_qa_record({
+                        self._db_add_case_qa_record({
                             "case_id": record.record_id,
                             "role": "doctor",
                             "content": content,
@@ -309,7 +417,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                         })
                         if i + 1 < len(conversation):
                             patient_msg = conversation[i + 1]
-                            self.dao.add_case_qa_record({
+                            self._db_add_case_qa_record({
                                 "case_id": record.record_id,
                                 "role": "patient",
                                 "content": patient_msg.get("content", ""),
@@ -320,7 +428,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                             i += 1
                         round_idx += 1
                     else:
-                        self.dao.add_case_qa_record({
+                        self._db_add_case_qa_record({
                             "case_id": record.record_id,
                             "role": role or "patient",
                             "content": content,
@@ -341,7 +449,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                             break
                 
                 if update_data:
-                    self.dao.update_medical_case(record.record_id, update_data)
+                    self._db_update_medical_case(record.record_id, update_data)
                 
         except Exception as e:
             logger.error(f"❌ [数据库] 问诊记录写入失败: {e}")
@@ -371,12 +479,11 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                 exam_id = f"L_{patient_id}_{timestamp_sec}{microsec}{random_suffix}"
                 
                 # 验证case_id是否存在于数据库
-                db_case = self.dao.get_medical_case(record.record_id)
-                if not db_case:
+                if not self._case_exists(record.record_id):
                     logger.warning(f"⚠️  [数据库] 病历 {record.record_id} 在数据库中不存在，跳过写入检查记录")
                     return True
                 
-                self.dao.add_examination({
+                self._db_add_examination({
                     "exam_id": exam_id,
                     "case_id": record.record_id,
                     "exam_name": test_name,
@@ -417,12 +524,11 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                 exam_id = f"I_{patient_id}_{timestamp_sec}{microsec}{random_suffix}"
                 
                 # 验证case_id是否存在于数据库
-                db_case = self.dao.get_medical_case(record.record_id)
-                if not db_case:
+                if not self._case_exists(record.record_id):
                     logger.warning(f"⚠️  [数据库] 病历 {record.record_id} 在数据库中不存在，跳过写入影像记录")
                     return True
                 
-                self.dao.add_examination({
+                self._db_add_examination({
                     "exam_id": exam_id,
                     "case_id": record.record_id,
                     "exam_name": imaging_type,
@@ -477,12 +583,12 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                 if diagnosis.get("medical_advice"):
                     update_data["medical_advice"] = diagnosis.get("medical_advice")
                 
-                self.dao.update_medical_case(record.record_id, update_data)
+                self._db_update_medical_case(record.record_id, update_data)
 
                 # 更新就诊记录中的主治医生信息
                 visit_id = self._current_visit_id.get(patient_id, "")
                 if visit_id:
-                    self.dao.update_visit(visit_id, {
+                    self._db_update_visit(visit_id, {
                         "attending_doctor_id": doctor_id,
                         "attending_doctor_name": doctor_name,
                     })
@@ -525,7 +631,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                 
                 treatment_plan = "药物治疗：\n" + "\n".join([f"{i+1}. {d}" for i, d in enumerate(med_details)])
                 
-                self.dao.update_medical_case(record.record_id, {
+                self._db_update_medical_case(record.record_id, {
                     "medications": json.dumps(medications, ensure_ascii=False),
                     "treatment_plan": treatment_plan,
                 })
@@ -552,14 +658,14 @@ class DatabaseMedicalRecordService(MedicalRecordService):
             record = self._active_records.get(patient_id)
             if record:
                 # 更新病历状态为 final
-                self.dao.update_medical_case(record.record_id, {
+                self._db_update_medical_case(record.record_id, {
                     "status": "final",
                 })
                 
                 # 更新就诊状态为 completed
                 visit_id = self._current_visit_id.get(patient_id, "")
                 if visit_id:
-                    self.dao.update_visit(visit_id, {
+                    self._db_update_visit(visit_id, {
                         "status": "completed",
                     })
                 
@@ -584,7 +690,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
                 if not treatment_plan:
                     treatment_plan = f"{treatment_type}：{treatment_details.get('description', '详见病历')}"
                 
-                self.dao.update_medical_case(record.record_id, {
+                self._db_update_medical_case(record.record_id, {
                     "treatment_plan": treatment_plan,
                 })
                 
@@ -602,7 +708,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
             return False
         
         try:
-            self.dao.update_medical_case(record.record_id, {
+            self._db_update_medical_case(record.record_id, {
                 "medical_advice": advice,
             })
             return True
@@ -622,7 +728,7 @@ class DatabaseMedicalRecordService(MedicalRecordService):
         
         try:
             update_data = {"followup_plan": followup_plan}
-            self.dao.update_medical_case(record.record_id, update_data)
+            self._db_update_medical_case(record.record_id, update_data)
             return True
             
         except Exception as e:
@@ -634,11 +740,21 @@ class DatabaseMedicalRecordService(MedicalRecordService):
     def get_statistics(self) -> Dict[str, Any]:
         """获取统计数据"""
         try:
+            # 统计前先提交队列中的写入，保证读到最新数据
+            self.flush_db_writes(timeout=10)
             return self.dao.get_daily_statistics()
         except Exception as e:
             logger.error(f"获取统计数据失败: {e}")
             return {}
     
     def close(self):
-        """关闭数据库连接"""
+        """落盘文件备份、提交剩余数据库写入并关闭数据库连接"""
+        super().close()
+        if self.db_writer is not None:
+            self.db_writer.close()
+            stats = self.db_writer.get_stats()
+            logger.info(
+                f"数据库写入队列: {stats['rows_written']}行/{stats['batches']}批, "
+                f"平均刷盘{stats['avg_flush_ms']}ms, 失败{stats['failed_ops']}"
+            )
         self.dao.close()
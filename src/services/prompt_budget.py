@@ -0,0 +1,371 @@
+"""提示词 token 预算 - 按优先级在各段落间分配 token，超出时截断低优先级内容
+
+token 计数优先使用 tiktoken（编码默认 cl100k_base，与 DeepSeek / OpenAI 分词器的计数量级一致）；
+未安装 tiktoken 或编码文件无法加载（离线环境首次使用需下载）时退化为估算：
+非 ASCII 字符（中文等）每字计 1，ASCII 每 4 字符计 1。
+
+PromptBudget 的用法：
+
+    budget = PromptBudget(max_tokens=6000)
+    budget.fixed("rules", RULES)                                 # 必需段落，不截断
+    budget.add("history", history_json, priority=3, keep="tail") # 超预算时保留末尾
+    budget.add_items("kb", chunk_lines, priority=2, max_item_tokens=240)
+    parts = budget.build()                                       # {"rules": ..., "history": ..., "kb": ...}
+
+分配规则：先扣除必需段落，再按 priority 从高到低满足各段的 min_tokens，
+最后按 priority 从高到低补足到完整长度；未获满额的段落截断（文本按 keep 保留头或尾，
+列表段落按顺序保留整条，余量足够时截断下一条）。列表段落默认去重（规范化后相同或被包含的条目）。
+build() 的组装量与裁剪量计入当前图节点的 prompt 预算统计（见 logging_utils.node_tracing）；
+结果只是外层预算的一个段落时用 nested=True 构建，组装量由外层计入，避免重复统计。
+"""
+from __future__ import annotations
+
+import importlib.util
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Sequence
+
+from logging_utils.node_tracing import record_prompt_budget
+from utils import get_logger
+
+logger = get_logger("hospital_agent.prompt_budget")
+
+# tiktoken 导入会加载 regex 等扩展，只在首次计数时导入
+HAS_TIKTOKEN = importlib.util.find_spec("tiktoken") is not None
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 6000
+DEFAULT_ENCODING = "cl100k_base"
+
+# 列表段落截断最后一条时，剩余预算低于该值则整条丢弃
+_MIN_PARTIAL_ITEM_TOKENS = 32
+
+_config_lock = threading.Lock()
+_prompt_token_budget = DEFAULT_PROMPT_TOKEN_BUDGET
+_encoding_name = DEFAULT_ENCODING
+_encoding: Any = None
+_encoding_failed = False
+
+_WS_RE = re.compile(r"\s+")
+
+
+# ===== 配置 =====
+
+def configure_prompt_budget(max_tokens: Optional[int] = None, encoding: Optional[str] = None) -> None:
+    """设置全局 prompt token 预算与分词编码（启动时由 SystemInitializer 调用）"""
+    global _prompt_token_budget, _encoding_name, _encoding, _encoding_failed
+    with _config_lock:
+        if max_tokens:
+            _prompt_token_budget = int(max_tokens)
+        if encoding and encoding != _encoding_name:
+            _encoding_name = encoding
+            _encoding = None
+            _encoding_failed = False
+            count_tokens.cache_clear()
+
+
+def get_prompt_token_budget() -> int:
+    return _prompt_token_budget
+
+
+def tokenizer_name() -> str:
+    """当前使用的计数方式（tiktoken 编码名或 estimate）"""
+    return _encoding_name if _get_encoding() is not None else "estimate"
+
+
+# ===== token 计数 =====
+
+def _get_encoding() -> Any:
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed or not HAS_TIKTOKEN:
+        return _encoding
+    with _config_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(_encoding_name)
+            except Exception as e:  # noqa: BLE001 - 编码文件下载失败等
+                _encoding_failed = True
+                logger.warning(f"⚠️  tiktoken 编码 {_encoding_name} 加载失败，改用估算计数: {e.__class__.__name__}")
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """无分词器时的估算：非 ASCII 字符每字 1 个 token，ASCII 每 4 字符 1 个 token"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """文本的 token 数（规则、模板等重复文本命中缓存）"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Sequence[dict[str, str]]) -> int:
+    """消息数组的 token 数（每条消息另计 4 个格式 token）"""
+    return sum(count_tokens(str(m.get("content") or "")) + 4 for m in messages) + 2
+
+
+def truncate_to_tokens(text: str, max_tokens: int, *, keep: str = "head", marker: str = "…") -> str:
+    """截断到不超过 max_tokens（含省略标记）
+
+    Args:
+        keep: "head" 保留开头（截掉末尾），"tail" 保留末尾（截掉开头，适合对话历史）
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens - count_tokens(marker)
+    if limit <= 0:
+        return ""
+
+    def piece(n: int) -> str:
+        return text[:n] if keep == "head" else text[len(text) - n:]
+
+    # 按字符数二分，找到不超过 limit 的最长片段（对 tiktoken 与估算计数都适用）
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(piece(mid)) <= limit:
+            lo = mid
+        else:
+            hi = mid - 1
+    return piece(lo) + marker if keep == "head" else marker + piece(lo)
+
+
+# ===== 去重 =====
+
+def _normalize(text: str) -> str:
+    return _WS_RE.sub("", text)
+
+
+def dedupe_texts(items: Iterable[str]) -> list[str]:
+    """去除规范化（去空白）后相同、或被其他条目包含的条目，保持原顺序"""
+    kept: list[tuple[str, str]] = []
+    for item in items:
+        norm = _normalize(item)
+        if not norm or any(norm in other for _, other in kept):
+            continue
+        # 新条目包含之前的较短条目时，占据第一条的位置并删除其余被包含的条目
+        contained = [i for i, (_, other) in enumerate(kept) if other in norm]
+        if contained:
+            kept[contained[0]] = (item, norm)
+            for i in reversed(contained[1:]):
+                del kept[i]
+        else:
+            kept.append((item, norm))
+    return [item for item, _ in kept]
+
+
+def dedupe_chunks(chunks: Sequence[dict[str, Any]]) -> list[dict[str, Any]]:
+    """检索片段去重：同一 (doc_id, chunk_id) 或正文相同 / 被包含的片段只保留一次"""
+    seen_ids: set = set()
+    unique: list[dict[str, Any]] = []
+    for c in chunks:
+        chunk_key = (c.get("doc_id"), c.get("chunk_id"))
+        if chunk_key[0] is not None and chunk_key[1] is not None:
+            if chunk_key in seen_ids:
+                continue
+            seen_ids.add(chunk_key)
+        unique.append(c)
+    texts = [str(c.get("text") or "") for c in unique]
+    kept_texts = set(dedupe_texts(texts))
+    result, used = [], set()
+    for c, text in zip(unique, texts):
+        if text in kept_texts and text not in used:
+            used.add(text)
+            result.append(c)
+    return result
+
+
+# ===== 预算分配 =====
+
+@dataclass
+class _Section:
+    name: str
+    text: str = ""
+    items: Optional[list[str]] = None
+    priority: int = 0
+    min_tokens: int = 0
+    keep: str = "head"
+    separator: str = "\n"
+    required: bool = False
+    tokens: int = 0
+    allocated: int = 0
+
+
+@dataclass
+class BudgetReport:
+    """一次预算分配的结果统计"""
+
+    max_tokens: int
+    used_tokens: int = 0
+    trimmed_tokens: int = 0
+    sections: dict[str, dict[str, int]] = field(default_factory=dict)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.used_tokens > self.max_tokens
+
+
+class PromptBudget:
+    """按优先级在提示词各段落之间分配 token 预算"""
+
+    def __init__(self, max_tokens: Optional[int] = None, *, reserved_tokens: int = 0, nested: bool = False):
+        """
+        Args:
+            max_tokens: 本次调用的 prompt token 上限（默认取全局配置 llm.prompt_token_budget）
+            reserved_tokens: 预留给未纳入分配的内容（如固定的 system 提示词、多轮消息格式）
+            nested: 结果将作为外层预算的段落（只计裁剪量，组装量由外层 build 计入）
+        """
+        self.max_tokens = int(max_tokens or get_prompt_token_budget())
+        self.reserved_tokens = max(0, int(reserved_tokens))
+        self.nested = nested
+        self._sections: list[_Section] = []
+        self.report: Optional[BudgetReport] = None
+
+    def fixed(self, name: str, text: str) -> "PromptBudget":
+        """必需段落（规则、输出格式等），完整保留"""
+        self._sections.append(_Section(name=name, text=text, required=True, tokens=count_tokens(text)))
+        return self
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        *,
+        priority: int = 0,
+        min_tokens: int = 0,
+        keep: str = "head",
+    ) -> "PromptBudget":
+        """可截断的文本段落（priority 越大越优先保留）"""
+        self._sections.append(_Section(
+            name=name, text=text, priority=priority, min_tokens=min_tokens, keep=keep,
+            tokens=count_tokens(text),
+        ))
+        return self
+
+    def add_items(
+        self,
+        name: str,
+        items: Iterable[str],
+        *,
+        priority: int = 0,
+        min_tokens: int = 0,
+        max_item_tokens: Optional[int] = None,
+        separator: str = "\n",
+        dedupe: bool = True,
+        keep: str = "head",
+    ) -> "PromptBudget":
+        """列表段落（知识片段、检查结果、对话轮次），按条保留
+
+        Args:
+            max_item_tokens: 单条上限（超出截断）
+            keep: "head" 优先保留靠前的条目（检索结果按相关度排序），"tail" 优先保留靠后的条目（最近的对话）
+        """
+        items = [str(item) for item in items if str(item).strip()]
+        if dedupe:
+            items = dedupe_texts(items)
+        if max_item_tokens:
+            items = [truncate_to_tokens(item, max_item_tokens) for item in items]
+        text = separator.join(items)
+        self._sections.append(_Section(
+            name=name, text=text, items=items, priority=priority, min_tokens=min_tokens,
+            keep=keep, separator=separator, tokens=count_tokens(text),
+        ))
+        return self
+
+    def build(self) -> dict[str, str]:
+        """分配预算并返回 {段落名: 文本}"""
+        remaining = self.max_tokens - self.reserved_tokens
+        for section in self._sections:
+            if section.required:
+                section.allocated = section.tokens
+                remaining -= section.tokens
+
+        optional = sorted(
+            (s for s in self._sections if not s.required), key=lambda s: s.priority, reverse=True
+        )
+        for section in optional:  # 第一轮：保底 min_tokens
+            grant = max(0, min(section.tokens, section.min_tokens, remaining))
+            section.allocated = grant
+            remaining -= grant
+        for section in optional:  # 第二轮：按优先级补足
+            grant = max(0, min(section.tokens - section.allocated, remaining))
+            section.allocated += grant
+            remaining -= grant
+
+        report = BudgetReport(max_tokens=self.max_tokens)
+        parts: dict[str, str] = {}
+        for section in self._sections:
+            text = section.text if section.allocated >= section.tokens else self._fit(section)
+            used = count_tokens(text)
+            parts[section.name] = text
+            report.used_tokens += used
+            report.trimmed_tokens += max(0, section.tokens - used)
+            report.sections[section.name] = {"tokens": section.tokens, "used": used}
+        report.used_tokens += self.reserved_tokens
+        self.report = report
+        record_prompt_budget(0 if self.nested else report.used_tokens, report.trimmed_tokens)
+        if report.trimmed_tokens:
+            trimmed = {
+                name: s["tokens"] - s["used"] for name, s in report.sections.items() if s["tokens"] > s["used"]
+            }
+            logger.debug(f"  ✂️  prompt 超出预算 {self.max_tokens} tokens，已裁剪: {trimmed}")
+        return parts
+
+    @staticmethod
+    def _fit(section: _Section) -> str:
+        if section.items is None:
+            return truncate_to_tokens(section.text, section.allocated, keep=section.keep)
+        budget = section.allocated
+        ordered = section.items if section.keep == "head" else list(reversed(section.items))
+        chosen: list[str] = []
+        sep_tokens = count_tokens(section.separator) if section.separator.strip() else 0
+        for item in ordered:
+            cost = count_tokens(item) + (sep_tokens if chosen else 0)
+            if cost <= budget:
+                chosen.append(item)
+                budget -= cost
+                continue
+            if budget >= _MIN_PARTIAL_ITEM_TOKENS:
+                chosen.append(truncate_to_tokens(item, budget - sep_tokens, keep=section.keep))
+            break
+        if section.keep != "head":
+            chosen.reverse()
+        return section.separator.join(chosen)
+
+
+# ===== 常用格式化 =====
+
+def format_chunks(
+    chunks: Sequence[dict[str, Any]],
+    max_tokens: int,
+    *,
+    max_chunk_tokens: int = 240,
+    with_chunk_id: bool = True,
+    nested: bool = False,
+) -> str:
+    """检索片段去重后按相关度顺序拼接，整体不超过 max_tokens（nested 见 PromptBudget）"""
+    lines = []
+    for c in dedupe_chunks(chunks):
+        text = str(c.get("text") or "").replace("\n", " ").strip()
+        label = f"{c.get('doc_id')}#{c.get('chunk_id')}" if with_chunk_id else f"{c.get('doc_id')}"
+        lines.append(f"[{label}] {text}")
+    return PromptBudget(max_tokens, nested=nested).add_items(
+        "chunks", lines, max_item_tokens=max_chunk_tokens, dedupe=False
+    ).build()["chunks"]
+
+
+def dumps_within(obj: Any, max_tokens: int, *, indent: Optional[int] = 2) -> str:
+    """JSON 序列化后截断到 max_tokens（结构化信息超长时保留开头）"""
+    return truncate_to_tokens(json.dumps(obj, ensure_ascii=False, indent=indent), max_tokens)
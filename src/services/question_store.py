@@ -0,0 +1,188 @@
+"""单次就诊的已问问题库 - 重复问题检测
+
+每个问题加入时只做一次归一化与特征计算，之后判断新问题是否重复时，
+与每个已存问题的比较都是固定代价：
+- 归一化文本完全相同（集合查找）
+- 关键词重叠度（原有规则，关键词集合在加入时缓存）
+- 字符 n-gram 的 MinHash 签名估计 Jaccard 相似度（对中文改写比整句关键词更敏感）
+- 可选：共享嵌入模型的句向量余弦相似度（向量按问题缓存，只在模型已加载时使用，不触发加载）
+"""
+from __future__ import annotations
+
+import random
+import re
+import unicodedata
+import zlib
+from typing import Any, Callable, Optional, Sequence
+
+Embedder = Callable[[str], Sequence[float]]
+
+# 归一化时去掉的语气词、称呼与疑问框架（不影响问题所问的内容）
+FILLER_WORDS = (
+    "请问", "有没有", "是不是", "是否", "一下", "您", "你",
+    "的", "了", "吗", "呢", "啊", "吧", "呀", "还", "也", "都",
+)
+# 原关键词规则的停用词与可单独作为关键词的单字
+KEYWORD_STOP_WORDS = frozenset({
+    "的", "了", "吗", "呢", "啊", "您", "你", "有没有", "是不是", "还", "也", "都", "和", "或者", "以及",
+})
+IMPORTANT_SINGLE_CHARS = frozenset({"痛", "疼", "麻", "红", "肿", "热", "冷", "晕", "吐", "泻"})
+
+NGRAM = 2  # 字符 n-gram 长度
+NUM_PERMUTATIONS = 64  # MinHash 签名长度
+MINHASH_THRESHOLD = 0.7  # Jaccard 估计值达到此值视为重复
+KEYWORD_THRESHOLD = 0.55  # 关键词重叠度超过此值视为重复
+EMBEDDING_THRESHOLD = 0.92  # 句向量余弦相似度达到此值视为重复（向量已归一化）
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = tuple(
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+)
+_FILLER_RE = re.compile("|".join(map(re.escape, sorted(FILLER_WORDS, key=len, reverse=True))))
+_NON_WORD_RE = re.compile(r"[^\w]")
+
+
+def normalize_question(text: str) -> str:
+    """NFKC 归一化、小写、去掉标点空白与语气词"""
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    text = _NON_WORD_RE.sub("", text)
+    return _FILLER_RE.sub("", text)
+
+
+def question_keywords(text: str) -> frozenset[str]:
+    """原有的关键词提取：按非单词字符切分，去停用词和不重要的单字"""
+    words = _NON_WORD_RE.sub(" ", str(text or "").lower().strip("？?。. ")).split()
+    return frozenset(
+        w for w in words
+        if w not in KEYWORD_STOP_WORDS and (len(w) > 1 or w in IMPORTANT_SINGLE_CHARS)
+    )
+
+
+def minhash_signature(normalized: str) -> tuple[int, ...]:
+    """字符 n-gram 集合的 MinHash 签名（文本短于 n 时整体作为一个 gram）"""
+    grams = {normalized[i:i + NGRAM] for i in range(max(1, len(normalized) - NGRAM + 1))}
+    hashes = [zlib.crc32(gram.encode("utf-8")) for gram in grams]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def _signature_similarity(left: tuple[int, ...], right: tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERMUTATIONS
+
+
+def _dot(left: Sequence[float], right: Sequence[float]) -> float:
+    return float(sum(x * y for x, y in zip(left, right)))
+
+
+def loaded_embedder(retriever: Any) -> Optional[Embedder]:
+    """取 RAG 检索器已加载的嵌入模型（未加载时返回 None，不触发模型加载）"""
+    for candidate in (
+        retriever,
+        getattr(retriever, "_simple_retriever", None),
+        getattr(retriever, "_hybrid_retriever", None),
+    ):
+        embeddings = getattr(candidate, "_embeddings", None)
+        if embeddings is not None:
+            return embeddings.embed_query
+    return None
+
+
+class _StoredQuestion:
+    __slots__ = ("text", "keywords", "signature", "vector")
+
+    def __init__(self, text: str, normalized: str):
+        self.text = text
+        self.keywords = question_keywords(text)
+        self.signature = minhash_signature(normalized)
+        self.vector: Optional[Sequence[float]] = None
+
+
+class QuestionStore:
+    """单次就诊的已问问题库（换患者时 clear）"""
+
+    def __init__(
+        self,
+        *,
+        minhash_threshold: float = MINHASH_THRESHOLD,
+        keyword_threshold: float = KEYWORD_THRESHOLD,
+        embedding_threshold: float = EMBEDDING_THRESHOLD,
+    ):
+        self.minhash_threshold = minhash_threshold
+        self.keyword_threshold = keyword_threshold
+        self.embedding_threshold = embedding_threshold
+        self._items: list[_StoredQuestion] = []
+        self._normalized: set[str] = set()
+        self._synced = 0  # sync() 已对齐的列表长度
+        self._synced_last: Optional[str] = None  # 上次对齐时列表的末项
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._normalized.clear()
+        self._synced = 0
+        self._synced_last = None
+
+    def add(self, question: str) -> None:
+        """加入一个已问问题（空问题忽略）"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        self._items.append(_StoredQuestion(question, normalized))
+        self._normalized.add(normalized)
+
+    def sync(self, questions: Sequence[str]) -> None:
+        """与按时间追加的已问问题列表对齐：只加入新增部分；列表变短或上次的末项变了（已重置）时重建
+
+        只比较长度与上次对齐时的末项，不逐项比对，每次调用的开销只与新增部分有关。
+        """
+        synced = self._synced
+        if len(questions) < synced or (synced and questions[synced - 1] != self._synced_last):
+            self.clear()
+            synced = 0
+        for question in questions[synced:]:
+            self.add(question)
+        self._synced = len(questions)
+        self._synced_last = questions[-1] if questions else None
+
+    def is_duplicate(self, question: str, embed: Optional[Embedder] = None) -> bool:
+        """判断新问题是否与已存问题重复
+
+        Args:
+            question: 候选问题
+            embed: 句向量函数（传入时额外比较语义相似度；已存问题的向量算一次后缓存）
+        """
+        normalized = normalize_question(question)
+        if not normalized or not self._items:
+            return False
+        if normalized in self._normalized:
+            return True
+
+        keywords = question_keywords(question)
+        signature = minhash_signature(normalized)
+        for item in self._items:
+            if keywords and item.keywords:
+                overlap = len(keywords & item.keywords) / min(len(keywords), len(item.keywords))
+                if overlap > self.keyword_threshold:
+                    return True
+            if _signature_similarity(signature, item.signature) >= self.minhash_threshold:
+                return True
+
+        if embed is None:
+            return False
+        try:
+            vector = embed(question)
+            for item in self._items:
+                if item.vector is None:
+                    item.vector = embed(item.text)
+                if _dot(vector, item.vector) >= self.embedding_threshold:
+                    return True
+        except Exception:
+            # 嵌入失败时只按文本特征判断
+            return False
+        return False
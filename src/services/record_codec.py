@@ -0,0 +1,278 @@
+"""
+病例快照编解码器 - 可插拔存储格式
+Medical Record Codecs
+
+- json-pretty   缩进 JSON（<patient_id>.json），便于调试，与历史格式一致
+- orjson        紧凑 JSON（<patient_id>.json），orjson 编解码
+- msgpack-zstd  MessagePack + zstd 压缩（<patient_id>.mrz），生产推荐
+
+读取时按文件内容自动识别格式（zstd 帧魔数 / JSON），因此切换编码后旧文件仍可透明读取；
+下次压缩写入时会以新格式落盘并删除旧格式快照。
+
+迁移与基准：
+    python -m services.record_codec migrate --dir ./medical_records --to msgpack-zstd
+    python -m services.record_codec bench --visits 20
+"""
+from __future__ import annotations
+
+import json
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import ormsgpack
+    import zstandard
+    HAS_MSGPACK_ZSTD = True
+except ImportError:
+    HAS_MSGPACK_ZSTD = False
+
+from utils import get_logger
+
+logger = get_logger("hospital_agent.medical_record")
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"  # zstd 帧魔数
+
+
+class RecordCodec(ABC):
+    """病例快照编解码器基类"""
+
+    name: str = ""
+    suffix: str = ".json"
+
+    @abstractmethod
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        """病例字典 → 快照字节"""
+
+    @abstractmethod
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        """快照字节 → 病例字典"""
+
+
+class JsonPrettyCodec(RecordCodec):
+    """缩进 JSON（历史默认格式）"""
+
+    name = "json-pretty"
+    suffix = ".json"
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        if HAS_ORJSON:
+            return orjson.loads(payload)
+        return json.loads(payload.decode("utf-8"))
+
+
+class OrjsonCodec(RecordCodec):
+    """紧凑 JSON（orjson）"""
+
+    name = "orjson"
+    suffix = ".json"
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        if HAS_ORJSON:
+            return orjson.dumps(data)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        if HAS_ORJSON:
+            return orjson.loads(payload)
+        return json.loads(payload.decode("utf-8"))
+
+
+class MsgpackZstdCodec(RecordCodec):
+    """MessagePack + zstd"""
+
+    name = "msgpack-zstd"
+    suffix = ".mrz"
+
+    def __init__(self, level: int = 3):
+        if not HAS_MSGPACK_ZSTD:
+            raise ImportError("msgpack-zstd 编码需要安装 ormsgpack 与 zstandard")
+        self.level = level
+        # zstd 压缩/解压上下文非线程安全，按调用创建（开销很小）
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        packed = ormsgpack.packb(data)
+        return zstandard.ZstdCompressor(level=self.level).compress(packed)
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        return ormsgpack.unpackb(zstandard.ZstdDecompressor().decompress(payload))
+
+
+_CODECS = {
+    JsonPrettyCodec.name: JsonPrettyCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgpackZstdCodec.name: MsgpackZstdCodec,
+}
+
+SNAPSHOT_SUFFIXES = (".json", ".mrz")
+
+
+def get_codec(name: str) -> RecordCodec:
+    """按名称获取编解码器；依赖缺失时降级为 json-pretty"""
+    codec_cls = _CODECS.get(name)
+    if codec_cls is None:
+        raise ValueError(f"未知的病例编码: {name}（可选: {', '.join(_CODECS)}）")
+    try:
+        return codec_cls()
+    except ImportError as e:
+        logger.warning(f"⚠️  {e}，病例编码降级为 json-pretty")
+        return JsonPrettyCodec()
+
+
+def decode_any(payload: bytes) -> Dict[str, Any]:
+    """按内容自动识别格式解码（兼容所有历史格式）"""
+    if payload[:4] == ZSTD_MAGIC:
+        if not HAS_MSGPACK_ZSTD:
+            raise ImportError("读取 msgpack-zstd 病例需要安装 ormsgpack 与 zstandard")
+        return ormsgpack.unpackb(zstandard.ZstdDecompressor().decompress(payload))
+    if HAS_ORJSON:
+        return orjson.loads(payload)
+    return json.loads(payload.decode("utf-8"))
+
+
+def read_snapshot(path: Path) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return decode_any(f.read())
+
+
+def write_snapshot(path: Path, data: Dict[str, Any], codec: RecordCodec) -> None:
+    """原子写入快照：写临时文件并 fsync 后再替换，崩溃时旧快照保持完整；随后删除其他格式的旧快照"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(codec.encode(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    for suffix in SNAPSHOT_SUFFIXES:
+        stale = path.with_suffix(suffix)
+        if stale != path and stale.exists():
+            stale.unlink()
+
+
+def find_snapshot(storage_dir: Path, patient_id: str, codec: Optional[RecordCodec] = None) -> Path:
+    """查找患者快照文件（优先当前编码的后缀）；都不存在时返回当前编码对应的路径"""
+    preferred = codec.suffix if codec else SNAPSHOT_SUFFIXES[0]
+    candidates = [preferred] + [s for s in SNAPSHOT_SUFFIXES if s != preferred]
+    for suffix in candidates:
+        path = storage_dir / f"{patient_id}{suffix}"
+        if path.exists():
+            return path
+    return storage_dir / f"{patient_id}{preferred}"
+
+
+def iter_snapshot_files(storage_dir: Path) -> Iterator[Path]:
+    """遍历目录下所有格式的病例快照"""
+    for suffix in SNAPSHOT_SUFFIXES:
+        yield from storage_dir.glob(f"*{suffix}")
+
+
+def migrate_directory(storage_dir: Path, target: str) -> Dict[str, int]:
+    """将目录下所有快照转换为目标编码（原子替换，旧格式文件随后删除）"""
+    codec = get_codec(target)
+    stats = {"converted": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    for path in sorted(iter_snapshot_files(storage_dir)):
+        try:
+            payload = path.read_bytes()
+            data = decode_any(payload)
+            encoded = codec.encode(data)
+            stats["bytes_before"] += len(payload)
+            stats["bytes_after"] += len(encoded)
+            if path.suffix == codec.suffix and payload == encoded:
+                stats["skipped"] += 1
+                continue
+            write_snapshot(path.with_suffix(codec.suffix), data, codec)
+            stats["converted"] += 1
+        except Exception as e:
+            stats["failed"] += 1
+            logger.error(f"迁移病例失败: {path}, 错误: {e}")
+    return stats
+
+
+def _build_benchmark_records(count: int, visits: int) -> List[Dict[str, Any]]:
+    """用 MedicalRecordService 的真实流程构造多次就诊病例"""
+    import tempfile
+    from .medical_record import MedicalRecordService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 刷盘间隔设大：构造过程只在内存中进行
+        service = MedicalRecordService(storage_dir=Path(tmp), flush_interval=3600)
+        records = []
+        for i in range(count):
+            pid = f"bench_{i:03d}"
+            service.create_record(pid, {"name": f"患者{i}", "age": 40 + i % 30, "gender": "女", "case_id": i})
+            for v in range(visits):
+                service.add_triage(pid, "neurology", f"反复头痛{v + 1}个月，伴恶心呕吐，劳累后加重")
+                service.add_vital_signs(pid, {"heart_rate": 72 + v, "blood_pressure_sys": 128, "temperature": 36.6}, "triage")
+                conversation = []
+                for q in range(8):
+                    conversation.append({"role": "doctor", "content": f"第{q + 1}个问题：头痛的部位、性质、持续时间如何？有无先兆？"})
+                    conversation.append({"role": "patient", "content": "主要是右侧太阳穴附近搏动性疼痛，每次持续4到6小时，发作前偶尔眼前闪光。"})
+                service.add_consultation(pid, "DOC001", conversation, {"present_illness": "反复发作性头痛" * 5}, {"神经系统": "未见明显异常"})
+                service.add_lab_test(pid, "血常规", {"WBC": 6.2, "RBC": 4.5, "HGB": 132, "PLT": 210, "summary": "未见明显异常"})
+                service.add_imaging(pid, "头颅MRI", {"findings": "脑实质未见明确异常信号" * 3, "summary": "未见异常"})
+                service.add_diagnosis(pid, "DOC001", {"name": "偏头痛", "reasoning": "典型搏动性单侧头痛伴先兆" * 4})
+                service.add_prescription(pid, "DOC001", [{"name": "布洛芬缓释胶囊", "dosage": "0.3g", "frequency": "bid"}])
+            records.append(service.get_record(pid).to_dict())
+        service.close()
+    return records
+
+
+def run_benchmark(count: int = 20, visits: int = 10, repeat: int = 3) -> None:
+    """对比各编码的保存/加载耗时与文件大小"""
+    import tempfile
+    import time
+
+    records = _build_benchmark_records(count, visits)
+    print(f"样本: {count} 份病例 × {visits} 次就诊，平均条目数 {sum(len(r['entries']) for r in records) / count:.0f}")
+    print(f"{'编码':<14} {'平均大小KB':>10} {'保存ms/份':>10} {'加载ms/份':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        for name in _CODECS:
+            codec = get_codec(name)
+            if codec.name != name:
+                print(f"{name:<14} {'（依赖缺失，跳过）':>10}")
+                continue
+            paths = [tmp_dir / f"{name}_{i}{codec.suffix}" for i in range(count)]
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for path, data in zip(paths, records):
+                    write_snapshot(path, data, codec)
+            save_ms = (time.perf_counter() - start) * 1000 / (repeat * count)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for path in paths:
+                    read_snapshot(path)
+            load_ms = (time.perf_counter() - start) * 1000 / (repeat * count)
+            size_kb = sum(p.stat().st_size for p in paths) / count / 1024
+            print(f"{name:<14} {size_kb:>10.1f} {save_ms:>10.2f} {load_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="病例编码迁移 / 基准工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = sub.add_parser("migrate", help="将目录下的病例快照转换为目标编码")
+    migrate_parser.add_argument("--dir", default="./medical_records")
+    migrate_parser.add_argument("--to", default="msgpack-zstd", choices=list(_CODECS))
+    bench_parser = sub.add_parser("bench", help="比较各编码的保存/加载耗时与文件大小")
+    bench_parser.add_argument("--records", type=int, default=20)
+    bench_parser.add_argument("--visits", type=int, default=10)
+    bench_parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        result = migrate_directory(Path(args.dir), args.to)
+        print(f"迁移完成: {result}")
+    else:
+        run_benchmark(args.records, args.visits, args.repeat)
@@ -0,0 +1,253 @@
+"""
+病例元数据索引 - 存储目录旁的 SQLite 侧车索引
+Medical Record Metadata Index
+
+search_records 不再遍历并完整解析每个 <patient_id>.json，而是查询索引：
+- 每次病例落盘时同步更新索引（写回模式下由后台写线程批量更新，同一事务）
+- 字段：patient_id, record_id, dept, status, 首次/最近就诊时间, 最近诊断名称, visit_id
+- dept / status / last_visit_at / diagnosis 建立索引，支持分页
+
+已有目录（或索引损坏）可重建：
+    python -m services.record_index rebuild --dir ./medical_records
+    python -m services.record_index query --dir ./medical_records --dept neurology --limit 20
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from utils import get_logger
+from .record_codec import iter_snapshot_files
+
+if TYPE_CHECKING:
+    from .medical_record import MedicalRecord
+
+logger = get_logger("hospital_agent.medical_record")
+
+INDEX_FILENAME = "_record_index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    patient_id     TEXT PRIMARY KEY,
+    record_id      TEXT,
+    dept           TEXT,
+    status         TEXT,
+    visit_id       TEXT,
+    first_visit_at TEXT,
+    last_visit_at  TEXT,
+    last_updated   TEXT,
+    diagnosis      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_dept ON records(dept);
+CREATE INDEX IF NOT EXISTS idx_records_status ON records(status);
+CREATE INDEX IF NOT EXISTS idx_records_dept_status ON records(dept, status);
+CREATE INDEX IF NOT EXISTS idx_records_last_visit ON records(last_visit_at);
+CREATE INDEX IF NOT EXISTS idx_records_diagnosis ON records(diagnosis);
+CREATE INDEX IF NOT EXISTS idx_records_record_id ON records(record_id);
+"""
+
+_COLUMNS = (
+    "patient_id", "record_id", "dept", "status", "visit_id",
+    "first_visit_at", "last_visit_at", "last_updated", "diagnosis",
+)
+
+# 精确匹配的查询条件 -> 列名
+_EQUALITY_CRITERIA = {
+    "patient_id": "patient_id",
+    "record_id": "record_id",
+    "dept": "dept",
+    "status": "status",
+    "visit_id": "visit_id",
+    "diagnosis": "diagnosis",
+}
+
+# 标记一次新就诊的条目类型
+_VISIT_ENTRY_TYPES = ("record_created", "visit_started")
+
+
+def record_metadata(record: "MedicalRecord") -> Dict[str, Any]:
+    """提取病例的索引字段"""
+    last_visit_at = record.created_at
+    for entry in reversed(record.entries):
+        if entry.entry_type in _VISIT_ENTRY_TYPES:
+            last_visit_at = entry.timestamp
+            break
+
+    diagnosis = None
+    if record.diagnoses:
+        latest = record.diagnoses[-1].get("diagnosis")
+        if isinstance(latest, dict):
+            diagnosis = latest.get("name")
+
+    profile = record.patient_profile or {}
+    return {
+        "patient_id": record.patient_id,
+        "record_id": record.record_id,
+        "dept": record.current_dept,
+        "status": record.current_status,
+        "visit_id": profile.get("visit_id"),
+        "first_visit_at": record.created_at,
+        "last_visit_at": last_visit_at,
+        "last_updated": record.last_updated,
+        "diagnosis": diagnosis,
+    }
+
+
+class RecordIndex:
+    """病例元数据索引（SQLite，线程安全）"""
+
+    def __init__(self, storage_dir: Path):
+        self.storage_dir = storage_dir
+        self.path = storage_dir / INDEX_FILENAME
+        self._lock = threading.Lock()
+        storage_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    # ===== 写入 =====
+
+    def upsert_many(self, records: Iterable["MedicalRecord"]) -> int:
+        """批量写入/更新索引（单事务）"""
+        rows = [tuple(record_metadata(r)[c] for c in _COLUMNS) for r in records]
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        sql = f"INSERT OR REPLACE INTO records ({', '.join(_COLUMNS)}) VALUES ({placeholders})"
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+        return len(rows)
+
+    def upsert(self, record: "MedicalRecord") -> None:
+        self.upsert_many([record])
+
+    def remove(self, patient_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM records WHERE patient_id = ?", (patient_id,))
+            self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+
+    # ===== 查询 =====
+
+    def _where(self, criteria: Dict[str, Any]) -> tuple:
+        clauses: List[str] = []
+        params: List[Any] = []
+        for key, value in criteria.items():
+            column = _EQUALITY_CRITERIA.get(key)
+            if column is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+            elif key == "diagnosis_like":
+                clauses.append("diagnosis LIKE ?")
+                params.append(f"%{value}%")
+            elif key == "visit_from":
+                clauses.append("last_visit_at >= ?")
+                params.append(str(value))
+            elif key == "visit_to":
+                clauses.append("last_visit_at < ?")
+                params.append(str(value))
+            else:
+                raise ValueError(f"不支持的索引查询条件: {key}")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, limit: Optional[int] = None, offset: int = 0,
+              order_by: str = "last_visit_at DESC", **criteria) -> List[Dict[str, Any]]:
+        """
+        按条件查询索引（分页）
+
+        Args:
+            limit: 每页条数（None 表示不限）
+            offset: 偏移量
+            order_by: 排序（列名 + ASC/DESC）
+            **criteria: patient_id / record_id / dept / status / visit_id / diagnosis（精确），
+                        diagnosis_like（模糊），visit_from / visit_to（按最近就诊时间 ISO 字符串区间）
+
+        Returns:
+            元数据字典列表
+        """
+        column, _, direction = order_by.partition(" ")
+        if column not in _COLUMNS or direction.upper() not in ("", "ASC", "DESC"):
+            raise ValueError(f"不支持的排序: {order_by}")
+        where, params = self._where(criteria)
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM records{where} ORDER BY {order_by}, patient_id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            params.append(int(offset))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def count(self, **criteria) -> int:
+        """满足条件的记录数（用于分页）"""
+        where, params = self._where(criteria)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM records{where}", params).fetchone()[0]
+
+    # ===== 重建 =====
+
+    def rebuild(self, load_record) -> int:
+        """
+        扫描存储目录重建索引
+
+        Args:
+            load_record: Path -> Optional[MedicalRecord] 的加载函数（快照 + 日志重放）
+
+        Returns:
+            索引的病例数
+        """
+        records = []
+        for record_file in sorted(iter_snapshot_files(self.storage_dir)):
+            record = load_record(record_file)
+            if record is not None:
+                records.append(record)
+        with self._lock:
+            self._conn.execute("DELETE FROM records")
+            self._conn.commit()
+        count = self.upsert_many(records)
+        logger.info(f"病例索引已重建: {count} 条 ({self.path})")
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from .medical_record import MedicalRecordService
+
+    parser = argparse.ArgumentParser(description="病例元数据索引工具")
+    parser.add_argument("command", choices=["rebuild", "query"])
+    parser.add_argument("--dir", default="./medical_records", help="病例存储目录")
+    parser.add_argument("--dept")
+    parser.add_argument("--status")
+    parser.add_argument("--diagnosis")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--offset", type=int, default=0)
+    args = parser.parse_args()
+
+    service = MedicalRecordService(storage_dir=Path(args.dir), write_behind=False)
+    if args.command == "rebuild":
+        print(f"已索引 {service.rebuild_index()} 条病例")
+    else:
+        criteria = {k: v for k, v in (("dept", args.dept), ("status", args.status),
+                                       ("diagnosis", args.diagnosis)) if v}
+        total = service.record_index.count(**criteria)
+        rows = service.record_index.query(limit=args.limit, offset=args.offset, **criteria)
+        print(f"共 {total} 条，显示 {args.offset + 1}-{args.offset + len(rows)}")
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
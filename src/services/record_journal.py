@@ -0,0 +1,349 @@
+"""
+病例写回缓存（write-behind）- 追加式条目日志 + 定期压缩
+Medical Record Write-Behind Journal
+
+磁盘布局（每位患者）：
+- <patient_id>.json|.mrz      快照（格式由 RecordCodec 决定，见 record_codec.py）
+- <patient_id>.entries.jsonl  追加日志：每行为一次刷盘的增量
+    {"seq": n, "ts": ..., "append": {列表字段: [新增元素]}, "set": {标量字段/patient_profile}}
+
+add_* 只在内存中修改病例并标记为脏；后台写线程按间隔合并脏病例，
+只把自上次刷盘以来新增的列表元素追加到日志（O(增量)，不再随病例变大而变慢）。
+日志行数达到阈值、患者出院或服务关闭时压缩：原子重写快照（临时文件 + fsync + os.replace）并清空日志。
+加载时读取快照并重放日志；快照记录已包含的日志序号（_journal_seq），
+压缩时若在"写快照"与"删日志"之间崩溃，重放会跳过已并入快照的行。
+
+注意：列表字段按"只追加"处理；若列表被截短会自动改为压缩写入。
+对已刷盘列表元素的原地修改只会在下次压缩时落盘。
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils import get_logger
+from .record_codec import JsonPrettyCodec, RecordCodec, find_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from .medical_record import MedicalRecord
+
+logger = get_logger("hospital_agent.medical_record")
+
+# MedicalRecord 中只追加的列表字段
+APPEND_FIELDS: Tuple[str, ...] = (
+    "entries",
+    "chief_complaints",
+    "vital_signs_history",
+    "diagnoses",
+    "prescriptions",
+    "lab_results",
+    "imaging_results",
+    "treatments",
+)
+
+# 每次刷盘整体覆盖的字段（体积小）
+SET_FIELDS: Tuple[str, ...] = (
+    "record_id",
+    "created_at",
+    "last_updated",
+    "patient_profile",
+    "current_status",
+    "current_location",
+    "current_dept",
+)
+
+LOG_SUFFIX = ".entries.jsonl"
+
+
+def log_path(storage_dir: Path, patient_id: str) -> Path:
+    return storage_dir / f"{patient_id}{LOG_SUFFIX}"
+
+
+def replay_log(data: Dict[str, Any], path: Path) -> Tuple[Dict[str, Any], int, int]:
+    """将追加日志重放到快照字典上（原地修改）
+
+    序号不大于快照 _journal_seq 的行已并入快照，跳过；
+    末尾不完整的行（崩溃时写了一半）会被忽略。
+
+    Returns:
+        (病例字典, 最新日志序号, 日志行数)
+    """
+    seq = int(data.get("_journal_seq", 0))
+    lines = 0
+    if not path.exists():
+        return data, seq, lines
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                delta = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"病例日志第{line_no}行损坏，已跳过: {path}")
+                continue
+            lines += 1
+            if delta.get("seq", 0) <= seq:
+                continue
+            seq = delta["seq"]
+            for key, items in delta.get("append", {}).items():
+                data.setdefault(key, []).extend(items)
+            data.update(delta.get("set", {}))
+    return data, seq, lines
+
+
+class RecordWriteBehind:
+    """病例写回缓存：后台线程合并脏病例并批量刷盘"""
+
+    def __init__(
+        self,
+        storage_dir: Path,
+        flush_interval: float = 2.0,
+        compact_every: int = 50,
+        fsync: bool = True,
+        codec: Optional[RecordCodec] = None,
+        on_persisted: Optional[Callable[[List["MedicalRecord"]], None]] = None,
+    ):
+        """
+        Args:
+            storage_dir: 病例存储目录
+            flush_interval: 后台刷盘间隔（秒）
+            compact_every: 单个病例日志达到多少行后压缩为快照
+            fsync: 每批刷盘后是否 fsync（关闭可提速，但断电时可能丢失最后一批）
+            codec: 快照编解码器（默认 json-pretty）
+            on_persisted: 每批落盘成功后的回调（如更新元数据索引）
+        """
+        self.storage_dir = storage_dir
+        self.flush_interval = flush_interval
+        self.compact_every = max(1, compact_every)
+        self.fsync = fsync
+        self.codec = codec or JsonPrettyCodec()
+        self.on_persisted = on_persisted
+
+        self._lock = threading.Lock()  # 保护 _dirty / _compact_requested
+        self._io_lock = threading.Lock()  # 串行化磁盘写入（后台线程与同步 flush 互斥）
+        self._dirty: Dict[str, "MedicalRecord"] = {}
+        self._compact_requested: Set[str] = set()
+
+        # 每个病例已落盘的列表长度 / 当前日志行数 / 单调递增的日志序号
+        self._records: Dict[str, "MedicalRecord"] = {}
+        self._flushed_lengths: Dict[str, Dict[str, int]] = {}
+        self._log_lines: Dict[str, int] = {}
+        self._seq: Dict[str, int] = {}
+
+        # 统计
+        self.flush_count = 0
+        self.compaction_count = 0
+        self.bytes_written = 0
+        self.last_flush_ms = 0.0
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="medical-record-writer", daemon=True
+        )
+        self._thread.start()
+
+        # 兜底：解释器正常退出时刷盘（弱引用，避免阻止回收）
+        self_ref = weakref.ref(self)
+        atexit.register(lambda: self_ref() and self_ref().close())
+
+    # ===== 生产者接口（患者线程调用，O(1)）=====
+
+    def mark_dirty(self, record: "MedicalRecord") -> None:
+        """标记病例待刷盘"""
+        with self._lock:
+            self._dirty[record.patient_id] = record
+            self._records[record.patient_id] = record
+
+    def request_compaction(self, record: "MedicalRecord") -> None:
+        """标记病例待压缩（如出院），并立即唤醒后台线程"""
+        with self._lock:
+            self._dirty[record.patient_id] = record
+            self._records[record.patient_id] = record
+            self._compact_requested.add(record.patient_id)
+        self._wakeup.set()
+
+    def pending_count(self) -> int:
+        """待刷盘病例数"""
+        with self._lock:
+            return len(self._dirty)
+
+    def mark_loaded(self, record: "MedicalRecord", seq: int = 0, log_lines: int = 0) -> None:
+        """记录从磁盘加载的病例的已落盘状态，后续只追加增量"""
+        with self._io_lock:
+            self._flushed_lengths[record.patient_id] = {
+                name: len(getattr(record, name)) for name in APPEND_FIELDS
+            }
+            self._seq[record.patient_id] = seq
+            self._log_lines[record.patient_id] = log_lines
+        with self._lock:
+            self._records[record.patient_id] = record
+
+    # ===== 刷盘 =====
+
+    def flush(self, patient_ids: Optional[Iterable[str]] = None, compact: bool = False) -> int:
+        """同步刷盘
+
+        Args:
+            patient_ids: 仅刷指定患者；None 表示全部脏病例
+            compact: 是否同时压缩为快照
+
+        Returns:
+            实际写入的病例数
+        """
+        with self._lock:
+            if patient_ids is None:
+                batch = self._dirty
+                self._dirty = {}
+                compact_ids = set(self._compact_requested)
+                self._compact_requested.clear()
+            else:
+                batch = {}
+                for pid in patient_ids:
+                    record = self._dirty.pop(pid, None)
+                    if record is not None:
+                        batch[pid] = record
+                compact_ids = self._compact_requested & set(batch)
+                self._compact_requested -= compact_ids
+
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        written: List["MedicalRecord"] = []
+        with self._io_lock:
+            self.storage_dir.mkdir(parents=True, exist_ok=True)
+            for pid, record in batch.items():
+                try:
+                    if compact or pid in compact_ids:
+                        self._compact(record)
+                    else:
+                        self._append_delta(record)
+                    written.append(record)
+                except RuntimeError:
+                    # 患者线程正在修改病例（字典迭代期间变化），留到下一轮
+                    self._requeue(record, compact or pid in compact_ids)
+                except Exception as e:
+                    logger.error(f"病例刷盘失败: {pid}, 错误: {e}")
+                    self._requeue(record, compact or pid in compact_ids)
+            if written and self.on_persisted is not None:
+                try:
+                    self.on_persisted(written)
+                except Exception as e:
+                    logger.error(f"病例落盘回调失败: {e}")
+        self.flush_count += 1
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return len(written)
+
+    def _requeue(self, record: "MedicalRecord", compact: bool) -> None:
+        with self._lock:
+            self._dirty.setdefault(record.patient_id, record)
+            if compact:
+                self._compact_requested.add(record.patient_id)
+
+    def _append_delta(self, record: "MedicalRecord") -> None:
+        pid = record.patient_id
+        flushed = self._flushed_lengths.get(pid)
+        if flushed is None or not find_snapshot(self.storage_dir, pid, self.codec).exists():
+            # 首次写入：直接生成快照
+            self._compact(record)
+            return
+
+        append: Dict[str, List[Any]] = {}
+        for name in APPEND_FIELDS:
+            items = getattr(record, name)
+            done = flushed.get(name, 0)
+            if len(items) < done:
+                # 列表被截短，增量无法表达，改为压缩
+                self._compact(record)
+                return
+            if len(items) > done:
+                tail = items[done:]
+                append[name] = [item.to_dict() for item in tail] if name == "entries" else tail
+
+        seq = self._seq.get(pid, 0) + 1
+        delta = {
+            "seq": seq,
+            "ts": time.time(),
+            "append": append,
+            "set": {name: getattr(record, name) for name in SET_FIELDS},
+        }
+        line = json.dumps(delta, ensure_ascii=False) + "\n"
+        with open(log_path(self.storage_dir, pid), "a", encoding="utf-8") as f:
+            f.write(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.bytes_written += len(line)
+        self._seq[pid] = seq
+        for name, items in append.items():
+            flushed[name] = flushed.get(name, 0) + len(items)
+        self._log_lines[pid] = self._log_lines.get(pid, 0) + 1
+
+        if self._log_lines[pid] >= self.compact_every:
+            self._compact(record)
+
+    def _compact(self, record: "MedicalRecord") -> None:
+        pid = record.patient_id
+        data = record.to_dict()
+        data["_journal_seq"] = self._seq.get(pid, 0)
+        write_snapshot(self.storage_dir / f"{pid}{self.codec.suffix}", data, self.codec)
+        # 快照已包含全部日志内容，删除日志
+        log_file = log_path(self.storage_dir, pid)
+        if log_file.exists():
+            log_file.unlink()
+        self._flushed_lengths[pid] = {name: len(data.get(name, [])) for name in APPEND_FIELDS}
+        self._log_lines[pid] = 0
+        self.compaction_count += 1
+        logger.debug(f"病例已压缩: {pid}")
+
+    # ===== 后台线程 =====
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"病例后台刷盘异常: {e}")
+
+    def close(self, compact: bool = True) -> None:
+        """停止后台线程并同步刷盘全部病例（可重复调用）
+
+        Args:
+            compact: 是否把日志未清空的病例全部压缩为快照
+        """
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._wakeup.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join(timeout=max(5.0, self.flush_interval * 2))
+        if compact:
+            with self._lock:
+                for pid, lines in list(self._log_lines.items()):
+                    if lines and pid in self._records:
+                        self._dirty.setdefault(pid, self._records[pid])
+        # 病例被并发修改时会重新入队，重试几次
+        for _ in range(3):
+            self.flush(compact=compact)
+            if not self.pending_count():
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """写回缓存统计"""
+        return {
+            "pending": self.pending_count(),
+            "flushes": self.flush_count,
+            "compactions": self.compaction_count,
+            "log_bytes_written": self.bytes_written,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
@@ -1,5 +1,18 @@
-"""工作流模块 - 诊断流程控制"""
+"""工作流模块 - 诊断流程控制（按需加载，避免导入时拉起 LangGraph / pandas）"""
 
-from .multi_patient import MultiPatientWorkflow
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .multi_patient import MultiPatientWorkflow
 
 __all__ = ["MultiPatientWorkflow"]
+
+
+def __getattr__(name: str) -> Any:
+    if name == "MultiPatientWorkflow":
+        from .multi_patient import MultiPatientWorkflow
+        globals()[name] = MultiPatientWorkflow
+        return MultiPatientWorkflow
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,310 @@
+"""患者到达过程 - 到达序列生成与单线程调度
+
+到达序列是 Arrival 的生成器（按 offset 非递减），可以惰性产生任意多个到达：
+- fixed_arrivals      固定间隔（与原 i * interval 行为一致）
+- poisson_arrivals    泊松过程，支持分段的时变到达率（thinning 法生成非齐次泊松过程）
+- trace_arrivals      回放到达轨迹 CSV（列：offset_seconds[, case_id, priority, dept]）
+
+ArrivalScheduler 用一个调度线程消费到达序列：按绝对时间点放行（前一个到达处理慢不会累积漂移），
+放行前做准入控制（在诊患者 + 待受理数 < max_active）与背压（科室候诊队列 ≤ max_queue_length），
+不满足时推迟放行并计入准入等待。受理（加载病例、分诊评估、提交处理器）在小线程池中进行，
+不阻塞调度线程。每次运行的实际到达记录为 arrivals.csv，可直接作为轨迹回放。
+"""
+from __future__ import annotations
+
+import csv
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+from utils import get_logger
+
+logger = get_logger("hospital_agent.workflow")
+
+TRACE_COLUMNS = ("offset_seconds", "case_id", "priority", "dept")
+
+
+@dataclass
+class Arrival:
+    """一次患者到达"""
+
+    index: int  # 到达序号（从 0 开始）
+    case_id: int
+    offset: float  # 相对调度开始的到达时间（秒）
+    priority: Optional[int] = None  # 轨迹中给定时跳过分诊评估
+    dept: str = "neurology"
+
+
+# ===== 到达序列 =====
+
+def fixed_arrivals(case_ids: Sequence[int], interval: float) -> Iterator[Arrival]:
+    """固定间隔到达"""
+    for i, case_id in enumerate(case_ids):
+        yield Arrival(index=i, case_id=case_id, offset=i * interval)
+
+
+def poisson_arrivals(
+    case_ids: Iterable[int],
+    rate_per_minute: float,
+    rate_schedule: Optional[Sequence[Sequence[float]]] = None,
+    seed: Optional[int] = None,
+) -> Iterator[Arrival]:
+    """泊松到达（非齐次）
+
+    Args:
+        case_ids: 病例序列（可为无限迭代器，到达数等于其长度）
+        rate_per_minute: 基础到达率（人/分钟），rate_schedule 为空时使用
+        rate_schedule: 分段到达率 [[起始分钟, 人/分钟], ...]，按起始分钟升序；
+                       最后一段持续到结束；到达率为 0 的段表示该时段无人到达，
+                       末尾若干段均为 0 时，之后不再产生到达（序列提前结束）
+        seed: 随机种子（便于复现）
+    """
+    rng = random.Random(seed)
+    segments = sorted((float(start) * 60, float(rate) / 60) for start, rate in (rate_schedule or []))
+    if not segments or segments[0][0] > 0:
+        segments.insert(0, (0.0, rate_per_minute / 60))
+    if any(rate < 0 for _, rate in segments):
+        raise ValueError("到达率不能为负数")
+    max_rate = max(rate for _, rate in segments)
+    if max_rate <= 0:
+        raise ValueError("到达率必须大于 0")
+    # 到达率从此时刻起恒为 0（末尾为 0 的段的起点）；无此时刻时为 inf
+    horizon = float("inf")
+    for start, rate in reversed(segments):
+        if rate > 0:
+            break
+        horizon = start
+
+    def rate_at(t: float) -> float:
+        current = segments[0][1]
+        for start, rate in segments:
+            if start > t:
+                break
+            current = rate
+        return current
+
+    t = 0.0
+    for i, case_id in enumerate(case_ids):
+        # thinning：以最大到达率生成候选点，按 rate(t)/max_rate 概率接受
+        while True:
+            t += rng.expovariate(max_rate)
+            if t >= horizon:
+                logger.warning(
+                    f"⚠️  到达率在第 {horizon / 60:g} 分钟后为 0，已产生 {i} 个到达，其余病例不再到达"
+                )
+                return
+            if rng.random() * max_rate <= rate_at(t):
+                break
+        yield Arrival(index=i, case_id=case_id, offset=t)
+
+
+def trace_arrivals(path: str | Path, case_ids: Optional[Sequence[int]] = None) -> Iterator[Arrival]:
+    """回放到达轨迹 CSV
+
+    必需列 offset_seconds；case_id 缺失时依次取 case_ids（循环），
+    priority / dept 可选。行按 offset_seconds 排序后回放。
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    if rows and "offset_seconds" not in rows[0]:
+        raise ValueError(f"到达轨迹缺少 offset_seconds 列: {path}")
+    rows.sort(key=lambda row: float(row["offset_seconds"]))
+    fallback = itertools.cycle(case_ids) if case_ids else None
+    for i, row in enumerate(rows):
+        if (row.get("case_id") or "").strip():
+            case_id = int(row["case_id"])
+        elif fallback is not None:
+            case_id = next(fallback)
+        else:
+            raise ValueError(f"到达轨迹第 {i + 2} 行缺少 case_id，且未提供病例列表")
+        priority = (row.get("priority") or "").strip()
+        yield Arrival(
+            index=i,
+            case_id=case_id,
+            offset=float(row["offset_seconds"]),
+            priority=int(priority) if priority else None,
+            dept=(row.get("dept") or "").strip() or "neurology",
+        )
+
+
+def build_arrivals(mode_config, case_ids: Sequence[int]) -> Iterator[Arrival]:
+    """按 mode 配置构造到达序列"""
+    process = (mode_config.arrival_process or "fixed").lower()
+    if process == "fixed":
+        return fixed_arrivals(case_ids, mode_config.patient_interval)
+    if process == "poisson":
+        return poisson_arrivals(
+            case_ids,
+            rate_per_minute=mode_config.arrival_rate,
+            rate_schedule=mode_config.arrival_rate_schedule,
+            seed=mode_config.arrival_seed,
+        )
+    if process == "trace":
+        if not mode_config.arrival_trace:
+            raise ValueError("arrival_process=trace 需要配置 arrival_trace")
+        return trace_arrivals(mode_config.arrival_trace, case_ids)
+    raise ValueError(f"未知的到达过程: {process}（可选: fixed / poisson / trace）")
+
+
+# ===== 调度 =====
+
+class ArrivalScheduler:
+    """单线程到达调度器：按时放行 + 准入控制 + 背压"""
+
+    def __init__(
+        self,
+        admit: Callable[[Arrival], None],
+        active_count: Callable[[], int],
+        max_active: int,
+        queue_length: Optional[Callable[[str], int]] = None,
+        max_queue_length: int = 0,
+        intake_workers: int = 4,
+        poll_interval: float = 0.2,
+        trace_path: Optional[str | Path] = None,
+    ):
+        """
+        Args:
+            admit: 受理一个到达（加载病例、分诊、提交处理器），在受理线程池中执行
+            active_count: 当前在诊患者数
+            max_active: 在诊 + 待受理患者数上限（通常为处理器 max_workers）
+            queue_length: 科室候诊队列长度查询（None 表示不做背压）
+            max_queue_length: 候诊队列超过该长度时暂停放行（0 表示不限）
+            intake_workers: 受理线程数
+            poll_interval: 准入等待时的轮询间隔（秒）
+            trace_path: 实际到达记录 CSV（可作为轨迹回放）
+        """
+        self.admit = admit
+        self.active_count = active_count
+        self.max_active = max(1, int(max_active))
+        self.queue_length = queue_length
+        self.max_queue_length = max(0, int(max_queue_length))
+        self.poll_interval = poll_interval
+        self.trace_path = Path(trace_path) if trace_path else None
+
+        self._intake = ThreadPoolExecutor(max_workers=max(1, intake_workers), thread_name_prefix="arrival-intake")
+        self._pending = 0  # 已放行但尚未提交到处理器的到达
+        self._pending_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            "arrivals": 0,
+            "admitted": 0,
+            "failed": 0,
+            "throttled": 0,  # 因准入控制推迟的到达数
+            "backpressured": 0,  # 因候诊队列过长推迟的到达数
+            "admission_wait_s": 0.0,
+            "max_admission_wait_s": 0.0,
+            "max_lag_s": 0.0,  # 放行时刻相对计划到达时刻的最大滞后
+        }
+
+    # ===== 生命周期 =====
+
+    def start(self, arrivals: Iterable[Arrival]) -> threading.Thread:
+        """启动调度线程"""
+        self._thread = threading.Thread(
+            target=self._run, args=(arrivals,), name="arrival-scheduler", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """等待全部到达放行并受理完成"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._intake.shutdown(wait=True)
+
+    def run(self, arrivals: Iterable[Arrival]) -> dict:
+        """启动调度线程并等待全部受理完成，返回统计"""
+        self.start(arrivals)
+        self.join()
+        return self.get_stats()
+
+    def stop(self) -> None:
+        """停止放行（已放行的到达仍会受理完成）"""
+        self._stopped.set()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["admission_wait_s"] = round(stats["admission_wait_s"], 3)
+        stats["max_admission_wait_s"] = round(stats["max_admission_wait_s"], 3)
+        stats["max_lag_s"] = round(stats["max_lag_s"], 3)
+        return stats
+
+    # ===== 调度循环 =====
+
+    def _run(self, arrivals: Iterable[Arrival]) -> None:
+        trace_file = writer = None
+        if self.trace_path is not None:
+            self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+            trace_file = open(self.trace_path, "w", encoding="utf-8", newline="")
+            writer = csv.writer(trace_file)
+            writer.writerow(TRACE_COLUMNS)
+        start = time.monotonic()
+        try:
+            for arrival in arrivals:
+                # 按绝对时间点等待，不累积前序处理的漂移
+                if self._stopped.wait(max(0.0, start + arrival.offset - time.monotonic())):
+                    break
+                self.stats["arrivals"] += 1
+                if not self._wait_for_admission(arrival):
+                    break
+                self.stats["max_lag_s"] = max(
+                    self.stats["max_lag_s"], time.monotonic() - start - arrival.offset
+                )
+                if writer is not None:
+                    writer.writerow((
+                        f"{time.monotonic() - start:.3f}",
+                        arrival.case_id,
+                        "" if arrival.priority is None else arrival.priority,
+                        arrival.dept,
+                    ))
+                with self._pending_lock:
+                    self._pending += 1
+                self._intake.submit(self._admit, arrival)
+        except Exception as e:
+            logger.error(f"❌ 到达调度异常: {e}")
+        finally:
+            if trace_file is not None:
+                trace_file.close()
+
+    def _wait_for_admission(self, arrival: Arrival) -> bool:
+        """准入控制 + 背压；被 stop() 中断时返回 False"""
+        wait_start = time.monotonic()
+        throttled = backpressured = False
+        while True:
+            with self._pending_lock:
+                load = self.active_count() + self._pending
+            if load >= self.max_active:
+                throttled = True
+            elif self.max_queue_length and self.queue_length is not None \
+                    and self.queue_length(arrival.dept) > self.max_queue_length:
+                backpressured = True
+            else:
+                break
+            if self._stopped.wait(self.poll_interval):
+                return False
+        waited = time.monotonic() - wait_start
+        self.stats["throttled"] += int(throttled)
+        self.stats["backpressured"] += int(backpressured)
+        self.stats["admission_wait_s"] += waited
+        self.stats["max_admission_wait_s"] = max(self.stats["max_admission_wait_s"], waited)
+        return True
+
+    def _admit(self, arrival: Arrival) -> None:
+        ok = False
+        try:
+            self.admit(arrival)
+            ok = True
+        except Exception as e:
+            logger.error(f"❌ 患者受理失败 (case {arrival.case_id}): {e}")
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+                self.stats["admitted" if ok else "failed"] += 1
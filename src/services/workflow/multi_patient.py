@@ -4,16 +4,19 @@ import random
 import threading
 import time
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from utils import get_logger
 from loaders import load_diagnosis_arena_case, _get_dataset_size
+from .arrivals import Arrival, ArrivalScheduler, build_arrivals, fixed_arrivals
+from .triage_scorer import BatchedTriageScorer
 from processing import LangGraphMultiPatientProcessor
 from display import format_patient_log, get_patient_color
 from config import Config
 from logging_utils import log_throughput, log_treatment_duration_summary
 from logging_utils import log_effective_rounds_summary, log_diagnosis_accuracy_summary
-from logging_utils import log_avg_rounds_summary, flush_rag_metric_summaries
+from logging_utils import log_avg_rounds_summary, flush_rag_metric_summaries, shutdown_node_tracing
+from logging_utils import get_current_metrics_log_paths
 
 
 logger = get_logger("hospital_agent.workflow")
@@ -43,6 +46,12 @@ class MultiPatientWorkflow:
         self._throughput_start_ts = 0.0
         self._throughput_start_iso = ""
         self._total_requests = 0
+        self.arrival_stats: Dict[str, Any] = {}
+        self.triage_scorer = BatchedTriageScorer(
+            llm=llm,
+            window_s=config.mode.triage_batch_window,
+            max_batch=config.mode.triage_batch_size,
+        )
     
     def register_doctors(self, num_doctors: int = 3) -> None:
         """注册医生到协调器
@@ -60,8 +69,9 @@ class MultiPatientWorkflow:
         """初始化多患者处理器
         
         Args:
-            num_patients: 患者数量
+            num_patients: 患者数量（mode.max_concurrent_patients 未设置时作为并发数）
         """
+        max_workers = self.config.mode.max_concurrent_patients or num_patients
         logger.info("⚙️  初始化处理器")
         self.processor = LangGraphMultiPatientProcessor(
             coordinator=self.coordinator,
@@ -70,7 +80,9 @@ class MultiPatientWorkflow:
             services=self.services,
             medical_record_service=self.medical_record_service,
             max_questions=self.config.agent.max_questions,
-            max_workers=num_patients,
+            max_workers=max_workers,
+            pipeline_interview=self.config.agent.pipeline_interview,
+            parallel_post_diagnosis=self.config.agent.parallel_post_diagnosis,
         )
     
     def select_patient_cases(self, num_patients: int) -> List[int]:
@@ -94,7 +106,10 @@ class MultiPatientWorkflow:
         return available_case_ids[:num_patients]
     
     def calculate_priority_by_symptoms(self, chief_complaint: str) -> int:
-        """根据主诉判断就诊优先级，优先使用LLM语义理解，失败时降级为默认优先级为5
+        """根据主诉判断就诊优先级
+        
+        由 BatchedTriageScorer 评分：短时间内到达的主诉合并为一次 LLM 请求，
+        相同主诉命中缓存；LLM 不可用或失败时使用本地规则评分。
         
         Args:
             chief_complaint: 主诉
@@ -102,40 +117,26 @@ class MultiPatientWorkflow:
         Returns:
             优先级（1-10，数字越大越紧急）
         """
-        # 优先使用LLM语义判断
-        if self.llm:
-            try:
-                system_prompt = (
-                    "你是急诊分诊护士，根据患者主诉判断就诊紧急程度。\n"
-                    "评分标准：\n"
-                    "  9-10分：危及生命，需立即处理（昏迷、休克、大出血、严重呼吸困难等）\n"
-                    "  7-8分：病情严重，需尽快处理（高热、剧烈疼痛、晕厥、呕血等）\n"
-                    "  5-6分：病情中等，需较快处理（发热、头晕、持续疼痛、恶心呕吐等）\n"
-                    "  3-4分：病情较轻，可正常排队（轻微不适、慢性症状复查等）\n"
-                    "只返回JSON，格式：{\"priority\": <整数>, \"reason\": \"<简短理由>\"}"
-                )
-                obj, _, _ = self.llm.generate_json(
-                    system_prompt=system_prompt,
-                    user_prompt=f"患者主诉：{chief_complaint}",
-                    fallback=lambda: {"priority": 5, "reason": "fallback"},
-                    temperature=0.1,
-                )
-                priority = int(obj.get("priority", 5))
-                priority = max(1, min(10, priority))  # 限制在1-10范围内
-                logger.debug(f"  🤖 LLM优先级评估: {priority}分 - {obj.get('reason', '')}")
-                return priority
-            except Exception as e:
-                logger.debug(f"  ⚠️  LLM优先级评估失败，返回默认值5: {e}")
-
-        return 5  # LLM不可用或失败时返回中等优先级
+        priority = self.triage_scorer.score(chief_complaint)
+        logger.debug(f"  🤖 分诊优先级评估: {priority}分")
+        return priority
     
-    def submit_patient(self, i: int, case_id: int, total_patients: int) -> str:
+    def submit_patient(
+        self,
+        i: int,
+        case_id: int,
+        total_patients: int,
+        priority: Optional[int] = None,
+        dept: str = "neurology",
+    ) -> str:
         """提交一个患者到处理队列
         
         Args:
             i: 患者索引
             case_id: 病例ID
             total_patients: 总患者数
+            priority: 已知优先级（如到达轨迹中给定），None 表示按主诉评估
+            dept: 就诊科室
         
         Returns:
             任务ID
@@ -152,7 +153,8 @@ class MultiPatientWorkflow:
             if not chief_complaint:
                 raise ValueError("病例缺少新字段'主诉'")
             
-            priority = self.calculate_priority_by_symptoms(chief_complaint)
+            if priority is None:
+                priority = self.calculate_priority_by_symptoms(chief_complaint)
         except Exception as e:
             logger.warning(f"⚠️  无法加载病例 {case_id} 的主诉，使用随机优先级: {e}")
             priority = random.randint(5, 7)
@@ -181,7 +183,7 @@ class MultiPatientWorkflow:
         task_id = self.processor.submit_patient(
             patient_id=patient_id,
             case_id=case_id,
-            dept="neurology",
+            dept=dept,
             priority=priority
         )
         
@@ -191,29 +193,58 @@ class MultiPatientWorkflow:
         return task_id
     
     def schedule_patients(self, case_ids: List[int], interval: float) -> None:
-        """按时间间隔调度患者
+        """按到达过程调度患者（阻塞至全部患者放行并提交）
+        
+        到达过程由 mode.arrival_process 决定：fixed 按 interval 固定间隔，
+        poisson / trace 见 services.workflow.arrivals。放行受准入控制
+        （在诊患者数 ≤ 处理器并发数）与候诊队列背压（mode.max_queue_length）约束。
         
         Args:
             case_ids: 病例ID列表
-            interval: 患者间隔时间（秒）
+            interval: 患者间隔时间（秒，fixed 模式）
         """
-        total_patients = len(case_ids)
+        mode = self.config.mode
+        process = (mode.arrival_process or "fixed").lower()
+        if process == "fixed":
+            arrivals = fixed_arrivals(case_ids, interval)
+            total_patients = len(case_ids)
+        elif process == "trace":
+            arrivals = list(build_arrivals(mode, case_ids))  # 轨迹行数即患者数
+            total_patients = len(arrivals)
+        else:
+            arrivals = build_arrivals(mode, case_ids)
+            total_patients = len(case_ids)
+
         self._total_requests = total_patients
         self._throughput_start_ts = time.time()
         self._throughput_start_iso = datetime.now().isoformat()
-        timers = []
-        
-        for i, case_id in enumerate(case_ids):
-            delay = i * interval
-            timer = threading.Timer(
-                delay,
-                lambda idx=i, cid=case_id: self.submit_patient(idx, cid, total_patients)
+
+        run_dir = get_current_metrics_log_paths().get("run_dir")
+
+        def admit(arrival: Arrival) -> None:
+            self.submit_patient(
+                arrival.index, arrival.case_id, total_patients,
+                priority=arrival.priority, dept=arrival.dept,
+            )
+
+        scheduler = ArrivalScheduler(
+            admit=admit,
+            active_count=self.processor.get_active_count,
+            max_active=self.processor.max_workers,
+            queue_length=getattr(self.coordinator, "get_queue_size", None),
+            max_queue_length=mode.max_queue_length,
+            intake_workers=mode.intake_workers,
+            trace_path=f"{run_dir}/arrivals.csv" if run_dir else None,
+        )
+        self.arrival_stats = scheduler.run(arrivals)
+
+        stats = self.arrival_stats
+        if stats["throttled"] or stats["backpressured"] or stats["failed"]:
+            logger.info(
+                f"🚦 到达调度: 放行 {stats['admitted']}/{stats['arrivals']} | "
+                f"准入限流 {stats['throttled']} 次 | 队列背压 {stats['backpressured']} 次 | "
+                f"累计等待 {stats['admission_wait_s']:.1f}s（最长 {stats['max_admission_wait_s']:.1f}s）"
             )
-            timer.start()
-            timers.append(timer)
-        
-        for timer in timers:
-            timer.join()
     
     def start_monitoring(self) -> threading.Thread:
         """启动状态监控线程
@@ -376,6 +407,22 @@ class MultiPatientWorkflow:
         return results
     
     def shutdown(self) -> None:
-        """关闭处理器"""
-        if self.processor:
-            self.processor.shutdown()
+        """关闭处理器，并将病例写回缓存全部落盘、关闭 LLM 连接池
+
+        即使处理器关闭失败也会执行病例落盘（快照原子替换，中途崩溃不会损坏已有快照）。
+        """
+        try:
+            self.triage_scorer.close()
+            if self.processor:
+                self.processor.shutdown()
+        finally:
+            shutdown_node_tracing()
+            close = getattr(self.medical_record_service, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.error(f"❌ 病例落盘失败: {e}")
+            close_llm = getattr(self.llm, "close", None)
+            if callable(close_llm):
+                close_llm()
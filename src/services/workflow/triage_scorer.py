@@ -0,0 +1,245 @@
+"""批量分诊评分 - 到达患者的就诊优先级（1-10，数字越大越紧急）
+
+短时间窗口内到达的主诉合并为一次 LLM 请求，返回 JSON 数组形式的逐条优先级：
+- 受理线程调用 score()，先查缓存（键为规范化后的主诉文本），未命中则加入待评分批次并等待结果
+- 后台评分线程在首条请求到达后等待 window_s 秒（或凑满 max_batch 条）后发出一次请求；
+  同一批内相同主诉只评一次
+- 无 LLM、请求失败、结果缺项或等待超时时，立即使用本地规则评分（关键词分级，识别否定词）
+规则评分结果不写入缓存，以便 LLM 恢复后重新评估。
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from utils import contains_any_positive, get_logger
+
+logger = get_logger("hospital_agent.workflow")
+
+DEFAULT_PRIORITY = 5
+
+# 规则评分：按紧急程度从高到低匹配关键词（否定表述如"无昏迷"不计）
+_RULE_TIERS: tuple[tuple[int, tuple[str, ...]], ...] = (
+    (9, ("昏迷", "意识障碍", "意识不清", "休克", "大出血", "呼吸困难", "窒息", "抽搐不止",
+         "癫痫持续", "偏瘫", "言语不清", "口角歪斜", "胸痛", "心跳骤停")),
+    (7, ("高热", "剧烈", "晕厥", "呕血", "黑便", "便血", "突发", "肢体无力", "抽搐",
+         "视物模糊", "复视", "喷射性呕吐", "颈项强直")),
+    (5, ("发热", "头晕", "眩晕", "头痛", "疼痛", "恶心", "呕吐", "麻木", "乏力", "心悸")),
+    (3, ("复查", "慢性", "轻微", "体检", "开药", "咨询", "随访")),
+)
+
+_TRIAGE_RUBRIC = (
+    "你是急诊分诊护士，根据患者主诉判断就诊紧急程度。\n"
+    "评分标准：\n"
+    "  9-10分：危及生命，需立即处理（昏迷、休克、大出血、严重呼吸困难等）\n"
+    "  7-8分：病情严重，需尽快处理（高热、剧烈疼痛、晕厥、呕血等）\n"
+    "  5-6分：病情中等，需较快处理（发热、头晕、持续疼痛、恶心呕吐等）\n"
+    "  3-4分：病情较轻，可正常排队（轻微不适、慢性症状复查等）\n"
+)
+
+_BATCH_SYSTEM_PROMPT = (
+    _TRIAGE_RUBRIC
+    + "下面按编号给出多位患者的主诉，请逐一独立评分。\n"
+    "只返回JSON，格式：{\"priorities\": [{\"id\": <编号>, \"priority\": <整数>, \"reason\": \"<简短理由>\"}, ...]}，"
+    "每个编号一项。"
+)
+
+_PUNCT_RE = re.compile(r"[\s　,，.。;；:：!！?？、\"'“”‘’()（）\[\]【】]+")
+
+
+def normalize_complaint(text: str) -> str:
+    """主诉规范化（缓存键）：全半角统一、去空白与标点、小写"""
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    return _PUNCT_RE.sub("", text)
+
+
+def rule_based_priority(chief_complaint: str) -> int:
+    """本地规则评分（无网络调用，用作即时降级）"""
+    text = str(chief_complaint or "")
+    for priority, keywords in _RULE_TIERS:
+        if contains_any_positive(text, list(keywords)):
+            return priority
+    return DEFAULT_PRIORITY
+
+
+@dataclass
+class _PendingScore:
+    key: str
+    complaint: str
+    future: Future
+    enqueued_at: float
+
+
+class BatchedTriageScorer:
+    """按时间窗口批量调用 LLM 的分诊评分器（线程安全）"""
+
+    def __init__(
+        self,
+        llm: Any = None,
+        window_s: float = 0.5,
+        max_batch: int = 16,
+        timeout_s: float = 60.0,
+        cache_size: int = 2048,
+    ):
+        """
+        Args:
+            llm: LLM 客户端（需提供 generate_json），None 时只用规则评分
+            window_s: 批次收集窗口（秒），从批内首条请求到达时开始计时
+            max_batch: 单次请求最多包含的主诉数
+            timeout_s: 调用方等待 LLM 结果的上限，超时改用规则评分
+            cache_size: 缓存条目上限（LRU）
+        """
+        self.llm = llm
+        self.window_s = max(0.0, window_s)
+        self.max_batch = max(1, max_batch)
+        self.timeout_s = timeout_s
+        self.cache_size = max(1, cache_size)
+
+        self._cache: OrderedDict[str, int] = OrderedDict()
+        self._inflight: dict[str, Future] = {}  # 同一主诉并发请求共享结果
+        self._pending: list[_PendingScore] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "llm_batches": 0,
+            "llm_scored": 0,
+            "rule_scored": 0,
+            "timeouts": 0,
+            "max_batch_size": 0,
+        }
+
+    # ===== 调用方接口 =====
+
+    def score(self, chief_complaint: str) -> int:
+        """返回主诉的就诊优先级（1-10）；可能阻塞至多 window_s + LLM 耗时"""
+        return self._resolve(chief_complaint, self._submit(chief_complaint))
+
+    def score_many(self, complaints: Sequence[str]) -> list[int]:
+        """批量评分：全部加入同一收集窗口后再等待结果"""
+        submitted = [self._submit(c) for c in complaints]
+        return [self._resolve(c, s) for c, s in zip(complaints, submitted)]
+
+    def _submit(self, chief_complaint: str) -> int | Future:
+        """命中缓存或直接规则评分时返回优先级，否则返回待评分的 Future"""
+        key = normalize_complaint(chief_complaint)
+        with self._cond:
+            self.stats["requests"] += 1
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return cached
+            if self.llm is None or not key or self._closed:
+                self.stats["rule_scored"] += 1
+                return rule_based_priority(chief_complaint)
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                self._pending.append(_PendingScore(key, chief_complaint, future, time.monotonic()))
+                self._ensure_started()
+                self._cond.notify()
+            return future
+
+    def _resolve(self, chief_complaint: str, submitted: int | Future) -> int:
+        if not isinstance(submitted, Future):
+            return submitted
+        try:
+            return submitted.result(timeout=self.timeout_s)
+        except FutureTimeoutError:
+            with self._cond:
+                self.stats["timeouts"] += 1
+                self.stats["rule_scored"] += 1
+            logger.debug(f"  ⚠️  分诊评分等待超时，使用规则评分: {chief_complaint[:30]}")
+            return rule_based_priority(chief_complaint)
+
+    def close(self) -> None:
+        """停止评分线程（待评分请求会先处理完）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.timeout_s)
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats["cache_size"] = len(self._cache)
+        return stats
+
+    # ===== 评分线程 =====
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="triage-scorer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = self._pending[0].enqueued_at + self.window_s
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._score_batch(batch)
+
+    def _score_batch(self, batch: list[_PendingScore]) -> None:
+        start = time.perf_counter()
+        scored: dict[int, int] = {}
+        try:
+            numbered = "\n".join(f"{i}. {item.complaint}" for i, item in enumerate(batch, 1))
+            obj, _, _ = self.llm.generate_json(
+                system_prompt=_BATCH_SYSTEM_PROMPT,
+                user_prompt=f"患者主诉（共{len(batch)}位）：\n{numbered}",
+                fallback=lambda: {"priorities": []},
+                temperature=0.1,
+                max_tokens=60 * len(batch) + 100,
+            )
+            for entry in obj.get("priorities") or []:
+                try:
+                    scored[int(entry["id"])] = max(1, min(10, int(entry["priority"])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        except Exception as e:
+            logger.debug(f"  ⚠️  批量分诊评分失败，使用规则评分: {e}")
+
+        llm_count = 0
+        with self._cond:
+            self.stats["llm_batches"] += 1
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            for i, item in enumerate(batch, 1):
+                priority = scored.get(i)
+                if priority is None:
+                    priority = rule_based_priority(item.complaint)
+                    self.stats["rule_scored"] += 1
+                else:
+                    llm_count += 1
+                    self._cache[item.key] = priority
+                    self._cache.move_to_end(item.key)
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+                self._inflight.pop(item.key, None)
+                item.future.set_result(priority)
+            self.stats["llm_scored"] += llm_count
+        logger.debug(
+            f"  🤖 批量分诊评分: {len(batch)} 位患者 / 1 次 LLM 调用 "
+            f"（LLM {llm_count}，规则 {len(batch) - llm_count}），{(time.perf_counter() - start) * 1000:.0f}ms"
+        )
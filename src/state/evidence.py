@@ -0,0 +1,176 @@
+"""单次就诊的检索证据库与审计日志
+
+- EvidenceStore  检索片段的内容寻址存储：键为 (来源, chunk_id, 正文摘要)，同一片段只保存一次；
+                 BaseState.retrieved_chunks 中只保留紧凑引用（key / doc_id / chunk_id / score）
+- AuditLog       只追加的审计日志；BaseState 引用同一个日志对象，不再在每次追加时复制整个列表
+
+两者都是 BaseState 的不序列化字段，LangGraph 在节点之间传递、输出状态时不再携带片段正文与审计明细。
+
+基准（旧布局：状态内保存完整片段与审计列表、每次追加复制列表）：
+    python -m state.evidence bench --nodes 16 --chunks 8
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Iterable, Iterator
+
+
+def chunk_key(chunk: dict[str, Any]) -> str:
+    """片段的内容寻址键：来源 + chunk_id + 正文摘要
+
+    各检索库的 chunk_id 只在单次检索结果内有序号意义（如患者历史库按结果下标编号），
+    单独用 (来源, chunk_id) 会把不同片段当成同一个，因此加上正文摘要。
+    """
+    meta = chunk.get("meta") or {}
+    source = meta.get("source") or chunk.get("doc_id") or ""
+    digest = hashlib.blake2b(str(chunk.get("text") or "").encode("utf-8"), digest_size=8).hexdigest()
+    return f"{source}:{chunk.get('chunk_id')}:{digest}"
+
+
+class EvidenceStore:
+    """单次就诊的检索片段存储（内容寻址、去重）"""
+
+    def __init__(self) -> None:
+        self._chunks: dict[str, dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._chunks
+
+    def add_chunks(self, chunks: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """保存片段，返回首次出现的片段的紧凑引用（已保存过的片段不再返回）"""
+        refs = []
+        for chunk in chunks:
+            key = chunk_key(chunk)
+            if key in self._chunks:
+                continue
+            self._chunks[key] = chunk
+            refs.append({
+                "key": key,
+                "doc_id": chunk.get("doc_id"),
+                "chunk_id": chunk.get("chunk_id"),
+                "score": chunk.get("score"),
+            })
+        return refs
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        return self._chunks.get(key)
+
+    def resolve(self, refs: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """引用 → 完整片段（按引用顺序，跳过本库中不存在的引用）"""
+        return [self._chunks[ref["key"]] for ref in refs if ref.get("key") in self._chunks]
+
+
+class AuditLog:
+    """只追加的审计日志"""
+
+    def __init__(self) -> None:
+        self._entries: list[dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(list(self._entries))
+
+    def append(self, entry: dict[str, Any]) -> int:
+        """追加一条审计记录，返回其序号"""
+        self._entries.append(entry)
+        return len(self._entries) - 1
+
+    def since(self, index: int) -> list[dict[str, Any]]:
+        """序号 index 之后（含）追加的记录"""
+        return self._entries[index:]
+
+    def to_list(self) -> list[dict[str, Any]]:
+        return list(self._entries)
+
+
+# ===== 基准 =====
+
+_BENCH_NODES = ["C1", "C2", "C3", "C4", "C5", "C6", "C7", "C8", "C9", "C10",
+                "C11", "C12", "C13", "C14", "C15", "C16"]
+
+
+def _bench_chunks(node_index: int, per_node: int) -> list[dict[str, Any]]:
+    """构造一个节点的检索结果；规则流程库的片段在多个节点重复命中"""
+    chunks = []
+    for i in range(per_node):
+        shared = i < per_node // 2  # 一半片段来自各节点共用的规则流程库
+        source = "HospitalProcess" if shared else "MedicalGuide"
+        chunk_id = str(i if shared else node_index * per_node + i)
+        chunks.append({
+            "doc_id": source.lower(),
+            "chunk_id": chunk_id,
+            "score": 0.8 - i * 0.01,
+            "text": f"【{source}#{chunk_id}】" + "神经内科门诊流程与头痛诊疗指南要点，包含红旗症状识别与检查指征。" * 12,
+            "meta": {"source": source, "section": f"第{i + 1}节"},
+        })
+    return chunks
+
+
+def run_benchmark(nodes: int = 16, chunks_per_node: int = 8, repeat: int = 20) -> None:
+    """模拟一次就诊：逐节点追加检索片段与审计记录，比较旧/新布局下的状态大小与序列化耗时"""
+    import time
+
+    from pydantic import create_model
+
+    from state.schema import BaseState, make_audit_entry
+
+    legacy_cls = create_model(
+        "LegacyState", __base__=BaseState,
+        legacy_audit_trail=(list[dict[str, Any]], []),
+    )
+
+    def legacy_step(state: Any, chunks: list[dict[str, Any]], entry: dict[str, Any]) -> None:
+        state.retrieved_chunks = [*state.retrieved_chunks, *chunks]
+        state.legacy_audit_trail = [*state.legacy_audit_trail, entry]
+
+    def current_step(state: Any, chunks: list[dict[str, Any]], entry: dict[str, Any]) -> None:
+        state.add_retrieved_chunks(chunks)
+        state.add_audit(entry)
+
+    def measure(state: Any) -> tuple[float, float]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            state.model_dump()
+        dump_ms = (time.perf_counter() - start) * 1000 / repeat
+        return len(state.model_dump_json().encode("utf-8")) / 1024, dump_ms
+
+    legacy = legacy_cls(run_id="bench", dept="neurology")
+    current = BaseState(run_id="bench", dept="neurology")
+    node_ids = (_BENCH_NODES * (nodes // len(_BENCH_NODES) + 1))[:nodes]
+    print(f"样本: {nodes} 个节点，每节点检索 {chunks_per_node} 个片段（其中一半为重复命中的流程库片段）")
+    print(f"{'节点':<6}{'旧KB':>9}{'旧dump ms':>11}{'新KB':>9}{'新dump ms':>11}")
+    totals = [0.0, 0.0]
+    for index, node_id in enumerate(node_ids):
+        chunks = _bench_chunks(index, chunks_per_node)
+        entry = make_audit_entry(
+            node_name=node_id, inputs_summary={"node": node_id}, outputs_summary={"chunks": len(chunks)},
+            decision="基准", chunks=chunks,
+        )
+        legacy_step(legacy, chunks, entry)
+        current_step(current, chunks, entry)
+        legacy_kb, legacy_ms = measure(legacy)
+        current_kb, current_ms = measure(current)
+        totals[0] += legacy_ms
+        totals[1] += current_ms
+        print(f"{node_id:<6}{legacy_kb:>9.1f}{legacy_ms:>11.3f}{current_kb:>9.1f}{current_ms:>11.3f}")
+    print(f"合计 dump ms: 旧 {totals[0]:.2f} / 新 {totals[1]:.2f}；"
+          f"证据库 {len(current.evidence)} 个片段，审计 {len(current.audit_log)} 条")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="就诊状态证据库基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_parser = sub.add_parser("bench", help="比较旧/新布局的状态大小与逐节点序列化耗时")
+    bench_parser.add_argument("--nodes", type=int, default=16)
+    bench_parser.add_argument("--chunks", type=int, default=8)
+    bench_parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    if args.command == "bench":
+        run_benchmark(args.nodes, args.chunks, args.repeat)
@@ -4,6 +4,7 @@ from typing import Any, Literal, Optional, TYPE_CHECKING
 
 from pydantic import BaseModel, ConfigDict, Field
 
+from state.evidence import AuditLog, EvidenceStore
 from utils import now_iso
 
 if TYPE_CHECKING:
@@ -82,9 +83,11 @@ class BaseState(BaseModel):
     discharge_docs: list[dict[str, Any]] = Field(default_factory=list)
     followup_plan: dict[str, Any] = Field(default_factory=dict)
 
-    retrieved_chunks: list[dict[str, Any]] = Field(default_factory=list)
+    retrieved_chunks: list[dict[str, Any]] = Field(default_factory=list)  # 检索片段的紧凑引用（正文在 evidence 中）
     escalations: list[str] = Field(default_factory=list)
-    audit_trail: list[dict[str, Any]] = Field(default_factory=list)
+    # 本次就诊的检索片段存储与只追加审计日志（不序列化，节点间按引用传递）
+    evidence: Any = Field(default_factory=EvidenceStore, exclude=True)
+    audit_log: Any = Field(default_factory=AuditLog, exclude=True)
     
     # 多智能体系统新增字段
     agent_interactions: dict[str, Any] = Field(default_factory=dict)  # 医患护对话记录
@@ -147,7 +150,6 @@ class BaseState(BaseModel):
             "followup_plan",
             "retrieved_chunks",
             "escalations",
-            "audit_trail",
             "agent_interactions",
             "agent_config",
             "ground_truth",
@@ -165,10 +167,20 @@ class BaseState(BaseModel):
             pass
 
     def add_retrieved_chunks(self, chunks: list[dict[str, Any]]) -> None:
-        self.retrieved_chunks = [*self.retrieved_chunks, *chunks]
+        """保存检索片段（同一片段只保存一次），状态中只追加紧凑引用"""
+        self.retrieved_chunks.extend(self.evidence.add_chunks(chunks))
+
+    def get_retrieved_chunks(self) -> list[dict[str, Any]]:
+        """本次就诊检索到的完整片段（按首次检索顺序）"""
+        return self.evidence.resolve(self.retrieved_chunks)
 
     def add_audit(self, entry: dict[str, Any]) -> None:
-        self.audit_trail = [*self.audit_trail, entry]
+        self.audit_log.append(entry)
+
+    @property
+    def audit_trail(self) -> list[dict[str, Any]]:
+        """审计记录（只读副本；追加请用 add_audit）"""
+        return self.audit_log.to_list()
     
     def sync_physical_state(self) -> None:
         """从HospitalWorld同步物理状态到快照"""
@@ -251,8 +263,7 @@ class BaseState(BaseModel):
                 result["consciousness"] = physical_state.consciousness_level
                 
                 # 记录危急警告到audit_trail
-                from utils import now_iso
-                self.audit_trail.append({
+                self.add_audit({
                     "ts": now_iso(),
                     "event": "PHYSICAL_CRITICAL_WARNING",
                     "consciousness": physical_state.consciousness_level,
@@ -269,8 +280,7 @@ class BaseState(BaseModel):
         result["physical_state"] = self.physical_state_snapshot
         
         # 记录物理状态变化到audit_trail（简化版）
-        from utils import now_iso
-        self.audit_trail.append({
+        self.add_audit({
             "ts": now_iso(),
             "event": "PHYSICAL_UPDATE",
             "action": action,
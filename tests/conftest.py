@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 源码在 src/ 下，按 PYTHONPATH=src 的方式导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
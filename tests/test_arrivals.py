@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+
+from services.workflow.arrivals import poisson_arrivals
+
+
+def _collect(*args, **kwargs):
+    result = []
+    worker = threading.Thread(target=lambda: result.extend(poisson_arrivals(*args, **kwargs)), daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    assert not worker.is_alive(), "poisson_arrivals 未结束"
+    return result
+
+
+def test_zero_rate_tail_stops_sequence():
+    arrivals = _collect(range(5), 1.0, [[0, 60], [0.01, 0]], seed=1)
+    assert len(arrivals) < 5
+    assert all(a.offset < 0.01 * 60 for a in arrivals)
+
+
+def test_zero_rate_gap_keeps_arrivals():
+    arrivals = _collect(range(20), 1.0, [[0, 1], [5, 0], [10, 1]], seed=3)
+    assert len(arrivals) == 20
+    assert not any(5 * 60 <= a.offset < 10 * 60 for a in arrivals)
+
+
+def test_negative_rate_rejected():
+    with pytest.raises(ValueError):
+        list(poisson_arrivals(range(3), 1.0, [[0, 1], [5, -1]]))
@@ -0,0 +1,72 @@
+"""CaseExamIndex 与原 LabAgent._find_existing_result（逐个 str.find 截取段落）的一致性"""
+import json
+from pathlib import Path
+
+import pytest
+
+from services import lab_catalog
+from services.lab_catalog import TEST_NAME_VARIANTS, CaseExamIndex
+
+DATASET = Path(__file__).resolve().parent.parent / "diagnosis_dataset" / "dataset.json"
+
+END_MARKERS = [
+    "\n\n", "。\n", "。 ",
+    "诊断：", "治疗：", "讨论：",
+    "血常规", "尿常规", "肝功能", "肾功能",
+    "CT", "MRI", "X光", "心电图", "B超",
+]
+TEST_NAMES = list(TEST_NAME_VARIANTS) + ["头颅CT", "脑电图", "肌电图", "EEG"]
+
+
+def legacy_find(test_name, case_info):
+    """原实现（仅名称变体表中的写法）"""
+    for variant in TEST_NAME_VARIANTS.get(test_name, [test_name]):
+        if variant in case_info:
+            start_idx = case_info.find(variant)
+            end_idx = start_idx + 500
+            remaining = case_info[start_idx:]
+            for marker in END_MARKERS:
+                pos = remaining.find(marker, len(variant) + 1)
+                if pos != -1 and start_idx + pos < end_idx:
+                    end_idx = start_idx + pos
+            result_text = case_info[start_idx:end_idx].strip()
+            if len(result_text) > len(variant) + 5:
+                return result_text
+    return None
+
+
+def _dataset_texts():
+    if not DATASET.exists():
+        return []
+    texts = []
+    with open(DATASET, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                texts.extend(str(v) for v in json.loads(line).values() if isinstance(v, str) and v)
+    return texts
+
+
+SAMPLE_TEXTS = [
+    "Head CT: no acute hemorrhage. The bone structure was intact.",
+    "Neurological activity normal; conductus noted. MRI showed no lesion。\n血常规：WBC 6.2",
+    "辅助检查：头颅CT示左侧基底节区低密度影。脑电图：轻度异常。EEG 示慢波增多",
+    "ct 与 mri 均未见异常，核磁共振成像：正常范围。",
+]
+
+
+@pytest.mark.parametrize("test_name", TEST_NAMES)
+def test_matches_legacy_extractor(test_name):
+    texts = SAMPLE_TEXTS + _dataset_texts()
+    for text in texts:
+        expected = legacy_find(test_name, text)
+        actual = CaseExamIndex(text, [test_name]).find(test_name)
+        if expected is not None:
+            assert actual == expected, text[:200]
+        elif actual is not None:
+            # 原实现找不到时，新增写法（设备关键词）找到的段落必须以该写法开头
+            assert actual.startswith(lab_catalog.aliases_for(test_name)), actual[:80]
+
+
+def test_latin_alias_does_not_match_inside_words():
+    text = "The bone structure was intact and activity was normal. CT scan: small infarct"
+    assert CaseExamIndex(text, ["CT"]).find("CT") == "CT scan: small infarct"
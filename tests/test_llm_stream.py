@@ -0,0 +1,106 @@
+"""DeepSeekLLMClient 流式路径（本地 SSE 桩服务）：提前终止断开连接、非流式回退、连接池关闭"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("httpx_sse")
+from services.llm_client import DeepSeekConfig, DeepSeekLLMClient, stop_after_sentences  # noqa: E402
+
+PIECES = ["头痛", "三天。", "伴恶心", "。", "无发热", "。"] + ["补充说明。"] * 40
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.requests.append(body)
+        if not body.get("stream") or server.mode == "json":
+            payload = json.dumps({
+                "choices": [{"message": {"content": "".join(PIECES)}}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": len(PIECES)},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for piece in PIECES:
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                server.sent += 1
+                time.sleep(0.01)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnected.set()
+        self.close_connection = True
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.requests, server.sent, server.mode = [], 0, "sse"
+    server.disconnected = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server):
+    host, port = server.server_address
+    return DeepSeekLLMClient(DeepSeekConfig(
+        api_key="test", base_url=f"http://{host}:{port}/v1", model="stub", max_retries=1,
+    ))
+
+
+def test_stream_stops_early_and_closes_connection(stub):
+    client = _client(stub)
+    try:
+        text = client.generate_text(system_prompt="s", user_prompt="u", stop=stop_after_sentences(2))
+    finally:
+        client.close()
+    assert text == "头痛三天。伴恶心。"
+    assert stub.requests[0]["stream"] is True
+    # 客户端断开后服务端不再发送剩余内容
+    assert stub.disconnected.wait(5)
+    assert stub.sent < len(PIECES)
+
+
+def test_non_stream_response_falls_back_and_truncates(stub):
+    stub.mode = "json"
+    client = _client(stub)
+    try:
+        text = client.generate_text(system_prompt="s", user_prompt="u", stop=stop_after_sentences(2))
+    finally:
+        client.close()
+    assert text == "头痛三天。伴恶心。"
+    assert stub.requests[0]["stream"] is True
+
+
+def test_close_releases_pool_and_reopens(stub):
+    client = _client(stub)
+    client.generate_text(system_prompt="s", user_prompt="u")
+    pool = client._client
+    client.close()
+    assert pool.is_closed and client._client is None
+    client.close()  # 重复关闭无副作用
+    assert client.generate_text(system_prompt="s", user_prompt="u") == "".join(PIECES)
+    client.close()
@@ -0,0 +1,43 @@
+"""MedicalRecordService 元数据索引的打开与关闭"""
+import threading
+
+import pytest
+
+from services import medical_record
+from services.medical_record import MedicalRecordService
+
+
+def test_record_index_opened_once_under_concurrency(tmp_path, monkeypatch):
+    opened = []
+    real_index = medical_record.RecordIndex
+
+    def counting_index(*args, **kwargs):
+        opened.append(1)
+        return real_index(*args, **kwargs)
+
+    monkeypatch.setattr(medical_record, "RecordIndex", counting_index)
+    service = MedicalRecordService(storage_dir=tmp_path, write_behind=False)
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def first_access():
+        barrier.wait()
+        seen.append(service.record_index)
+
+    threads = [threading.Thread(target=first_access) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    service.close()
+    assert len(opened) == 1
+    assert len({id(index) for index in seen}) == 1
+
+
+def test_record_index_after_close_raises(tmp_path):
+    service = MedicalRecordService(storage_dir=tmp_path, write_behind=False)
+    service.search_records()
+    service.close()
+    with pytest.raises(RuntimeError):
+        service.record_index
+    service.close()  # 重复关闭无副作用
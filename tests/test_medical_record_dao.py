@@ -0,0 +1,98 @@
+"""MedicalRecordDAO 聚合读取：结果与逐条查询一致，查询次数固定"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+from sqlalchemy import event  # noqa: E402
+
+from services.medical_record_dao import MedicalRecordDAO  # noqa: E402
+
+T0 = datetime(2025, 3, 1, 9, 0)
+
+
+@pytest.fixture
+def dao():
+    dao = MedicalRecordDAO("sqlite:///:memory:")
+    dao.create_patient({"patient_id": "p1", "name": "张三"})
+    dao.create_visit({"visit_id": "v1", "patient_id": "p1", "visit_date": T0})
+    dao.create_visit({"visit_id": "v2", "patient_id": "p1", "visit_date": T0})
+    for c in range(3):
+        case_id = f"c{c}"
+        dao.create_medical_case({"case_id": case_id, "visit_id": "v1", "created_at": T0 + timedelta(minutes=c)})
+        for e in range(c):  # c0 无检查，c1 一项，c2 两项
+            exam_id = f"{case_id}-e{e}"
+            dao.add_examination({"exam_id": exam_id, "case_id": case_id, "exam_name": f"检查{e}",
+                                 "ordered_at": T0 + timedelta(minutes=e)})
+            for i in range(e + 1):  # e0 一条明细，e1 两条；另有一项无明细的检查
+                dao.add_exam_item({"item_id": f"{exam_id}-i{i}", "exam_id": exam_id, "item_name": f"指标{i}",
+                                   "created_at": T0 + timedelta(seconds=i)})
+        dao.add_examination({"exam_id": f"{case_id}-empty", "case_id": case_id, "exam_name": "未出结果",
+                             "ordered_at": T0 + timedelta(hours=1)})
+        for r in range(2):
+            dao.add_case_qa_record({"qa_id": f"{case_id}-q{r}", "case_id": case_id, "role": "doctor",
+                                    "content": f"问题{r}", "round_index": r})
+    yield dao
+    dao.close()
+
+
+def _count_queries(dao, fn, *args, **kwargs):
+    statements = []
+
+    def before(conn, cursor, statement, *rest):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(dao.engine, "before_cursor_execute", before)
+    try:
+        return fn(*args, **kwargs), len(statements)
+    finally:
+        event.remove(dao.engine, "before_cursor_execute", before)
+
+
+def _expected_case(dao, case_id):
+    case = dao.get_medical_case(case_id)
+    full = {k: v for k, v in case.items() if k != "examinations"}
+    exams = dao.get_examinations_by_case_id(case_id)
+    return full, [e["exam_id"] for e in exams], {
+        e["exam_id"]: [i["item_id"] for i in dao.get_exam_items(e["exam_id"])] for e in exams
+    }, [q["qa_id"] for q in dao.get_qa_records_by_case(case_id)]
+
+
+def _shape(bundle):
+    full = {k: v for k, v in bundle.items() if k not in ("examinations", "qa_records")}
+    return full, [e["exam_id"] for e in bundle["examinations"]], {
+        e["exam_id"]: [i["item_id"] for i in e["items"]] for e in bundle["examinations"]
+    }, [q["qa_id"] for q in bundle["qa_records"]]
+
+
+def test_case_bundle_matches_per_entity_reads_in_two_queries(dao):
+    for case_id in ("c0", "c1", "c2"):
+        bundle, queries = _count_queries(dao, dao.get_case_bundle, case_id)
+        assert queries <= 2
+        assert _shape(bundle) == _expected_case(dao, case_id)
+    assert dao.get_case_bundle("missing") is None
+
+
+def test_case_bundles_keep_order_and_query_count(dao):
+    bundles, queries = _count_queries(dao, dao.get_case_bundles, ["c2", "missing", "c0", "c2"])
+    assert [b["case_id"] for b in bundles] == ["c2", "c0"]
+    assert queries <= 2
+    without_children, queries = _count_queries(
+        dao, dao.get_case_bundles, ["c1"], include_items=False, include_qa=False)
+    assert queries == 1
+    assert "qa_records" not in without_children[0]
+    assert all("items" not in e for e in without_children[0]["examinations"])
+
+
+def test_visit_bundle_in_two_queries(dao):
+    bundle, queries = _count_queries(dao, dao.get_visit_bundle, "v1")
+    assert queries <= 2
+    assert {k: v for k, v in bundle.items() if k != "medical_cases"} == dao.get_visit("v1")
+    assert [c["case_id"] for c in bundle["medical_cases"]] == ["c0", "c1", "c2"]
+    for case in bundle["medical_cases"]:
+        assert _shape(case) == _expected_case(dao, case["case_id"])
+
+    empty, queries = _count_queries(dao, dao.get_visit_bundle, "v2")
+    assert empty["medical_cases"] == [] and queries <= 2
+    assert dao.get_visit_bundle("missing") is None
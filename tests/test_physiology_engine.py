@@ -0,0 +1,97 @@
+"""PhysiologyEngine 行/症状槽的释放与复用"""
+import threading
+from datetime import datetime
+
+import pytest
+
+from environment.hospital_world import HospitalWorld, PhysicalState
+from environment.physiology_engine import PhysiologyEngine, ReleasedRowError
+
+
+def test_removed_row_and_slots_are_reused():
+    engine = PhysiologyEngine()
+    first = PhysicalState("p1", symptoms={"头痛": 6.0, "头晕": 3.0}, engine=engine)
+    first.update_vital_sign("heart_rate", 130)
+    first.release()
+    assert engine.n_rows == 1 and not engine.active[0]
+
+    second = PhysicalState("p2", symptoms={"恶心": 2.0}, engine=engine)
+    assert second._row == first._row_id
+    assert engine.n_rows == 1 and engine.n_slots == 2
+    assert list(second.symptoms) == ["恶心"]
+    assert second.get_vital_signs_dict()["heart_rate"] != 130
+    assert int(engine.sym_active[: engine.n_slots].sum()) == 1
+
+    # 重复释放不会把同一行放回两次
+    row = second._row
+    second.release()
+    second.release()
+    assert engine._free_rows == [row]
+
+
+def test_stale_views_raise_after_release():
+    engine = PhysiologyEngine()
+    first = PhysicalState("p1", symptoms={"头痛": 6.0}, engine=engine)
+    symptom = first.symptoms["头痛"]
+    vital = first.vital_signs["heart_rate"]
+    first.release()
+    second = PhysicalState("p2", symptoms={"恶心": 2.0}, engine=engine)
+    assert second._row == first._row_id and first.released
+
+    for read in (lambda: first.pain_level, lambda: symptom.severity, lambda: vital.value):
+        with pytest.raises(ReleasedRowError):
+            read()
+    with pytest.raises(ReleasedRowError):
+        first.energy_level = 0.0
+    with pytest.raises(ReleasedRowError):
+        symptom.severity = 10.0
+    assert second.energy_level == 10.0
+    assert second.symptoms["恶心"].severity == 2.0
+
+
+def test_replaced_symptom_view_raises():
+    engine = PhysiologyEngine()
+    state = PhysicalState("p1", symptoms={"头痛": 6.0}, engine=engine)
+    old = state.symptoms["头痛"]
+    state.add_symptom("头痛", 3.0)
+    with pytest.raises(ReleasedRowError):
+        old.severity
+    assert state.symptoms["头痛"].severity == 3.0
+
+
+@pytest.mark.parametrize("target, attr, value", [
+    ("symptom", "severity", 9.0),
+    ("symptom", "progression_rate", 0.5),
+    ("symptom", "trend", "worsening"),
+    ("state", "energy_level", 3.0),
+    ("state", "pain_level", 7.0),
+    ("state", "consciousness_level", "drowsy"),
+])
+def test_setters_take_engine_lock(target, attr, value):
+    engine = PhysiologyEngine()
+    state = PhysicalState("p1", symptoms={"头痛": 5.0}, engine=engine)
+    obj = state.symptoms["头痛"] if target == "symptom" else state
+    before = getattr(obj, attr)
+    engine._lock.acquire()
+    try:
+        writer = threading.Thread(target=setattr, args=(obj, attr, value))
+        writer.start()
+        writer.join(timeout=0.2)
+        assert writer.is_alive()
+        assert getattr(obj, attr) == before
+    finally:
+        engine._lock.release()
+    writer.join(timeout=5)
+    assert getattr(obj, attr) == value
+
+
+def test_world_remove_agent_releases_row():
+    world = HospitalWorld(start_time=datetime(2025, 1, 1, 8, 0))
+    rows = world.physiology.n_rows
+    for _ in range(3):
+        assert world.add_agent("patient_x", agent_type="patient")
+        assert world.remove_agent("patient_x")
+    assert world.physiology.n_rows == rows + 1
+    assert "patient_x" not in world.physical_states
+    assert "patient_x" not in world.get_agents_in_location("lobby")
+    assert not world.remove_agent("patient_x")
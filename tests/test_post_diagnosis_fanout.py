@@ -0,0 +1,27 @@
+"""诊后 fan-out：节点失败时不滞留其余任务"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langgraph")
+from graphs.common_opd_graph import _PostDiagnosisFanOut  # noqa: E402
+
+
+def test_failed_node_discards_remaining_jobs():
+    fan_out = _PostDiagnosisFanOut()
+    state = SimpleNamespace(run_id="run", patient_id="p1")
+    other = SimpleNamespace(run_id="run", patient_id="p2")
+    release = threading.Event()
+    fan_out.submit(state, {"C14": lambda: 1, "C15": lambda: release.wait(5)})
+    fan_out.submit(other, {"C15": lambda: 2})
+
+    def failing_c14(s):
+        fan_out.take(s, "C14", lambda: None)
+        raise RuntimeError("文书生成失败")
+
+    with pytest.raises(RuntimeError):
+        fan_out.discard_on_error(failing_c14)(state)
+    release.set()
+    assert list(fan_out._jobs) == [("run", "p2", "C15")]
+    assert fan_out.take(other, "C15", lambda: None) == 2
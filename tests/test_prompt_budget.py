@@ -0,0 +1,21 @@
+"""PromptBudget 的节点预算统计：嵌套构建不重复计入组装量"""
+from logging_utils import capture_node_usage
+from services.prompt_budget import PromptBudget, count_tokens, format_chunks
+
+CHUNKS = [{"doc_id": "guide", "chunk_id": i, "text": f"第{i}条指南：头痛伴呕吐需排查颅内病变。" * 20} for i in range(6)]
+
+
+def _outer_build(nested: bool) -> dict[str, str]:
+    kb = format_chunks(CHUNKS, 300, nested=nested)
+    return PromptBudget(2000).add("info", "主诉：头痛三天", priority=2).add("kb", kb, priority=1).build()
+
+
+def test_nested_build_counts_assembled_tokens_once():
+    parts, usage = capture_node_usage(_outer_build, True)
+    assert usage.budget_tokens == sum(count_tokens(text) for text in parts.values())
+    # 内层的裁剪量仍计入
+    assert usage.trimmed_tokens > 0
+
+    _, doubled = capture_node_usage(_outer_build, False)
+    assert doubled.budget_tokens > usage.budget_tokens
+    assert doubled.trimmed_tokens == usage.trimmed_tokens
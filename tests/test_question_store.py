@@ -0,0 +1,34 @@
+"""QuestionStore：重复问题判定与 sync 增量对齐"""
+from services.question_store import QuestionStore
+
+
+def test_paraphrase_is_duplicate():
+    store = QuestionStore()
+    store.add("请问您头痛持续多长时间了？")
+    assert store.is_duplicate("头痛持续多长时间了")
+    assert not store.is_duplicate("最近有没有发烧？")
+
+
+def test_sync_adds_only_new_tail(monkeypatch):
+    store = QuestionStore()
+    history = ["头痛多久了？", "有没有呕吐？"]
+    store.sync(history)
+    added = []
+    real_add = store.add
+    monkeypatch.setattr(store, "add", lambda q: (added.append(q), real_add(q)))
+    history.append("视物模糊吗？")
+    store.sync(history)
+    store.sync(history)
+    assert added == ["视物模糊吗？"]
+    assert len(store) == 3
+
+
+def test_sync_rebuilds_after_reset():
+    store = QuestionStore()
+    store.sync(["头痛多久了？", "有没有呕吐？"])
+    # 换患者后列表从头开始（长度不变、末项不同）
+    store.sync(["最近睡眠怎么样？", "有没有发烧？"])
+    assert len(store) == 2
+    assert not store.is_duplicate("头痛多久了？")
+    store.sync([])
+    assert len(store) == 0
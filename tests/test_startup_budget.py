@@ -0,0 +1,23 @@
+"""启动导入回归：import main 不超出耗时预算、不提前加载重依赖（预算见 core.startup_profile）"""
+import subprocess
+import sys
+from pathlib import Path
+
+from core.startup_profile import HEAVY_MODULES, profile_startup
+
+SRC_ROOT = Path(__file__).resolve().parent.parent / "src"
+
+
+def test_main_import_loads_no_heavy_dependency():
+    profile = profile_startup("main")
+    assert profile.heavy_loaded == [], f"启动时提前加载了重依赖: {profile.heavy_loaded}"
+    assert set(HEAVY_MODULES).isdisjoint(profile.loaded_packages)
+
+
+def test_startup_check_within_budget():
+    proc = subprocess.run(
+        [sys.executable, "-m", "core.startup_profile", "--check"],
+        cwd=str(SRC_ROOT), capture_output=True, text=True, encoding="utf-8",
+    )
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "✅ 启动耗时在预算内" in proc.stdout